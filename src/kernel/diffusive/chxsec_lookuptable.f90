@@ -129,7 +129,6 @@ contains
   !-----------------------------------------------------------------------------
   ! Some parameters for using natural cross section bathymetry data
     mxnbathy            = mxnbathy_g ! maximum size of bathymetry data points
-    !z                  = z_ar_g     ! node elevation array
     applyNaturalSection = 1          ! 0: synthetic channel xsec;  1: topobathy data
     timesDepth          = 4.0 ! water depth multiplier used in readXsection
     nel                 = nrow_chxsec_lookuptable ! number of rows in the hydraulic value lookup tables for ch.xsec   
@@ -147,8 +146,9 @@ contains
     allocate(xsec_tab(11, nel, mxncomp, nlinks))
   
   !-----------------------------------------------------------------------------
-  ! channel network mapping matrix  
+  ! channel network mapping matrix and node elevation array
     frnw_g  = frnw_ar_g      
+    z       = z_ar_g
       
   !-----------------------------------------------------------------------------
   ! Identify mainstem reaches and list their ids in an array
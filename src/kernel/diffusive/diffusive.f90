@@ -78,6 +78,7 @@ contains
                     iniq, frnw_col, frnw_ar_g, qlat_g, ubcd_g, dbcd_g, qtrib_g,                         &
                     paradim, para_ar_g, mxnbathy_g, x_bathy_g, z_bathy_g, mann_bathy_g, size_bathy_g,   &
                     usgs_da_g, usgs_da_reach_g, rdx_ar_g, cwnrow_g, cwncol_g, crosswalk_g, z_thalweg_g, &
+                    nrow_chxsec_g, chxsec_lookuptable_g, z_adj_g,                                       &
                     q_ev_g, elv_ev_g, depth_ev_g)                                     
                     
 
@@ -129,6 +130,7 @@ contains
     integer, intent(in) :: paradim
     integer, intent(in) :: cwnrow_g
     integer, intent(in) :: cwncol_g
+    integer, intent(in) :: nrow_chxsec_g
     integer, dimension(nrch_g), intent(in) :: usgs_da_reach_g
     integer, dimension(nrch_g, frnw_col),  intent(in) :: frnw_ar_g
     integer, dimension(mxncomp_g, nrch_g), intent(in) :: size_bathy_g
@@ -155,6 +157,8 @@ contains
     double precision, dimension(mxnbathy_g, mxncomp_g, nrch_g),  intent(in ) :: x_bathy_g
     double precision, dimension(mxnbathy_g, mxncomp_g, nrch_g),  intent(in ) :: z_bathy_g
     double precision, dimension(mxnbathy_g, mxncomp_g, nrch_g),  intent(in ) :: mann_bathy_g
+    double precision, dimension(11, nrow_chxsec_g, mxncomp_g, nrch_g), intent(in ) :: chxsec_lookuptable_g
+    double precision, dimension(mxncomp_g, nrch_g),              intent(in ) :: z_adj_g
     double precision, dimension(ntss_ev_g, mxncomp_g, nrch_g),   intent(out) :: q_ev_g
     double precision, dimension(ntss_ev_g, mxncomp_g, nrch_g),   intent(out) :: elv_ev_g
     double precision, dimension(ntss_ev_g, mxncomp_g, nrch_g),   intent(out) :: depth_ev_g
@@ -240,7 +244,11 @@ contains
   !-----------------------------------------------------------------------------
   ! miscellaneous parameters
     timesDepth = 4.0 ! water depth multiplier used in readXsection
-    nel        = 501 ! number of sub intervals in look-up tables
+    if (nrow_chxsec_g > 0) then
+      nel      = nrow_chxsec_g ! number of rows of the given look-up tables
+    else
+      nel      = 501 ! number of sub intervals in look-up tables
+    end if
     nts_da     = nts_da_g ! make DA time steps global
 
   !-----------------------------------------------------------------------------
@@ -420,69 +428,81 @@ contains
     print*, 'Applying natural channel cross section...'
   end if 
     
-  if (applyNaturalSection == 1) then
-  
-    ! use bathymetry data 
-    x_bathy    = x_bathy_g
-    z_bathy    = z_bathy_g
-    mann_bathy = mann_bathy_g
-    size_bathy = size_bathy_g
-    
-    do jm = 1, nmstem_rch !* mainstem reach only
-      j = mstem_frj(jm)
-      do i = 1, frnw_g(j, 1)
-        call readXsection_natural_mann_vertices(i, j, timesDepth)
-      end do
-    end do
-  
-  else
-    ! use RouteLink.nc data
+  if (nrow_chxsec_g > 0) then
+    ! use the hydraulic lookup table built by chxsec_lookuptable_calc, with the
+    ! channel bottom elevation it adjusted at mainstem nodes
+    xsec_tab = chxsec_lookuptable_g
     do jm = 1, nmstem_rch !* mainstem reach only
       j     = mstem_frj(jm)
       ncomp = frnw_g(j,1)
-      do i = 1, ncomp
-        leftBank(i,j)  = (twcc_ar_g(i,j) - tw_ar_g(i,j)) / 2.0
-        rightBank(i,j) = (twcc_ar_g(i,j) - tw_ar_g(i,j)) / 2.0 + tw_ar_g(i,j)
-      end do
+      z(1:ncomp, j) = z_adj_g(1:ncomp, j)
     end do
+
+  else
+    if (applyNaturalSection == 1) then
+  
+      ! use bathymetry data 
+      x_bathy    = x_bathy_g
+      z_bathy    = z_bathy_g
+      mann_bathy = mann_bathy_g
+      size_bathy = size_bathy_g
     
-    do jm = 1, nmstem_rch !* mainstem reach only
+      do jm = 1, nmstem_rch !* mainstem reach only
+        j = mstem_frj(jm)
+        do i = 1, frnw_g(j, 1)
+          call readXsection_natural_mann_vertices(i, j, timesDepth)
+        end do
+      end do
+  
+    else
+      ! use RouteLink.nc data
+      do jm = 1, nmstem_rch !* mainstem reach only
         j     = mstem_frj(jm)
         ncomp = frnw_g(j,1)
-        
-        do i=1,ncomp
-          skLeft(i,j) = 1.0 / manncc_ar_g(i,j)
-          skRight(i,j)= 1.0 / manncc_ar_g(i,j)
-          skMain(i,j) = 1.0 / mann_ar_g(i,j)
-
-          call readXsection(i, (1.0/skLeft(i,j)), (1.0/skMain(i,j)), &
-                            (1.0/skRight(i,j)), leftBank(i,j),       &
-                            rightBank(i,j), timesDepth, j, z_ar_g,   &
-                            bo_ar_g, traps_ar_g, tw_ar_g, twcc_ar_g, mxncomp_g, nrch_g)
+        do i = 1, ncomp
+          leftBank(i,j)  = (twcc_ar_g(i,j) - tw_ar_g(i,j)) / 2.0
+          rightBank(i,j) = (twcc_ar_g(i,j) - tw_ar_g(i,j)) / 2.0 + tw_ar_g(i,j)
         end do
-    end do  
-  end if  
+      end do
+    
+      do jm = 1, nmstem_rch !* mainstem reach only
+          j     = mstem_frj(jm)
+          ncomp = frnw_g(j,1)
+        
+          do i=1,ncomp
+            skLeft(i,j) = 1.0 / manncc_ar_g(i,j)
+            skRight(i,j)= 1.0 / manncc_ar_g(i,j)
+            skMain(i,j) = 1.0 / mann_ar_g(i,j)
+
+            call readXsection(i, (1.0/skLeft(i,j)), (1.0/skMain(i,j)), &
+                              (1.0/skRight(i,j)), leftBank(i,j),       &
+                              rightBank(i,j), timesDepth, j, z_ar_g,   &
+                              bo_ar_g, traps_ar_g, tw_ar_g, twcc_ar_g, mxncomp_g, nrch_g)
+          end do
+      end do  
+    end if  
       
-  !-----------------------------------------------------------------------------
-  ! Add uniform flow column to the hydraulic lookup table in order to avoid the 
-  ! use of the trial-and-error iteration for solving normal depth
-  do jm = 1, nmstem_rch !* mainstem reach only
-    j = mstem_frj(jm)
-    do i = 1, frnw_g(j,1)
-      do iel = 1, nel
-        convey = xsec_tab(5, iel, i, j)
-        if (i < frnw_g(j, 1)) then
-          slope = (z(i, j) - z(i+1, j)) / dx(i, j)
-        else
-          slope = (z(i-1, j) - z(i, j)) / dx(i-1, j)
-        endif
+    !-----------------------------------------------------------------------------
+    ! Add uniform flow column to the hydraulic lookup table in order to avoid the 
+    ! use of the trial-and-error iteration for solving normal depth
+    do jm = 1, nmstem_rch !* mainstem reach only
+      j = mstem_frj(jm)
+      do i = 1, frnw_g(j,1)
+        do iel = 1, nel
+          convey = xsec_tab(5, iel, i, j)
+          if (i < frnw_g(j, 1)) then
+            slope = (z(i, j) - z(i+1, j)) / dx(i, j)
+          else
+            slope = (z(i-1, j) - z(i, j)) / dx(i-1, j)
+          endif
 
-        if (slope .le. so_llm) slope = so_llm
+          if (slope .le. so_llm) slope = so_llm
 
-        xsec_tab(10, iel, i, j) = convey * slope**0.50
+          xsec_tab(10, iel, i, j) = convey * slope**0.50
+        end do
       end do
     end do
-  end do
+  end if
 
   !-----------------------------------------------------------------------------
   ! Build time arrays for lateral flow, upstream boundary, downstream boundary,
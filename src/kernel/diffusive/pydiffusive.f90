@@ -11,6 +11,7 @@ subroutine c_diffnw(timestep_ar_g, nts_ql_g, nts_ub_g, nts_db_g, ntss_ev_g, nts_
                     iniq, frnw_col, frnw_ar_g, qlat_g, ubcd_g, dbcd_g, qtrib_g,                         &
                     paradim, para_ar_g, mxnbathy_g, x_bathy_g, z_bathy_g, mann_bathy_g, size_bathy_g,   &                                      
                     usgs_da_g, usgs_da_reach_g, rdx_ar_g, cwnrow_g, cwncol_g, crosswalk_g, z_thalweg_g, &
+                    nrow_chxsec_g, chxsec_lookuptable_g, z_adj_g,                                       &
                     q_ev_g, elv_ev_g, depth_ev_g) bind(c)      
 
     integer(c_int), intent(in) :: nts_ql_g, nts_ub_g, nts_db_g, nts_qtrib_g, nts_da_g
@@ -21,6 +22,7 @@ subroutine c_diffnw(timestep_ar_g, nts_ql_g, nts_ub_g, nts_db_g, ntss_ev_g, nts_
     integer(c_int), intent(in) :: mxnbathy_g
     integer(c_int), intent(in) :: cwnrow_g
     integer(c_int), intent(in) :: cwncol_g
+    integer(c_int), intent(in) :: nrow_chxsec_g
     integer(c_int), dimension(nrch_g), intent(in) :: usgs_da_reach_g
     integer(c_int), dimension(nrch_g, frnw_col),    intent(in) :: frnw_ar_g
     integer(c_int), dimension(mxncomp_g, nrch_g),   intent(in) :: size_bathy_g 
@@ -42,6 +44,8 @@ subroutine c_diffnw(timestep_ar_g, nts_ql_g, nts_ub_g, nts_db_g, ntss_ev_g, nts_
     real(c_double), dimension(mxnbathy_g, mxncomp_g, nrch_g), intent(in ) :: z_bathy_g
     real(c_double), dimension(mxnbathy_g, mxncomp_g, nrch_g), intent(in ) :: mann_bathy_g
     real(c_double), dimension(cwnrow_g, cwncol_g),            intent(in ) :: crosswalk_g 
+    real(c_double), dimension(11, nrow_chxsec_g, mxncomp_g, nrch_g), intent(in ) :: chxsec_lookuptable_g
+    real(c_double), dimension(mxncomp_g, nrch_g),             intent(in ) :: z_adj_g
     real(c_double), dimension(ntss_ev_g, mxncomp_g, nrch_g),  intent(out) :: q_ev_g, elv_ev_g, depth_ev_g    
           
     call diffnw(timestep_ar_g, nts_ql_g, nts_ub_g, nts_db_g, ntss_ev_g, nts_qtrib_g, nts_da_g,      &
@@ -50,6 +54,7 @@ subroutine c_diffnw(timestep_ar_g, nts_ql_g, nts_ub_g, nts_db_g, ntss_ev_g, nts_
                 iniq, frnw_col, frnw_ar_g, qlat_g, ubcd_g, dbcd_g, qtrib_g,                         &
                 paradim, para_ar_g, mxnbathy_g, x_bathy_g, z_bathy_g, mann_bathy_g, size_bathy_g,   &
                 usgs_da_g, usgs_da_reach_g, rdx_ar_g, cwnrow_g, cwncol_g, crosswalk_g, z_thalweg_g, &
+                nrow_chxsec_g, chxsec_lookuptable_g, z_adj_g,                                       &
                 q_ev_g, elv_ev_g, depth_ev_g)                                
     
 end subroutine c_diffnw
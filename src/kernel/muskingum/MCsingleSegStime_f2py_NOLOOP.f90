@@ -3,16 +3,24 @@ module muskingcunge_module
     use precis
     implicit none
 
+    !* residual of the last secant solve on this thread, see muskingcungenwm
+    real(prec) :: last_Qj_0 = 0.0_prec
+    !$omp threadprivate(last_Qj_0)
+
 contains
 
 subroutine muskingcungenwm(dt, qup, quc, qdp, ql, dx, bw, tw, twcc,&
-    n, ncc, cs, s0, velp, depthp, qdc, velc, depthc, ck, cn, X)
+    n, ncc, cs, s0, velp, depthp, qdc, velc, depthc, ck, cn, X, &
+    iterations, retries, converged)
 
     !* exactly follows SUBMUSKINGCUNGE in NWM:
     !* 1) qup and quc for a reach in upstream limit take zero values all the time
     !* 2) initial value of depth of time t of each reach is equal to the value at time t-1
     !* 3) qup as well as quc at time t for a downstream reach in a serial network takes
     !*    exactly the same value qdp at time t (or qdc at time t-1) for the upstream reach
+    !* optionally returns the convergence of the secant method: the total number
+    !* of iterations, the number of times the search space was expanded and
+    !* whether it converged (1) or gave up (0)
 
     implicit none
 
@@ -23,13 +31,14 @@ subroutine muskingcungenwm(dt, qup, quc, qdp, ql, dx, bw, tw, twcc,&
     real(prec), intent(in) :: depthp
     real(prec), intent(out) :: qdc, velc, depthc
     real(prec), intent(out) :: ck, cn, X
+    integer, intent(out), optional :: iterations, retries, converged
     real(prec) :: z
     real(prec) :: bfd, C1, C2, C3, C4
 
     !Uncomment next line for old initialization
     !real(prec) :: WPC, AREAC
 
-    integer :: iter
+    integer :: iter, total_iter
     integer :: maxiter, tries
     real(prec) :: mindepth, aerror, rerror
     real(prec) :: R, twl, h_1, h, h_0, Qj, Qj_0
@@ -45,6 +54,14 @@ subroutine muskingcungenwm(dt, qup, quc, qdp, ql, dx, bw, tw, twcc,&
     aerror = 0.01_prec
     rerror = 1.0_prec
     tries = 0
+    total_iter = 0
+    iter = 0
+
+    !* secant2_h reads the previous residual of the upper estimate when
+    !* computing X before the first solve. NWM results were produced with the
+    !* residual left over from the previous call, so carry it over explicitly
+    Qj_0 = last_Qj_0
+    Qj = 0.0_prec
 
     if(cs .eq. 0.0_prec) then
         z = 1.0_prec
@@ -122,6 +139,7 @@ subroutine muskingcungenwm(dt, qup, quc, qdp, ql, dx, bw, tw, twcc,&
             endif
         end do !*do while (rerror .gt. 0.01 .and. ....
 111    continue
+        total_iter = total_iter + iter
 
         if(iter .ge. maxiter) then
             tries = tries + 1
@@ -183,8 +201,413 @@ subroutine muskingcungenwm(dt, qup, quc, qdp, ql, dx, bw, tw, twcc,&
     call courant(h, bfd, bw, twcc, ncc, s0, n, z, dx, dt, ck, cn)
     !print*, "deep down", depthc
 
+    last_Qj_0 = Qj_0
+
+    if (present(iterations)) iterations = total_iter
+    if (present(retries)) retries = min(tries, 4)
+    if (present(converged)) then
+        if (iter .ge. maxiter) then
+            converged = 0
+        else
+            converged = 1
+        endif
+    endif
+
 end subroutine muskingcungenwm
 
+!**---------------------------------------------------**!
+!*                                                     *!
+!*            HEADWATER REACH SUBROUTINE               *!
+!*                                                     *!
+!**---------------------------------------------------**!
+subroutine muskingcunge_headwater(nseg, nsteps, nts_ql, qts_subdivisions, short_ts, &
+    dt, dx, bw, tw, twcc, n, ncc, cs, s0, ql, qdp0, depthp0, qvd)
+
+    !* routes every timestep of a reach without upstream inflow, i.e. qup and
+    !* quc of its first segment are zero all the time, with the same results
+    !* as calling muskingcungenwm segment by segment at every timestep.
+    !* A segment only depends on itself and on the segment above it, so all
+    !* timesteps of a segment are routed before moving to the next one:
+    !* channel parameters stay in registers, and the lateral inflow ql(:, i)
+    !* and results qvd(:, :, i) of a segment are contiguous.
+
+    implicit none
+
+    integer, intent(in) :: nseg, nsteps, nts_ql, qts_subdivisions, short_ts
+    real(prec), dimension(nseg), intent(in) :: dt, dx, bw, tw, twcc, n, ncc, cs, s0
+    real(prec), dimension(nts_ql, nseg), intent(in) :: ql
+    real(prec), dimension(nseg), intent(in) :: qdp0, depthp0
+    real(prec), dimension(3, nsteps, nseg), intent(out) :: qvd  !* qdc, velc, depthc
+
+    integer :: i, t
+    real(prec) :: qup, quc, qdp, depthp
+    real(prec) :: qdc, velc, depthc, ck, cn, X
+
+    do i = 1, nseg
+        do t = 1, nsteps
+            !* inflow from the segment above, at the previous and current timestep
+            if (i .eq. 1) then
+                qup = 0.0_prec
+                quc = 0.0_prec
+            else
+                if (t .eq. 1) then
+                    qup = qdp0(i-1)
+                else
+                    qup = qvd(1, t-1, i-1)
+                endif
+                if (short_ts .ne. 0) then
+                    quc = qup
+                else
+                    quc = qvd(1, t, i-1)
+                endif
+            endif
+
+            if (t .eq. 1) then
+                qdp = qdp0(i)
+                depthp = depthp0(i)
+            else
+                qdp = qvd(1, t-1, i)
+                depthp = qvd(3, t-1, i)
+            endif
+
+            qdc = 0.0_prec
+            call muskingcungenwm(dt(i), qup, quc, qdp, ql((t-1)/qts_subdivisions + 1, i), &
+                dx(i), bw(i), tw(i), twcc(i), n(i), ncc(i), cs(i), s0(i), &
+                0.0_prec, depthp, qdc, velc, depthc, ck, cn, X)
+
+            qvd(1, t, i) = qdc
+            qvd(2, t, i) = velc
+            qvd(3, t, i) = depthc
+        end do
+    end do
+
+end subroutine muskingcunge_headwater
+
+!**---------------------------------------------------**!
+!*                                                     *!
+!*             HYDRAULIC TABLE SUBROUTINES             *!
+!*                                                     *!
+!**---------------------------------------------------**!
+subroutine hydraulic_table(bw, tw, twcc, n, ncc, cs, s0, ntab, hmax, table)
+
+    !* tabulates the static channel geometry of a segment at ntab depths
+    !* between 0 and hmax, spaced quadratically to resolve shallow flows.
+    !* With a floodplain, half of the depths are within the channel and half
+    !* above bankfull depth, where conveyance and celerity are discontinuous:
+    !*   table(1, i) depth
+    !*   table(2, i) Manning discharge, conveyance * sqrt(s0), to the power
+    !*               3/5, which is close to linear in depth
+    !*   table(3, i) kinematic celerity, as in secant2_h
+    !*   table(4, i) top width used by the Muskingum X parameter
+
+    implicit none
+
+    real(prec), intent(in) :: bw, tw, twcc, n, ncc, cs, s0, hmax
+    integer, intent(in) :: ntab
+    real(prec), dimension(4, ntab), intent(out) :: table
+
+    integer :: i, nbf
+    real(prec) :: z, bfd, h, twl, R, AREA, AREAC, WP, WPC, Ck
+
+    call channel_shape(bw, tw, cs, z, bfd)
+
+    if( (bfd .gt. 0.0_prec) .and. (bfd .lt. hmax) .and. (twcc .gt. 0.0_prec) .and. (ncc .gt. 0.0_prec) .and. (ntab .ge. 4) ) then
+        nbf = ntab / 2
+    else
+        nbf = 0
+    endif
+
+    do i = 1, ntab
+        if (nbf .eq. 0) then
+            h = hmax * (real(i - 1, prec) / real(ntab - 1, prec))**2
+        elseif (i .le. nbf) then
+            h = bfd * (real(i - 1, prec) / real(nbf - 1, prec))**2
+        else
+            h = bfd + (hmax - bfd) * (real(i - nbf, prec) / real(ntab - nbf, prec))**2
+        endif
+
+        call hydraulic_geometry(h, bfd, bw, twcc, z, &
+            twl, R, AREA, AREAC, WP, WPC)
+
+        table(1, i) = h
+        if ((WP+WPC) .gt. 0.0_prec) then
+            table(2, i) = ((1.0_prec/(((WP*n)+(WPC*ncc))/(WP+WPC))) * &
+                (AREA+AREAC) * (R**(2.0_prec/3.0_prec)) * sqrt(s0))**0.6_prec
+        else
+            table(2, i) = 0.0_prec
+        endif
+
+        if( (h .gt. bfd) .and. (twcc .gt. 0.0_prec) .and. (ncc .gt. 0.0_prec) ) then
+            Ck = max(0.0_prec,((sqrt(s0)/n) &
+                * ((5.0_prec/3.0_prec)*R**(2.0_prec/3.0_prec) &
+                - ((2.0_prec/3.0_prec)*R**(5.0_prec/3.0_prec) &
+                * (2.0_prec*sqrt(1.0_prec + z*z)/(bw+2.0_prec*bfd*z)))) &
+                * AREA &
+                + ((sqrt(s0)/(ncc))*(5.0_prec/3.0_prec) &
+                * (h-bfd)**(2.0_prec/3.0_prec))*AREAC) &
+                / (AREA+AREAC))
+            table(4, i) = twcc
+        else
+            if(h .gt. 0.0_prec) then
+                Ck = max(0.0_prec,(sqrt(s0)/n) &
+                    * ((5.0_prec/3.0_prec)*R**(2.0_prec/3.0_prec) &
+                    - ((2.0_prec/3.0_prec)*R**(5.0_prec/3.0_prec) &
+                    * (2.0_prec*sqrt(1.0_prec + z*z)/(bw+2.0_prec*h*z)))))
+            else
+                Ck = 0.0_prec
+            endif
+            table(4, i) = twl
+        endif
+        table(3, i) = Ck
+    end do
+
+end subroutine hydraulic_table
+
+subroutine table_residual(dt, dx, s0, qup, quc, qdp, ql, Qt, Ck, twx, Qj, Qmc, X)
+
+    !* residual of the Muskingum Cunge and Manning discharges at a depth with
+    !* tabulated Manning discharge Qt (see hydraulic_table), celerity Ck and
+    !* top width twx. X is evaluated with the Manning discharge, which equals
+    !* the routed discharge at the root.
+
+    implicit none
+
+    real(prec), intent(in) :: dt, dx, s0, qup, quc, qdp, ql, Qt, Ck, twx
+    real(prec), intent(out) :: Qj, Qmc, X
+    real(prec) :: Qn, Km, D, C1, C2, C3, C4
+
+    Qn = Qt**(5.0_prec/3.0_prec)
+
+    if(Ck .gt. 0.0_prec) then
+        Km = max(dt,dx/Ck)
+        X = min(0.5_prec,max(0.25_prec,0.5_prec*(1.0_prec-(Qn/(2.0_prec*twx*s0*Ck*dx)))))
+    else
+        Km = dt
+        X = 0.5_prec
+    endif
+
+    D = (Km*(1.0_prec - X) + dt/2.0_prec)
+    C1 =  (Km*X + dt/2.0_prec)/D
+    C2 =  (dt/2.0_prec - Km*X)/D
+    C3 =  (Km*(1.0_prec-X)-dt/2.0_prec)/D
+    C4 =  (ql*dt)/D
+
+    if( (C4 .lt. 0.0_prec) .and. (abs(C4) .gt. (C1*qup)+(C2*quc)+(C3*qdp)))  then
+        C4 = -((C1*qup)+(C2*quc)+(C3*qdp))
+    endif
+
+    Qmc = (C1*qup)+(C2*quc)+(C3*qdp) + C4
+    if(Qmc .lt. 0.0_prec) then
+        if( (C4 .lt. 0.0_prec) .and. (abs(C4) .gt. (C1*qup)+(C2*quc)+(C3*qdp)) )  then
+            Qmc = 0.0_prec
+        else
+            Qmc = MAX( ( (C1*qup)+(C2*quc) + C4),((C1*qup)+(C3*qdp) + C4) )
+        endif
+    endif
+
+    Qj = Qmc - Qn
+
+end subroutine table_residual
+
+subroutine table_interpolate(ntab, table, lo, h, Qt, Ck, twx)
+
+    implicit none
+
+    integer, intent(in) :: ntab, lo
+    real(prec), dimension(4, ntab), intent(in) :: table
+    real(prec), intent(in) :: h
+    real(prec), intent(out) :: Qt, Ck, twx
+    real(prec) :: w
+
+    w = (h - table(1, lo)) / (table(1, lo + 1) - table(1, lo))
+    Qt = table(2, lo) + w * (table(2, lo + 1) - table(2, lo))
+    Ck = table(3, lo) + w * (table(3, lo + 1) - table(3, lo))
+    twx = table(4, lo) + w * (table(4, lo + 1) - table(4, lo))
+
+end subroutine table_interpolate
+
+subroutine muskingcunge_table(dt, qup, quc, qdp, ql, dx, bw, tw, twcc,&
+    n, ncc, cs, s0, velp, depthp, ntab, table, qdc, velc, depthc, ck, cn, X, &
+    iterations, retries, converged)
+
+    !* same interface and results as muskingcungenwm, within the accuracy of
+    !* the table, solving for depth from the tabulated channel geometry of
+    !* the segment (see hydraulic_table) instead of the secant iteration:
+    !* 1) the root is bracketed between two table depths, searching outwards
+    !*    from the previous depth with only the tabulated values
+    !* 2) the root is refined within the bracket by regula falsi on the
+    !*    linearly interpolated table values
+    !* Depths beyond the table fall back to muskingcungenwm. ck and cn are
+    !* derived from the tabulated kinematic celerity. iterations counts the
+    !* residual evaluations, see muskingcungenwm for retries and converged.
+
+    implicit none
+
+    real(prec), intent(in) :: dt
+    real(prec), intent(in) :: qup, quc, qdp, ql
+    real(prec), intent(in) :: dx, bw, tw, twcc, n, ncc, cs, s0
+    real(prec), intent(in) :: velp
+    real(prec), intent(in) :: depthp
+    integer, intent(in) :: ntab
+    real(prec), dimension(4, ntab), intent(in) :: table
+    real(prec), intent(out) :: qdc, velc, depthc
+    real(prec), intent(out) :: ck, cn, X
+    integer, intent(out), optional :: iterations, retries, converged
+
+    integer :: lo, hi, mid, iter, nres
+    real(prec) :: z, bfd, R, twl, h, h_lo, h_hi, f_lo, f_hi, f, Qmc, Qt, Ckh, twx
+    integer :: side
+
+    call channel_shape(bw, tw, cs, z, bfd)
+
+    if(ql .gt. 0.0_prec .or. qup .gt. 0.0_prec .or. quc .gt. 0.0_prec &
+        .or. qdp .gt. 0.0_prec) then
+
+        call table_residual(dt, dx, s0, qup, quc, qdp, ql, &
+            table(2, ntab), table(3, ntab), table(4, ntab), f_hi, Qmc, X)
+        if (f_hi .ge. 0.0_prec) then
+            !* deeper than the table
+            call muskingcungenwm(dt, qup, quc, qdp, ql, dx, bw, tw, twcc,&
+                n, ncc, cs, s0, velp, depthp, qdc, velc, depthc, ck, cn, X, &
+                iterations, retries, converged)
+            return
+        endif
+
+        call table_residual(dt, dx, s0, qup, quc, qdp, ql, &
+            table(2, 1), table(3, 1), table(4, 1), f_lo, Qmc, X)
+
+        nres = 2
+        iter = 0
+        if (f_lo .le. 0.0_prec) then
+            h = table(1, 1)
+            Ckh = table(3, 1)
+            call table_residual(dt, dx, s0, qup, quc, qdp, ql, &
+                table(2, 1), table(3, 1), table(4, 1), f, qdc, X)
+        else
+            !* bracket: residual >= 0 at table(1, lo), < 0 at table(1, hi),
+            !* hunting outwards from the previous depth, so that the root
+            !* nearest to it is found, as by the secant iteration
+            lo = 1
+            hi = ntab
+            do while (hi - lo .gt. 1)
+                mid = (lo + hi) / 2
+                if (table(1, mid) .le. depthp) then
+                    lo = mid
+                else
+                    hi = mid
+                endif
+            end do
+            call table_residual(dt, dx, s0, qup, quc, qdp, ql, &
+                table(2, lo), table(3, lo), table(4, lo), f, Qmc, X)
+            nres = nres + 1
+            if (f .ge. 0.0_prec) then
+                f_lo = f
+                hi = lo + 1
+                do
+                    call table_residual(dt, dx, s0, qup, quc, qdp, ql, &
+                        table(2, hi), table(3, hi), table(4, hi), f, Qmc, X)
+                    nres = nres + 1
+                    if (f .lt. 0.0_prec) exit
+                    lo = hi
+                    f_lo = f
+                    hi = hi + 1
+                end do
+                f_hi = f
+            else
+                hi = lo
+                f_hi = f
+                lo = hi - 1
+                do
+                    call table_residual(dt, dx, s0, qup, quc, qdp, ql, &
+                        table(2, lo), table(3, lo), table(4, lo), f, Qmc, X)
+                    nres = nres + 1
+                    if (f .ge. 0.0_prec) exit
+                    hi = lo
+                    f_hi = f
+                    lo = lo - 1
+                end do
+                f_lo = f
+            endif
+
+            !* regula falsi (Illinois variant) within the bracket
+            h_lo = table(1, lo)
+            h_hi = table(1, hi)
+            h = h_lo
+            side = 0
+            do iter = 1, 20
+                h = (h_lo * f_hi - h_hi * f_lo) / (f_hi - f_lo)
+                call table_interpolate(ntab, table, lo, h, Qt, Ckh, twx)
+                call table_residual(dt, dx, s0, qup, quc, qdp, ql, Qt, Ckh, twx, f, Qmc, X)
+                nres = nres + 1
+                !* an order of magnitude tighter than muskingcungenwm
+                if (abs(f) .le. 1.0e-3_prec * Qmc .or. &
+                    (h_hi - h_lo) .le. 1.0e-3_prec * h + 1.0e-4_prec) exit
+                if (f .ge. 0.0_prec) then
+                    h_lo = h
+                    f_lo = f
+                    if (side .eq. 1) f_hi = f_hi * 0.5_prec
+                    side = 1
+                else
+                    h_hi = h
+                    f_hi = f
+                    if (side .eq. -1) f_lo = f_lo * 0.5_prec
+                    side = -1
+                endif
+            end do
+            qdc = Qmc
+        endif
+
+        call hydraulic_geometry(h, bfd, bw, twcc, z, twl, R)
+        R = (h*(bw + twl) / 2.0_prec) / (bw + 2.0_prec*(((twl - bw) / 2.0_prec)**2.0_prec + h**2.0_prec)**0.5_prec)
+        velc = (1.0_prec/n) * (R **(2.0_prec/3.0_prec)) * sqrt(s0)
+        depthc = h
+        !* tabulated celerity, instead of the one of courant
+        ck = Ckh
+        cn = ck * (dt/dx)
+
+        if (present(iterations)) iterations = nres
+        if (present(retries)) retries = 0
+        if (present(converged)) then
+            if (iter .gt. 20) then
+                converged = 0
+            else
+                converged = 1
+            endif
+        endif
+    else
+        !* no flow to route, as muskingcungenwm
+        call muskingcungenwm(dt, qup, quc, qdp, ql, dx, bw, tw, twcc,&
+            n, ncc, cs, s0, velp, depthp, qdc, velc, depthc, ck, cn, X, &
+            iterations, retries, converged)
+    endif
+
+end subroutine muskingcunge_table
+
+subroutine channel_shape(bw, tw, cs, z, bfd)
+
+    !* channel side distance and bankfull depth, as in muskingcungenwm
+
+    implicit none
+
+    real(prec), intent(in) :: bw, tw, cs
+    real(prec), intent(out) :: z, bfd
+
+    if(cs .eq. 0.0_prec) then
+        z = 1.0_prec
+    else
+        z = 1.0_prec/cs
+    endif
+
+    if(bw .gt. tw) then
+        bfd = bw/0.00001_prec
+    elseif (bw .eq. tw) then
+        bfd =  bw/(2.0_prec*z)
+    else
+        bfd =  (tw - bw)/(2.0_prec*z)
+    endif
+
+end subroutine channel_shape
+
 !**---------------------------------------------------**!
 !*                                                     *!
 !*                 SECANT2 SUBROUTINE                  *!
@@ -1,7 +1,8 @@
 module muskingcunge_interface
 
-use, intrinsic :: iso_c_binding, only: c_float
-use muskingcunge_module, only: muskingcungenwm
+use, intrinsic :: iso_c_binding, only: c_float, c_int
+use muskingcunge_module, only: muskingcungenwm, muskingcunge_headwater, &
+    hydraulic_table, muskingcunge_table, last_Qj_0
 
 implicit none
 contains
@@ -20,4 +21,79 @@ subroutine c_muskingcungenwm(dt, qup, quc, qdp, ql, dx, bw, tw, twcc,&
     !print*, "fortran c_bind", depthc
     
 end subroutine c_muskingcungenwm
+
+subroutine c_muskingcungenwm_diag(dt, qup, quc, qdp, ql, dx, bw, tw, twcc,&
+    n, ncc, cs, s0, velp, depthp, qdc, velc, depthc, ck, cn, X, &
+    iterations, retries, converged) bind(c)
+
+    real(c_float), intent(in) :: dt
+    real(c_float), intent(in) :: qup, quc, qdp, ql
+    real(c_float), intent(in) :: dx, bw, tw, twcc, n, ncc, cs, s0
+    real(c_float), intent(in) :: velp, depthp
+    real(c_float), intent(out) :: qdc, velc, depthc
+    real(c_float), intent(out) :: ck, cn, X
+    integer(c_int), intent(out) :: iterations, retries, converged
+
+    call muskingcungenwm(dt, qup, quc, qdp, ql, dx, bw, tw, twcc,&
+    n, ncc, cs, s0, velp, depthp, qdc, velc, depthc, ck, cn, X, &
+    iterations, retries, converged)
+
+end subroutine c_muskingcungenwm_diag
+
+subroutine c_muskingcunge_headwater(nseg, nsteps, nts_ql, qts_subdivisions, short_ts,&
+    dt, dx, bw, tw, twcc, n, ncc, cs, s0, ql, qdp0, depthp0, qvd) bind(c)
+
+    integer(c_int), intent(in) :: nseg, nsteps, nts_ql, qts_subdivisions, short_ts
+    real(c_float), dimension(nseg), intent(in) :: dt, dx, bw, tw, twcc, n, ncc, cs, s0
+    real(c_float), dimension(nts_ql, nseg), intent(in) :: ql
+    real(c_float), dimension(nseg), intent(in) :: qdp0, depthp0
+    real(c_float), dimension(3, nsteps, nseg), intent(out) :: qvd
+
+    call muskingcunge_headwater(nseg, nsteps, nts_ql, qts_subdivisions, short_ts,&
+    dt, dx, bw, tw, twcc, n, ncc, cs, s0, ql, qdp0, depthp0, qvd)
+
+end subroutine c_muskingcunge_headwater
+
+subroutine c_hydraulic_table(bw, tw, twcc, n, ncc, cs, s0, ntab, hmax, table) bind(c)
+
+    real(c_float), intent(in) :: bw, tw, twcc, n, ncc, cs, s0, hmax
+    integer(c_int), intent(in) :: ntab
+    real(c_float), dimension(4, ntab), intent(out) :: table
+
+    call hydraulic_table(bw, tw, twcc, n, ncc, cs, s0, ntab, hmax, table)
+
+end subroutine c_hydraulic_table
+
+subroutine c_muskingcunge_table(dt, qup, quc, qdp, ql, dx, bw, tw, twcc,&
+    n, ncc, cs, s0, velp, depthp, ntab, table, qdc, velc, depthc, ck, cn, X, &
+    iterations, retries, converged) bind(c)
+
+    real(c_float), intent(in) :: dt
+    real(c_float), intent(in) :: qup, quc, qdp, ql
+    real(c_float), intent(in) :: dx, bw, tw, twcc, n, ncc, cs, s0
+    real(c_float), intent(in) :: velp, depthp
+    integer(c_int), intent(in) :: ntab
+    real(c_float), dimension(4, ntab), intent(in) :: table
+    real(c_float), intent(out) :: qdc, velc, depthc
+    real(c_float), intent(out) :: ck, cn, X
+    integer(c_int), intent(out) :: iterations, retries, converged
+
+    call muskingcunge_table(dt, qup, quc, qdp, ql, dx, bw, tw, twcc,&
+    n, ncc, cs, s0, velp, depthp, ntab, table, qdc, velc, depthc, ck, cn, X, &
+    iterations, retries, converged)
+
+end subroutine c_muskingcunge_table
+
+subroutine c_swap_secant_residual(residual) bind(c)
+
+    !* exchanges the residual carried over by the secant solves of this
+    !* thread, so that several routing states can carry their own
+    real(c_float), intent(inout) :: residual
+    real(c_float) :: previous
+
+    previous = last_Qj_0
+    last_Qj_0 = residual
+    residual = previous
+
+end subroutine c_swap_secant_residual
 end module muskingcunge_interface
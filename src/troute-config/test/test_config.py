@@ -3,6 +3,7 @@ from test import temporarily_change_dir
 from typing import Any, Dict, Tuple
 
 import pytest
+import yaml
 from pydantic import ValidationError
 from troute.config import Config
 
@@ -96,3 +97,68 @@ def test_strict_config_validation(config_data: Tuple[Path, Dict[str, Any]]) -> N
                 for err in e.errors()
             )
             pytest.fail(f"Validation failed for {path}:\n{error_details}")
+
+
+@pytest.mark.parametrize(
+    "compute_method, output_type, valid",
+    [("serial", ".nc", True), ("by-subnetwork-jit-clustered", ".nc", False), ("serial", ".csv", False)],
+)
+def test_stream_during_routing_validation(compute_method: str, output_type: str, valid: bool) -> None:
+    """Validates that stream output is only written during routing by the serial method to .nc files
+
+    Parameters
+    ----------
+    compute_method : str
+        The parallel_compute_method of the config
+    output_type : str
+        The stream_output_type of the config
+    valid : bool
+        Whether the config is expected to pass validation
+    """
+    path = Path(__file__).parents[3] / "test" / "LowerColorado_TX_v4" / "test_AnA_V4_HYFeature_noDA.yaml"
+    data = yaml.load(path.read_text(), Loader=yaml.Loader)
+    data["compute_parameters"]["parallel_compute_method"] = compute_method
+    data["output_parameters"]["stream_output"].update(
+        stream_during_routing=True, stream_output_type=output_type
+    )
+    with temporarily_change_dir(path.parent):
+        if valid:
+            Config(**data)
+        else:
+            with pytest.raises(ValidationError, match="stream_during_routing"):
+                Config(**data)
+
+
+@pytest.mark.parametrize(
+    "compute_method, stream_during_routing, valid",
+    [
+        ("serial", False, True),
+        ("by-network", False, True),
+        ("by-subnetwork-jit-clustered", False, False),
+        ("serial", True, False),
+    ],
+)
+def test_ensemble_members_validation(compute_method: str, stream_during_routing: bool, valid: bool) -> None:
+    """Validates that ensemble members are only routed by the serial and by-network methods, without streaming
+
+    Parameters
+    ----------
+    compute_method : str
+        The parallel_compute_method of the config
+    stream_during_routing : bool
+        Whether stream output is written during routing
+    valid : bool
+        Whether the config is expected to pass validation
+    """
+    path = Path(__file__).parents[3] / "test" / "LowerColorado_TX_v4" / "test_AnA_V4_HYFeature_noDA.yaml"
+    data = yaml.load(path.read_text(), Loader=yaml.Loader)
+    forcing_parameters = data["compute_parameters"]["forcing_parameters"]
+    forcing_parameters["ensemble_qlat_input_folders"] = [forcing_parameters["qlat_input_folder"]] * 2
+    data["compute_parameters"]["parallel_compute_method"] = compute_method
+    data["output_parameters"]["stream_output"].update(stream_during_routing=stream_during_routing)
+    with temporarily_change_dir(path.parent):
+        if valid:
+            Config(**data)
+        else:
+            with pytest.raises(ValidationError, match="ensemble_qlat_input_folders"):
+                Config(**data)
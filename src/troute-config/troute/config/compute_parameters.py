@@ -1,3 +1,4 @@
+from pathlib import Path
 from pydantic import BaseModel, Field, validator
 from datetime import datetime
 
@@ -15,12 +16,15 @@ ParallelComputeMethod = Literal[
     "by-network",
     "by-subnetwork-jit",
     "by-subnetwork-jit-clustered",
+    "by-subnetwork-jit-clustered-shared",
     "by-subnetwork-diffusive",
     "bmi",
 ]
 
 ComputeKernel = Literal["V02-structured", "diffusive", "diffusice_cnt"]
 
+ParallelBackend = Literal["loky", "threading"]
+
 
 class ComputeParameters(BaseModel):
     """
@@ -33,6 +37,7 @@ class ComputeParameters(BaseModel):
     - "by-network": parallelization across independent drainage basins
     - "by-subnetwork-jit": parallelization across subnetworks 
     - "by-subnetwork-jit-clustered": parallelization across subnetworks, with clustering to optimize scaling
+    - "by-subnetwork-jit-clustered-shared": as "by-subnetwork-jit-clustered", using persistent workers that read channel parameters and forcings from shared memory
     """
     compute_kernel: ComputeKernel = "V02-structured"
     """
@@ -54,15 +59,145 @@ class ComputeParameters(BaseModel):
     The magnitude of this parameter affects parallel scaling. This is to improve efficiency. Default value has 
     been tested as the fastest for CONUS simultions. For smaller domains this can be reduced.
     """
+    subnetwork_cache_dir: Optional[Path] = None
+    """
+    Folder for caching the clustered subnetwork decomposition used by the "by-subnetwork-jit-clustered..." 
+    parallel schemes. Cache files are keyed by a hash of the network connections, gages, waterbodies and 
+    subnetwork_target_size, so repeated runs on the same network skip the decomposition. 
+    If None (default), subnetworks are rebuilt on every run.
+    """
+    network_batch_size: int = 1000
+    """
+    Only used by the "by-network" parallel scheme. Independent networks are routed longest first, and networks 
+    smaller than this many segments are combined into jobs of about this size, to save the overhead of one job 
+    per small network. Job and network routing times are logged at debug level to tune it. 0 does not batch.
+    The default, 1000, is also the default of compute_nhd_routing_v02 and nwm_route when called directly.
+    """
+    cluster_cost_packing: bool = False
+    """
+    Only used by the "by-subnetwork-jit-clustered..." parallel schemes. If True, the subnetworks of each order are 
+    packed into clusters of even estimated routing cost, from their segments, reaches, reservoirs, DA reservoirs 
+    and gages, instead of greedily by segment count, so that clusters of an order finish at about the same time. With "by-network", 
+    networks are ordered and batched by the same estimated cost.
+    """
+    cluster_cost_file: Optional[Path] = None
+    """
+    Only used with cluster_cost_packing. JSON file of cost model weights. If it exists, clusters are packed with 
+    its weights, and at the end of the run it is (over)written with weights fitted to the routing times of the 
+    clusters of the run, so the next run packs by measured cost. If None (default), rough default weights are used.
+    """
+    pipeline_subnetwork_orders: bool = False
+    """
+    Only used by "by-subnetwork-jit", "by-subnetwork-jit-clustered" and "by-subnetwork-jit-clustered-shared". If 
+    True, each (clustered) subnetwork is computed as soon as the ones draining into it have finished, instead of 
+    waiting for every one of the next higher order. Pool utilization is logged for both. Jobs then run in another 
+    order, so secant results (hydraulic_table_size 0) may differ slightly, see reach_threads; hydraulic table 
+    results are identical.
+    """
+    shared_output: bool = False
+    """
+    Only used by "by-subnetwork-jit-clustered-shared". If True, workers write the flowveldepth and reservoir 
+    inflows of their clusters into one shared output array, with a contiguous block of rows per cluster, and only 
+    return the remaining, small results. Routed arrays are then neither sent back from the workers nor 
+    concatenated again for output. Results are unchanged.
+    """
     cpu_pool: Optional[int] = 1
     """
     Number of CPUs used for parallel computations
     If parallel_compute_method is anything but 'serial', this determines how many cpus to use for parallel processing.
     """
+    parallel_backend: ParallelBackend = "loky"
+    """
+    Only used by "by-network" and "by-subnetwork-jit-clustered". Backend running the routing jobs:
+    - "loky": worker processes, the inputs of every job are pickled to the workers
+    - "threading": threads of the routing process, which read its arrays without copying them. The routing 
+      timesteps run without the GIL, so threads route networks concurrently. With reuse_routing_plans, the 
+      reach structures of every job are also kept between loops.
+    """
+    reach_threads: int = 1
+    """
+    Only used by "serial" and "by-network". Number of OpenMP threads routing the Muskingum Cunge reaches of 
+    each independent network, reaches at the same topological depth being routed concurrently. 
+    Useful for domains dominated by one large network. With "by-network", cpu_pool x reach_threads cores are used.
+    The secant iteration starts from the residual of the previous solve on its thread, so with 
+    hydraulic_table_size 0 results differ from the serial sweep, and between runs. Hydraulic table results 
+    match the serial sweep.
+    """
+    reuse_routing_plans: bool = False
+    """
+    Only used by "serial" and "by-subnetwork-jit-clustered-shared". If True, the reach structures, upstream 
+    positions and hydraulic tables of each (sub)network are built on the first loop and kept for the 
+    following loops, which only pass in new initial conditions, lateral inflows and DA data. A plan is rebuilt 
+    when the reaches, upstream connections, segments or channel parameters of its network change. Results are 
+    unchanged. With "by-subnetwork-jit-clustered-shared", every worker keeps the plans of the clusters it 
+    routed, so set to False if worker memory is short.
+    """
+    reuse_cluster_inputs: bool = False
+    """
+    Only used by "by-network", "by-subnetwork-jit" and "by-subnetwork-jit-clustered". The segments of every job are 
+    laid out as one contiguous block, with channel parameters, waterbodies and reach types, and each job is handed 
+    slices of the initial conditions, lateral inflows, waterbody states and DA data, reindexed once per loop. If 
+    True, the layout is built on the first loop and kept for the following loops, as long as the jobs and channel 
+    segments are unchanged. If False, the layout is rebuilt on every loop. Results are unchanged. The pool of 
+    "by-subnetwork-jit-clustered-shared" always keeps the layout of its shared arrays, on the same condition.
+    """
+    reuse_diffusive_inputs: bool = False
+    """
+    If True, the static inputs of every diffusive domain (reach ordering, network mapping, channel geometry and 
+    cross section data) are built on the first loop and kept for the following loops, which only build the lateral 
+    inflows, initial conditions, boundary conditions and DA data. They are rebuilt when the domain, its junctions, 
+    its topobathy or its refactored hydrofabric inputs change, checked by a hash of them every loop. Results are 
+    unchanged.
+    """
+    diffusive_cache_dir: Optional[Path] = None
+    """
+    Folder for caching the static arrays of every diffusive domain as Fortran ordered .npy files, keyed by a hash 
+    of the domain, its channel parameters, junctions and topobathy data, so repeated runs on the same domain 
+    skip building them. The channel cross section lookup table of every domain is also built once into a memory 
+    mapped file there, keyed by a hash of its inputs, and mapped read-only by later loops and runs instead of 
+    being rebuilt by the diffusive kernel on every loop. If None (default), they are built on every run.
+    """
     return_courant: bool = False
     """
     If True, Courant metrics are returnd with simulations. This only works for MC simulations
     """
+    hydraulic_lookup_tables: bool = False
+    """
+    If True, the channel geometry of each Muskingum Cunge segment is tabulated before routing and the 
+    Muskingum Cunge depth is solved from these tables instead of by the secant iteration. Results match 
+    the secant iteration to within its tolerance, except where the equation has several solutions in 
+    depth. route_headwaters_upfront is then ignored.
+    """
+    hydraulic_table_size: int = Field(64, ge=2)
+    """
+    Only used with hydraulic_lookup_tables. Number of depths tabulated for each segment.
+    """
+    hydraulic_table_max_depth: float = Field(20.0, gt=0)
+    """
+    Only used with hydraulic_lookup_tables. Deepest tabulated depth [m], deeper flows are solved by 
+    the secant iteration.
+    """
+    route_headwaters_upfront: bool = False
+    """
+    If True, every timestep of the Muskingum Cunge headwater reaches without gages is routed in one 
+    kernel call per reach before the other reaches, instead of timestep by timestep with them. Faster, 
+    but the secant iteration starts from different estimates, so results differ within its tolerance.
+    """
+    solver_diagnostics: bool = False
+    """
+    If True, the iterations, retries and non-converged solves of the Muskingum Cunge depth solution are
+    counted for each segment over the whole run, and the most expensive segments are reported at the end.
+    route_headwaters_upfront is then ignored.
+    """
+    solver_diagnostics_top: int = Field(20, ge=1)
+    """
+    Only used with solver_diagnostics. Number of most expensive segments reported.
+    """
+    solver_diagnostics_file: Optional[Path] = None
+    """
+    Only used with solver_diagnostics. If given, the diagnostics of every segment are written to this
+    csv file, ranked by iterations.
+    """
 
     restart_parameters: "RestartParameters" = Field(default_factory=dict)
     hybrid_parameters: "HybridParameters" = Field(default_factory=dict)
@@ -426,6 +561,13 @@ class ForcingParameters(BaseModel):
     Time step size (seconds). Default is 5 mintues
     """
     qlat_input_folder: Optional[DirectoryPath] = None
+    ensemble_qlat_input_folders: Optional[List[DirectoryPath]] = None
+    """
+    Folders of the lateral inflow files of further ensemble members, holding files named as those of qlat_input_folder. 
+    The members are routed together with the lateral inflows of qlat_input_folder, sharing the network, channel parameters 
+    and observations, each from its own initial states. Outputs of the k-th folder are written to a member_k folder of 
+    every output folder.
+    """
     nts: Optional[int] = 288
     """
     Number of timesteps. This value, multiplied by 'dt', gives the total simulation time in seconds.
@@ -291,3 +291,45 @@ class Config(BaseModel):
                         raise ValueError("UPDATE nts. Make sure 'nts' times 'dt' divided by ('stream_output_internal_frequency' times 60) is a whole number in your configuration.")
 
         return values    
+
+    @root_validator(skip_on_failure=True)
+    def check_stream_during_routing(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        """Verify that stream output can be written during routing IF stream_during_routing is enabled."""
+        compute_params = values.get('compute_parameters')
+        output_params = values.get('output_parameters')
+
+        if compute_params and output_params and output_params.stream_output:
+            stream_output = output_params.stream_output
+            if stream_output.stream_during_routing:
+                assert compute_params.parallel_compute_method == 'serial', \
+                    "stream_during_routing is enabled, but parallel_compute_method is not 'serial'."
+                assert stream_output.stream_output_type == '.nc', \
+                    "stream_during_routing is enabled, but stream_output_type is not '.nc'."
+                hybrid_parameters = compute_params.hybrid_parameters
+                assert not (hybrid_parameters and hybrid_parameters.run_hybrid_routing), \
+                    "stream_during_routing is enabled, but diffusive routing is enabled."
+
+        return values
+
+    @root_validator(skip_on_failure=True)
+    def check_ensemble_members(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        """Verify that ensemble members can be routed together IF ensemble_qlat_input_folders are provided."""
+        compute_params = values.get('compute_parameters')
+        output_params = values.get('output_parameters')
+
+        forcing_params = compute_params.forcing_parameters if compute_params else None
+        if forcing_params and forcing_params.ensemble_qlat_input_folders:
+            assert compute_params.parallel_compute_method in ('serial', 'by-network'), \
+                "ensemble_qlat_input_folders are provided, but parallel_compute_method is not 'serial' or 'by-network'."
+            data_assimilation_parameters = compute_params.data_assimilation_parameters
+            assert not (data_assimilation_parameters and data_assimilation_parameters.divergence_outflow), \
+                "ensemble_qlat_input_folders are provided, but divergence_outflow is enabled."
+            if output_params:
+                stream_output = output_params.stream_output
+                assert not (stream_output and stream_output.stream_during_routing), \
+                    "ensemble_qlat_input_folders are provided, but stream_during_routing is enabled."
+                for output in ('chrtout_output', 'hydro_rst_output', 'wrf_hydro_parity_check'):
+                    assert getattr(output_params, output) is None, \
+                        f"ensemble_qlat_input_folders are provided, but {output} is enabled."
+
+        return values
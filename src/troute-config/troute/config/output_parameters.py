@@ -25,6 +25,26 @@ class OutputParameters(BaseModel):
     test_output: Optional[Path] = None
     stream_output: Optional["StreamOutput"] = None
     lastobs_output: Optional[DirectoryPath] = None
+    compact_flowveldepth: bool = False
+    """
+    Hold routing results in per-variable flow, velocity and depth arrays rather than a single wide DataFrame. 
+    Stream, CHRTOUT, CHANOBS and restart outputs are written directly from the arrays. CSV, parquet and test 
+    outputs still require the DataFrame and will build it from the arrays.
+    """
+    pack_velocity_depth: bool = False
+    """
+    Only used with 'compact_flowveldepth'. Store velocity and depth as int16 with a scale factor and offset 
+    derived from the simulated range, reducing their memory footprint by half at the cost of precision.
+    """
+    async_output: bool = False
+    """
+    Write the outputs of each routing loop on a background thread while the next loop is being routed.
+    """
+    async_output_queue_size: Annotated[int, Field(strict=True, ge=1)] = 1
+    """
+    Only used with 'async_output'. Maximum number of routing loops whose results are waiting to be written. 
+    The next loop waits for the oldest one to be written once this is reached, bounding memory use.
+    """
 
 
 class ChanobsOutput(BaseModel):
@@ -165,6 +185,19 @@ class StreamOutput(BaseModel):
     NOTE: This value should not be smaller than dt, and should be a multiple of dt (keep in mind dt is in seconds, while this value 
     is in minutes). So if dt=300(sec), this value cannot be smaller than 5(min) and should be a multiple of 5. 
     """
+    stream_during_routing: bool = False
+    """
+    Write each 'stream_output_time' window of results to its netCDF file as soon as routing has completed it, 
+    on a background thread, instead of after the whole loop has been routed. Requires the 'serial' 
+    parallel_compute_method, '.nc' output and run_hybrid_routing off; configurations asking for anything 
+    else are rejected. A network with diffusive domains, or a 'mask_output' holding nexus ids, can not be 
+    streamed either; t-route then warns once and writes files after routing as usual.
+    """
+    stream_buffer_size: Annotated[int, Field(strict=True, ge=1)] = 4
+    """
+    Maximum number of routed windows waiting to be written when 'stream_during_routing' is on. Routing pauses 
+    while the buffer is full, bounding the memory held for output.
+    """
     
     @validator('stream_output_directory')
     def validate_stream_output_directory(cls, value):
@@ -0,0 +1,91 @@
+import weakref
+
+import numpy as np
+import pandas as pd
+import pytest
+from troute.flowveldepth import FlowVelDepth
+from troute.nhd_io import updated_flowveldepth, updated_flowveldepth_variables
+
+nts = 12
+
+
+@pytest.fixture
+def results():
+    rng = np.random.default_rng(0)
+    out = []
+    for ids in ([11, 12, 13], [], [21, 22, 23, 24]):
+        fvd = rng.uniform(0, 10, (len(ids), nts * 3)).astype("float32")
+        fvd[rng.random(fvd.shape) < 0.05] = np.nan
+        out.append((np.asarray(ids, dtype=np.intp), fvd))
+    return out
+
+
+def _wide(results):
+    qvd_columns = pd.MultiIndex.from_product([range(nts), ["q", "v", "d"]]).to_flat_index()
+    return pd.concat(
+        [pd.DataFrame(r[1], index=r[0], columns=qvd_columns) for r in results], copy=False
+    )
+
+
+def test_from_results(results):
+    fvd = FlowVelDepth.from_results(results, nts)
+    pd.testing.assert_frame_equal(fvd.to_dataframe(), _wide(results), check_index_type=False)
+
+
+@pytest.mark.parametrize("pack", [False, True])
+def test_from_results_release(results, pack):
+    expected = FlowVelDepth.from_results(results, nts, pack=pack).to_dataframe()
+    released = [(r[0], r[1].copy(), "courant") for r in results]
+    arrays = [weakref.ref(r[1]) for r in released]
+
+    fvd = FlowVelDepth.from_results(released, nts, pack=pack, release=True)
+    pd.testing.assert_frame_equal(fvd.to_dataframe(), expected)
+    for r, ids in zip(released, results):
+        np.testing.assert_array_equal(r[0], ids[0])
+        assert r[1] is None and r[2] == "courant"
+    # nothing else holds the routed arrays, they are freed
+    assert all(ref() is None for ref in arrays)
+
+
+def test_packed_velocity_depth(results):
+    fvd = FlowVelDepth.from_results(results, nts, pack=True)
+    expected = _wide(results)
+    np.testing.assert_array_equal(fvd.flow, expected.iloc[:, 0::3].to_numpy())
+    for k, v in ((1, "v"), (2, "d")):
+        scale, _ = fvd.packing[v]
+        np.testing.assert_allclose(
+            fvd.variable(v), expected.iloc[:, k::3].to_numpy(), rtol=0, atol=scale / 2 + 1e-6
+        )
+    assert fvd.nbytes < 3 * 4 * expected.size // 3
+
+
+def test_variable_reindex(results):
+    fvd = FlowVelDepth.from_results(results, nts, pack=True)
+    values = fvd.variable("d", ids=[22, 99, 11], timesteps=slice(1, None, 4))
+    assert values.shape == (3, 3)
+    assert np.isnan(values[1]).all()
+    np.testing.assert_array_equal(values[[0, 2]], fvd.depth[[4, 0], 1::4])
+
+
+@pytest.mark.parametrize(
+    "nex_id, seg_id",
+    [
+        ({}, []),
+        ({}, [12, 22]),
+        ({}, [9999]),
+        ({1: [11, 12], 2: [23], 3: [55]}, []),
+        ({1: [11, 12], 2: [23]}, [13, 21]),
+    ],
+)
+def test_updated_flowveldepth_variables(results, nex_id, seg_id):
+    fvd = FlowVelDepth.from_results(results, nts)
+    ind = [2, 5, 8, 11]
+    flow, velocity, depth = updated_flowveldepth_variables(fvd, ind, nex_id, seg_id)
+
+    expected = updated_flowveldepth(_wide(results), nex_id, seg_id, None)
+    for v, df in zip("qvd", (flow, velocity, depth)):
+        assert df.index.names == ["featureID", "Type"]
+        np.testing.assert_array_equal(df.index.to_list(), expected.index.to_list())
+        np.testing.assert_allclose(
+            df.to_numpy(), expected[[(t, v) for t in ind]].to_numpy(dtype="float32"), rtol=1e-6
+        )
@@ -0,0 +1,76 @@
+from datetime import datetime
+
+import netCDF4
+import numpy as np
+import pandas as pd
+import pytest
+from troute.nhd_io import FlowVelDepthStreamWriter, write_flowveldepth
+
+t0 = datetime(2023, 4, 2, 3)
+dt = 300
+nts = 30
+
+
+def _networks():
+    rng = np.random.default_rng(0)
+    return [
+        (np.arange(ids, ids + n), rng.uniform(0, 10, (n, nts, 3)).astype("float32"))
+        for ids, n in ((100, 4), (200, 7))
+    ]
+
+
+def _stream(writer, networks):
+    # as compute_network_structured with a stream_callback, network by network
+    for ids, fvd in networks:
+        for start in range(0, nts, writer.window):
+            stop = min(start + writer.window, nts)
+            writer(ids, np.empty(0, dtype=int), start, fvd[:, start:stop], np.empty((0, stop - start)))
+    writer.close()
+
+
+@pytest.mark.parametrize("timediff, frequency", [(1, 5), (1, 15), (-1, 10)])
+def test_stream_writer_matches_write_flowveldepth(tmp_path, timediff, frequency):
+    networks = _networks()
+    (tmp_path / "stream").mkdir()
+    (tmp_path / "batch").mkdir()
+
+    writer = FlowVelDepthStreamWriter(tmp_path / "stream", t0, dt, nts, timediff, frequency)
+    _stream(writer, networks)
+
+    flowveldepth = pd.DataFrame(
+        np.concatenate([fvd.reshape(len(ids), -1) for ids, fvd in networks]),
+        index=np.concatenate([ids for ids, _ in networks]),
+    )
+    write_flowveldepth(
+        tmp_path / "batch", None, flowveldepth, np.zeros((0, nts + 1)), np.empty(0, dtype=int),
+        t0, dt, timediff, ".nc", frequency,
+    )
+
+    files = sorted(f.name for f in (tmp_path / "batch").iterdir())
+    assert files == sorted(f.name for f in (tmp_path / "stream").iterdir())
+    for f in files:
+        with netCDF4.Dataset(tmp_path / "stream" / f) as a, netCDF4.Dataset(tmp_path / "batch" / f) as b:
+            for v in ("time", "feature_id", "type", "flow", "velocity", "depth", "nudge"):
+                np.testing.assert_array_equal(a[v][:], b[v][:])
+
+
+def test_stream_writer_mask_and_nudge(tmp_path):
+    ids, fvd = _networks()[1]
+    nudge = np.arange(2 * nts, dtype="float32").reshape(2, nts)
+    writer = FlowVelDepthStreamWriter(tmp_path, t0, dt, nts, -1, 5, seg_id=[201, 203, 205])
+    writer(ids, np.array([203, 999]), 0, fvd, nudge)
+    writer.close()
+
+    with netCDF4.Dataset(tmp_path / "troute_output_202304020300.nc") as ds:
+        np.testing.assert_array_equal(ds["feature_id"][:], [201, 203, 205])
+        np.testing.assert_array_equal(ds["depth"][:], fvd[[1, 3, 5], :, 2])
+        np.testing.assert_array_equal(ds["nudge"][1], nudge[0])
+        np.testing.assert_array_equal(ds["nudge"][0], np.full(nts, -9999.0))
+
+
+def test_stream_writer_error(tmp_path):
+    ids, fvd = _networks()[0]
+    writer = FlowVelDepthStreamWriter(tmp_path / "missing", t0, dt, nts, -1, 5)
+    writer(ids, np.empty(0, dtype=int), 0, fvd, np.empty((0, nts)))
+    with pytest.raises(RuntimeError):
+        writer.close()
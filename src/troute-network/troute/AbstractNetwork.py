@@ -174,6 +174,29 @@ class AbstractNetwork(ABC):
             else:
                 self._coastal_boundary_depth_df = pd.DataFrame()            
 
+    def ensemble_qlateral(self, run, qlat_input_folder):
+        """
+        Lateral inflows of an ensemble member, read from the forcing files of
+        a run-set in the member's own folder. The lateral inflows of the
+        network are left as they are.
+
+        Arguments
+        ---------
+        - run                          (dict): a single run-set, assembled by
+                                               assemble_forcings
+        - qlat_input_folder             (str): folder of the member's forcing files
+
+        Returns
+        -------
+        - qlats                   (DataFrame): lateral inflows of the member
+        """
+        qlateral = self._qlateral
+        try:
+            self.build_qlateral_array(dict(run, qlat_input_folder=qlat_input_folder))
+            return self._qlateral
+        finally:
+            self._qlateral = qlateral
+
     def new_q0(self, run_results):
         """
         Prepare a new q0 dataframe with initial flow and depth to act as
@@ -8,6 +8,7 @@ from itertools import chain
 
 from troute.nhd_network import reverse_network, reachable
 from troute.nhd_network_utilities_v02 import organize_independent_networks, build_refac_connections
+from troute.topobathy_store import is_topobathy_store, read_topobathy_store, topobathy_hy_ids
 
 LOG = logging.getLogger('')
 
@@ -77,7 +78,7 @@ def read_parquet(file_path, seg_ids):
                          columns=['hy_id', 'relative_dist', 'Z', 'roughness', 'cs_id'],
                          filters=[('hy_id', 'in', seg_ids)]).dropna()
     
-    if 'hy_id' in df.columns and not df['hy_id'].str.isnumeric().all():
+    if 'hy_id' in df.columns and not pd.api.types.is_integer_dtype(df['hy_id']) and not df['hy_id'].str.isnumeric().all():
         df['hy_id'] = df['hy_id'].apply(lambda x: x.split('-')[-1])
     return df
 
@@ -397,8 +398,12 @@ class MCwithDiffusiveNatlXSectionNonRefactored(MCwithDiffusive):
                 seg_ids = []
                 for tw in self._diffusive_domain:
                     seg_ids = seg_ids + self._diffusive_domain[tw]['links']
-                seg_ids = ['wb-' + str(seg) for seg in seg_ids]
-                self._topobathy_df = read_parquet(topobathy_file, seg_ids).set_index('hy_id')
+                if is_topobathy_store(topobathy_file):
+                    # segment sorted store, read only the row groups of these segments
+                    self._topobathy_df = read_topobathy_store(topobathy_file, seg_ids).set_index('hy_id')
+                else:
+                    seg_ids = topobathy_hy_ids(topobathy_file, seg_ids)
+                    self._topobathy_df = read_parquet(topobathy_file, seg_ids).set_index('hy_id')
                 self._topobathy_df.index = self._topobathy_df.index.astype(int)
         
             # Load topobathy data and remove any links for which topo data cannot be obtained
@@ -438,6 +443,8 @@ class MCwithDiffusiveNatlXSectionRefactored(MCwithDiffusive):
     @property
     def topobathy_df(self):
         if self._topobathy_df.empty:
+            # refactored topobathy is a netCDF file of refactored links, not a parquet file the
+            # topobathy store can be written from, and diffusive routing reads all of it
             refactored_topobathy_file = self.hybrid_params.get("refactored_topobathy_domain", None)
             self._topobathy_df = read_netcdf(refactored_topobathy_file).set_index('link')
         return self._topobathy_df
@@ -9,6 +9,7 @@ from joblib import delayed, Parallel
 import glob
 import re
 import time
+import copy
 import logging
 
 LOG = logging.getLogger('')
@@ -1023,6 +1024,34 @@ class DataAssimilation(NudgingDA, PersistenceDA, RFCDA):
         PersistenceDA.update_for_next_loop(self, network, da_run)
         RFCDA.update_for_next_loop(self)
         great_lake.update_for_next_loop(self, network, da_run)
+
+    def ensemble_member(self, member=None):
+        '''
+        Data assimilation object of an ensemble member, sharing the observations
+        of this object, with DA states of its own. The member's states are
+        those of its object of the previous loop, or copies of the states of
+        this object for a new member.
+
+        Arguments:
+        ----------
+        - member       (DataAssimilation): object of the member in the previous
+                                           loop, None for a new member
+
+        Returns:
+        --------
+        - data_assimilation (DataAssimilation): data assimilation object of the member
+        '''
+        states = self if member is None else member
+        data_assimilation = copy.copy(self)
+        for state in (
+            '_last_obs_df',
+            '_reservoir_usgs_param_df',
+            '_reservoir_usace_param_df',
+            '_reservoir_rfc_param_df',
+            '_great_lakes_param_df',
+        ):
+            setattr(data_assimilation, state, getattr(states, state).copy())
+        return data_assimilation
     
 
     @property
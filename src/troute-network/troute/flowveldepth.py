@@ -0,0 +1,233 @@
+import numpy as np
+import pandas as pd
+
+_INT16_FILL = np.iinfo(np.int16).min
+_INT16_MAX = np.iinfo(np.int16).max
+
+
+def _packing_parameters(lo, hi):
+    '''
+    Scale factor and offset that map [lo, hi] onto the symmetric int16 range,
+    leaving the most negative value free as a fill value for NaN.
+    '''
+    if not np.isfinite(lo) or not np.isfinite(hi) or hi <= lo:
+        offset = lo if np.isfinite(lo) else 0.0
+        return 1.0, float(offset)
+    return float((hi - lo) / (2 * _INT16_MAX)), float((hi + lo) / 2)
+
+
+def _pack(values, scale, offset, out):
+    '''
+    Pack float values into the int16 array `out` in place.
+    '''
+    packed = np.rint((values - offset) / scale)
+    np.clip(packed, -_INT16_MAX, _INT16_MAX, out=packed)
+    packed[np.isnan(values)] = _INT16_FILL
+    out[...] = packed
+
+
+def _unpack(packed, scale, offset):
+    '''
+    Unpack an int16 array into float32, restoring NaN at fill values.
+    '''
+    values = packed.astype("float32") * np.float32(scale) + np.float32(offset)
+    values[packed == _INT16_FILL] = np.nan
+    return values
+
+
+class FlowVelDepth:
+    '''
+    Compact, struct-of-arrays container for routing results.
+
+    Flow, velocity and depth are held as separate C-contiguous (segments, nts)
+    arrays instead of the wide DataFrame with interleaved (timestep, q/v/d)
+    columns. Velocity and depth may optionally be packed into int16 with a
+    per-variable scale factor and offset (netCDF-style `scale_factor` /
+    `add_offset`), bounding the absolute error to half of the scale factor.
+    Flow is always kept at full float32 precision since it feeds data
+    assimilation, restarts and gage comparisons.
+
+    Arguments:
+    ----------
+    - index      (array-like): segment ids, one per row
+    - flow          (ndarray): float32 (segments, nts) flow [m3/s]
+    - velocity      (ndarray): float32 or packed int16 (segments, nts) velocity [m/s]
+    - depth         (ndarray): float32 or packed int16 (segments, nts) depth [m]
+    - packing          (dict): {'v': (scale, offset), 'd': (scale, offset)} for
+                               packed variables, empty if nothing is packed
+    '''
+    variables = ("q", "v", "d")
+
+    def __init__(self, index, flow, velocity, depth, packing=None):
+        self.index = pd.Index(index)
+        self._data = {"q": flow, "v": velocity, "d": depth}
+        self.packing = dict(packing or {})
+        for v, a in self._data.items():
+            if a.shape != flow.shape or a.shape[0] != len(self.index):
+                raise ValueError(
+                    "Shape of variable %s %s does not match flow %s and index of length %d"
+                    % (v, a.shape, flow.shape, len(self.index))
+                )
+
+    @classmethod
+    def from_results(cls, results, nts, pack=False, release=False):
+        '''
+        Build the container directly from the per-network results tuples
+        returned by compute_nhd_routing_v02, where r[0] holds segment ids and
+        r[1] the (segments, nts * 3) flowveldepth array.
+
+        Arguments:
+        ----------
+        - results (list): routing results
+        - nts      (int): number of simulated timesteps
+        - pack    (bool): pack velocity and depth into int16
+        - release (bool): replace every results tuple, in place, with one
+                          without its flowveldepth array (r[1] set to None)
+                          once the array is copied, so that the routing
+                          results and the container are not held in full
+                          at the same time
+
+        Returns:
+        --------
+        - (FlowVelDepth)
+        '''
+        routed = [k for k, r in enumerate(results) if len(r[0])]
+        n = sum(len(results[k][0]) for k in routed)
+        index = np.concatenate([results[k][0] for k in routed]) if routed else np.empty(0, dtype="int64")
+        flow = np.empty((n, nts), dtype="float32")
+
+        packing = {}
+        if pack:
+            for j, v in ((1, "v"), (2, "d")):
+                lo = min((np.fmin.reduce(results[k][1][:, j::3], axis=None) for k in routed), default=np.nan)
+                hi = max((np.fmax.reduce(results[k][1][:, j::3], axis=None) for k in routed), default=np.nan)
+                packing[v] = _packing_parameters(lo, hi)
+            velocity = np.empty((n, nts), dtype="int16")
+            depth = np.empty((n, nts), dtype="int16")
+        else:
+            velocity = np.empty((n, nts), dtype="float32")
+            depth = np.empty((n, nts), dtype="float32")
+
+        start = 0
+        for k, r in enumerate(results):
+            stop = start + len(r[0])
+            if stop > start:
+                flow[start:stop] = r[1][:, 0::3]
+                if pack:
+                    _pack(r[1][:, 1::3], *packing["v"], velocity[start:stop])
+                    _pack(r[1][:, 2::3], *packing["d"], depth[start:stop])
+                else:
+                    velocity[start:stop] = r[1][:, 1::3]
+                    depth[start:stop] = r[1][:, 2::3]
+            start = stop
+            if release:
+                results[k] = (r[0], None, *r[2:])
+
+        return cls(index, flow, velocity, depth, packing)
+
+    @property
+    def nts(self):
+        return self._data["q"].shape[1]
+
+    @property
+    def shape(self):
+        return (len(self.index), 3 * self.nts)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self._data.values())
+
+    @property
+    def flow(self):
+        return self.variable("q")
+
+    @property
+    def velocity(self):
+        return self.variable("v")
+
+    @property
+    def depth(self):
+        return self.variable("d")
+
+    def variable(self, variable, ids=None, timesteps=None):
+        '''
+        Float32 values of a single variable, optionally subset by segment ids
+        and/or timestep positions. Packed variables are unpacked only for the
+        requested subset.
+
+        Arguments:
+        ----------
+        - variable        (str): one of 'q', 'v' or 'd'
+        - ids      (array-like): segment ids. Ids not in the container are
+                                 returned as rows of NaN (as DataFrame.reindex)
+        - timesteps (array-like or slice): timestep positions
+
+        Returns:
+        --------
+        - values (ndarray): float32 (len(ids), len(timesteps)) array
+        '''
+        data = self._data[variable]
+        if timesteps is not None:
+            data = data[:, timesteps]
+        missing = None
+        if ids is not None:
+            rows = self.index.get_indexer(pd.Index(ids))
+            missing = rows < 0
+            data = data[np.where(missing, 0, rows)] if len(self.index) else np.zeros(
+                (len(rows),) + data.shape[1:], dtype=data.dtype
+            )
+        if variable in self.packing:
+            data = _unpack(data, *self.packing[variable])
+        else:
+            data = np.asarray(data, dtype="float32")
+        if missing is not None and missing.any():
+            data[missing] = np.nan
+        return data
+
+    def subset(self, ids):
+        '''
+        New container holding only the rows of `ids`, all of which must be
+        present in the index.
+        '''
+        rows = self.index.get_indexer(pd.Index(ids))
+        if (rows < 0).any():
+            raise KeyError("%d ids not found in the flowveldepth index" % (rows < 0).sum())
+        return FlowVelDepth(
+            self.index[rows],
+            *(self._data[v][rows] for v in self.variables),
+            packing=self.packing,
+        )
+
+    def set_index(self, index):
+        '''
+        Replace the segment ids, e.g. lake ids with outlet link ids.
+        '''
+        index = pd.Index(index)
+        if len(index) != len(self.index):
+            raise ValueError("New index has length %d, expected %d" % (len(index), len(self.index)))
+        self.index = index
+        return self
+
+    def to_dataframe(self, timesteps=None):
+        '''
+        Wide DataFrame with flat (timestep, variable) columns, identical in
+        layout to the one assembled by nwm_output_generator. Only intended
+        for writers that have no array-based path (CSV, parquet, test output),
+        or for small subsets.
+
+        Arguments:
+        ----------
+        - timesteps (array-like): timestep positions to include, default all
+
+        Returns:
+        --------
+        - df (DataFrame)
+        '''
+        ts = np.arange(self.nts) if timesteps is None else np.asarray(timesteps)
+        values = np.empty((len(self.index), len(ts), 3), dtype="float32")
+        for k, v in enumerate(self.variables):
+            values[:, :, k] = self.variable(v, timesteps=ts)
+        columns = pd.MultiIndex.from_product([ts.tolist(), list(self.variables)]).to_flat_index()
+        return pd.DataFrame(
+            values.reshape(len(self.index), -1), index=self.index, columns=columns
+        )
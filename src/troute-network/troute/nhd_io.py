@@ -6,6 +6,8 @@ import pathlib
 import logging
 from datetime import *
 import time
+import queue
+import threading
 
 import yaml
 import xarray as xr
@@ -19,6 +21,7 @@ import dateutil.parser as dparser
 from datetime import datetime, timedelta
 
 from troute.nhd_network import reverse_dict
+from troute.flowveldepth import FlowVelDepth
 
 LOG = logging.getLogger('')
 
@@ -530,7 +533,7 @@ def write_chanobs(
     Arguments
     -------------
         chanobs_filepath (Path or string) - 
-        flowveldepth (DataFrame) - t-route flow velocity and depth results
+        flowveldepth (DataFrame or FlowVelDepth) - t-route flow velocity and depth results
         link_gage_df (DataFrame) - linkIDs of gages in network
         t0 (datetime) - initial time
         dt (int) - timestep duration (seconds)
@@ -553,7 +556,10 @@ def write_chanobs(
     
     # array of simulated flow data at gage locations    
     #gage_flow_data = flowveldepth.loc[link_gage_df.index].iloc[:,::3].to_numpy(dtype="float32") 
-    gage_flow_data = flowveldepth.loc[link_gage_df_nona.index].iloc[:,::3].to_numpy(dtype="float32") 
+    if isinstance(flowveldepth, FlowVelDepth):
+        gage_flow_data = flowveldepth.variable("q", ids=link_gage_df_nona.index)
+    else:
+        gage_flow_data = flowveldepth.loc[link_gage_df_nona.index].iloc[:,::3].to_numpy(dtype="float32") 
     
     # array of simulation time
     gage_flow_time = [t0 + timedelta(seconds = (i+1) * dt) for i in range(nts)]
@@ -744,7 +750,10 @@ def write_chrtout(
     LOG.debug("Starting the write_chrtout function") 
     
     # count the number of simulated timesteps
-    nsteps = len(flowveldepth.loc[:,::3].columns)
+    if isinstance(flowveldepth, FlowVelDepth):
+        nsteps = flowveldepth.nts
+    else:
+        nsteps = len(flowveldepth.loc[:,::3].columns)
     
     # determine how many files to write results out to
     nfiles_to_write = int(np.floor(nsteps / qts_subdivisions))
@@ -752,12 +761,13 @@ def write_chrtout(
     if nfiles_to_write >= 1:
         
         LOG.debug("%d CHRTOUT files will be written." % (nfiles_to_write))
-        LOG.debug("Extracting flow DataFrame on qts_subdivisions from FVD DataFrame")
-        start = time.time()
+        if not isinstance(flowveldepth, FlowVelDepth):
+            LOG.debug("Extracting flow DataFrame on qts_subdivisions from FVD DataFrame")
+            start = time.time()
 
-        flow = flowveldepth.loc[:, ::3].iloc[:, qts_subdivisions-1::qts_subdivisions]
+            flow = flowveldepth.loc[:, ::3].iloc[:, qts_subdivisions-1::qts_subdivisions]
         
-        LOG.debug("Extracting flow DataFrame took %s seconds." % (time.time() - start))
+            LOG.debug("Extracting flow DataFrame took %s seconds." % (time.time() - start))
         
         varname = 'streamflow_troute'
         dim = 'feature_id'
@@ -775,7 +785,14 @@ def write_chrtout(
         with xr.open_dataset(chrtout_files[0],engine='netcdf4') as ds:
             newindex = ds.feature_id.values
             
-        qtrt = flow.reindex(newindex).to_numpy().astype("float32")
+        if isinstance(flowveldepth, FlowVelDepth):
+            qtrt = flowveldepth.variable(
+                "q",
+                ids=newindex,
+                timesteps=slice(qts_subdivisions-1, None, qts_subdivisions),
+            )
+        else:
+            qtrt = flow.reindex(newindex).to_numpy().astype("float32")
         
         LOG.debug("Reindexing the flow DataFrame took %s seconds." % (time.time() - start))
         
@@ -1522,7 +1539,7 @@ def write_hydro_rst(
     Write t-route flow and depth data to WRF-Hydro restart files. 
     Agruments
     ---------
-        data (Data Frame): t-route simulated flow, velocity and depth data
+        data (Data Frame or FlowVelDepth): t-route simulated flow, velocity and depth data
         restart_files (list): globbed list of WRF-Hydro restart files
         channel_initial_states_file (str): WRF-HYDRO standard restart file used to initiate t-route simulation
         dt_troute (int): timestep of t-route simulation (seconds)
@@ -1585,25 +1602,29 @@ def write_hydro_rst(
         for i, f in enumerate(files_to_append):
             
             LOG.debug('Preparing data for- and writing data to- %s' % f)
-            # extract and reindex depth data
-            qtrt = (
-                data.iloc[:,::3]
-                .iloc[:, a[i]]
-                .reindex(xdf.link)
-                .to_numpy()
-                .astype("float32")
-                .reshape(len(xdf.link,))
-            )
+            if isinstance(data, FlowVelDepth):
+                qtrt = data.variable("q", ids=xdf.link, timesteps=[a[i]]).reshape(len(xdf.link,))
+                htrt = data.variable("d", ids=xdf.link, timesteps=[a[i]]).reshape(len(xdf.link,))
+            else:
+                # extract and reindex depth data
+                qtrt = (
+                    data.iloc[:,::3]
+                    .iloc[:, a[i]]
+                    .reindex(xdf.link)
+                    .to_numpy()
+                    .astype("float32")
+                    .reshape(len(xdf.link,))
+                )
 
-            # extract and reindex depth data
-            htrt = (
-                data.iloc[:, 2::3]
-                .iloc[:, a[i]]
-                .reindex(xdf.link)
-                .to_numpy()
-                .astype("float32")
-                .reshape(len(xdf.link,))
-            )
+                # extract and reindex depth data
+                htrt = (
+                    data.iloc[:, 2::3]
+                    .iloc[:, a[i]]
+                    .reindex(xdf.link)
+                    .to_numpy()
+                    .astype("float32")
+                    .reshape(len(xdf.link,))
+                )
             
             # assemble variables dictionary with content to be written out
             variables = {
@@ -2345,6 +2366,68 @@ def updated_flowveldepth(flowveldepth, nex_id, seg_id, mask_list):
     
     return flowveldepth
 
+def updated_flowveldepth_variables(flowveldepth, timesteps, nex_id, seg_id):
+    '''
+    Counterpart of updated_flowveldepth for a FlowVelDepth container. Applies
+    the same segment/nexus masking and nexus aggregation (flow summed, velocity
+    kept only for single-segment nexuses, depth averaged) one variable at a
+    time, so the wide DataFrame is never assembled.
+
+    Arguments
+    -------------
+    flowveldepth (FlowVelDepth) - t-route flow velocity and depth results
+    timesteps (list) - timestep positions to extract
+    nex_id (dict) - nexus ids and their contributing segment ids
+    seg_id (list) - segment ids to output, 9999 for all segments
+
+    Returns
+    -------------
+    flow, velocity, depth (DataFrame) - one column per timestep, indexed
+                                        by ('featureID', 'Type')
+    '''
+    def frame(values, ids, tag):
+        index = pd.MultiIndex.from_arrays(
+            [np.asarray(ids), np.full(len(ids), tag)], names=['featureID', 'Type']
+        )
+        return pd.DataFrame(values, index=index, columns=timesteps)
+
+    if seg_id and 9999 not in seg_id:
+        seg_ids = flowveldepth.index[flowveldepth.index.isin(seg_id)]
+    else:
+        seg_ids = flowveldepth.index if seg_id else flowveldepth.index[:0]
+    
+    nex_pairs = [(nex, wb) for nex, wbs in nex_id.items() for wb in wbs]
+    nex_pairs = [(nex, wb) for nex, wb in nex_pairs if wb in flowveldepth.index]
+
+    if len(seg_ids) == 0 and not nex_pairs:
+        # no (matching) mask, write out all segments
+        seg_ids = flowveldepth.index
+    
+    variables = []
+    for variable in flowveldepth.variables:
+        seg_df = frame(
+            flowveldepth.variable(variable, ids=seg_ids, timesteps=timesteps), seg_ids, 'wb'
+        )
+        if nex_pairs:
+            nex, wb = map(list, zip(*nex_pairs))
+            grouped = pd.DataFrame(
+                flowveldepth.variable(variable, ids=wb, timesteps=timesteps),
+                index=pd.Index(nex, name='featureID'),
+                columns=timesteps,
+            ).groupby(level=0)
+            if variable == 'q':
+                nex_df = grouped.sum()
+            elif variable == 'v':
+                nex_df = grouped.first()
+                nex_df[grouped.size() > 1] = np.nan
+            else:
+                nex_df = grouped.mean()
+            nex_df = frame(nex_df.to_numpy(), nex_df.index, 'nex')
+            seg_df = pd.concat([seg_df, nex_df])
+        variables.append(seg_df)
+
+    return tuple(variables)
+
 def write_flowveldepth(
     stream_output_directory,
     stream_output_mask,
@@ -2365,14 +2448,13 @@ def write_flowveldepth(
     Arguments
     -------------
     stream_output_directory (Path or string) - directory where file will be created
-    flowveldepth (DataFrame) -  including flowrate, velocity, and depth for each time step
+    flowveldepth (DataFrame or FlowVelDepth) -  including flowrate, velocity, and depth for each time step
     nudge (numpy.ndarray) - nudge data with shape (76, 289)
     usgs_positions_id (array) - Position ids of usgs gages
     '''
     
     mask_list = stream_output_mask_reader(stream_output_mask)
     nex_id, seg_id = mask_find_seg(mask_list, nexus_dict, poi_crosswalk)
-    flowveldepth = updated_flowveldepth(flowveldepth, nex_id, seg_id, mask_list)
 
     # timesteps, variable = zip(*flowveldepth.columns.tolist())
     # timesteps = list(timesteps)
@@ -2381,25 +2463,30 @@ def write_flowveldepth(
     ind = [i for i in range(ts-1,n_timesteps,ts)]
     timestamps_sec =  [(i+1)*dt for i in ind]
     
-    flow = flowveldepth.iloc[:,0::3].iloc[:,ind]
-    velocity = flowveldepth.iloc[:,1::3].iloc[:,ind]
-    depth = flowveldepth.iloc[:,2::3].iloc[:,ind]
+    if isinstance(flowveldepth, FlowVelDepth):
+        flow, velocity, depth = updated_flowveldepth_variables(flowveldepth, ind, nex_id, seg_id)
+    else:
+        flowveldepth = updated_flowveldepth(flowveldepth, nex_id, seg_id, mask_list)
+        flow = flowveldepth.iloc[:,0::3].iloc[:,ind]
+        velocity = flowveldepth.iloc[:,1::3].iloc[:,ind]
+        depth = flowveldepth.iloc[:,2::3].iloc[:,ind]
+    fvd_index = flow.index
 
     # Check if the first column of nudge is all zeros
     if np.all(nudge[:, 0] == 0):
         # Drop the first column
         nudge = nudge[:, 1:]
     nudge_df = pd.DataFrame(data=nudge, index=usgs_positions_id).iloc[:,ind]
-    empty_ids = list(set(flowveldepth.index).difference(set(nudge_df.index)))
+    empty_ids = list(set(fvd_index).difference(set(nudge_df.index)))
     empty_df = pd.DataFrame(index=empty_ids, columns=nudge_df.columns).fillna(-9999.0)
-    nudge_df = pd.concat([nudge_df, empty_df]).loc[flowveldepth.index]
+    nudge_df = pd.concat([nudge_df, empty_df]).loc[fvd_index]
     file_name_time = t0
     jobs = []
     
     if stream_output_timediff > 0:
         ts_per_file = stream_output_timediff*60//stream_output_internal_frequency
         
-        num_files = flowveldepth.shape[1]//3*dt//(stream_output_timediff*60*60)
+        num_files = n_timesteps*dt//(stream_output_timediff*60*60)
         if num_files==0:
             num_files=1
         
@@ -2460,6 +2547,231 @@ def write_flowveldepth(
     
     LOG.debug("Completed the write_flowveldepth_netcdf function") 
 
+def append_flowveldepth_netcdf(filepath, feature_ids, flow, velocity, depth, nudge,
+                               timestamps, t0, create=False):
+    '''
+    Append the rows of a block of segments to a stream output netCDF file,
+    creating the file first if `create` is True. Files share the layout of
+    write_flowveldepth_netcdf, except that the feature_id dimension is
+    unlimited so that rows from consecutive networks can be appended.
+
+    Arguments
+    -------------
+    filepath (Path or string) - output file
+    feature_ids (ndarray) - segment ids of the rows
+    flow, velocity, depth, nudge (ndarray) - (rows, time) float32 values
+    timestamps (list) - seconds since t0 of each column
+    t0 (datetime) - simulation start time
+    create (bool) - create (overwrite) the file instead of appending
+    '''
+    if create:
+        with netCDF4.Dataset(filename=filepath, mode='w', format='NETCDF4') as ncfile:
+            _ = ncfile.createDimension('feature_id', None)
+            _ = ncfile.createDimension('time', len(timestamps))
+            _ = ncfile.createDimension('type_strlen', 2)
+
+            TIME = ncfile.createVariable(
+                varname = "time",
+                datatype = 'float64',
+                dimensions = ("time",),
+                fill_value = -9999.0
+            )
+            TIME[:] = timestamps
+            ncfile['time'].setncatts(
+                {
+                    'long_name': 'valid output time',
+                    'standard_name': 'time',
+                    'units': f'seconds since {t0.strftime("%Y-%m-%d %H:%M:%S")}',
+                    'missing_value': -9999.0
+                }
+            )
+            _ = ncfile.createVariable(
+                varname = "feature_id",
+                datatype = 'int64',
+                dimensions = ("feature_id",),
+            )
+            ncfile['feature_id'].setncatts({'long_name': 'Segment ID'})
+            _ = ncfile.createVariable(
+                varname = "type",
+                datatype = 'S2',
+                dimensions = ("feature_id",),
+            )
+            ncfile['type'].setncatts({'long_name': 'Type'})
+
+            for varname, long_name, units in (
+                ('flow', 'Flow', 'm3 s-1'),
+                ('velocity', 'Velocity', 'm/s'),
+                ('depth', 'Depth', 'm'),
+                ('nudge', 'Streamflow Nudge Value', 'm3 s-1'),
+            ):
+                _ = ncfile.createVariable(
+                    varname = varname,
+                    datatype = "f4",
+                    dimensions = ("feature_id", "time"),
+                    fill_value = -9999.0
+                )
+                ncfile[varname].setncatts(
+                    {
+                        'long_name': long_name,
+                        'units': units,
+                        'missing_value': -9999.0
+                    }
+                )
+
+            ncfile.setncatts(
+                {
+                    'TITLE': 'OUTPUT FROM T-ROUTE',
+                    'file_reference_time': t0.strftime('%Y-%m-%d_%H:%M:%S'),
+                    'code_version': '',
+                }
+            )
+
+    with netCDF4.Dataset(filename=filepath, mode='r+', format='NETCDF4') as ncfile:
+        start = len(ncfile.dimensions['feature_id'])
+        stop = start + len(feature_ids)
+        ncfile['feature_id'][start:stop] = feature_ids
+        ncfile['type'][start:stop] = np.full(len(feature_ids), 'wb', dtype='S2')
+        ncfile['flow'][start:stop, :] = flow
+        ncfile['velocity'][start:stop, :] = velocity
+        ncfile['depth'][start:stop, :] = depth
+        ncfile['nudge'][start:stop, :] = nudge
+
+class FlowVelDepthStreamWriter:
+    '''
+    Writes stream output netCDF files while routing is still running.
+
+    The routing kernel hands over each completed window of timesteps of its
+    network (see the `stream_callback` argument of compute_network_structured).
+    Windows are passed through a bounded queue to a background thread that
+    appends them to the output file covering that window, so writing overlaps
+    with routing and at most `buffer_size` windows are held in memory. When
+    the queue is full the kernel blocks until the writer catches up.
+
+    Windows span `stream_output_time` hours of simulation so that each one
+    maps onto exactly one output file, named and laid out as the files of
+    write_flowveldepth. Nexus aggregation cannot be applied one network at a
+    time and is not supported, segment masks are.
+
+    Arguments
+    -------------
+    stream_output_directory (Path or string) - directory where files are created
+    t0 (datetime) - start of the routing loop
+    dt (int) - routing timestep (seconds)
+    nts (int) - number of timesteps in the routing loop
+    stream_output_timediff (int) - hours per output file, -1 for a single file
+    stream_output_internal_frequency (int) - minutes between output values
+    seg_id (list) - segment ids to write, all segments if empty or 9999
+    link_lake_crosswalk (dict) - lake ids to be replaced with outlet link ids
+    buffer_size (int) - maximum number of windows waiting to be written
+    '''
+    def __init__(
+        self,
+        stream_output_directory,
+        t0,
+        dt,
+        nts,
+        stream_output_timediff,
+        stream_output_internal_frequency = 5,
+        seg_id = None,
+        link_lake_crosswalk = None,
+        buffer_size = 4,
+    ):
+        self.directory = pathlib.Path(stream_output_directory)
+        self.t0 = t0
+        self.dt = dt
+        self.stride = stream_output_internal_frequency//(dt//60)
+        if stream_output_timediff > 0:
+            self.window = min(stream_output_timediff*60*60//dt, nts)
+            # as in write_flowveldepth, trailing timesteps that do not fill a file are not written
+            self.nts = max(nts*dt//(stream_output_timediff*60*60), 1)*self.window
+        else:
+            self.window = nts
+            self.nts = nts
+        self.seg_id = seg_id if seg_id and 9999 not in seg_id else None
+        self.crosswalk = link_lake_crosswalk or {}
+
+        self._created = set()
+        self._error = None
+        self._queue = queue.Queue(maxsize = buffer_size)
+        self._thread = threading.Thread(target = self._run, daemon = True)
+        self._thread.start()
+
+    def __call__(self, feature_ids, gage_ids, start, flowveldepth, nudge):
+        '''
+        Queue a window of results for writing.
+
+        Arguments
+        -------------
+        feature_ids (ndarray) - segment ids of the rows of flowveldepth
+        gage_ids (ndarray) - segment ids of the rows of nudge
+        start (int) - first timestep of the window, counted from the loop start
+        flowveldepth (ndarray) - (segments, window, 3) flow, velocity and depth
+        nudge (ndarray) - (gages, window) streamflow nudge values
+        '''
+        self._raise()
+        if start >= self.nts:
+            return
+        steps = np.arange(start, min(start + flowveldepth.shape[1], self.nts))
+        steps = steps[(steps + 1) % self.stride == 0]
+        if len(steps) == 0:
+            return
+
+        feature_ids = np.asarray(feature_ids)
+        rows = np.isin(feature_ids, self.seg_id) if self.seg_id else slice(None)
+        values = flowveldepth[rows][:, steps - start]
+
+        nudge_values = np.full(values.shape[:2], -9999.0, dtype="float32")
+        ids = pd.Index(feature_ids[rows])
+        gage_rows = ids.get_indexer(np.asarray(gage_ids))
+        found = gage_rows >= 0
+        nudge_values[gage_rows[found]] = np.asarray(nudge)[found][:, steps - start]
+
+        if self.crosswalk:
+            ids = ids.map(lambda i: self.crosswalk.get(i, i))
+
+        file_time = self.t0 + timedelta(seconds = start*self.dt)
+        filename = self.directory / ('troute_output_' + file_time.strftime('%Y%m%d%H%M') + '.nc')
+        self._queue.put(
+            (
+                filename,
+                ids.to_numpy(dtype="int64"),
+                values[:, :, 0],
+                values[:, :, 1],
+                values[:, :, 2],
+                nudge_values,
+                ((steps + 1)*self.dt).tolist(),
+            )
+        )
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if self._error is None:
+                    filename, *args = item
+                    append_flowveldepth_netcdf(
+                        filename, *args, self.t0, create = filename not in self._created
+                    )
+                    self._created.add(filename)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise(self):
+        if self._error is not None:
+            raise RuntimeError("Writing stream output failed") from self._error
+
+    def close(self):
+        '''
+        Wait until all queued windows are written and stop the writer thread.
+        '''
+        self._queue.put(None)
+        self._thread.join()
+        self._raise()
+
     
 
 
@@ -2569,7 +2881,7 @@ def write_flowveldepth(
 #     Arguments
 #     -------------
 #     stream_output_directory (Path or string) - directory where file will be created
-#     flowveldepth (DataFrame) -  including flowrate, velocity, and depth for each time step
+#     flowveldepth (DataFrame or FlowVelDepth) -  including flowrate, velocity, and depth for each time step
 #     nudge (numpy.ndarray) - nudge data with shape (76, 289)
 #     usgs_positions_id (array) - Position ids of usgs gages
 #     '''
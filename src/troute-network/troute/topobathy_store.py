@@ -0,0 +1,234 @@
+'''
+Segment sorted topobathy store.
+
+Topobathy parquet files of the hydrofabric hold the cross section stations
+of every segment, with string "wb-<id>" segment ids, in no particular order.
+write_topobathy_store rewrites such a file once, as a parquet file with
+integer segment ids, sorted by segment and split into row groups of a fixed
+size, and a sidecar offset index, <store>.index.npz, holding the rows of
+every segment, the first row of every row group, and the size and
+modification time of the store it was written for. read_topobathy_store
+then reads the stations of a set of segments from the few row groups that
+hold them, instead of scanning and filtering the whole file:
+
+    python -m troute.topobathy_store topobathy.parquet topobathy_sorted.parquet
+
+The store is a regular parquet file, so it can be used as topobathy_domain.
+A store replaced or modified after its index was written, or copied without
+keeping its modification time, no longer matches the index, and is read
+with read_parquet like any other topobathy file.
+'''
+import argparse
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import logging
+
+LOG = logging.getLogger('')
+
+# bump when the layout of the store changes
+STORE_VERSION = 2
+
+# columns of the topobathy data read for natural cross sections
+TOPOBATHY_COLUMNS = ['hy_id', 'relative_dist', 'Z', 'roughness', 'cs_id']
+
+# rows per parquet row group of the store
+ROW_GROUP_SIZE = 16384
+
+
+def index_path(store_path):
+    '''
+    Path of the sidecar offset index of a topobathy store.
+    '''
+    return f"{os.fspath(store_path)}.index.npz"
+
+
+def _file_stamp(path):
+    '''
+    Size and modification time (ns) of a file.
+    '''
+    stat = os.stat(path)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype='int64')
+
+
+def _index_mismatch(store_path, npz):
+    '''
+    Why the offset index of a topobathy store does not match the store, or
+    None if it does.
+    '''
+    version = int(npz['version'][0])
+    if version != STORE_VERSION:
+        return "topobathy store %s has version %d, expected %d" % (store_path, version, STORE_VERSION)
+    if 'stamp' not in npz or not np.array_equal(npz['stamp'], _file_stamp(store_path)):
+        return "topobathy store %s was modified after its offset index was written" % store_path
+    return None
+
+
+def is_topobathy_store(file_path):
+    '''
+    Whether a parquet file was written by write_topobathy_store, and still
+    matches its offset index. A store that does not is logged, so it is read
+    with read_parquet instead.
+    '''
+    if not os.path.isfile(index_path(file_path)):
+        return False
+    with np.load(index_path(file_path), allow_pickle=False) as npz:
+        mismatch = _index_mismatch(file_path, npz)
+    if mismatch:
+        LOG.warning("%s, reading it without its offset index" % mismatch)
+        return False
+    return True
+
+
+def topobathy_hy_ids(file_path, seg_ids):
+    '''
+    Segment ids as the hy_id values of a topobathy parquet file, integers if
+    the file holds integer ids, like a store, "wb-<id>" strings otherwise.
+    '''
+    if pa.types.is_integer(pq.read_schema(file_path).field('hy_id').type):
+        return [int(seg) for seg in seg_ids]
+    return ['wb-' + str(seg) for seg in seg_ids]
+
+
+def _integer_ids(hy_id):
+    '''
+    Segment ids as integers, from either integers or strings like "wb-254530".
+    '''
+    if pd.api.types.is_integer_dtype(hy_id):
+        return hy_id.to_numpy(dtype='int64')
+    return hy_id.astype(str).str.rsplit('-', n=1).str[-1].astype('int64').to_numpy()
+
+
+def _replace(write, path):
+    '''
+    Write a file with write(tmp) under a temporary name, then move it to path.
+    '''
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(suffix=os.path.splitext(path)[1], dir=folder)
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def write_topobathy_store(topobathy_file, store_path, row_group_size=ROW_GROUP_SIZE):
+    '''
+    Rewrite a topobathy parquet file as a segment sorted store.
+
+    Arguments
+    ---------
+    topobathy_file (str or pathlib.Path): topobathy parquet file
+    store_path     (str or pathlib.Path): parquet file to write, its offset
+                                          index is written next to it
+    row_group_size                 (int): rows per parquet row group
+
+    Notes
+    -----
+    - Rows with missing values are dropped, as read_parquet drops them.
+    - Stations of a segment keep the order they have in topobathy_file.
+    - The index records the size and modification time of the store, a
+      store modified afterwards is no longer read through the index.
+    '''
+    df = pd.read_parquet(topobathy_file, columns=TOPOBATHY_COLUMNS).dropna()
+    hy_id = _integer_ids(df['hy_id'])
+    order = np.argsort(hy_id, kind='stable')
+    df = df.iloc[order].reset_index(drop=True)
+    df['hy_id'] = hy_id[order]
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    store_path = os.fspath(store_path)
+    _replace(
+        lambda tmp: pq.write_table(table, tmp, row_group_size=row_group_size),
+        store_path,
+    )
+
+    # rows of every segment, and first row of every row group
+    ids, starts = np.unique(df['hy_id'].to_numpy(), return_index=True)
+    metadata = pq.ParquetFile(store_path).metadata
+    group_rows = [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+    arrays = {
+        'version': np.array([STORE_VERSION], dtype='int64'),
+        'hy_id': ids.astype('int64'),
+        'ptr': np.append(starts, len(df)).astype('int64'),
+        'group_ptr': np.concatenate([[0], np.cumsum(group_rows, dtype='int64')]),
+        'stamp': _file_stamp(store_path),
+    }
+
+    def _write_index(tmp):
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+
+    _replace(_write_index, index_path(store_path))
+    LOG.info(
+        "wrote topobathy store %s: %d segments, %d rows in %d row groups"
+        % (store_path, len(ids), len(df), len(group_rows))
+    )
+
+
+def read_topobathy_store(store_path, seg_ids):
+    '''
+    Read the stations of the given segments from a topobathy store.
+
+    Arguments
+    ---------
+    store_path (str or pathlib.Path): parquet file written by write_topobathy_store
+    seg_ids                   (iter): integer segment ids
+
+    Returns
+    -------
+    df (DataFrame): TOPOBATHY_COLUMNS of the segments found in the store,
+                    sorted by segment, with integer hy_id, as read_parquet
+                    returns them
+    '''
+    with np.load(index_path(store_path), allow_pickle=False) as npz:
+        mismatch = _index_mismatch(store_path, npz)
+        if mismatch:
+            raise ValueError("%s, rewrite it with write_topobathy_store" % mismatch)
+        ids, ptr, group_ptr = npz['hy_id'], npz['ptr'], npz['group_ptr']
+
+    parquet = pq.ParquetFile(store_path)
+
+    # rows of the requested segments, in segment order
+    seg_ids = np.unique(np.fromiter(seg_ids, dtype='int64'))
+    pos = np.searchsorted(ids, seg_ids)
+    found = pos[(pos < len(ids)) & (ids[np.minimum(pos, len(ids) - 1)] == seg_ids)]
+    if found.size == 0:
+        return pd.DataFrame(columns=TOPOBATHY_COLUMNS)
+    starts, stops = ptr[found], ptr[found + 1]
+    lengths = stops - starts
+    rows = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+    # read only the row groups holding these rows, and take the rows from them
+    groups = np.unique(np.searchsorted(group_ptr, rows, side='right') - 1)
+    table = parquet.read_row_groups(groups.tolist(), columns=TOPOBATHY_COLUMNS)
+    group_rows = group_ptr[groups + 1] - group_ptr[groups]
+    local_start = np.concatenate([[0], np.cumsum(group_rows)[:-1]])
+    group_of_row = np.searchsorted(groups, np.searchsorted(group_ptr, rows, side='right') - 1)
+    local = local_start[group_of_row] + rows - group_ptr[groups[group_of_row]]
+    return table.take(pa.array(local)).to_pandas()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rewrite a topobathy parquet file as a segment sorted store"
+    )
+    parser.add_argument("topobathy_file", help="topobathy parquet file")
+    parser.add_argument("store_path", help="parquet file of the store")
+    parser.add_argument("--row-group-size", type=int, default=ROW_GROUP_SIZE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    write_topobathy_store(args.topobathy_file, args.store_path, args.row_group_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,9 +21,19 @@ from .preprocess import (
     nwm_forcing_preprocess,
     unpack_nwm_preprocess_data,
 )
-from .output import nwm_output_generator
+from .output import (
+    nwm_output_generator,
+    stream_during_routing_segments,
+    stream_output_writer,
+    ensemble_output_parameters,
+    OutputService,
+    accumulate_solver_diagnostics,
+    solver_diagnostics_report,
+)
 from .log_level_set import log_level_set
 from troute.routing.compute import compute_nhd_routing_v02, compute_diffusive_routing, compute_log_mc, compute_log_diff
+from troute.routing.shared_pool import SharedMemoryPool
+from troute.routing.cluster_cost import ClusterCostModel
 
 import troute.nhd_io as nhd_io
 import troute.nhd_network_utilities_v02 as nnu
@@ -186,6 +196,57 @@ def main_v04(argv):
     # to function from inital loop.     
     subnetwork_list = [None, None, None]
 
+    # Keep routing workers and shared channel parameters alive across loops
+    routing_pool = None
+    if parallel_compute_method == "by-subnetwork-jit-clustered-shared":
+        routing_pool = SharedMemoryPool(cpu_pool)
+
+    # Reach structures of each network, built on the first loop and reused by the others
+    routing_plans = {} if compute_parameters.get("reuse_routing_plans", False) else None
+
+    # Inputs of the parallel jobs, partitioned on the first loop and reused by the others
+    cluster_inputs = {} if compute_parameters.get("reuse_cluster_inputs", False) else None
+
+    # Static inputs of the diffusive domains, built on the first loop and reused by the others
+    diffusive_static = {} if compute_parameters.get("reuse_diffusive_inputs", False) else None
+
+    # Pack clusters by estimated routing cost, calibrated by earlier runs if recorded
+    cluster_cost_model = None
+    cluster_cost_file = compute_parameters.get("cluster_cost_file", None)
+    if compute_parameters.get("cluster_cost_packing", False):
+        if cluster_cost_file and Path(cluster_cost_file).is_file():
+            cluster_cost_model = ClusterCostModel.load(cluster_cost_file)
+        else:
+            cluster_cost_model = ClusterCostModel()
+
+    # Write the outputs of each loop on a background thread while the next loop is routed
+    output_service = None
+    if (output_parameters or {}).get("async_output", False):
+        output_service = OutputService(output_parameters.get("async_output_queue_size", 1))
+
+    # Segments streamed from the routing kernel, None if stream output is written after routing
+    stream_seg_id = stream_during_routing_segments(
+        output_parameters,
+        network.diffusive_network_data,
+        network.nexus_dict,
+        network.poi_nex_dict,
+    )
+
+    # Muskingum Cunge solver iterations of each segment, over all loops
+    solver_diagnostics = None
+
+    # Further ensemble members, routed together with the forcing of qlat_input_folder,
+    # each from initial states and DA states of its own, kept across loops
+    ensemble_folders = forcing_parameters.get("ensemble_qlat_input_folders", None) or []
+    ensemble_states = [
+        {
+            "q0": network.q0.copy(),
+            "waterbodies_df": network.waterbody_dataframe.copy(),
+            "data_assimilation": data_assimilation.ensemble_member(),
+        }
+        for _ in ensemble_folders
+    ]
+
     # Flag for first run for param output
     firstRun = True
     # Disable in case there is no log file
@@ -205,6 +266,35 @@ def main_v04(argv):
         if data_assimilation_parameters.get("divergence_outflow", False):   
             network.diverge_flow(data_assimilation, run_set_iterator)
         
+        # write stream output from the routing kernel as windows complete
+        stream_writer = None
+        if stream_seg_id is not None:
+            stream_writer = stream_output_writer(
+                output_parameters,
+                t0,
+                dt,
+                nts,
+                stream_seg_id,
+                network.link_lake_crosswalk,
+            )
+
+        # lateral inflows and states of the ensemble members, see nwm_route
+        members = None
+        if ensemble_folders:
+            members = [{}] + [
+                {
+                    "q0": state["q0"],
+                    "qlats": network.ensemble_qlateral(run, folder),
+                    "waterbodies_df": state["waterbodies_df"],
+                    "lastobs_df": state["data_assimilation"].lastobs_df,
+                    "reservoir_usgs_param_df": state["data_assimilation"].reservoir_usgs_param_df,
+                    "reservoir_usace_param_df": state["data_assimilation"].reservoir_usace_param_df,
+                    "reservoir_rfc_param_df": state["data_assimilation"].reservoir_rfc_param_df,
+                    "great_lakes_param_df": state["data_assimilation"].great_lakes_param_df,
+                }
+                for folder, state in zip(ensemble_folders, ensemble_states)
+            ]
+
         route_start_time = time.time()
 
         run_results = nwm_route(
@@ -250,17 +340,44 @@ def main_v04(argv):
             network.coastal_boundary_depth_df,
             network.unrefactored_topobathy_df,
             firstRun,
-            logFileName            
+            logFileName,
+            routing_pool=routing_pool,
+            subnetwork_cache_dir=compute_parameters.get("subnetwork_cache_dir", None),
+            pipeline_orders=compute_parameters.get("pipeline_subnetwork_orders", False),
+            reach_threads=compute_parameters.get("reach_threads", 1),
+            stream_writer=stream_writer,
+            hydraulic_table_size=(
+                compute_parameters.get("hydraulic_table_size", 64)
+                if compute_parameters.get("hydraulic_lookup_tables", False) else 0
+            ),
+            hydraulic_table_max_depth=compute_parameters.get("hydraulic_table_max_depth", 20.0),
+            solver_diagnostics=compute_parameters.get("solver_diagnostics", False),
+            route_headwaters_upfront=compute_parameters.get("route_headwaters_upfront", False),
+            routing_plans=routing_plans,
+            cluster_cost_model=cluster_cost_model,
+            network_batch_size=compute_parameters.get("network_batch_size", 1000),
+            cluster_inputs=cluster_inputs,
+            parallel_backend=compute_parameters.get("parallel_backend", "loky"),
+            shared_output=compute_parameters.get("shared_output", False),
+            diffusive_static=diffusive_static,
+            diffusive_cache_dir=compute_parameters.get("diffusive_cache_dir", None),
+            members=members,
         )
       
         # returns list, first item is run result, second item is subnetwork items
         subnetwork_list = run_results[1]
         run_results = run_results[0]
+        member_results = []
+        if members is not None:
+            run_results, member_results = run_results[0], run_results[1:]
 
         
         route_end_time = time.time()
         task_times['route_time'] += route_end_time - route_start_time
 
+        if compute_parameters.get("solver_diagnostics", False):
+            solver_diagnostics = accumulate_solver_diagnostics(run_results, solver_diagnostics)
+
         # create initial conditions for next loop itteration
         network.new_q0(run_results)
         network.update_waterbody_water_elevation()    
@@ -278,6 +395,19 @@ def main_v04(argv):
                     output_parameters['lite_restart']
                 )                    
 
+        # initial conditions, DA states and restarts of the ensemble members
+        for member, (results, state) in enumerate(zip(member_results, ensemble_states), 1):
+            state["q0"] = new_nwm_q0(results)
+            state["waterbodies_df"] = get_waterbody_water_elevation(state["waterbodies_df"], state["q0"])
+            state["data_assimilation"].update_after_compute(results, dt*nts)
+            if output_parameters and output_parameters['lite_restart'] is not None:
+                nhd_io.write_lite_restart(
+                    state["q0"],
+                    state["waterbodies_df"],
+                    t0 + timedelta(seconds = dt * nts),
+                    ensemble_output_parameters(output_parameters, member)['lite_restart']
+                )
+
         # Prepare input forcing for next time loop simulation when mutiple time loops are presented.
         if run_set_iterator < len(run_sets) - 1:
             # update t0
@@ -290,6 +420,12 @@ def main_v04(argv):
             data_assimilation.update_for_next_loop(
                 network,
                 da_sets[run_set_iterator + 1])
+
+            # observations of the next loop, with the DA states of every member
+            for state in ensemble_states:
+                state["data_assimilation"] = data_assimilation.ensemble_member(
+                    state["data_assimilation"]
+                )
             
             
             forcing_end_time = time.time()
@@ -302,29 +438,53 @@ def main_v04(argv):
 
         output_start_time = time.time()  
         
-        #TODO Update this to work with either network type...
-        nwm_output_generator(
-            run,
-            run_results,
-            supernetwork_parameters,
-            output_parameters,
-            parity_parameters,
-            restart_parameters,
-            parity_sets[run_set_iterator] if parity_parameters else {},
-            qts_subdivisions,
-            compute_parameters.get("return_courant", False),
-            cpu_pool,
-            network.waterbody_dataframe,
-            network.waterbody_types_dataframe,
-            duplicate_ids_df,
-            data_assimilation_parameters,
-            data_assimilation.lastobs_df,
-            network.link_gage_df,
-            network.link_lake_crosswalk,
-            network.nexus_dict,
-            poi_crosswalk, 
-            logFileName            
-        )
+        if stream_writer:
+            # finish writing the streamed windows, stream output is then complete
+            stream_writer.close()
+        
+        # outputs of every ensemble member, member 0 is the run of qlat_input_folder
+        member_outputs = [
+            (run_results, network.waterbody_dataframe, data_assimilation.lastobs_df)
+        ] + [
+            (results, state["waterbodies_df"], state["data_assimilation"].lastobs_df)
+            for results, state in zip(member_results, ensemble_states)
+        ]
+        for member, (results, waterbodies_df, lastobs_df) in enumerate(member_outputs):
+            output_args = (
+                run,
+                results,
+                supernetwork_parameters,
+                ensemble_output_parameters(
+                    dict(output_parameters, stream_output=None) if stream_writer else output_parameters,
+                    member,
+                ),
+                parity_parameters,
+                restart_parameters,
+                parity_sets[run_set_iterator] if parity_parameters else {},
+                qts_subdivisions,
+                compute_parameters.get("return_courant", False),
+                cpu_pool,
+                waterbodies_df,
+                network.waterbody_types_dataframe,
+                duplicate_ids_df,
+                data_assimilation_parameters,
+                lastobs_df,
+                network.link_gage_df,
+                network.link_lake_crosswalk,
+                network.nexus_dict,
+                poi_crosswalk, 
+                logFileName            
+            )
+
+            #TODO Update this to work with either network type...
+            if output_service:
+                # snapshot the frames the next loop updates in place before handing them over
+                output_args = tuple(
+                    a.copy() if isinstance(a, pd.DataFrame) else a for a in output_args
+                )
+                output_service.submit(*output_args)
+            else:
+                nwm_output_generator(*output_args)
         
 
         output_end_time = time.time()
@@ -334,6 +494,27 @@ def main_v04(argv):
     
     # end of for run_set_iterator, run in enumerate(run_sets):
     
+    if routing_pool:
+        routing_pool.shutdown()
+
+    if cluster_cost_model is not None and cluster_cost_file:
+        # the cluster timings of this run calibrate the packing of the next one
+        cluster_cost_model.calibrated().save(cluster_cost_file)
+        LOG.info("saved cluster cost model to %s" % cluster_cost_file)
+    
+    if output_service:
+        output_start_time = time.time()
+        output_service.close()
+        task_times['output_time'] += time.time() - output_start_time
+        task_times['output_write_time'] = output_service.write_time
+        task_times['output_overlap_time'] = output_service.overlap_time
+
+    if solver_diagnostics is not None:
+        solver_diagnostics_report(
+            solver_diagnostics,
+            compute_parameters.get("solver_diagnostics_top", 20),
+            compute_parameters.get("solver_diagnostics_file", None),
+        )
     
     task_times['total_time'] = time.time() - main_start_time
 
@@ -369,6 +550,14 @@ def main_v04(argv):
             round(task_times['output_time'] / task_times['total_time'] * 100, 2)
         )
     )
+    if output_service:
+        LOG.info(
+            'Background output writing: {} secs, {} secs overlapped with routing'\
+            .format(
+                round(task_times['output_write_time'], 2),
+                round(task_times['output_overlap_time'], 2)
+            )
+        )
     LOG.info('----------------------------------------')
     LOG.info(
         'Total execution time: {} secs'\
@@ -411,6 +600,14 @@ def main_v04(argv):
                 round(task_times['output_time']/task_times['total_time'] * 100,2)
             )
         )
+        if output_service:
+            print(
+                'Background output writing: {} secs, {} secs overlapped with routing'\
+                .format(
+                    round(task_times['output_write_time'],2),
+                    round(task_times['output_overlap_time'],2)
+                )
+            )
         print('----------------------------------------')
         print(
             'Total execution time: {} secs'\
@@ -1167,6 +1364,24 @@ def nwm_route(
     logFileName='troute_run_log.txt',  
     flowveldepth_interorder={},
     from_files=False,
+    routing_pool=None,
+    subnetwork_cache_dir=None,
+    pipeline_orders=False,
+    reach_threads=1,
+    stream_writer=None,
+    hydraulic_table_size=0,
+    hydraulic_table_max_depth=20.0,
+    solver_diagnostics=False,
+    route_headwaters_upfront=False,
+    routing_plans=None,
+    cluster_cost_model=None,
+    network_batch_size=1000,
+    cluster_inputs=None,
+    parallel_backend="loky",
+    shared_output=False,
+    diffusive_static=None,
+    diffusive_cache_dir=None,
+    members=None,
 ):
 
     ################### Main Execution Loop across ordered networks      
@@ -1252,6 +1467,22 @@ def nwm_route(
         subnetwork_list,
         flowveldepth_interorder,
         from_files = from_files,
+        routing_pool = routing_pool,
+        subnetwork_cache_dir = subnetwork_cache_dir,
+        pipeline_orders = pipeline_orders,
+        reach_threads = reach_threads,
+        stream_writer = stream_writer,
+        hydraulic_table_size = hydraulic_table_size,
+        hydraulic_table_max_depth = hydraulic_table_max_depth,
+        solver_diagnostics = solver_diagnostics,
+        route_headwaters_upfront = route_headwaters_upfront,
+        routing_plans = routing_plans,
+        cluster_cost_model = cluster_cost_model,
+        network_batch_size = network_batch_size,
+        cluster_inputs = cluster_inputs,
+        parallel_backend = parallel_backend,
+        shared_output = shared_output,
+        members = members,
     )
     LOG.debug("MC computation complete in %s seconds." % (time.time() - start_time_mc))
     # returns list, first item is run result, second item is subnetwork items
@@ -1289,29 +1520,37 @@ def nwm_route(
                 unrefactored_topobathy_df,                
             )          
 
-        # call diffusive wave simulation and append results to MC results
-        results.extend(
-            compute_diffusive_routing(
-                results,
-                diffusive_network_data,
-                cpu_pool,
-                t0,
-                dt,
-                nts,
-                q0,
-                qlats,
-                qts_subdivisions,
-                usgs_df,
-                lastobs_df,
-                da_parameter_dict,
-                waterbodies_df,
-                topobathy_df,
-                refactored_diffusive_domain,
-                refactored_reaches,
-                coastal_boundary_depth_df,
-                unrefactored_topobathy_df,
+        # call diffusive wave simulation and append results to MC results,
+        # of every ensemble member from its own initial states and forcing
+        if members is None:
+            member_results = [(results, {})]
+        else:
+            member_results = zip(results, members)
+        for mc_results, member in member_results:
+            mc_results.extend(
+                compute_diffusive_routing(
+                    mc_results,
+                    diffusive_network_data,
+                    cpu_pool,
+                    t0,
+                    dt,
+                    nts,
+                    member.get("q0", q0),
+                    member.get("qlats", qlats),
+                    qts_subdivisions,
+                    usgs_df,
+                    member.get("lastobs_df", lastobs_df),
+                    da_parameter_dict,
+                    member.get("waterbodies_df", waterbodies_df),
+                    topobathy_df,
+                    refactored_diffusive_domain,
+                    refactored_reaches,
+                    coastal_boundary_depth_df,
+                    unrefactored_topobathy_df,
+                    diffusive_static=diffusive_static,
+                    diffusive_cache_dir=diffusive_cache_dir,
+                )
             )
-        )
         LOG.debug("Diffusive computation complete in %s seconds." % (time.time() - start_time_diff))
 
     else:
@@ -1,9 +1,13 @@
 import time
 import numpy as np
 import pandas as pd
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime, timedelta
 import troute.nhd_io as nhd_io
+from troute.flowveldepth import FlowVelDepth
+from troute.routing.shared_pool import stacked_rows
 from build_tests import parity_check
 import logging
 
@@ -18,12 +22,12 @@ def _reindex_lake_to_link_id(target_df, crosswalk):
     
     Arguments:
     ----------
-    - target_df (DataFrame): Data frame to be reinexed
+    - target_df (DataFrame or FlowVelDepth): Data frame to be reinexed
     - crosswalk      (dict): Relates lake ids to outlet link ids
     
     Returns:
     --------
-    - target_df (DataFrame): Re-indexed with link ids replacing 
+    - target_df (DataFrame or FlowVelDepth): Re-indexed with link ids replacing 
                              lake ids
     '''
 
@@ -42,11 +46,35 @@ def _reindex_lake_to_link_id(target_df, crosswalk):
     idxs[lake_index_intersect[1]] = linkids[lake_index_intersect[2]]
 
     # (re) set the target_df index
-    target_df.set_index(idxs, inplace = True)
+    if isinstance(target_df, FlowVelDepth):
+        target_df.set_index(idxs)
+    else:
+        target_df.set_index(idxs, inplace = True)
 
     return target_df
 
 
+def _results_frame(results, k, columns):
+    '''
+    Frame of the k-th array of every routing results tuple, stacked by rows.
+    Arrays written to the shared output buffers (compute parameter
+    shared_output) are consecutive rows of one array, which is wrapped
+    without a copy.
+    '''
+    values = stacked_rows([r[k] for r in results])
+    if values is None:
+        return pd.concat(
+            [pd.DataFrame(r[k], index=r[0], columns=columns) for r in results],
+            copy=False,
+        )
+    return pd.DataFrame(
+        values,
+        index=np.concatenate([r[0] for r in results]),
+        columns=columns,
+        copy=False,
+    )
+
+
 def _parquet_output_format_converter(df, start_datetime, dt, configuration, prefix_ids):
     '''
     Utility function for convert flowveldepth dataframe
@@ -114,6 +142,217 @@ def _parquet_output_format_converter(df, start_datetime, dt, configuration, pref
     return timeseries_df
 
 
+def stream_during_routing_segments(
+    output_parameters,
+    diffusive_network_data = None,
+    nexus_dict = None,
+    poi_crosswalk = None,
+):
+    '''
+    Decide once, before routing, whether stream output is written while
+    loops are being routed. Configuration validation already requires the
+    serial compute method, .nc stream output and no diffusive routing;
+    diffusive domains and nexus masks depend on the network, and are
+    checked here.
+
+    Arguments:
+    ----------
+    - output_parameters         (dict): output parameters
+    - diffusive_network_data    (dict): diffusive domains, if any
+    - nexus_dict                (dict): nexus to segment crosswalk
+    - poi_crosswalk             (dict): points of interest crosswalk
+
+    Returns:
+    --------
+    - seg_id (list or None): segment ids of the stream output mask, empty
+                             for all segments, None if stream output is
+                             written after routing
+    '''
+    stream_output = (output_parameters or {}).get("stream_output", None)
+    if not stream_output or not stream_output.get("stream_during_routing", False):
+        return None
+
+    mask_list = nhd_io.stream_output_mask_reader(stream_output.get("mask_output", None))
+    nex_id, seg_id = nhd_io.mask_find_seg(mask_list, nexus_dict, poi_crosswalk)
+
+    if diffusive_network_data or nex_id:
+        LOG.warning(
+            "stream_during_routing requires no diffusive domains and no nexus masks. "
+            "Stream output will be written after routing."
+        )
+        return None
+
+    return seg_id
+
+
+def stream_output_writer(
+    output_parameters,
+    t0,
+    dt,
+    nts,
+    seg_id,
+    link_lake_crosswalk = None,
+):
+    '''
+    Create a writer that receives stream output from the routing kernel
+    while a loop is being routed.
+
+    Arguments:
+    ----------
+    - output_parameters         (dict): output parameters
+    - t0                    (datetime): start of the routing loop
+    - dt                         (int): routing timestep (seconds)
+    - nts                        (int): number of timesteps in the loop
+    - seg_id                    (list): segment ids of the stream output
+                                        mask (see stream_during_routing_segments)
+    - link_lake_crosswalk       (dict): relates lake ids to outlet link ids
+
+    Returns:
+    --------
+    - writer (FlowVelDepthStreamWriter)
+    '''
+    stream_output = output_parameters["stream_output"]
+
+    return nhd_io.FlowVelDepthStreamWriter(
+        Path(stream_output['stream_output_directory']),
+        t0,
+        dt,
+        nts,
+        int(stream_output['stream_output_time']),
+        stream_output['stream_output_internal_frequency'],
+        seg_id = seg_id,
+        link_lake_crosswalk = link_lake_crosswalk,
+        buffer_size = stream_output.get("stream_buffer_size", 4),
+    )
+
+
+# folders of the output parameters holding the outputs of ensemble members,
+# see ensemble_output_parameters
+ENSEMBLE_OUTPUT_FOLDERS = {
+    "csv_output": "csv_output_folder",
+    "parquet_output": "parquet_output_folder",
+    "chanobs_output": "chanobs_output_directory",
+    "lite_restart": "lite_restart_output_directory",
+    "stream_output": "stream_output_directory",
+}
+
+
+def ensemble_output_parameters(output_parameters, member):
+    '''
+    Output parameters of an ensemble member, writing its outputs to a
+    member_<member> folder of every output folder. The outputs of member 0,
+    routed with the forcing of qlat_input_folder, go to the output folders
+    themselves.
+
+    Arguments:
+    ----------
+    - output_parameters         (dict): output parameters
+    - member                     (int): ensemble member
+
+    Returns:
+    --------
+    - member_parameters (dict): output parameters of the member
+    '''
+    if not output_parameters or member == 0:
+        return output_parameters
+
+    member_folder = f"member_{member}"
+
+    def _member_folder(folder):
+        folder = Path(folder) / member_folder
+        folder.mkdir(parents = True, exist_ok = True)
+        return folder
+
+    member_parameters = dict(output_parameters)
+    for output, folder_key in ENSEMBLE_OUTPUT_FOLDERS.items():
+        parameters = output_parameters.get(output, None)
+        if parameters and parameters.get(folder_key, None):
+            member_parameters[output] = dict(
+                parameters, **{folder_key: _member_folder(parameters[folder_key])}
+            )
+    for output in ("lakeout_output", "lastobs_output"):
+        if output_parameters.get(output, None):
+            member_parameters[output] = _member_folder(output_parameters[output])
+    test = output_parameters.get("test_output", None)
+    if test:
+        test = Path(test)
+        member_parameters["test_output"] = test.with_name(f"{test.stem}_{member_folder}{test.suffix}")
+
+    return member_parameters
+
+
+SOLVER_DIAGNOSTICS_COLUMNS = ["iterations", "retries", "nonconverged", "max_iterations"]
+
+
+def accumulate_solver_diagnostics(results, diagnostics = None):
+    '''
+    Add the Muskingum Cunge solver diagnostics of one routing loop to those
+    of the previous loops.
+
+    Arguments:
+    ----------
+    - results            (list): routing results, with the solver
+                                 diagnostics after the great lakes DA
+                                 results (see compute_nhd_routing_v02)
+    - diagnostics (pd.DataFrame): diagnostics of the previous loops, if any
+
+    Returns:
+    --------
+    - diagnostics (pd.DataFrame): iterations, retries, non-converged solves
+                                  and most iterations of a single solve,
+                                  indexed by segment id
+    '''
+    frames = [
+        pd.DataFrame(r[10], index=r[0], columns=SOLVER_DIAGNOSTICS_COLUMNS)
+        for r in results if len(r) > 10 and r[10] is not None
+    ]
+    if diagnostics is not None:
+        frames.append(diagnostics)
+    if not frames:
+        return diagnostics
+
+    return pd.concat(frames).groupby(level=0).agg(
+        {"iterations": "sum", "retries": "sum", "nonconverged": "sum", "max_iterations": "max"}
+    )
+
+
+def solver_diagnostics_report(diagnostics, top = 20, diagnostics_file = None):
+    '''
+    Log the segments whose Muskingum Cunge solution took the most solver
+    iterations, and optionally write the diagnostics of all segments.
+
+    Arguments:
+    ----------
+    - diagnostics (pd.DataFrame): see accumulate_solver_diagnostics
+    - top                  (int): number of segments logged
+    - diagnostics_file    (Path): csv file for all segments, ranked
+
+    Returns:
+    --------
+    - ranked (pd.DataFrame): diagnostics ranked by iterations, then retries
+    '''
+    ranked = diagnostics.sort_values(
+        ["iterations", "retries", "nonconverged"], ascending=False, kind="stable"
+    )
+    ranked.index.name = "feature_id"
+
+    total = ranked["iterations"].sum()
+    LOG.info('********** SOLVER DIAGNOSTICS **********')
+    LOG.info(
+        "%d segments, %d iterations, %d retries, %d non-converged solves"
+        % (len(ranked), total, ranked["retries"].sum(), ranked["nonconverged"].sum())
+    )
+    if total:
+        share = ranked["iterations"].head(top).sum() / total * 100
+        LOG.info("top %d segments account for %.1f%% of iterations" % (min(top, len(ranked)), share))
+    LOG.info("\n%s" % ranked.head(top).to_string())
+
+    if diagnostics_file:
+        ranked.to_csv(diagnostics_file)
+
+    return ranked
+
+
 def nwm_output_generator(
     run,
     results,
@@ -190,6 +429,8 @@ def nwm_output_generator(
     wbdyo = output_parameters.get("lakeout_output", None)
     stream_output = output_parameters.get("stream_output", None)
     lastobso = output_parameters.get("lastobs_output", None)
+    compact_fvd = output_parameters.get("compact_flowveldepth", False)
+    pack_fvd = output_parameters.get("pack_velocity_depth", False)
 
     if csv_output:
         csv_output_folder = output_parameters["csv_output"].get(
@@ -206,14 +447,19 @@ def nwm_output_generator(
     if csv_output_folder or parquet_output_folder or rsrto or chrto or chano or test or wbdyo or stream_output:
 
         start = time.time()
-        qvd_columns = pd.MultiIndex.from_product(
-            [range(nts), ["q", "v", "d"]]
-        ).to_flat_index()
+        if compact_fvd:
+            # per-variable arrays, velocity and depth optionally packed to int16.
+            # The routed arrays are released as they are copied, unless the
+            # parity check reads them later
+            flowveldepth = FlowVelDepth.from_results(
+                results, nts, pack=pack_fvd, release=isinstance(results, list) and not parity_set
+            )
+        else:
+            qvd_columns = pd.MultiIndex.from_product(
+                [range(nts), ["q", "v", "d"]]
+            ).to_flat_index()
 
-        flowveldepth = pd.concat(
-            [pd.DataFrame(r[1], index=r[0], columns=qvd_columns) for r in results],
-            copy=False,
-        )
+            flowveldepth = _results_frame(results, 1, qvd_columns)
 
         if wbdyo and not waterbodies_df.empty:
             
@@ -222,13 +468,13 @@ def nwm_output_generator(
                 [range(nts), ["i"]]
             ).to_flat_index()
 
-            wbdy = pd.concat(
-                [pd.DataFrame(r[6], index=r[0], columns=i_columns) for r in results],
-                copy=False,
-            )
+            wbdy = _results_frame(results, 6, i_columns)
 
             wbdy_id_list = waterbodies_df.index.values.tolist()
-            flow_df = flowveldepth.loc[wbdy_id_list]
+            if compact_fvd:
+                flow_df = flowveldepth.subset(wbdy_id_list).to_dataframe()
+            else:
+                flow_df = flowveldepth.loc[wbdy_id_list]
             wbdy = wbdy.loc[wbdy_id_list]
             
             # Replace synthetic waterbody IDs (made from duplicate IDs) with
@@ -311,7 +557,7 @@ def nwm_output_generator(
                 preRunLog.write("-----\n") 
                 preRunLog.write("Output of flow velocity depth files into folder: "+str(Path(stream_output_directory))+"\n") 
                 preRunLog.write("-----\n") 
-                nTimeBins = int( len(flowveldepth.columns)/3)
+                nTimeBins = int(flowveldepth.shape[1]/3)
                 fCalc = int(dt/60)
                 preRunLog.write("Internal computation of FVD data every "+str(stream_output_internal_frequency)+" minutes\n")
                 preRunLog.write("Output of FVD data every "+str(fCalc)+" minutes\n")
@@ -319,7 +565,10 @@ def nwm_output_generator(
             preRunLog.close()      
 
     if test:
-        flowveldepth.to_pickle(Path(test))
+        if compact_fvd:
+            flowveldepth.to_dataframe().to_pickle(Path(test))
+        else:
+            flowveldepth.to_pickle(Path(test))
     
     if wbdyo and not waterbodies_df.empty:
         
@@ -437,6 +686,10 @@ def nwm_output_generator(
 
         LOG.debug("writing CHRTOUT files took a total time of %s seconds." % (time.time() - start))
 
+    if compact_fvd and (csv_output_folder or parquet_output_folder):
+        # tabular writers have no array-based path, fall back to the wide DataFrame
+        flowveldepth = flowveldepth.to_dataframe()
+
     if csv_output_folder: 
     
         LOG.info("- writing flow, velocity, and depth results to .csv")
@@ -608,3 +861,73 @@ def nwm_output_generator(
         )
 
         LOG.debug("parity check complete in %s seconds." % (time.time() - start_time))
+
+
+class OutputService:
+    '''
+    Runs nwm_output_generator on a background thread so that the outputs of
+    one routing loop are written while the next loop is being routed.
+
+    At most `max_pending` loops are queued or being written at any time.
+    Submitting another loop blocks until the oldest one is written, which
+    bounds the memory held by results waiting for output. Errors raised by a
+    writer are re-raised in the main thread on the next submit or on close.
+
+    Arguments:
+    ----------
+    - max_pending (int): maximum number of loops waiting to be written
+
+    Attributes:
+    -----------
+    - write_time (float): seconds spent writing output in the background
+    - wait_time  (float): seconds the main thread was blocked waiting for
+                          output to be written
+    '''
+    def __init__(self, max_pending=1):
+        self.max_pending = max(int(max_pending), 1)
+        self.write_time = 0
+        self.wait_time = 0
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = deque()
+
+    def _run(self, args, kwargs):
+        start = time.time()
+        try:
+            nwm_output_generator(*args, **kwargs)
+        finally:
+            self.write_time += time.time() - start
+
+    def _wait_oldest(self):
+        start = time.time()
+        try:
+            self._pending.popleft().result()
+        finally:
+            self.wait_time += time.time() - start
+
+    def submit(self, *args, **kwargs):
+        '''
+        Queue a call of nwm_output_generator with the given arguments. The
+        arguments must not be modified by the caller afterwards.
+        '''
+        while self._pending and self._pending[0].done():
+            self._pending.popleft().result()
+        while len(self._pending) >= self.max_pending:
+            self._wait_oldest()
+        self._pending.append(self._executor.submit(self._run, args, kwargs))
+
+    @property
+    def overlap_time(self):
+        '''
+        Seconds of output writing that overlapped with other work.
+        '''
+        return max(self.write_time - self.wait_time, 0)
+
+    def close(self):
+        '''
+        Wait for all queued output to be written and stop the writer thread.
+        '''
+        try:
+            while self._pending:
+                self._wait_oldest()
+        finally:
+            self._executor.shutdown(wait=True)
@@ -85,7 +85,8 @@ mc_reach = Extension(
     libraries=[],
     library_dirs=[],
     extra_objects=[],
-    extra_compile_args=["-O2", "-g"],
+    extra_compile_args=["-O2", "-g", "-fopenmp"],
+    extra_link_args=["-fopenmp"],
 )
 
 simple_da = Extension(
@@ -100,6 +101,18 @@ simple_da = Extension(
     extra_compile_args=["-O2", "-g"],
 )
 
+reservoir_da = Extension(
+    "troute.routing.fast_reach.reservoir_da",
+    sources=[
+        "troute/routing/fast_reach/reservoir_da.{}".format(ext),
+    ],
+    include_dirs=[np.get_include()],
+    libraries=[],
+    library_dirs=[],
+    extra_objects=[],
+    extra_compile_args=["-O2", "-g"],
+)
+
 diffusive = Extension(
     "troute.routing.fast_reach.diffusive",
     sources=["troute/routing/fast_reach/diffusive.{}".format(ext)],
@@ -125,7 +138,7 @@ chxsec_lookuptable = Extension(
 )
 
 package_data = {"troute.fast_reach": ["reach.pxd", "fortran_wrappers.pxd", "utils.pxd"]}
-ext_modules = [reach, mc_reach, diffusive, simple_da, chxsec_lookuptable]
+ext_modules = [reach, mc_reach, diffusive, simple_da, reservoir_da, chxsec_lookuptable]
 
 if USE_CYTHON:
     from Cython.Build import cythonize
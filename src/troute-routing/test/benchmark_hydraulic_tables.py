@@ -0,0 +1,101 @@
+"""
+Parity report and throughput of the hydraulic table solution of the Muskingum
+Cunge kernel against the secant iteration, routing a synthetic hydrograph
+through a long reach of random segments:
+
+    python benchmark_hydraulic_tables.py [--segments 2000] [--timesteps 288]
+                                         [--size 64] [--max-depth 20]
+"""
+import argparse
+import time
+
+import numpy as np
+from troute.routing.fast_reach.reach import (
+    build_hydraulic_tables,
+    compute_reach,
+    compute_reach_table,
+)
+
+
+def random_reach(rng, nseg):
+    params = np.empty((nseg, 10), dtype="float32")
+    params[:, 1] = 300.0                                        # dt
+    params[:, 2] = rng.uniform(100, 5000, nseg)                 # dx
+    params[:, 3] = rng.uniform(1, 50, nseg)                     # bw
+    params[:, 4] = params[:, 3] * rng.uniform(1, 2, nseg)       # tw
+    params[:, 5] = params[:, 4] * rng.uniform(1, 3, nseg)       # twcc
+    params[:, 6] = rng.uniform(0.03, 0.08, nseg)                # n
+    params[:, 7] = rng.uniform(0.05, 0.15, nseg)                # ncc
+    params[:, 8] = rng.uniform(0.1, 1.0, nseg)                  # cs
+    params[:, 9] = rng.uniform(0.0001, 0.01, nseg)              # s0
+    return params
+
+
+def route(params, qlat, upstream, tables=None, states=None):
+    """
+    Route every timestep, or only one timestep from each of the given states
+    """
+    nseg, nsteps = qlat.shape
+    qvd = np.zeros((nsteps + 1, nseg, 3), dtype="float32")
+    qvd[0, :, 0] = upstream[0]
+    qvd[0, :, 2] = 0.5
+    elapsed = 0.0
+    for t in range(nsteps):
+        params[:, 0] = qlat[:, t]
+        boundary = upstream[t:t + 2]
+        previous = qvd[t] if states is None else states[t]
+        start = time.perf_counter()
+        if tables is None:
+            compute_reach(boundary, previous, params, qvd[t + 1])
+        else:
+            compute_reach_table(boundary, previous, params, tables, qvd[t + 1])
+        elapsed += time.perf_counter() - start
+    return qvd, elapsed
+
+
+def report(name, a, b):
+    print(name)
+    for k, variable in enumerate(("flow", "velocity", "depth")):
+        diff = np.abs(a[..., k] - b[..., k])
+        rel = diff / np.maximum(np.abs(a[..., k]), 1e-3)
+        p50, p99, p999 = np.percentile(rel, [50, 99, 99.9])
+        print(
+            f"  {variable:8s} relative difference: median {p50:.1e}, 99% {p99:.1e}, "
+            f"99.9% {p999:.1e}, max {rel.max():.1e} (max absolute {diff.max():.3g})"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--segments", type=int, default=2000)
+    parser.add_argument("--timesteps", type=int, default=288)
+    parser.add_argument("--size", type=int, default=64)
+    parser.add_argument("--max-depth", type=float, default=20.0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    params = random_reach(rng, args.segments)
+    # a flood wave from upstream on top of random lateral inflows
+    t = np.arange(args.timesteps + 1)
+    upstream = (10 + 200 * np.exp(-(((t - args.timesteps / 3) / (args.timesteps / 8)) ** 2))).astype("float32")
+    qlat = rng.uniform(0, 0.1, (args.segments, args.timesteps)).astype("float32")
+
+    start = time.perf_counter()
+    tables = build_hydraulic_tables(params[:, 3:10], args.size, args.max_depth)
+    build = time.perf_counter() - start
+
+    secant, secant_time = route(params, qlat, upstream)
+    table, table_time = route(params, qlat, upstream, tables)
+    one_step, _ = route(params, qlat, upstream, tables, states=secant)
+
+    steps = args.segments * args.timesteps
+    print(f"{args.segments} segments x {args.timesteps} timesteps, tables of {args.size} depths to {args.max_depth} m")
+    print(f"  table build      {build:8.3f} s")
+    print(f"  secant iteration {steps / secant_time:12.0f} segments/s")
+    print(f"  hydraulic tables {steps / table_time:12.0f} segments/s ({secant_time / table_time:.2f}x)")
+    report("one timestep from the same states", secant[1:], one_step[1:])
+    report("whole simulation", secant[1:], table[1:])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Routing time of the "by-network" and "by-subnetwork-jit-clustered" methods
+with the "loky" (worker processes) and "threading" backends, on a synthetic
+domain of random independent networks whose sizes follow a heavy tailed
+distribution, as those of the CONUS domain (about 2.7 million segments):
+
+    python benchmark_parallel_backend.py [--segments 200000] [--timesteps 12]
+                                         [--cores 8 32 64] [--loops 3]
+                                         [--methods by-network by-subnetwork-jit-clustered]
+
+Every configuration routes the same loop --loops times and reports the first
+loop, which builds the routing plans and the input layout, and the mean of
+the others. Flows of the threading backend are compared against those of
+loky. They differ slightly, as the secant iteration of the kernel starts from
+the residual of the previous segment routed on the same thread or process.
+"""
+import argparse
+import os
+import time
+from datetime import datetime
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import troute.nhd_network as nhd_network
+from troute.routing.compute import compute_nhd_routing_v02
+
+PARAM_COLS = ["dt", "bw", "tw", "twcc", "dx", "n", "ncc", "cs", "s0", "alt"]
+
+
+def random_domain(rng, nseg, max_network=None):
+    """
+    Random tree networks, draining segments into one of the few segments
+    created before them, with Pareto distributed sizes
+    """
+    max_network = max_network or max(nseg // 10, 1)
+    connections = {}
+    seg = 1
+    while seg <= nseg:
+        size = int(min(rng.pareto(1.2) * 20 + 1, max_network, nseg - seg + 1))
+        connections[seg] = []
+        for i in range(1, size):
+            connections[seg + i] = [seg + int(rng.integers(max(0, i - 4), i))]
+        seg += size
+    return connections
+
+
+def build_inputs(rng, connections, nts, dt):
+    rconn = nhd_network.reverse_network(connections)
+    independent_networks = nhd_network.reachable_network(rconn)
+    reaches_bytw = {
+        tw: nhd_network.dfs_decomposition(net, partial(nhd_network.split_at_junction, net))
+        for tw, net in independent_networks.items()
+    }
+
+    segs = np.fromiter(connections, dtype="int64")
+    n = segs.shape[0]
+    param_df = pd.DataFrame(index=segs, columns=PARAM_COLS, dtype="float32")
+    param_df["dt"] = dt
+    param_df["bw"] = rng.uniform(1, 50, n)
+    param_df["tw"] = param_df["bw"] * rng.uniform(1, 2, n)
+    param_df["twcc"] = param_df["tw"] * rng.uniform(1, 3, n)
+    param_df["dx"] = rng.uniform(100, 5000, n)
+    param_df["n"] = rng.uniform(0.03, 0.08, n)
+    param_df["ncc"] = rng.uniform(0.05, 0.15, n)
+    param_df["cs"] = rng.uniform(0.1, 1.0, n)
+    param_df["s0"] = rng.uniform(0.0001, 0.01, n)
+    param_df["alt"] = rng.uniform(0, 1000, n)
+
+    q0 = pd.DataFrame(
+        {"qu0": rng.uniform(0, 10, n), "qd0": rng.uniform(0, 10, n), "h0": 0.5},
+        index=segs,
+    )
+    qlats = pd.DataFrame(rng.uniform(0, 0.1, (n, nts)), index=segs)
+    return rconn, independent_networks, reaches_bytw, param_df, q0, qlats
+
+
+def route(domain, method, backend, cores, nts, dt, loops):
+    connections, rconn, independent_networks, reaches_bytw, param_df, q0, qlats = domain
+    empty = pd.DataFrame()
+    routing_plans = {}
+    cluster_inputs = {}
+    subnetwork_list = [None, None, None]
+    times = []
+    for loop in range(loops):
+        start = time.perf_counter()
+        results, subnetwork_list = compute_nhd_routing_v02(
+            connections,
+            rconn,
+            {},
+            reaches_bytw,
+            "V02-structured",
+            method,
+            10000,
+            cores,
+            datetime(2020, 1, 1),
+            dt,
+            nts,
+            1,
+            independent_networks,
+            param_df,
+            q0,
+            qlats,
+            empty,
+            empty,
+            empty,
+            empty,
+            empty,
+            empty,
+            empty,
+            empty,
+            empty,
+            empty,
+            empty,
+            {},
+            True,
+            False,
+            empty,
+            {},
+            empty,
+            False,
+            subnetwork_list,
+            from_files=False,
+            routing_plans=routing_plans,
+            cluster_inputs=cluster_inputs,
+            parallel_backend=backend,
+        )
+        times.append(time.perf_counter() - start)
+    flowveldepth = pd.concat(
+        [pd.DataFrame(r[1], index=r[0]) for r in results]
+    ).sort_index()
+    return times, flowveldepth
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--segments", type=int, default=200000)
+    parser.add_argument("--timesteps", type=int, default=12)
+    parser.add_argument("--cores", type=int, nargs="+", default=[8, 32, 64])
+    parser.add_argument("--loops", type=int, default=3)
+    parser.add_argument(
+        "--methods",
+        nargs="+",
+        default=["by-network", "by-subnetwork-jit-clustered"],
+    )
+    args = parser.parse_args()
+    dt = 300.0
+
+    rng = np.random.default_rng(0)
+    connections = random_domain(rng, args.segments)
+    rconn, independent_networks, reaches_bytw, param_df, q0, qlats = build_inputs(
+        rng, connections, args.timesteps, dt
+    )
+    domain = (connections, rconn, independent_networks, reaches_bytw, param_df, q0, qlats)
+    sizes = np.array([len(net) for net in independent_networks.values()])
+    print(
+        f"{len(connections)} segments in {len(independent_networks)} networks "
+        f"(largest {sizes.max()}), {args.timesteps} timesteps, {os.cpu_count()} cores available"
+    )
+
+    for method in args.methods:
+        for cores in args.cores:
+            reference = None
+            for backend in ("loky", "threading"):
+                times, flowveldepth = route(
+                    domain, method, backend, cores, args.timesteps, dt, args.loops
+                )
+                later = np.mean(times[1:]) if len(times) > 1 else float("nan")
+                line = (
+                    f"  {method:28s} {backend:9s} {cores:3d} workers: "
+                    f"first loop {times[0]:8.3f} s, following loops {later:8.3f} s"
+                )
+                if reference is None:
+                    reference = flowveldepth
+                else:
+                    diff = np.abs(flowveldepth.values - reference.values)[:, ::3]
+                    line += f", max flow difference {diff.max():.2g} m3/s"
+                print(line)
+
+
+if __name__ == "__main__":
+    main()
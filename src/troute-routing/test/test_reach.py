@@ -0,0 +1,179 @@
+import numpy as np
+import pytest
+from troute.routing.fast_reach.reach import (
+    build_hydraulic_tables,
+    compute_headwater_reach,
+    compute_reach_kernel,
+    compute_reach_kernel_table,
+    compute_reach_table,
+)
+
+
+def _random_reach(rng, nseg, nts_ql):
+    params = np.empty((11, nseg), dtype="float32")
+    params[0] = 300.0                                    # dt
+    params[1] = rng.uniform(100, 5000, nseg)             # dx
+    params[2] = rng.uniform(1, 50, nseg)                 # bw
+    params[3] = params[2] * rng.uniform(1, 2, nseg)      # tw
+    params[4] = params[3] * rng.uniform(1, 3, nseg)      # twcc
+    params[5] = rng.uniform(0.03, 0.08, nseg)            # n
+    params[6] = rng.uniform(0.05, 0.15, nseg)            # ncc
+    params[7] = rng.uniform(0.1, 1.0, nseg)              # cs
+    params[8] = rng.uniform(0.0001, 0.01, nseg)          # s0
+    params[9] = rng.uniform(0, 20, nseg)                 # qdp0
+    params[10] = rng.uniform(0, 2, nseg)                 # depthp0
+    qlat = rng.uniform(0, 5, (nseg, nts_ql)).astype("float32")
+    qlat[rng.random(qlat.shape) < 0.2] = 0.0
+    return params, qlat
+
+
+def _reset_secant_residual(params):
+    # the secant iteration starts from the residual left by the previous solve,
+    # which a solve from zero depth does not read
+    compute_reach_kernel(params[0, 0], 0.0, 0.0, 0.0, 1.0, *params[1:9, 0], 0.0, 0.0)
+
+
+def _route_by_timestep(params, qlat, nsteps, qts_subdivisions, assume_short_ts, by_segment=False):
+    # segment by segment at every timestep, as in compute_network_structured,
+    # or every timestep of a segment before the next, as in compute_headwater_reach
+    nseg = params.shape[1]
+    qvd = np.zeros((nseg, nsteps + 1, 3), dtype="float32")
+    qvd[:, 0, 0] = params[9]
+    qvd[:, 0, 2] = params[10]
+    steps = [(t, i) for t in range(1, nsteps + 1) for i in range(nseg)]
+    if by_segment:
+        steps.sort(key=lambda step: step[1])
+    _reset_secant_residual(params)
+    for t, i in steps:
+        qup = qvd[i - 1, t - 1, 0] if i else 0.0
+        quc = qvd[i - 1, t, 0] if i and not assume_short_ts else qup
+        rv = compute_reach_kernel(
+            params[0, i], qup, quc, qvd[i, t - 1, 0], qlat[i, (t - 1) // qts_subdivisions],
+            *params[1:9, i], 0.0, qvd[i, t - 1, 2],
+        )
+        qvd[i, t] = rv["qdc"], rv["velc"], rv["depthc"]
+    return qvd[:, 1:]
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("assume_short_ts", [False, True])
+def test_compute_headwater_reach(seed, assume_short_ts):
+    rng = np.random.default_rng(seed)
+    nseg, nsteps, qts_subdivisions = int(rng.integers(1, 12)), 48, 12
+    params, qlat = _random_reach(rng, nseg, nsteps // qts_subdivisions)
+    output = np.empty((nseg, nsteps, 3), dtype="float32")
+
+    _reset_secant_residual(params)
+    compute_headwater_reach(params, qlat, output, qts_subdivisions, assume_short_ts)
+
+    np.testing.assert_array_equal(
+        output,
+        _route_by_timestep(params, qlat, nsteps, qts_subdivisions, assume_short_ts, by_segment=True),
+    )
+
+
+def test_compute_headwater_reach_short_qlat():
+    params, qlat = _random_reach(np.random.default_rng(0), 3, 2)
+    with pytest.raises(ValueError):
+        compute_headwater_reach(params, qlat, np.empty((3, 12, 3), dtype="float32"), 1)
+
+
+def _geometry(params):
+    # bw, tw, twcc, n, ncc, cs, s0 of each segment, as build_hydraulic_tables expects
+    return np.ascontiguousarray(params[2:9].T)
+
+
+def test_build_hydraulic_tables():
+    params, _ = _random_reach(np.random.default_rng(0), 20, 1)
+    tables = np.asarray(build_hydraulic_tables(_geometry(params), 32, 15.0))
+
+    assert tables.shape == (20, 32, 4)
+    np.testing.assert_array_equal(tables[:, 0, :3], 0)
+    np.testing.assert_allclose(tables[:, -1, 0], 15.0)
+    assert (np.diff(tables[:, :, 0], axis=1) > 0).all()
+    # half of the depths within the channel, up to bankfull depth
+    z = 1 / params[7]
+    bfd = (params[3] - params[2]) / (2 * z)
+    np.testing.assert_allclose(tables[:, 15, 0], bfd, rtol=1e-5)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_compute_reach_kernel_table(seed):
+    # a step from the states of the secant iteration, which the table
+    # solution mostly matches to within the 1% tolerance of the secant
+    # iteration. Where the Muskingum Cunge discharge has several roots in
+    # depth, the two solutions may find different ones.
+    rng = np.random.default_rng(seed)
+    nseg, nsteps = 10, 48
+    params, qlat = _random_reach(rng, nseg, nsteps)
+    qvd = _route_by_timestep(params, qlat, nsteps, 1, False)
+    tables = np.asarray(build_hydraulic_tables(_geometry(params), 64, 20.0))
+
+    rel = []
+    for t in range(1, nsteps):
+        qup = quc = 0.0
+        for i in range(nseg):
+            args = (params[0, i], qup, quc, qvd[i, t - 1, 0], qlat[i, t], *params[1:9, i], 0.0, qvd[i, t - 1, 2])
+            expected = compute_reach_kernel(*args)
+            rv = compute_reach_kernel_table(*args, tables[i])
+            rel.append(abs(rv["qdc"] - expected["qdc"]) / max(expected["qdc"], 1e-3))
+            qup, quc = qvd[i, t - 1, 0], expected["qdc"]
+
+    rel = np.array(rel)
+    assert np.median(rel) < 1e-3
+    assert (rel < 1e-2).mean() > 0.85
+
+
+def test_compute_reach_kernel_table_fallback():
+    params, _ = _random_reach(np.random.default_rng(0), 1, 1)
+    tables = np.asarray(build_hydraulic_tables(_geometry(params), 16, 0.5))
+    for qup, quc, qdp, ql in ((500.0, 520.0, 480.0, 1.0), (0.0, 0.0, 0.0, 0.0)):
+        args = (params[0, 0], qup, quc, qdp, ql, *params[1:9, 0], 0.0, 1.0)
+        _reset_secant_residual(params)
+        rv = compute_reach_kernel_table(*args, tables[0])
+        _reset_secant_residual(params)
+        assert rv == compute_reach_kernel(*args)
+
+
+def test_compute_reach_table():
+    rng = np.random.default_rng(0)
+    nseg = 8
+    params, qlat = _random_reach(rng, nseg, 1)
+    parameter_inputs = np.ascontiguousarray(np.vstack([qlat[:, 0], params[:9]]).T)
+    previous_state = np.stack([params[9], np.zeros(nseg), params[10]], axis=1).astype("float32")
+    tables = np.asarray(build_hydraulic_tables(_geometry(params), 64, 20.0))
+    output = np.empty((nseg, 3), dtype="float32")
+
+    compute_reach_table(np.array([3.0, 4.0], dtype="float32"), previous_state, parameter_inputs, tables, output)
+
+    qup, quc = 3.0, 4.0
+    for i in range(nseg):
+        rv = compute_reach_kernel_table(
+            params[0, i], qup, quc, params[9, i], qlat[i, 0], *params[1:9, i], 0.0, params[10, i], tables[i]
+        )
+        np.testing.assert_array_equal(output[i], [rv["qdc"], rv["velc"], rv["depthc"]])
+        qup, quc = params[9, i], rv["qdc"]
+
+
+@pytest.mark.parametrize("seed", range(2))
+def test_compute_reach_kernel_diagnostics(seed):
+    rng = np.random.default_rng(seed)
+    nseg, nsteps = 10, 24
+    params, qlat = _random_reach(rng, nseg, nsteps)
+    qvd = _route_by_timestep(params, qlat, nsteps, 1, False)
+    tables = np.asarray(build_hydraulic_tables(_geometry(params), 64, 20.0))
+
+    for t in range(1, nsteps):
+        for i in range(nseg):
+            args = (params[0, i], 0.0, 0.0, qvd[i, t - 1, 0], qlat[i, t], *params[1:9, i], 0.0, qvd[i, t - 1, 2])
+            # diagnostics leave the solution unchanged
+            for kernel, extra in ((compute_reach_kernel, ()), (compute_reach_kernel_table, (tables[i],))):
+                _reset_secant_residual(params)
+                rv = kernel(*args, *extra, return_diagnostics=True)
+                _reset_secant_residual(params)
+                expected = kernel(*args, *extra)
+                assert {k: rv[k] for k in expected} == expected
+                assert rv["iterations"] >= 1
+                assert 0 <= rv["retries"] <= 4
+                # the secant iteration only gives up after its last retry
+                assert rv["converged"] or rv["retries"] == 4 or kernel is compute_reach_kernel_table
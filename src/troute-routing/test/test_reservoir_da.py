@@ -0,0 +1,125 @@
+import numpy as np
+import pytest
+from troute.routing.fast_reach.reservoir_hybrid_da import reservoir_hybrid_da
+from troute.routing.fast_reach.reservoir_RFC_da import reservoir_RFC_da
+from troute.routing.fast_reach.reservoir_GL_da import great_lakes_da
+from troute.routing.fast_reach.reservoir_da import (
+    reservoir_hybrid_da_py,
+    reservoir_RFC_da_py,
+    great_lakes_da_py,
+)
+
+n_trials = 2000
+
+
+def _assert_same(native, python, float32_positions=()):
+    # state values are stored in float32 arrays by the routing loop
+    assert len(native) == len(python)
+    for i, (a, b) in enumerate(zip(native, python)):
+        if i in float32_positions:
+            a, b = np.float32(a), np.float32(b)
+        if isinstance(b, str):
+            assert a == b
+        else:
+            np.testing.assert_array_equal(np.float64(a), np.float64(b))
+
+
+def _observations(rng, n, nan_fraction=0.3, negative_fraction=0.0):
+    obs = rng.uniform(0, 500, n).astype("float32")
+    obs[rng.random(n) < negative_fraction] *= -1
+    obs[rng.random(n) < nan_fraction] = np.nan
+    return obs
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_reservoir_hybrid_da_parity(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(n_trials):
+        n = int(rng.integers(1, 30))
+        gage_time = (np.arange(n) * 900 - rng.integers(0, n) * 900).astype("float32")
+        gage_obs = _observations(rng, n, negative_fraction=0.05)
+        lake_area = float(np.float32(rng.uniform(0.01, 50)))
+        orifice_elevation = float(np.float32(rng.uniform(0, 10)))
+        max_depth = orifice_elevation + float(np.float32(rng.uniform(0.1, 20)))
+        args = (
+            1234,                                                    # lake_number
+            gage_obs,
+            gage_time,
+            float(np.float32(rng.integers(0, 48) * 300)),           # now
+            np.float32(np.nan if rng.random() < 0.2 else rng.uniform(0, 500)),
+            np.float32(rng.integers(0, 4) * 86400 / 4),             # persistence_update_time
+            np.float32(rng.integers(0, 14)),                        # persistence_index
+            float(np.float32(rng.uniform(0, 500))),                 # levelpool_outflow
+            float(np.float32(rng.uniform(0, 1000))),                # inflow
+            300.0,                                                   # routing_period
+            lake_area,
+            max_depth,
+            orifice_elevation,
+            float(np.float32(rng.uniform(orifice_elevation - 1, max_depth + 1))),
+            float(rng.choice([1.0, 48.0])),                          # obs_lookback_hours
+            np.float32(rng.integers(-2, 48) * 300),                 # update_time
+        )
+        _assert_same(
+            reservoir_hybrid_da_py(*args),
+            reservoir_hybrid_da(*args),
+            float32_positions=(1, 3, 4, 5),
+        )
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_reservoir_RFC_da_parity(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(n_trials):
+        n = int(rng.integers(2, 40))
+        time_series = _observations(rng, n, nan_fraction=0.0, negative_fraction=0.3)
+        reservoir_type = int(rng.choice([4, 5]))
+        max_water_elevation = float(np.float32(rng.uniform(1, 20)))
+        args = (
+            bool(rng.random() < 0.8),                                # use_RFC
+            time_series,
+            int(rng.integers(0, n - 1)),                             # timeseries_idx
+            int(rng.integers(1, n)),                                 # total_counts
+            300.0,                                                   # routing_period
+            float(np.float32(rng.integers(0, 48) * 300)),           # current_time
+            np.float32(rng.integers(0, 12) * 3600),                 # update_time
+            np.int32(3600),                                          # DA_time_step
+            np.int32(rng.integers(0, 3)) * 24 * 60 * 60,             # rfc_forecast_persist_seconds
+            reservoir_type,
+            float(np.float32(rng.uniform(0, 1000))),                # inflow
+            float(np.float32(rng.uniform(0, max_water_elevation))), # water_elevation
+            float(np.float32(rng.uniform(0, 500))),                 # levelpool_outflow
+            float(np.float32(rng.uniform(0, max_water_elevation))), # levelpool_water_elevation
+            float(np.float32(rng.uniform(0.01, 50))) * 1.0e6,       # lake_area
+            max_water_elevation,
+            "2021-08-23_13.60min.01234567.RFCTimeSeries.ncdf",
+        )
+        _assert_same(
+            reservoir_RFC_da_py(*args),
+            reservoir_RFC_da(*args),
+            float32_positions=(2,),
+        )
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_great_lakes_da_parity(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(n_trials):
+        n = int(rng.integers(0, 20))
+        gage_time = np.sort(rng.integers(-30, 30, n) * 86400 // 2).astype("int32")
+        t0 = "20{:02d}-{:02d}-{:02d}_{:02d}:00:00".format(
+            int(rng.integers(10, 30)),
+            int(rng.integers(1, 13)),
+            int(rng.integers(1, 29)),
+            int(rng.integers(0, 24)),
+        )
+        args = (
+            _observations(rng, n),
+            gage_time,
+            np.float32(np.nan if rng.random() < 0.3 else rng.uniform(0, 500)),
+            np.int32(rng.integers(-20, 5) * 86400),                 # previous_assimilated_time
+            np.int32(rng.integers(0, 20) * 3600),                   # update_time
+            t0,
+            float(np.float32(rng.integers(0, 24 * 40) * 3600)),     # now
+            rng.uniform(0, 500, 12).astype("float32"),              # climatology_outflows
+        )
+        _assert_same(great_lakes_da_py(*args), great_lakes_da(*args))
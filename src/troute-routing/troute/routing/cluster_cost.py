@@ -0,0 +1,190 @@
+import heapq
+import json
+import math
+import time
+
+import numpy as np
+
+# static features of a cluster, see cluster_features
+FEATURES = ("segments", "reaches", "reservoirs", "da_reservoirs", "gages")
+
+
+def cluster_features(reach_list, gages, waterbodies, da_reservoirs):
+    '''
+    Static features driving the routing cost of a set of reaches.
+
+    Arguments
+    ---------
+    reach_list    (list): reaches, lists of segment ids
+    gages          (set): segments with streamflow DA gages
+    waterbodies    (set): waterbody ids
+    da_reservoirs  (set): waterbodies with hybrid or RFC reservoir DA
+
+    Returns
+    -------
+    features (ndarray): counts of FEATURES: Muskingum Cunge segments and
+                        reaches, level pool reservoirs, DA reservoirs and
+                        gaged segments
+    '''
+    features = np.zeros(len(FEATURES))
+    for reach in reach_list:
+        # waterbody reaches, as in compute._build_reach_type_list
+        if any(seg in waterbodies for seg in reach):
+            if any(seg in da_reservoirs for seg in reach):
+                features[3] += 1
+            else:
+                features[2] += 1
+            continue
+        features[0] += len(reach)
+        features[1] += 1
+        features[4] += sum(1 for seg in reach if seg in gages)
+    return features
+
+
+def timed_call(func, *args, **kwargs):
+    '''
+    Call func, returning its result and the seconds it took.
+    '''
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+class ClusterCostModel:
+    '''
+    Linear model of the routing time of a cluster of subnetworks, in the
+    cost of one plain Muskingum Cunge segment, from its cluster_features.
+
+    The default weights are rough relative costs. Routing times of the
+    clusters of a run are recorded with record, and calibrated returns a
+    model fitted to them, which can be saved for the next run.
+    Subclasses may override features or cost to model other effects.
+    '''
+
+    DEFAULT_WEIGHTS = {
+        "segments": 1.0,
+        "reaches": 1.0,
+        "reservoirs": 5.0,
+        "da_reservoirs": 20.0,
+        "gages": 2.0,
+    }
+
+    def __init__(self, weights=None):
+        '''
+        Arguments
+        ---------
+        weights (dict): cost of one unit of each of FEATURES, missing
+                        features take their DEFAULT_WEIGHTS
+        '''
+        weights = dict(self.DEFAULT_WEIGHTS, **(weights or {}))
+        self.weights = np.array([float(weights[f]) for f in FEATURES])
+        self.observations = []
+
+    def features(self, reach_list, gages, waterbodies, da_reservoirs):
+        '''
+        Features of a set of reaches, see cluster_features.
+        '''
+        return cluster_features(reach_list, gages, waterbodies, da_reservoirs)
+
+    def cost(self, features):
+        '''
+        Estimated cost of a cluster with the given features, in plain segments.
+        '''
+        return float(np.dot(self.weights, features)) / self.weights[0]
+
+    def key(self):
+        '''
+        Text identifying the model in the subnetwork cache key.
+        '''
+        return "cost:" + ",".join("%.6g" % w for w in self.weights / self.weights[0])
+
+    def record(self, features, seconds):
+        '''
+        Record the routing time of a cluster with the given features, in
+        seconds per routing timestep.
+        '''
+        self.observations.append((np.asarray(features, dtype=float), float(seconds)))
+
+    def calibrated(self):
+        '''
+        A model fitted by least squares to the recorded routing times. A
+        feature whose weight comes out negative is dropped from the fit,
+        features without observations keep their weight relative to the
+        segment weight.
+
+        Returns
+        -------
+        model (ClusterCostModel): self if nothing was recorded
+        '''
+        if not self.observations:
+            return self
+        X = np.array([f for f, _ in self.observations])
+        y = np.array([s for _, s in self.observations])
+
+        active = X.any(axis=0)
+        active[0] = True
+        fitted = np.zeros(len(FEATURES))
+        while True:
+            fitted[:] = 0.0
+            fitted[active] = np.linalg.lstsq(X[:, active], y, rcond=None)[0]
+            if (fitted[active] >= 0).all():
+                break
+            active &= fitted > 0
+            if not active.any():
+                return self
+
+        if fitted[0] <= 0:
+            return self
+        # unobserved features keep their weight relative to the segment weight
+        scale = fitted[0] / self.weights[0]
+        weights = np.where(X.any(axis=0), fitted, self.weights * scale)
+        return type(self)(dict(zip(FEATURES, weights.tolist())))
+
+    def save(self, path):
+        '''
+        Write the weights to a JSON file.
+        '''
+        with open(path, "w") as f:
+            json.dump(dict(zip(FEATURES, self.weights.tolist())), f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Read weights written by save.
+        '''
+        with open(path) as f:
+            return cls(json.load(f))
+
+
+def pack_by_cost(costs, target_cost):
+    '''
+    Pack independent subnetworks into clusters of about target_cost each,
+    assigning the most expensive remaining subnetwork to the cheapest
+    cluster so far (longest processing time first), so that clusters
+    finish at about the same time.
+
+    Arguments
+    ---------
+    costs        (dict): {subnetwork tailwater: estimated cost}
+    target_cost (float): cost of one cluster
+
+    Returns
+    -------
+    clusters (list): lists of subnetwork tailwaters, in the order of costs
+    '''
+    if not costs:
+        return [[]]
+    total = sum(costs.values())
+    n_clusters = max(1, min(len(costs), math.ceil(total / target_cost))) if target_cost > 0 else 1
+
+    heap = [(0.0, c) for c in range(n_clusters)]
+    members = [[] for _ in range(n_clusters)]
+    for tw in sorted(costs, key=costs.get, reverse=True):
+        load, c = heapq.heappop(heap)
+        members[c].append(tw)
+        heapq.heappush(heap, (load + costs[tw], c))
+
+    # keep the subnetworks of a cluster in their original order
+    position = {tw: i for i, tw in enumerate(costs)}
+    clusters = [sorted(m, key=position.get) for m in members if m]
+    return sorted(clusters, key=lambda m: position[m[0]])
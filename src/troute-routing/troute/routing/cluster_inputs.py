@@ -0,0 +1,281 @@
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+# waterbody parameters passed to the compute kernel, static ones first,
+# then the outflow and water elevation every loop starts from
+WATERBODY_PARAM_COLS = [
+    "LkArea",
+    "LkMxE",
+    "OrificeA",
+    "OrificeC",
+    "OrificeE",
+    "WeirC",
+    "WeirE",
+    "WeirL",
+    "ifd",
+]
+WATERBODY_STATE_COLS = ["qd0", "h0"]
+WATERBODY_COLS = WATERBODY_PARAM_COLS + WATERBODY_STATE_COLS
+
+
+class ClusterInputs:
+    '''
+    Inputs of the routing jobs of a network, partitioned once.
+
+    The segments of every job (a cluster of subnetworks, or an independent
+    network) are laid out as one contiguous, sorted block of rows, holding
+    the job's segments, its waterbodies and its offnetwork upstream
+    segments, the ordering compute_nhd_routing_v02 builds per job with
+    param_df_sub. Channel parameters are reindexed to this layout once,
+    initial conditions and lateral inflows once per loop, and the inputs
+    of a job are then slices of these arrays instead of label based
+    selections from the frames of the whole domain. Waterbody states and
+    streamflow DA frames are split by job once per loop as well.
+    '''
+
+    def __init__(
+        self,
+        jobs,
+        param_df,
+        param_cols,
+        waterbodies_df,
+        waterbody_types_df,
+    ):
+        '''
+        Arguments
+        ---------
+        jobs                  (dict): {job: (segments, offnetwork upstream
+                                      segments, reach list)}
+        param_df         (DataFrame): channel parameters, indexed by segment id
+        param_cols            (list): parameter columns passed to the compute kernel
+        waterbodies_df   (DataFrame): waterbody parameters, indexed by waterbody id
+        waterbody_types_df (DataFrame): reservoir type codes, indexed by waterbody id
+        '''
+        self.keys = list(jobs)
+        self.param_index = param_df.index.values.copy()
+        self.layout = {}
+        self.lake_layout = {}
+        self.waterbodies = {}
+        self.reach_types = {}
+        self.upstreams = {}
+        self._reach_segs = {}
+
+        param_index = param_df.index
+        wbody_index = waterbodies_df.index
+        blocks = []
+        lake_blocks = []
+        owned = []
+        owners = []
+        start = 0
+        lake_start = 0
+        for j, (job, (segs, offnetwork_upstreams, reach_list)) in enumerate(jobs.items()):
+            job_segs = np.fromiter(
+                set(segs).union(offnetwork_upstreams), dtype="int64"
+            )
+            in_param = param_index.get_indexer(job_segs) >= 0
+            in_wbody = wbody_index.get_indexer(job_segs) >= 0
+            block = np.sort(job_segs[in_param | in_wbody])
+            blocks.append(block)
+            self.layout[job] = (start, start + block.shape[0])
+            start += block.shape[0]
+
+            # segments of the job, no offnetwork upstreams, which take DA
+            own = block[~np.isin(block, np.fromiter(offnetwork_upstreams, dtype="int64"))]
+            owned.append(own)
+            owners.append(np.full(own.shape[0], j))
+
+            self.upstreams[job] = {
+                us: int(np.searchsorted(block, us)) for us in offnetwork_upstreams
+            }
+
+            # reaches with segments off the channel parameters are waterbodies,
+            # as in compute._build_reach_type_list
+            wbodies_segs = set(job_segs[~in_param].tolist())
+            self.reach_types[job] = [
+                (reach, 1 if wbodies_segs.intersection(reach) else 0)
+                for reach in reach_list
+            ]
+
+            # waterbodies in the order of waterbodies_df
+            lakes = block[wbody_index.get_indexer(block) >= 0]
+            lakes = lakes[np.argsort(wbody_index.get_indexer(lakes), kind="stable")]
+            lake_segs = lakes.tolist()
+            lake_blocks.append(lakes)
+            self.lake_layout[job] = (lake_start, lake_start + lakes.shape[0])
+            lake_start += lakes.shape[0]
+            waterbody_types_df_sub = pd.DataFrame()
+            if not waterbodies_df.empty and not waterbody_types_df.empty:
+                waterbody_types_df_sub = waterbody_types_df.loc[
+                    lake_segs, ["reservoir_type"]
+                ]
+            self.waterbodies[job] = (lake_segs, None, waterbody_types_df_sub)
+
+            # reach position of each segment, to find the reaches of DA gages
+            self._reach_segs[job] = (
+                np.fromiter(chain.from_iterable(reach_list), dtype="int64"),
+                np.repeat(np.arange(len(reach_list)), [len(r) for r in reach_list]),
+            )
+
+        self.index = np.concatenate(blocks) if blocks else np.empty(0, dtype="int64")
+        self.lake_index = (
+            np.concatenate(lake_blocks) if lake_blocks else np.empty(0, dtype="int64")
+        )
+        self.params = param_df.reindex(self.index)[param_cols].to_numpy(dtype="float32")
+        self._waterbody_rows = param_index.get_indexer(self.index) < 0
+        self.param_cols = np.array(param_cols, dtype=object)
+        self._owner_index = pd.Index(np.concatenate(owned) if owned else [])
+        self._owners = np.concatenate(owners) if owners else np.empty(0, dtype=int)
+        self.q0 = None
+        self.qlat = None
+        self.update_waterbodies(waterbodies_df)
+
+    def matches(self, keys, param_index):
+        '''
+        Whether the partition was built for these jobs and channel segments.
+        '''
+        return (
+            keys == self.keys
+            and len(param_index) == len(self.param_index)
+            and np.array_equal(param_index.values, self.param_index)
+        )
+
+    def update_waterbodies(self, waterbodies_df):
+        '''
+        Waterbody parameters and initial states of every job, in the order
+        of its waterbodies, selected once for all jobs.
+
+        Arguments
+        ---------
+        waterbodies_df (DataFrame): waterbody parameters, with the outflow (qd0)
+                                    and water elevation (h0) this loop starts
+                                    from, indexed by waterbody id
+        '''
+        values = None
+        if not waterbodies_df.empty:
+            values = waterbodies_df.loc[self.lake_index, WATERBODY_COLS].values
+        for job, (lake_segs, _, waterbody_types_df_sub) in self.waterbodies.items():
+            if values is not None:
+                lake_start, lake_stop = self.lake_layout[job]
+                waterbodies_values = values[lake_start:lake_stop]
+            else:
+                waterbodies_values = pd.DataFrame().values
+            self.waterbodies[job] = (lake_segs, waterbodies_values, waterbody_types_df_sub)
+
+    def update_forcing(self, q0, qlats, waterbodies_df):
+        '''
+        Lay out initial conditions and lateral inflows of this loop.
+
+        Arguments
+        ---------
+        q0             (DataFrame): initial flow, velocity and depth, indexed by segment id
+        qlats          (DataFrame): lateral inflows, indexed by segment id
+        waterbodies_df (DataFrame): waterbody parameters, with the outflow (qd0)
+                                    and water elevation (h0) this loop starts
+                                    from, indexed by waterbody id
+        '''
+        self.update_waterbodies(waterbodies_df)
+        self.q0 = q0.reindex(self.index).to_numpy(dtype="float32")
+        self.qlat = qlats.reindex(self.index).to_numpy(dtype="float32")
+        # waterbodies take no channel initial conditions or lateral inflows
+        self.q0[self._waterbody_rows] = np.nan
+        self.qlat[self._waterbody_rows] = np.nan
+
+    def job_arrays(self, job):
+        '''
+        Segment ids, channel parameters, initial conditions and lateral
+        inflows of a job, as views of the partitioned arrays.
+        '''
+        start, stop = self.layout[job]
+        return (
+            self.index[start:stop],
+            self.params[start:stop],
+            self.q0[start:stop],
+            self.qlat[start:stop],
+        )
+
+    def _rows_by_job(self, index):
+        '''
+        Positions of the rows of index owned by each job, in the order of index.
+        '''
+        positions = self._owner_index.get_indexer(index)
+        rows = np.flatnonzero(positions >= 0)
+        owners = self._owners[positions[rows]]
+        order = np.argsort(owners, kind="stable")
+        bounds = np.searchsorted(owners[order], np.arange(len(self.keys) + 1))
+        return {
+            self.keys[j]: rows[order[bounds[j]:bounds[j + 1]]]
+            for j in np.unique(owners)
+        }
+
+    def split_da(self, usgs_df, lastobs_df):
+        '''
+        Split streamflow DA frames by job, as _prep_da_dataframes and
+        _prep_da_positions_byreach select them for every job.
+
+        Arguments
+        ---------
+        usgs_df    (DataFrame): gage observations, indexed by segment id
+        lastobs_df (DataFrame): last valid observations, indexed by segment id
+
+        Returns
+        -------
+        da_by_job (dict): {job: [usgs values, DA positions by segment,
+                          by reach and by gage, lastobs discharge, time since
+                          lastobs]} the streamflow DA arguments of the compute
+                          kernel. Jobs without gages are left out, see empty_da.
+        '''
+        if usgs_df.empty and lastobs_df.empty:
+            return {}
+        gages = lastobs_df if not lastobs_df.empty else usgs_df
+        rows_by_job = self._rows_by_job(gages.index)
+        if not usgs_df.empty:
+            usgs_rows = usgs_df.index.get_indexer(gages.index)
+            usgs_values = usgs_df.to_numpy(dtype="float32")
+
+        da_by_job = {}
+        for job, rows in rows_by_job.items():
+            start, stop = self.layout[job]
+            gage_segs = gages.index.values[rows]
+            if usgs_df.empty:
+                usgs_sub = np.empty((rows.shape[0], 0), dtype="float32")
+            elif (usgs_rows[rows] < 0).any():
+                usgs_sub = usgs_df.loc[gage_segs].values.astype("float32")
+            else:
+                usgs_sub = usgs_values[usgs_rows[rows]]
+
+            lastobs_sub = lastobs_df.iloc[rows] if not lastobs_df.empty else None
+            lastobs = [
+                lastobs_sub[col].values.astype("float32")
+                if lastobs_sub is not None and col in lastobs_sub
+                else np.full(rows.shape[0], np.nan, dtype="float32")
+                for col in ("lastobs_discharge", "time_since_lastobs")
+            ]
+
+            reach_segs, reach_keys = self._reach_segs[job]
+            gaged = np.isin(reach_segs, gage_segs)
+            gage_positions = pd.Index(gage_segs).get_indexer(reach_segs[gaged])
+
+            da_by_job[job] = [
+                usgs_sub,
+                np.searchsorted(self.index[start:stop], gage_segs).astype("int32"),
+                reach_keys[gaged].astype("int32"),
+                gage_positions.astype("int32"),
+                *lastobs,
+            ]
+        return da_by_job
+
+    @staticmethod
+    def empty_da(usgs_df, lastobs_df):
+        '''
+        Streamflow DA arguments of a job without gages, see split_da.
+        '''
+        return [
+            np.empty((0, usgs_df.shape[1] if not usgs_df.empty else 0), dtype="float32"),
+            np.empty(0, dtype="int32"),
+            np.empty(0, dtype="int32"),
+            np.empty(0, dtype="int32"),
+            np.empty(0, dtype="float32"),
+            np.empty(0, dtype="float32"),
+        ]
@@ -7,11 +7,30 @@ import time
 import pandas as pd
 import numpy as np
 import copy
+import hashlib
 import os.path
 
 import troute.nhd_network as nhd_network
-from troute.routing.fast_reach.mc_reach import compute_network_structured
+from troute.routing.fast_reach.mc_reach import (
+    RoutingPlan,
+    compute_network_structured,
+)
 import troute.routing.diffusive_utils_v02 as diff_utils
+from troute.routing.shared_pool import SharedMemoryPool
+from troute.routing.subnetwork_cache import load_or_build_subnetworks
+from troute.routing.diffusive_cache import (
+    load_or_build_static_inputs,
+    load_or_build_chxsec_lookuptable,
+    static_inputs_key,
+)
+from troute.routing.cluster_cost import pack_by_cost, timed_call
+from troute.routing.cluster_inputs import WATERBODY_COLS, ClusterInputs
+from troute.routing.scheduler import (
+    barrier_dependencies,
+    cluster_dependencies,
+    job_executor,
+    run_scheduled,
+)
 from troute.routing.fast_reach import diffusive
 
 import logging
@@ -37,6 +56,28 @@ def _format_qlat_start_time(qlat_start_time):
         return qlat_start_time
 
 
+def _tailwater_results(results, tailwaters):
+    '''
+    Flowveldepth rows of the tailwater segments of a subnetwork, located by
+    one search of the sorted segment ids returned with its results.
+
+    Arguments
+    ---------
+    results    (tuple): compute_network_structured results of the subnetwork
+    tailwaters (list): tailwater segment ids
+
+    Returns
+    -------
+    {tailwater: flowveldepth row}
+    '''
+    ids, flowveldepth = results[0], results[1]
+    tailwaters = np.fromiter(tailwaters, dtype=ids.dtype)
+    positions = np.searchsorted(ids, tailwaters)
+    if (positions >= len(ids)).any() or (ids[np.minimum(positions, len(ids) - 1)] != tailwaters).any():
+        raise ValueError("tailwater segments missing from the subnetwork results")
+    return dict(zip(tailwaters.tolist(), flowveldepth[positions]))
+
+
 def _build_reach_type_list(reach_list, wbodies_segs):
 
     reach_type_list = [
@@ -295,6 +336,611 @@ def _prep_reservoir_da_dataframes(reservoir_usgs_df,
         )
 
 
+def _prep_reservoir_da_job_args(
+    reservoir_usgs_df,
+    reservoir_usgs_param_df,
+    reservoir_usace_df,
+    reservoir_usace_param_df,
+    reservoir_rfc_df,
+    reservoir_rfc_param_df,
+    great_lakes_df,
+    great_lakes_param_df,
+    great_lakes_climatology_df,
+    waterbody_types_df_sub,
+    t0,
+    from_files,
+    exclude_segments=None,
+):
+    '''
+    Build the reservoir DA arguments of the compute kernel for a single job,
+    i.e. the arguments from reservoir_usgs_obs through great_lakes_climatology
+    of compute_network_structured.
+
+    Arguments
+    ---------
+    See _prep_reservoir_da_dataframes.
+
+    Returns
+    -------
+    waterbody_types_df_sub (DataFrame): reservoir type codes, updated for DA availability
+    reservoir_da_args           (list): positional compute kernel arguments
+    '''
+    (reservoir_usgs_df_sub, 
+     reservoir_usgs_df_time,
+     reservoir_usgs_update_time,
+     reservoir_usgs_prev_persisted_flow,
+     reservoir_usgs_persistence_update_time,
+     reservoir_usgs_persistence_index,
+     reservoir_usace_df_sub, 
+     reservoir_usace_df_time,
+     reservoir_usace_update_time,
+     reservoir_usace_prev_persisted_flow,
+     reservoir_usace_persistence_update_time,
+     reservoir_usace_persistence_index,
+     reservoir_rfc_df_sub, 
+     reservoir_rfc_totalCounts, 
+     reservoir_rfc_file, 
+     reservoir_rfc_use_forecast, 
+     reservoir_rfc_timeseries_idx, 
+     reservoir_rfc_update_time, 
+     reservoir_rfc_da_timestep, 
+     reservoir_rfc_persist_days,
+     gl_df_sub, 
+     gl_parm_lake_id_sub, 
+     gl_param_flows_sub, 
+     gl_param_time_sub, 
+     gl_param_update_time_sub,
+     gl_climatology_df_sub,
+     waterbody_types_df_sub,
+     ) = _prep_reservoir_da_dataframes(
+        reservoir_usgs_df,
+        reservoir_usgs_param_df,
+        reservoir_usace_df, 
+        reservoir_usace_param_df,
+        reservoir_rfc_df,
+        reservoir_rfc_param_df,
+        great_lakes_df,
+        great_lakes_param_df,
+        great_lakes_climatology_df,
+        waterbody_types_df_sub, 
+        t0,
+        from_files,
+        exclude_segments
+    )
+
+    reservoir_da_args = [
+        # USGS Hybrid Reservoir DA data
+        reservoir_usgs_df_sub.values.astype("float32"),
+        reservoir_usgs_df_sub.index.values.astype("int32"),
+        reservoir_usgs_df_time.astype('float32'),
+        reservoir_usgs_update_time.astype('float32'),
+        reservoir_usgs_prev_persisted_flow.astype('float32'),
+        reservoir_usgs_persistence_update_time.astype('float32'),
+        reservoir_usgs_persistence_index.astype('float32'),
+        # USACE Hybrid Reservoir DA data
+        reservoir_usace_df_sub.values.astype("float32"),
+        reservoir_usace_df_sub.index.values.astype("int32"),
+        reservoir_usace_df_time.astype('float32'),
+        reservoir_usace_update_time.astype("float32"),
+        reservoir_usace_prev_persisted_flow.astype("float32"),
+        reservoir_usace_persistence_update_time.astype("float32"),
+        reservoir_usace_persistence_index.astype("float32"),
+        # RFC Reservoir DA data
+        reservoir_rfc_df_sub.values.astype("float32"),
+        reservoir_rfc_df_sub.index.values.astype("int32"),
+        reservoir_rfc_totalCounts.astype("int32"),
+        reservoir_rfc_file,
+        reservoir_rfc_use_forecast.astype("int32"),
+        reservoir_rfc_timeseries_idx.astype("int32"),
+        reservoir_rfc_update_time.astype("float32"),
+        reservoir_rfc_da_timestep.astype("int32"),
+        reservoir_rfc_persist_days.astype("int32"),
+        # Great Lakes DA data
+        gl_df_sub.lake_id.values.astype("int32"),
+        gl_df_sub.time.values.astype("int32"),
+        gl_df_sub.Discharge.values.astype("float32"),
+        gl_parm_lake_id_sub.astype("int32"),
+        gl_param_flows_sub.astype("float32"),
+        gl_param_time_sub.astype("int32"),
+        gl_param_update_time_sub.astype("int32"),
+        gl_climatology_df_sub.values.astype("float32"),
+    ]
+
+    return waterbody_types_df_sub, reservoir_da_args
+
+
+# inputs of compute_nhd_routing_v02 an ensemble member can replace, the
+# network, channel parameters and observations are shared by the members
+ENSEMBLE_MEMBER_INPUTS = (
+    "q0",
+    "qlats",
+    "waterbodies_df",
+    "lastobs_df",
+    "reservoir_usgs_param_df",
+    "reservoir_usace_param_df",
+    "reservoir_rfc_param_df",
+    "great_lakes_param_df",
+)
+
+# positions of the compute kernel arguments holding the rows of every member,
+# initial conditions, lateral inflows, waterbody parameters, last observations
+# and the reservoir DA states, see compute_network_structured
+_MEMBER_KERNEL_ARGS = (8, 9, 11, 20, 21) + tuple(
+    23 + i for i in (3, 4, 5, 6, 10, 11, 12, 13, 19, 20, 27, 28, 29)
+)
+
+
+def _ensemble_members(members, **inputs):
+    '''
+    Inputs of every ensemble member routed by a call of compute_nhd_routing_v02.
+
+    Arguments
+    ---------
+    members (list): {input: value} the inputs of every member, see
+                    ENSEMBLE_MEMBER_INPUTS, inputs a member leaves out are
+                    those of the call. None routes the inputs of the call only.
+    inputs        : the ENSEMBLE_MEMBER_INPUTS of the call
+
+    Returns
+    -------
+    member_inputs (list): {input: value} the inputs of every member
+    '''
+    if members is None:
+        return [inputs]
+    if not members:
+        raise ValueError("Expected at least one ensemble member")
+    member_inputs = []
+    for member in members:
+        unknown = set(member).difference(ENSEMBLE_MEMBER_INPUTS)
+        if unknown:
+            raise ValueError(f"Ensemble members cannot replace {sorted(unknown)}")
+        member_inputs.append(dict(inputs, **member))
+
+    # the kernel takes the last observations of every member at the gages of the first
+    gages = member_inputs[0]["lastobs_df"].index
+    for member in member_inputs[1:]:
+        member["lastobs_df"] = member["lastobs_df"].reindex(gages)
+    return member_inputs
+
+
+def _stack_member_args(member_args):
+    '''
+    Compute kernel arguments of ensemble members routed together, the rows of
+    every member one member after the other, see compute_network_structured.
+
+    Arguments
+    ---------
+    member_args (list): positional compute kernel arguments of every member
+
+    Returns
+    -------
+    args (list): positional compute kernel arguments of the members, the
+                 arguments shared by the members are those of the first
+    '''
+    args = list(member_args[0])
+    if len(member_args) > 1:
+        for position in _MEMBER_KERNEL_ARGS:
+            args[position] = np.concatenate([a[position] for a in member_args])
+    return args
+
+
+def _member_results(results, n_members):
+    '''
+    Results of every member, from the results of jobs routing n_members
+    ensemble members together.
+
+    Arguments
+    ---------
+    results  (list): results of every job, a list of the results of every
+                     member if n_members > 1
+    n_members (int): number of ensemble members
+
+    Returns
+    -------
+    member_results (list): results of every job, of every member
+    '''
+    if n_members == 1:
+        return [results]
+    return [[result[m] for result in results] for m in range(n_members)]
+
+
+def _get_cluster_inputs(
+    cluster_inputs,
+    parallel_compute_method,
+    keys,
+    build_jobs,
+    param_df,
+    param_cols,
+    waterbodies_df,
+    waterbody_types_df,
+):
+    '''
+    Partitioned inputs of the jobs of a parallel compute method, built on
+    the first loop and kept in cluster_inputs for the following ones.
+
+    Arguments
+    ---------
+    cluster_inputs (dict or None): {parallel_compute_method: ClusterInputs},
+                                   None builds the partition for this call only
+    keys                   (list): jobs, in the order they are routed
+    build_jobs         (function): returns the jobs argument of ClusterInputs
+    See ClusterInputs for the rest.
+
+    Returns
+    -------
+    inputs (ClusterInputs)
+    '''
+    inputs = None if cluster_inputs is None else cluster_inputs.get(parallel_compute_method)
+    if inputs is None or not inputs.matches(keys, param_df.index):
+        inputs = ClusterInputs(
+            build_jobs(), param_df, param_cols, waterbodies_df, waterbody_types_df
+        )
+        if cluster_inputs is not None:
+            cluster_inputs[parallel_compute_method] = inputs
+    return inputs
+
+
+def _cluster_jobs(reaches_ordered_bysubntw_clustered, rconn):
+    '''
+    Jobs of the clustered subnetworks, as the jobs argument of ClusterInputs,
+    upstream orders first.
+    '''
+    jobs = {}
+    for order in sorted(reaches_ordered_bysubntw_clustered, reverse=True):
+        for cluster, clustered_subns in reaches_ordered_bysubntw_clustered[order].items():
+            segs = clustered_subns["segs"]
+            segs_set = set(segs)
+            offnetwork_upstreams = {
+                us for seg in segs for us in rconn[seg] if us not in segs_set
+            }
+            jobs[(order, cluster)] = (
+                segs,
+                offnetwork_upstreams,
+                clustered_subns["subn_reach_list"],
+            )
+    return jobs
+
+
+def _subnetwork_jobs(reaches_ordered_bysubntw, rconn):
+    '''
+    Jobs of the subnetworks, as the jobs argument of ClusterInputs, upstream
+    orders first.
+    '''
+    jobs = {}
+    for order in sorted(reaches_ordered_bysubntw, reverse=True):
+        for subn_tw, subn_reach_list in reaches_ordered_bysubntw[order].items():
+            segs = list(chain.from_iterable(subn_reach_list))
+            segs_set = set(segs)
+            offnetwork_upstreams = {
+                us for seg in segs for us in rconn[seg] if us not in segs_set
+            }
+            jobs[(order, subn_tw)] = (segs, offnetwork_upstreams, subn_reach_list)
+    return jobs
+
+
+def _cost_model_context(usgs_df, waterbodies_df, waterbody_types_df):
+    '''
+    Gaged segments, waterbodies and DA reservoirs of the network, as
+    passed to ClusterCostModel.features.
+    '''
+    gages = set(usgs_df.index.values) if not usgs_df.empty else set()
+    waterbodies = set(waterbodies_df.index.values) if not waterbodies_df.empty else set()
+    da_reservoirs = set()
+    if waterbody_types_df is not None and not waterbody_types_df.empty:
+        # USGS and USACE hybrid, RFC and glacially dammed lake reservoirs
+        da_reservoirs = set(
+            waterbody_types_df.index[waterbody_types_df["reservoir_type"].between(2, 5)]
+        )
+    return gages, waterbodies, da_reservoirs
+
+
+def _record_cluster_timings(cost_model, context, clusters, timed_results, nts):
+    '''
+    Record the routing time per timestep of each cluster with the cost model.
+
+    Arguments
+    ---------
+    cost_model  (ClusterCostModel): model recording the timings
+    context                (tuple): see _cost_model_context
+    clusters                (dict): {cluster: clustered subnetworks} of one order
+    timed_results           (list): (results, seconds) of each cluster, in the order of clusters
+    nts                      (int): number of routing timesteps
+    '''
+    for clustered_subns, (_, seconds) in zip(clusters.values(), timed_results):
+        cost_model.record(
+            cost_model.features(clustered_subns["subn_reach_list"], *context),
+            seconds / max(nts, 1),
+        )
+
+
+def _batch_networks(costs, batch_size):
+    '''
+    Order independent networks longest first and batch the small ones, so
+    that the largest networks start first and the many small networks of
+    a domain do not pay the overhead of one job each.
+
+    Arguments
+    ---------
+    costs        (dict): {network tailwater: estimated cost}
+    batch_size  (float): networks costing less are combined into batches
+                         of about this cost, 0 does not batch
+
+    Returns
+    -------
+    batches (list): lists of network tailwaters, longest batch first
+    '''
+    batches = []
+    small = []
+    small_cost = 0.0
+    for tw in sorted(costs, key=costs.get, reverse=True):
+        if costs[tw] >= batch_size:
+            batches.append([tw])
+            continue
+        if small and small_cost + costs[tw] > batch_size:
+            batches.append(small)
+            small, small_cost = [], 0.0
+        small.append(tw)
+        small_cost += costs[tw]
+    if small:
+        batches.append(small)
+    return batches
+
+
+def _cached_plan(
+    routing_plans, key, reaches_wTypes, upstream_connections, data_idx, data_cols, data_values
+):
+    '''
+    Routing plan of a job from routing_plans, built on the first loop and
+    rebuilt if the topology, segments or channel parameters of the job changed.
+
+    Arguments
+    ---------
+    routing_plans (dict): {job: RoutingPlan}, updated in place
+    key                 : job, a network tailwater or a cluster
+    the others          : RoutingPlan arguments
+
+    Returns
+    -------
+    plan (RoutingPlan): plan of the job
+    '''
+    plan = routing_plans.get(key)
+    if plan is None or not plan.matches(
+        reaches_wTypes, upstream_connections, data_idx, data_cols, data_values
+    ):
+        plan = routing_plans[key] = RoutingPlan(
+            reaches_wTypes,
+            upstream_connections,
+            data_idx,
+            data_cols,
+            data_values,
+        )
+    return plan
+
+
+def _compute_network_batch(jobs):
+    '''
+    Run the network jobs of a batch, as built by delayed.
+
+    Returns
+    -------
+    results (list): (result, seconds) of each job
+    '''
+    return [timed_call(func, *args, **kwargs) for func, args, kwargs in jobs]
+
+
+def _report_network_timings(batches, timed_batches, costs):
+    '''
+    Log the routing time of each by-network job and network, to tune
+    the batching of networks.
+
+    Arguments
+    ---------
+    batches       (list): lists of network tailwaters of each job
+    timed_batches (list): (result, seconds) of each network of each job
+    costs         (dict): {network tailwater: estimated cost}
+    '''
+    job_seconds = [sum(seconds for _, seconds in timed) for timed in timed_batches]
+    for batch, timed, seconds in zip(batches, timed_batches, job_seconds):
+        LOG.debug(
+            "by-network job of %d networks, estimated cost %s: %s seconds"
+            % (len(batch), sum(costs[tw] for tw in batch), seconds)
+        )
+        for tw, (_, network_seconds) in zip(batch, timed):
+            LOG.debug("  network %s, estimated cost %s: %s seconds" % (tw, costs[tw], network_seconds))
+    if job_seconds:
+        LOG.info(
+            "by-network: %d networks in %d jobs, longest job %s seconds, mean %s seconds"
+            % (len(costs), len(batches), max(job_seconds), np.mean(job_seconds))
+        )
+
+
+def _build_clustered_subnetworks(
+    connections,
+    rconn,
+    subnetwork_target_size,
+    independent_networks,
+    usgs_df,
+    waterbodies_df,
+    cost_model=None,
+    waterbody_types_df=None,
+):
+    '''
+    Decompose the network into ordered subnetworks and pack the subnetworks of
+    each order into clusters of roughly subnetwork_target_size segments. With
+    a cost_model (see cluster_cost.ClusterCostModel), clusters are packed to
+    even out their estimated routing cost instead, in units of plain segments.
+
+    Returns
+    -------
+    subnetworks_only_ordered_jit       (dict): {order: {subnetwork tailwater: segments}}
+    reaches_ordered_bysubntw_clustered (dict): {order: {cluster: {'segs', 'upstreams', 'tw', 'subn_reach_list'}}}
+    '''
+    networks_with_subnetworks_ordered_jit = nhd_network.build_subnetworks(
+        connections, rconn, subnetwork_target_size
+    )
+    subnetworks_only_ordered_jit = defaultdict(dict)
+    subnetworks = defaultdict(dict)
+    for tw, ordered_network in networks_with_subnetworks_ordered_jit.items():
+        intw = independent_networks[tw]
+        for order, subnet_sets in ordered_network.items():
+            subnetworks_only_ordered_jit[order].update(subnet_sets)
+            for subn_tw, subnetwork in subnet_sets.items():
+                subnetworks[subn_tw] = {k: intw[k] for k in subnetwork}
+
+    reaches_ordered_bysubntw = defaultdict(dict)
+    for order, ordered_subn_dict in subnetworks_only_ordered_jit.items():
+        for subn_tw, subnet in ordered_subn_dict.items():
+            conn_subn = {k: connections[k] for k in subnet if k in connections}
+            rconn_subn = {k: rconn[k] for k in subnet if k in rconn}
+
+            if not waterbodies_df.empty and not usgs_df.empty:
+                path_func = partial(
+                    nhd_network.split_at_gages_waterbodies_and_junctions,
+                    set(usgs_df.index.values),
+                    set(waterbodies_df.index.values),
+                    rconn_subn
+                    )
+
+            elif waterbodies_df.empty and not usgs_df.empty:
+                path_func = partial(
+                    nhd_network.split_at_gages_and_junctions,
+                    set(usgs_df.index.values),
+                    rconn_subn
+                    )
+
+            elif not waterbodies_df.empty and usgs_df.empty:
+                path_func = partial(
+                    nhd_network.split_at_waterbodies_and_junctions,
+                    set(waterbodies_df.index.values),
+                    rconn_subn
+                    )
+
+            else:
+                path_func = partial(nhd_network.split_at_junction, rconn_subn)
+
+            reaches_ordered_bysubntw[order][
+                subn_tw
+            ] = nhd_network.dfs_decomposition(rconn_subn, path_func)
+
+    cluster_threshold = 0.65  # When a job has a total segment count 65% of the target size, compute it
+    # Otherwise, keep adding reaches.
+
+    reaches_ordered_bysubntw_clustered = defaultdict(dict)
+
+    if cost_model is not None:
+        context = _cost_model_context(usgs_df, waterbodies_df, waterbody_types_df)
+        for order in subnetworks_only_ordered_jit:
+            costs = {
+                subn_tw: cost_model.cost(cost_model.features(subn_reach_list, *context))
+                for subn_tw, subn_reach_list in reaches_ordered_bysubntw[order].items()
+            }
+            for cluster, subn_tws in enumerate(
+                pack_by_cost(costs, cluster_threshold * subnetwork_target_size)
+            ):
+                clustered_subns = {
+                    "segs": [],
+                    "upstreams": {},
+                    "tw": [],
+                    "subn_reach_list": [],
+                }
+                for subn_tw in subn_tws:
+                    subn_reach_list = reaches_ordered_bysubntw[order][subn_tw]
+                    clustered_subns["segs"].extend(chain.from_iterable(subn_reach_list))
+                    clustered_subns["upstreams"].update(subnetworks[subn_tw])
+                    clustered_subns["tw"].append(subn_tw)
+                    clustered_subns["subn_reach_list"].extend(subn_reach_list)
+                reaches_ordered_bysubntw_clustered[order][cluster] = clustered_subns
+
+        return [subnetworks_only_ordered_jit, reaches_ordered_bysubntw_clustered]
+
+    for order in subnetworks_only_ordered_jit:
+        cluster = 0
+        reaches_ordered_bysubntw_clustered[order][cluster] = {
+            "segs": [],
+            "upstreams": {},
+            "tw": [],
+            "subn_reach_list": [],
+        }
+        for twi, (subn_tw, subn_reach_list) in enumerate(
+            reaches_ordered_bysubntw[order].items(), 1
+        ):
+            segs = list(chain.from_iterable(subn_reach_list))
+            reaches_ordered_bysubntw_clustered[order][cluster]["segs"].extend(segs)
+            reaches_ordered_bysubntw_clustered[order][cluster]["upstreams"].update(
+                subnetworks[subn_tw]
+            )
+
+            reaches_ordered_bysubntw_clustered[order][cluster]["tw"].append(subn_tw)
+            reaches_ordered_bysubntw_clustered[order][cluster][
+                "subn_reach_list"
+            ].extend(subn_reach_list)
+
+            if (
+                len(reaches_ordered_bysubntw_clustered[order][cluster]["segs"])
+                >= cluster_threshold * subnetwork_target_size
+            ) and (
+                twi
+                < len(reaches_ordered_bysubntw[order])
+                # i.e., we haven't reached the end
+                # TODO: perhaps this should be a while condition...
+            ):
+                cluster += 1
+                reaches_ordered_bysubntw_clustered[order][cluster] = {
+                    "segs": [],
+                    "upstreams": {},
+                    "tw": [],
+                    "subn_reach_list": [],
+                }
+
+    return [subnetworks_only_ordered_jit, reaches_ordered_bysubntw_clustered]
+
+
+def _get_clustered_subnetworks(
+    connections,
+    rconn,
+    subnetwork_target_size,
+    independent_networks,
+    usgs_df,
+    waterbodies_df,
+    subnetwork_cache_dir=None,
+    cost_model=None,
+    waterbody_types_df=None,
+):
+    '''
+    Return clustered subnetworks, reading them from the on-disk cache in
+    subnetwork_cache_dir when one is given. See _build_clustered_subnetworks.
+    '''
+    build = partial(
+        _build_clustered_subnetworks,
+        connections,
+        rconn,
+        subnetwork_target_size,
+        independent_networks,
+        usgs_df,
+        waterbodies_df,
+        cost_model,
+        waterbody_types_df,
+    )
+    if not subnetwork_cache_dir:
+        return build()
+
+    packing = ""
+    if cost_model is not None:
+        _, _, da_reservoirs = _cost_model_context(usgs_df, waterbodies_df, waterbody_types_df)
+        packing = "%s;%s" % (cost_model.key(), sorted(da_reservoirs))
+
+    return load_or_build_subnetworks(
+        subnetwork_cache_dir,
+        build,
+        connections,
+        # reaches are only split where the frames hold data, see _build_clustered_subnetworks
+        usgs_df.index.values if not usgs_df.empty else [],
+        waterbodies_df.index.values if not waterbodies_df.empty else [],
+        subnetwork_target_size,
+        packing,
+    )
+
+
 def compute_log_mc(
     fileName,
     connections,
@@ -420,7 +1066,7 @@ def compute_log_diff(
     topobathy_df,
     refactored_diffusive_domain,
     refactored_reaches,                
-    coastal_boundary_depth_df,
+    coastal_boundary_depth_df, 
     unrefactored_topobathy_df,                
 ):
 
@@ -542,370 +1188,456 @@ def compute_nhd_routing_v02(
     subnetwork_list,
     flowveldepth_interorder = {},
     from_files = True,
+    routing_pool = None,
+    subnetwork_cache_dir = None,
+    pipeline_orders = False,
+    reach_threads = 1,
+    stream_writer = None,
+    hydraulic_table_size = 0,
+    hydraulic_table_max_depth = 20.0,
+    solver_diagnostics = False,
+    route_headwaters_upfront = False,
+    routing_plans = None,
+    cluster_cost_model = None,
+    network_batch_size = 1000,
+    cluster_inputs = None,
+    parallel_backend = "loky",
+    shared_output = False,
+    members = None,
 ):
 
+    # ensemble members are routed together by the serial and by-network jobs,
+    # see compute_network_structured
+    if members is not None:
+        if parallel_compute_method not in ("serial", "by-network"):
+            raise ValueError(
+                f"Ensemble members are routed by the serial and by-network methods, not {parallel_compute_method}"
+            )
+        if stream_writer is not None:
+            raise ValueError("Ensemble members are not streamed during routing")
+    member_inputs = _ensemble_members(
+        members,
+        q0=q0,
+        qlats=qlats,
+        waterbodies_df=waterbodies_df,
+        lastobs_df=lastobs_df,
+        reservoir_usgs_param_df=reservoir_usgs_param_df,
+        reservoir_usace_param_df=reservoir_usace_param_df,
+        reservoir_rfc_param_df=reservoir_rfc_param_df,
+        great_lakes_param_df=great_lakes_param_df,
+    )
+    n_members = len(member_inputs)
+
     da_decay_coefficient = da_parameter_dict.get("da_decay_coefficient", 0)
     param_df["dt"] = dt
     param_df = param_df.astype("float32")
     
     start_time = time.time()
     compute_func = _compute_func_map[compute_func_name]
+    # clustered jobs are timed to calibrate the cluster cost model
+    job_func = compute_func
+    if cluster_cost_model is not None:
+        job_func = partial(timed_call, compute_func)
+        cost_context = _cost_model_context(usgs_df, waterbodies_df, waterbody_types_df)
+
+    # inputs of the subnetwork, cluster and network jobs are partitioned once, see ClusterInputs
+    param_cols = ["dt", "bw", "tw", "twcc", "dx", "n", "ncc", "cs", "s0", "alt"]
+
+    # jobs on threads take plans built in this process, see _cached_plan
+    thread_plans = routing_plans if parallel_backend == "threading" else None
+
+    lakeless_reservoir_da = {}
+
+    def _partitioned_da_args(inputs, job, da_by_job, member=0):
+        # streamflow and reservoir DA arguments of a partitioned job, the
+        # reservoir DA arguments of all jobs without waterbodies are the same
+        member_frames = member_inputs[member]
+        lake_segs, _, waterbody_types_df_sub = inputs.waterbodies[job]
+        if lake_segs or member not in lakeless_reservoir_da:
+            reservoir_da = _prep_reservoir_da_job_args(
+                reservoir_usgs_df,
+                member_frames["reservoir_usgs_param_df"],
+                reservoir_usace_df,
+                member_frames["reservoir_usace_param_df"],
+                reservoir_rfc_df,
+                member_frames["reservoir_rfc_param_df"],
+                great_lakes_df,
+                member_frames["great_lakes_param_df"],
+                great_lakes_climatology_df,
+                waterbody_types_df_sub.copy(),
+                t0,
+                from_files,
+                set(inputs.upstreams[job]),
+            )
+            if not lake_segs:
+                lakeless_reservoir_da[member] = reservoir_da
+        else:
+            reservoir_da = lakeless_reservoir_da[member]
+        waterbody_types_df_sub, reservoir_da_args = reservoir_da
+        return waterbody_types_df_sub, [
+            *da_by_job.get(
+                job, ClusterInputs.empty_da(usgs_df, member_frames["lastobs_df"])
+            ),
+            da_decay_coefficient,
+            *reservoir_da_args,
+        ]
+
     if parallel_compute_method == "by-subnetwork-jit-clustered":
         
         # Create subnetwork objects if they have not already been created
         if not subnetwork_list[0] or not subnetwork_list[1]:
-            networks_with_subnetworks_ordered_jit = nhd_network.build_subnetworks(
-                connections, rconn, subnetwork_target_size
+            # save subnetworks_only_ordered_jit and reaches_ordered_bysubntw_clustered in a list
+            # to be passed on to next loop. Work from a deep copy of this list to prevent it from being
+            # altered before being returned
+            subnetwork_list = _get_clustered_subnetworks(
+                connections,
+                rconn,
+                subnetwork_target_size,
+                independent_networks,
+                usgs_df,
+                waterbodies_df,
+                subnetwork_cache_dir,
+                cluster_cost_model,
+                waterbody_types_df,
             )
-            subnetworks_only_ordered_jit = defaultdict(dict)
-            subnetworks = defaultdict(dict)
-            for tw, ordered_network in networks_with_subnetworks_ordered_jit.items():
-                intw = independent_networks[tw]
-                for order, subnet_sets in ordered_network.items():
-                    subnetworks_only_ordered_jit[order].update(subnet_sets)
-                    for subn_tw, subnetwork in subnet_sets.items():
-                        subnetworks[subn_tw] = {k: intw[k] for k in subnetwork}
-            
-            reaches_ordered_bysubntw = defaultdict(dict)
-            for order, ordered_subn_dict in subnetworks_only_ordered_jit.items():
-                for subn_tw, subnet in ordered_subn_dict.items():
-                    conn_subn = {k: connections[k] for k in subnet if k in connections}
-                    rconn_subn = {k: rconn[k] for k in subnet if k in rconn}
-                    
-                    if not waterbodies_df.empty and not usgs_df.empty:
-                        path_func = partial(
-                            nhd_network.split_at_gages_waterbodies_and_junctions,
-                            set(usgs_df.index.values),
-                            set(waterbodies_df.index.values),
-                            rconn_subn
-                            )
 
-                    elif waterbodies_df.empty and not usgs_df.empty:
-                        path_func = partial(
-                            nhd_network.split_at_gages_and_junctions,
-                            set(usgs_df.index.values),
-                            rconn_subn
-                            )
+        # the partitioned inputs only read the subnetwork structures, no need for a copy
+        subnetworks_only_ordered_jit, reaches_ordered_bysubntw_clustered = subnetwork_list
+        max_order = max(subnetworks_only_ordered_jit.keys())
+
+        inputs = _get_cluster_inputs(
+            cluster_inputs,
+            parallel_compute_method,
+            [
+                (order, cluster)
+                for order in range(max_order, -1, -1)
+                for cluster in reaches_ordered_bysubntw_clustered[order]
+            ],
+            partial(_cluster_jobs, reaches_ordered_bysubntw_clustered, rconn),
+            param_df,
+            param_cols,
+            waterbodies_df,
+            waterbody_types_df,
+        )
+        inputs.update_forcing(q0, qlats, waterbodies_df)
+        da_by_job = inputs.split_da(usgs_df, lastobs_df)
+        
+        if 1 == 1:
+            LOG.info("JIT Preprocessing time %s seconds." % (time.time() - start_time))
+            LOG.info("starting Parallel JIT calculation")
+        
+        start_para_time = time.time()
 
-                    elif not waterbodies_df.empty and usgs_df.empty:
-                        path_func = partial(
-                            nhd_network.split_at_waterbodies_and_junctions,
-                            set(waterbodies_df.index.values),
-                            rconn_subn
-                            )
+        # tailwater results of finished clusters, until the downstream cluster is submitted
+        flowveldepth_interorder = {}
 
-                    else:
-                        path_func = partial(nhd_network.split_at_junction, rconn_subn)
+        def _submit(job):
+            order, cluster = job
+            clustered_subns = reaches_ordered_bysubntw_clustered[order][cluster]
+            index, params, q0_sub, qlat_sub = inputs.job_arrays(job)
+            lake_segs, waterbodies_values, _ = inputs.waterbodies[job]
+            waterbody_types_df_sub, da_args = _partitioned_da_args(
+                inputs, job, da_by_job
+            )
+            plan_kwargs = {}
+            if thread_plans is not None:
+                plan_kwargs["plan"] = _cached_plan(
+                    thread_plans,
+                    job,
+                    inputs.reach_types[job],
+                    clustered_subns["upstreams"],
+                    index,
+                    inputs.param_cols,
+                    params,
+                )
 
-                    reaches_ordered_bysubntw[order][
-                        subn_tw
-                    ] = nhd_network.dfs_decomposition(rconn_subn, path_func)
+            return executor.submit(
+                job_func,
+                nts,
+                dt,
+                qts_subdivisions,
+                inputs.reach_types[job],
+                clustered_subns["upstreams"],
+                index,
+                inputs.param_cols,
+                params,
+                q0_sub,
+                qlat_sub,
+                lake_segs, 
+                waterbodies_values,
+                data_assimilation_parameters,
+                waterbody_types_df_sub.values.astype("int32"),
+                waterbody_type_specified,
+                t0.strftime('%Y-%m-%d_%H:%M:%S'),
+                *da_args,
+                {
+                    us: {
+                        "results": flowveldepth_interorder.pop(us),
+                        "position_index": subn_tw_sortposition,
+                    }
+                    for us, subn_tw_sortposition in inputs.upstreams[job].items()
+                },
+                assume_short_ts,
+                return_courant,
+                from_files = from_files,
+                hydraulic_table_size=hydraulic_table_size,
+                hydraulic_table_max_depth=hydraulic_table_max_depth,
+                return_diagnostics=solver_diagnostics,
+                route_headwaters_upfront=route_headwaters_upfront,
+                **plan_kwargs,
+            )
 
-            cluster_threshold = 0.65  # When a job has a total segment count 65% of the target size, compute it
-            # Otherwise, keep adding reaches.
+        def _hand_off(job, result):
+            # forward tailwater results to the downstream cluster
+            order, cluster = job
+            if cluster_cost_model is not None:
+                _record_cluster_timings(
+                    cluster_cost_model,
+                    cost_context,
+                    {cluster: reaches_ordered_bysubntw_clustered[order][cluster]},
+                    [result],
+                    nts,
+                )
+                result = result[0]
+            if order > 0:  # This is not needed for the last rank of subnetworks
+                flowveldepth_interorder.update(
+                    _tailwater_results(
+                        result, reaches_ordered_bysubntw_clustered[order][cluster]["tw"]
+                    )
+                )
 
-            reaches_ordered_bysubntw_clustered = defaultdict(dict)
+        dependencies = cluster_dependencies(reaches_ordered_bysubntw_clustered, rconn)
+        if not pipeline_orders:
+            dependencies = barrier_dependencies(dependencies)
 
-            for order in subnetworks_only_ordered_jit:
-                cluster = 0
-                reaches_ordered_bysubntw_clustered[order][cluster] = {
-                    "segs": [],
-                    "upstreams": {},
-                    "tw": [],
-                    "subn_reach_list": [],
-                }
-                for twi, (subn_tw, subn_reach_list) in enumerate(
-                    reaches_ordered_bysubntw[order].items(), 1
-                ):
-                    segs = list(chain.from_iterable(subn_reach_list))
-                    reaches_ordered_bysubntw_clustered[order][cluster]["segs"].extend(segs)
-                    reaches_ordered_bysubntw_clustered[order][cluster]["upstreams"].update(
-                        subnetworks[subn_tw]
-                    )
+        with job_executor(parallel_backend, cpu_pool) as executor:
+            results_by_job, scheduler_stats = run_scheduled(
+                dependencies, _submit, _hand_off, cpu_pool
+            )
+        if cluster_cost_model is not None:
+            results_by_job = {job: result for job, (result, _) in results_by_job.items()}
 
-                    reaches_ordered_bysubntw_clustered[order][cluster]["tw"].append(subn_tw)
-                    reaches_ordered_bysubntw_clustered[order][cluster][
-                        "subn_reach_list"
-                    ].extend(subn_reach_list)
-
-                    if (
-                        len(reaches_ordered_bysubntw_clustered[order][cluster]["segs"])
-                        >= cluster_threshold * subnetwork_target_size
-                    ) and (
-                        twi
-                        < len(reaches_ordered_bysubntw[order])
-                        # i.e., we haven't reached the end
-                        # TODO: perhaps this should be a while condition...
-                    ):
-                        cluster += 1
-                        reaches_ordered_bysubntw_clustered[order][cluster] = {
-                            "segs": [],
-                            "upstreams": {},
-                            "tw": [],
-                            "subn_reach_list": [],
-                        }
-            
+        results = []
+        for order in subnetworks_only_ordered_jit:
+            results.extend(
+                results_by_job[(order, cluster)]
+                for cluster in reaches_ordered_bysubntw_clustered[order]
+            )
 
-            # save subnetworks_only_ordered_jit and reaches_ordered_bysubntw_clustered in a list
-            # to be passed on to next loop. Create a deep copy of this list to prevent it from being
-            # altered before being returned
-            subnetwork_list = [subnetworks_only_ordered_jit, reaches_ordered_bysubntw_clustered]
-            subnetwork_list = copy.deepcopy(subnetwork_list)
+        LOG.info(
+            "%s schedule: %d jobs, pool utilization %.1f%%"
+            % (
+                "pipelined" if pipeline_orders else "barrier",
+                scheduler_stats.jobs,
+                100 * scheduler_stats.utilization,
+            )
+        )
 
-        else:
-            subnetworks_only_ordered_jit, reaches_ordered_bysubntw_clustered = copy.deepcopy(subnetwork_list)
-        
         if 1 == 1:
-            LOG.info("JIT Preprocessing time %s seconds." % (time.time() - start_time))
-            LOG.info("starting Parallel JIT calculation")
+            LOG.info("PARALLEL TIME %s seconds." % (time.time() - start_para_time))
         
+    elif parallel_compute_method == "by-subnetwork-jit-clustered-shared":
+
+        # Create subnetwork objects if they have not already been created
+        if not subnetwork_list[0] or not subnetwork_list[1]:
+            subnetwork_list = _get_clustered_subnetworks(
+                connections,
+                rconn,
+                subnetwork_target_size,
+                independent_networks,
+                usgs_df,
+                waterbodies_df,
+                subnetwork_cache_dir,
+                cluster_cost_model,
+                waterbody_types_df,
+            )
+
+        # the shared-memory path only reads the subnetwork structures, no need for a copy
+        subnetworks_only_ordered_jit, reaches_ordered_bysubntw_clustered = subnetwork_list
+
+        # a pool handed in by the caller outlives this call, otherwise use one for this call only
+        shutdown_pool = routing_pool is None
+        if routing_pool is None:
+            routing_pool = SharedMemoryPool(cpu_pool)
+
+        # the pool keeps the layout of its shared arrays across loops, checked
+        # against the clusters and channel segments of every loop
+        keys = [
+            (order, cluster)
+            for order in range(max(subnetworks_only_ordered_jit.keys()), -1, -1)
+            for cluster in reaches_ordered_bysubntw_clustered[order]
+        ]
+        inputs = routing_pool.inputs
+        if inputs is None or not inputs.matches(keys, param_df.index):
+            inputs = ClusterInputs(
+                _cluster_jobs(reaches_ordered_bysubntw_clustered, rconn),
+                param_df,
+                param_cols,
+                waterbodies_df,
+                waterbody_types_df,
+            )
+            routing_pool.set_layout(inputs, waterbodies_df)
+        routing_pool.update_forcing(q0, qlats, waterbodies_df)
+        da_by_job = inputs.split_da(usgs_df, lastobs_df)
+        layout_index = routing_pool.layout["index"]
+        # waterbodies are read from the shared arrays, unless there are none
+        shared_lakes = not waterbodies_df.empty
+
+        LOG.info("JIT Preprocessing time %s seconds." % (time.time() - start_time))
+        LOG.info("starting shared-memory JIT calculation")
+
         start_para_time = time.time()
-        # if 1 == 1:
-        with Parallel(n_jobs=cpu_pool, backend="loky") as parallel:
-            results_subn = defaultdict(list)
-            flowveldepth_interorder = {}
-
-            for order in range(max(subnetworks_only_ordered_jit.keys()), -1, -1):
-                jobs = []
-                for cluster, clustered_subns in reaches_ordered_bysubntw_clustered[
-                    order
-                ].items():
-                    segs = clustered_subns["segs"]
-                    offnetwork_upstreams = set()
-                    segs_set = set(segs)
-                    for seg in segs:
-                        for us in rconn[seg]:
-                            if us not in segs_set:
-                                offnetwork_upstreams.add(us)
-
-                    segs.extend(offnetwork_upstreams)
-                    
-                    common_segs = list(param_df.index.intersection(segs))
-                    wbodies_segs = set(segs).symmetric_difference(common_segs)
-                    
-                    #Declare empty dataframe
-                    waterbody_types_df_sub = pd.DataFrame()
-
-                    if not waterbodies_df.empty:
-                        lake_segs = list(waterbodies_df.index.intersection(segs))
-                        waterbodies_df_sub = waterbodies_df.loc[
-                            lake_segs,
-                            [
-                                "LkArea",
-                                "LkMxE",
-                                "OrificeA",
-                                "OrificeC",
-                                "OrificeE",
-                                "WeirC",
-                                "WeirE",
-                                "WeirL",
-                                "ifd",
-                                "qd0",
-                                "h0",
-                            ],
-                        ]
-                        
-                        #If reservoir types other than Level Pool are active
-                        if not waterbody_types_df.empty:
-                            waterbody_types_df_sub = waterbody_types_df.loc[
-                                lake_segs,
-                                [
-                                    "reservoir_type",
-                                ],
-                            ]
 
-                    else:
-                        lake_segs = []
-                        waterbodies_df_sub = pd.DataFrame()
-
-                    param_df_sub = param_df.loc[
-                        common_segs,
-                        ["dt", "bw", "tw", "twcc", "dx", "n", "ncc", "cs", "s0", "alt"],
-                    ].sort_index()
-                    
-                    param_df_sub_super = param_df_sub.reindex(
-                        param_df_sub.index.tolist() + lake_segs
-                    ).sort_index()
-                    
-                    if order < max(subnetworks_only_ordered_jit.keys()):
-                        for us_subn_tw in offnetwork_upstreams:
-                            subn_tw_sortposition = param_df_sub_super.index.get_loc(
-                                us_subn_tw
-                            )
-                            flowveldepth_interorder[us_subn_tw][
-                                "position_index"
-                            ] = subn_tw_sortposition
-   
-                    subn_reach_list = clustered_subns["subn_reach_list"]
-                    upstreams = clustered_subns["upstreams"]
-
-                    subn_reach_list_with_type = _build_reach_type_list(subn_reach_list, wbodies_segs)
-
-                    qlat_sub = qlats.loc[param_df_sub.index]
-                    q0_sub = q0.loc[param_df_sub.index]
-                                        
-                    param_df_sub = param_df_sub.reindex(
-                        param_df_sub.index.tolist() + lake_segs
-                    ).sort_index()
-
-                    usgs_df_sub, lastobs_df_sub, da_positions_list_byseg = _prep_da_dataframes(usgs_df, lastobs_df, param_df_sub.index, offnetwork_upstreams)
-                    da_positions_list_byreach, da_positions_list_bygage = _prep_da_positions_byreach(subn_reach_list, lastobs_df_sub.index)
-
-                    qlat_sub = qlat_sub.reindex(param_df_sub.index)
-                    q0_sub = q0_sub.reindex(param_df_sub.index)
-
-                    # prepare reservoir DA data
-                    (reservoir_usgs_df_sub, 
-                     reservoir_usgs_df_time,
-                     reservoir_usgs_update_time,
-                     reservoir_usgs_prev_persisted_flow,
-                     reservoir_usgs_persistence_update_time,
-                     reservoir_usgs_persistence_index,
-                     reservoir_usace_df_sub, 
-                     reservoir_usace_df_time,
-                     reservoir_usace_update_time,
-                     reservoir_usace_prev_persisted_flow,
-                     reservoir_usace_persistence_update_time,
-                     reservoir_usace_persistence_index,
-                     reservoir_rfc_df_sub, 
-                     reservoir_rfc_totalCounts, 
-                     reservoir_rfc_file, 
-                     reservoir_rfc_use_forecast, 
-                     reservoir_rfc_timeseries_idx, 
-                     reservoir_rfc_update_time, 
-                     reservoir_rfc_da_timestep, 
-                     reservoir_rfc_persist_days,
-                     gl_df_sub, 
-                     gl_parm_lake_id_sub, 
-                     gl_param_flows_sub, 
-                     gl_param_time_sub, 
-                     gl_param_update_time_sub,
-                     gl_climatology_df_sub,
-                     waterbody_types_df_sub,
-                     ) = _prep_reservoir_da_dataframes(
-                        reservoir_usgs_df,
-                        reservoir_usgs_param_df,
-                        reservoir_usace_df, 
-                        reservoir_usace_param_df,
-                        reservoir_rfc_df,
-                        reservoir_rfc_param_df,
-                        great_lakes_df,
-                        great_lakes_param_df,
-                        great_lakes_climatology_df,
-                        waterbody_types_df_sub, 
-                        t0,
-                        from_files,
-                        offnetwork_upstreams
-                    )
-                    
-                    # results_subn[order].append(
-                    #     compute_func(
-                    jobs.append(
-                        delayed(compute_func)(
-                            nts,
-                            dt,
-                            qts_subdivisions,
-                            subn_reach_list_with_type,
-                            upstreams,
-                            param_df_sub.index.values,
-                            param_df_sub.columns.values,
-                            param_df_sub.values,
-                            q0_sub.values.astype("float32"),
-                            qlat_sub.values.astype("float32"),
-                            lake_segs, 
-                            waterbodies_df_sub.values,
-                            data_assimilation_parameters,
-                            waterbody_types_df_sub.values.astype("int32"),
-                            waterbody_type_specified,
-                            t0.strftime('%Y-%m-%d_%H:%M:%S'),
-                            usgs_df_sub.values.astype("float32"),
-                            # flowveldepth_interorder,  # obtain keys and values from this dataset
-                            np.array(da_positions_list_byseg, dtype="int32"),
-                            np.array(da_positions_list_byreach, dtype="int32"),
-                            np.array(da_positions_list_bygage, dtype="int32"),
-                            lastobs_df_sub.get(
-                                "lastobs_discharge",
-                                pd.Series(index=lastobs_df_sub.index, name="Null", dtype="float32"),
-                            ).values.astype("float32"),
-                            lastobs_df_sub.get(
-                                "time_since_lastobs",
-                                pd.Series(index=lastobs_df_sub.index, name="Null", dtype="float32"),
-                            ).values.astype("float32"),
-                            da_decay_coefficient,
-                            # USGS Hybrid Reservoir DA data
-                            reservoir_usgs_df_sub.values.astype("float32"),
-                            reservoir_usgs_df_sub.index.values.astype("int32"),
-                            reservoir_usgs_df_time.astype('float32'),
-                            reservoir_usgs_update_time.astype('float32'),
-                            reservoir_usgs_prev_persisted_flow.astype('float32'),
-                            reservoir_usgs_persistence_update_time.astype('float32'),
-                            reservoir_usgs_persistence_index.astype('float32'),
-                            # USACE Hybrid Reservoir DA data
-                            reservoir_usace_df_sub.values.astype("float32"),
-                            reservoir_usace_df_sub.index.values.astype("int32"),
-                            reservoir_usace_df_time.astype('float32'),
-                            reservoir_usace_update_time.astype("float32"),
-                            reservoir_usace_prev_persisted_flow.astype("float32"),
-                            reservoir_usace_persistence_update_time.astype("float32"),
-                            reservoir_usace_persistence_index.astype("float32"),
-                            # RFC Reservoir DA data
-                            reservoir_rfc_df_sub.values.astype("float32"),
-                            reservoir_rfc_df_sub.index.values.astype("int32"),
-                            reservoir_rfc_totalCounts.astype("int32"),
-                            reservoir_rfc_file,
-                            reservoir_rfc_use_forecast.astype("int32"),
-                            reservoir_rfc_timeseries_idx.astype("int32"),
-                            reservoir_rfc_update_time.astype("float32"),
-                            reservoir_rfc_da_timestep.astype("int32"),
-                            reservoir_rfc_persist_days.astype("int32"),
-                            # Great Lakes DA data
-                            gl_df_sub.lake_id.values.astype("int32"),
-                            gl_df_sub.time.values.astype("int32"),
-                            gl_df_sub.Discharge.values.astype("float32"),
-                            gl_parm_lake_id_sub.astype("int32"),
-                            gl_param_flows_sub.astype("float32"),
-                            gl_param_time_sub.astype("int32"),
-                            gl_param_update_time_sub.astype("int32"),
-                            gl_climatology_df_sub.values.astype("float32"),
-                            {
-                                us: fvd
-                                for us, fvd in flowveldepth_interorder.items()
-                                if us in offnetwork_upstreams
-                            },
-                            assume_short_ts,
-                            return_courant,
-                            from_files = from_files,
-                        )
+        # Prepare every job up front, only upstream results are added at submission.
+        # Reservoir types and DA data change every loop and go with the job
+        jobs = {}
+        position_index = {}
+        for order in range(max(subnetworks_only_ordered_jit.keys()), -1, -1):
+            for cluster, clustered_subns in reaches_ordered_bysubntw_clustered[
+                order
+            ].items():
+                job = (order, cluster)
+                start, stop = routing_pool.layout[job]
+                offnetwork_upstreams = inputs.upstreams[job]
+                position_index.update(offnetwork_upstreams)
+
+                waterbody_types_df_sub, da_args = _partitioned_da_args(
+                    inputs, job, da_by_job
+                )
+                if shared_lakes:
+                    lakes = inputs.lake_layout[job]
+                    lake_args = []
+                else:
+                    lakes = None
+                    lake_args = [[], pd.DataFrame().values]
+
+                jobs[job] = (
+                    start,
+                    stop,
+                    set(offnetwork_upstreams),
+                    lakes,
+                    [
+                        nts,
+                        dt,
+                        qts_subdivisions,
+                        inputs.reach_types[job],
+                        clustered_subns["upstreams"],
+                        inputs.param_cols,
+                        *lake_args,
+                        data_assimilation_parameters,
+                        waterbody_types_df_sub.values.astype("int32"),
+                        waterbody_type_specified,
+                        t0.strftime('%Y-%m-%d_%H:%M:%S'),
+                        *da_args,
+                    ],
+                )
+
+        # rows of every job in the shared output buffers, in the order of the
+        # returned results, so that nwm_output_generator wraps them without a copy
+        output_rows = {}
+        if shared_output:
+            rows = 0
+            for order in subnetworks_only_ordered_jit:
+                for cluster in reaches_ordered_bysubntw_clustered[order]:
+                    start, stop, offnetwork_upstreams, _, _ = jobs[(order, cluster)]
+                    routed = (stop - start) - np.isin(
+                        layout_index[start:stop],
+                        np.fromiter(offnetwork_upstreams, dtype="int64"),
+                    ).sum()
+                    output_rows[(order, cluster)] = (rows, rows + routed)
+                    rows += routed
+            routing_pool.allocate_output(rows, nts)
+
+        def _output(job, result):
+            # results of a job written to the output buffers, as views of them
+            if job not in output_rows:
+                return result
+            return routing_pool.output_view(result, *output_rows[job])
+
+        flowveldepth_interorder = {}
+
+        def _submit(job):
+            start, stop, offnetwork_upstreams, lakes, args = jobs[job]
+            output = None
+            if job in output_rows:
+                output = dict(routing_pool.output_paths, rows=output_rows[job])
+            upstream_results = {
+                us: {
+                    "results": flowveldepth_interorder[us],
+                    "position_index": position_index[us],
+                }
+                for us in offnetwork_upstreams
+                if us in flowveldepth_interorder
+            }
+            return routing_pool.submit(
+                compute_func,
+                start,
+                stop,
+                *args,
+                upstream_results,
+                assume_short_ts,
+                return_courant,
+                from_files=from_files,
+                hydraulic_table_size=hydraulic_table_size,
+                hydraulic_table_max_depth=hydraulic_table_max_depth,
+                return_diagnostics=solver_diagnostics,
+                route_headwaters_upfront=route_headwaters_upfront,
+                lakes=lakes,
+                cache_plan=routing_plans is not None,
+                output=output,
+                timed=cluster_cost_model is not None,
+            )
+
+        def _hand_off(job, result):
+            # forward tailwater results to the downstream cluster
+            order, cluster = job
+            if cluster_cost_model is not None:
+                _record_cluster_timings(
+                    cluster_cost_model,
+                    cost_context,
+                    {cluster: reaches_ordered_bysubntw_clustered[order][cluster]},
+                    [result],
+                    nts,
+                )
+                result = result[0]
+            if order > 0:  # This is not needed for the last rank of subnetworks
+                flowveldepth_interorder.update(
+                    _tailwater_results(
+                        _output(job, result),
+                        reaches_ordered_bysubntw_clustered[order][cluster]["tw"],
                     )
-                results_subn[order] = parallel(jobs)
-   
-                if order > 0:  # This is not needed for the last rank of subnetworks
-                    flowveldepth_interorder = {}
-                    for ci, (cluster, clustered_subns) in enumerate(
-                        reaches_ordered_bysubntw_clustered[order].items()
-                    ):
-                        for subn_tw in clustered_subns["tw"]:
-                            # TODO: This index step is necessary because we sort the segment index
-                            # TODO: I think there are a number of ways we could remove the sorting step
-                            #       -- the binary search could be replaced with an index based on the known topology
-                            flowveldepth_interorder[subn_tw] = {}
-                            subn_tw_sortposition = (
-                                results_subn[order][ci][0].tolist().index(subn_tw)
-                            )
-                            flowveldepth_interorder[subn_tw]["results"] = results_subn[
-                                order
-                            ][ci][1][subn_tw_sortposition]
-                            # what will it take to get just the tw FVD values into an array to pass to the next loop?
-                            # There will be an empty array initialized at the top of the loop, then re-populated here.
-                            # we don't have to bother with populating it after the last group
+                )
+
+        dependencies = cluster_dependencies(reaches_ordered_bysubntw_clustered, rconn)
+        if not pipeline_orders:
+            dependencies = barrier_dependencies(dependencies)
+
+        results_by_job, scheduler_stats = run_scheduled(
+            dependencies, _submit, _hand_off, cpu_pool
+        )
+        if cluster_cost_model is not None:
+            results_by_job = {job: result for job, (result, _) in results_by_job.items()}
 
         results = []
         for order in subnetworks_only_ordered_jit:
-            results.extend(results_subn[order])
+            results.extend(
+                _output((order, cluster), results_by_job[(order, cluster)])
+                for cluster in reaches_ordered_bysubntw_clustered[order]
+            )
+
+        if shutdown_pool:
+            routing_pool.shutdown()
+
+        LOG.info(
+            "%s schedule: %d jobs, pool utilization %.1f%%"
+            % (
+                "pipelined" if pipeline_orders else "barrier",
+                scheduler_stats.jobs,
+                100 * scheduler_stats.utilization,
+            )
+        )
+        LOG.info("PARALLEL TIME %s seconds." % (time.time() - start_para_time))
 
-        if 1 == 1:
-            LOG.info("PARALLEL TIME %s seconds." % (time.time() - start_para_time))
-        
     elif parallel_compute_method == "by-subnetwork-jit":
         # Create subnetwork objects if they have not already been created
         if not subnetwork_list[0] or not subnetwork_list[1] or not subnetwork_list[2]:
@@ -967,432 +1699,224 @@ def compute_nhd_routing_v02(
             LOG.info("JIT Preprocessing time %s seconds." % (time.time() - start_time))
             LOG.info("starting Parallel JIT calculation")
 
+        max_order = max(subnetworks_only_ordered_jit.keys())
+        inputs = _get_cluster_inputs(
+            cluster_inputs,
+            parallel_compute_method,
+            [
+                (order, subn_tw)
+                for order in range(max_order, -1, -1)
+                for subn_tw in reaches_ordered_bysubntw[order]
+            ],
+            partial(_subnetwork_jobs, reaches_ordered_bysubntw, rconn),
+            param_df,
+            param_cols,
+            waterbodies_df,
+            waterbody_types_df,
+        )
+        inputs.update_forcing(q0, qlats, waterbodies_df)
+        da_by_job = inputs.split_da(usgs_df, lastobs_df)
+
         start_para_time = time.time()
-        with Parallel(n_jobs=cpu_pool, backend="loky") as parallel:
-            results_subn = defaultdict(list)
-            flowveldepth_interorder = {}
-
-            for order in range(max(subnetworks_only_ordered_jit.keys()), -1, -1):
-                jobs = []
-                for twi, (subn_tw, subn_reach_list) in enumerate(
-                    reaches_ordered_bysubntw[order].items(), 1
-                ):
-                    # TODO: Confirm that a list here is best -- we are sorting,
-                    # so a set might be sufficient/better
-                    segs = list(chain.from_iterable(subn_reach_list))
-                    offnetwork_upstreams = set()
-                    segs_set = set(segs)
-                    for seg in segs:
-                        for us in rconn[seg]:
-                            if us not in segs_set:
-                                offnetwork_upstreams.add(us)
-
-                    segs.extend(offnetwork_upstreams)
-                    
-                    common_segs = list(param_df.index.intersection(segs))
-                    wbodies_segs = set(segs).symmetric_difference(common_segs)
-                    
-                    #Declare empty dataframe
-                    waterbody_types_df_sub = pd.DataFrame()
-                
-                    if not waterbodies_df.empty:
-                        lake_segs = list(waterbodies_df.index.intersection(segs))
-                        waterbodies_df_sub = waterbodies_df.loc[
-                            lake_segs,
-                            [
-                                "LkArea",
-                                "LkMxE",
-                                "OrificeA",
-                                "OrificeC",
-                                "OrificeE",
-                                "WeirC",
-                                "WeirE",
-                                "WeirL",
-                                "ifd",
-                                "qd0",
-                                "h0",
-                            ],
-                        ]
-                        
-                        #If reservoir types other than Level Pool are active
-                        if not waterbody_types_df.empty:
-                            waterbody_types_df_sub = waterbody_types_df.loc[
-                                lake_segs,
-                                [
-                                    "reservoir_type",
-                                ],
-                            ]
 
-                    else:
-                        lake_segs = []
-                        waterbodies_df_sub = pd.DataFrame()
-                    
-                    param_df_sub = param_df.loc[
-                        common_segs,
-                        ["dt", "bw", "tw", "twcc", "dx", "n", "ncc", "cs", "s0", "alt"],
-                    ].sort_index()
-                    
-                    param_df_sub_super = param_df_sub.reindex(
-                        param_df_sub.index.tolist() + lake_segs
-                    ).sort_index()
-                    
-                    if order < max(subnetworks_only_ordered_jit.keys()):
-                        for us_subn_tw in offnetwork_upstreams:
-                            subn_tw_sortposition = param_df_sub_super.index.get_loc(
-                                us_subn_tw
-                            )
-                            flowveldepth_interorder[us_subn_tw][
-                                "position_index"
-                            ] = subn_tw_sortposition
-
-                    subn_reach_list_with_type = _build_reach_type_list(subn_reach_list, wbodies_segs)
-
-                    qlat_sub = qlats.loc[param_df_sub.index]
-                    q0_sub = q0.loc[param_df_sub.index]
-
-                    param_df_sub = param_df_sub.reindex(
-                        param_df_sub.index.tolist() + lake_segs
-                    ).sort_index()
-
-                    usgs_df_sub, lastobs_df_sub, da_positions_list_byseg = _prep_da_dataframes(usgs_df, lastobs_df, param_df_sub.index, offnetwork_upstreams)
-                    da_positions_list_byreach, da_positions_list_bygage = _prep_da_positions_byreach(subn_reach_list, lastobs_df_sub.index)
-
-                    qlat_sub = qlat_sub.reindex(param_df_sub.index)
-                    q0_sub = q0_sub.reindex(param_df_sub.index)
-                    
-                    # prepare reservoir DA data
-                    (reservoir_usgs_df_sub, 
-                     reservoir_usgs_df_time,
-                     reservoir_usgs_update_time,
-                     reservoir_usgs_prev_persisted_flow,
-                     reservoir_usgs_persistence_update_time,
-                     reservoir_usgs_persistence_index,
-                     reservoir_usace_df_sub, 
-                     reservoir_usace_df_time,
-                     reservoir_usace_update_time,
-                     reservoir_usace_prev_persisted_flow,
-                     reservoir_usace_persistence_update_time,
-                     reservoir_usace_persistence_index,
-                     reservoir_rfc_df_sub, 
-                     reservoir_rfc_totalCounts, 
-                     reservoir_rfc_file, 
-                     reservoir_rfc_use_forecast, 
-                     reservoir_rfc_timeseries_idx, 
-                     reservoir_rfc_update_time, 
-                     reservoir_rfc_da_timestep, 
-                     reservoir_rfc_persist_days,
-                     gl_df_sub, 
-                     gl_parm_lake_id_sub, 
-                     gl_param_flows_sub, 
-                     gl_param_time_sub, 
-                     gl_param_update_time_sub,
-                     gl_climatology_df_sub,
-                     waterbody_types_df_sub,
-                     ) = _prep_reservoir_da_dataframes(
-                        reservoir_usgs_df,
-                        reservoir_usgs_param_df,
-                        reservoir_usace_df, 
-                        reservoir_usace_param_df,
-                        reservoir_rfc_df,
-                        reservoir_rfc_param_df,
-                        great_lakes_df,
-                        great_lakes_param_df,
-                        great_lakes_climatology_df,
-                        waterbody_types_df_sub, 
-                        t0,
-                        from_files,
-                        offnetwork_upstreams
-                    )
+        # tailwater results of finished subnetworks, until the downstream subnetwork is submitted
+        flowveldepth_interorder = {}
 
-                    jobs.append(
-                        delayed(compute_func)(
-                            nts,
-                            dt,
-                            qts_subdivisions,
-                            subn_reach_list_with_type,
-                            subnetworks[subn_tw],
-                            param_df_sub.index.values,
-                            param_df_sub.columns.values,
-                            param_df_sub.values,
-                            q0_sub.values.astype("float32"),
-                            qlat_sub.values.astype("float32"),
-                            lake_segs,
-                            waterbodies_df_sub.values,
-                            data_assimilation_parameters,
-                            waterbody_types_df_sub.values.astype("int32"),
-                            waterbody_type_specified,
-                            t0.strftime('%Y-%m-%d_%H:%M:%S'),
-                            usgs_df_sub.values.astype("float32"),
-                            # flowveldepth_interorder,  # obtain keys and values from this dataset
-                            np.array(da_positions_list_byseg, dtype="int32"),
-                            np.array(da_positions_list_byreach, dtype="int32"),
-                            np.array(da_positions_list_bygage, dtype="int32"),
-                            lastobs_df_sub.get(
-                                "lastobs_discharge",
-                                pd.Series(index=lastobs_df_sub.index, name="Null", dtype="float32"),
-                            ).values.astype("float32"),
-                            lastobs_df_sub.get(
-                                "time_since_lastobs",
-                                pd.Series(index=lastobs_df_sub.index, name="Null", dtype="float32"),
-                            ).values.astype("float32"),
-                            da_decay_coefficient,
-                            # USGS Hybrid Reservoir DA data
-                            reservoir_usgs_df_sub.values.astype("float32"),
-                            reservoir_usgs_df_sub.index.values.astype("int32"),
-                            reservoir_usgs_df_time.astype('float32'),
-                            reservoir_usgs_update_time.astype('float32'),
-                            reservoir_usgs_prev_persisted_flow.astype('float32'),
-                            reservoir_usgs_persistence_update_time.astype('float32'),
-                            reservoir_usgs_persistence_index.astype('float32'),
-                            # USACE Hybrid Reservoir DA data
-                            reservoir_usace_df_sub.values.astype("float32"),
-                            reservoir_usace_df_sub.index.values.astype("int32"),
-                            reservoir_usace_df_time.astype('float32'),
-                            reservoir_usace_update_time.astype("float32"),
-                            reservoir_usace_prev_persisted_flow.astype("float32"),
-                            reservoir_usace_persistence_update_time.astype("float32"),
-                            reservoir_usace_persistence_index.astype("float32"),
-                            # RFC Reservoir DA data
-                            reservoir_rfc_df_sub.values.astype("float32"),
-                            reservoir_rfc_df_sub.index.values.astype("int32"),
-                            reservoir_rfc_totalCounts.astype("int32"),
-                            reservoir_rfc_file,
-                            reservoir_rfc_use_forecast.astype("int32"),
-                            reservoir_rfc_timeseries_idx.astype("int32"),
-                            reservoir_rfc_update_time.astype("float32"),
-                            reservoir_rfc_da_timestep.astype("int32"),
-                            reservoir_rfc_persist_days.astype("int32"),
-                            # Great Lakes DA data
-                            gl_df_sub.lake_id.values.astype("int32"),
-                            gl_df_sub.time.values.astype("int32"),
-                            gl_df_sub.Discharge.values.astype("float32"),
-                            gl_parm_lake_id_sub.astype("int32"),
-                            gl_param_flows_sub.astype("float32"),
-                            gl_param_time_sub.astype("int32"),
-                            gl_param_update_time_sub.astype("int32"),
-                            gl_climatology_df_sub.values.astype("float32"),
-                            {
-                                us: fvd
-                                for us, fvd in flowveldepth_interorder.items()
-                                if us in offnetwork_upstreams
-                            },
-                            assume_short_ts,
-                            return_courant,
-                            from_files=from_files,
-                        )
-                    )
+        def _submit(job):
+            order, subn_tw = job
+            index, params, q0_sub, qlat_sub = inputs.job_arrays(job)
+            lake_segs, waterbodies_values, _ = inputs.waterbodies[job]
+            waterbody_types_df_sub, da_args = _partitioned_da_args(
+                inputs, job, da_by_job
+            )
+
+            return executor.submit(
+                compute_func,
+                nts,
+                dt,
+                qts_subdivisions,
+                inputs.reach_types[job],
+                subnetworks[subn_tw],
+                index,
+                inputs.param_cols,
+                params,
+                q0_sub,
+                qlat_sub,
+                lake_segs,
+                waterbodies_values,
+                data_assimilation_parameters,
+                waterbody_types_df_sub.values.astype("int32"),
+                waterbody_type_specified,
+                t0.strftime('%Y-%m-%d_%H:%M:%S'),
+                *da_args,
+                {
+                    us: {
+                        "results": flowveldepth_interorder.pop(us),
+                        "position_index": subn_tw_sortposition,
+                    }
+                    for us, subn_tw_sortposition in inputs.upstreams[job].items()
+                },
+                assume_short_ts,
+                return_courant,
+                from_files=from_files,
+                hydraulic_table_size=hydraulic_table_size,
+                hydraulic_table_max_depth=hydraulic_table_max_depth,
+                return_diagnostics=solver_diagnostics,
+                route_headwaters_upfront=route_headwaters_upfront,
+            )
 
-                results_subn[order] = parallel(jobs)
-
-                if order > 0:  # This is not needed for the last rank of subnetworks
-                    flowveldepth_interorder = {}
-                    for twi, subn_tw in enumerate(reaches_ordered_bysubntw[order]):
-                        # TODO: This index step is necessary because we sort the segment index
-                        # TODO: I think there are a number of ways we could remove the sorting step
-                        #       -- the binary search could be replaced with an index based on the known topology
-                        flowveldepth_interorder[subn_tw] = {}
-                        subn_tw_sortposition = (
-                            results_subn[order][twi][0].tolist().index(subn_tw)
-                        )
-                        flowveldepth_interorder[subn_tw]["results"] = results_subn[
-                            order
-                        ][twi][1][subn_tw_sortposition]
-                        # what will it take to get just the tw FVD values into an array to pass to the next loop?
-                        # There will be an empty array initialized at the top of the loop, then re-populated here.
-                        # we don't have to bother with populating it after the last group
+        def _hand_off(job, result):
+            # forward tailwater results to the downstream subnetwork
+            order, subn_tw = job
+            if order > 0:  # This is not needed for the last rank of subnetworks
+                flowveldepth_interorder.update(_tailwater_results(result, [subn_tw]))
+
+        # every offnetwork upstream segment is the tailwater of another subnetwork
+        producer = {subn_tw: (order, subn_tw) for order, subn_tw in inputs.keys}
+        dependencies = {
+            job: {producer[us] for us in inputs.upstreams[job]} for job in inputs.keys
+        }
+        if not pipeline_orders:
+            dependencies = barrier_dependencies(dependencies)
+
+        with job_executor("loky", cpu_pool) as executor:
+            results_by_job, scheduler_stats = run_scheduled(
+                dependencies, _submit, _hand_off, cpu_pool
+            )
 
         results = []
         for order in subnetworks_only_ordered_jit:
-            results.extend(results_subn[order])
+            results.extend(
+                results_by_job[(order, subn_tw)]
+                for subn_tw in reaches_ordered_bysubntw[order]
+            )
+
+        LOG.info(
+            "%s schedule: %d jobs, pool utilization %.1f%%"
+            % (
+                "pipelined" if pipeline_orders else "barrier",
+                scheduler_stats.jobs,
+                100 * scheduler_stats.utilization,
+            )
+        )
 
         if 1 == 1:
             LOG.info("PARALLEL TIME %s seconds." % (time.time() - start_para_time))
 
     elif parallel_compute_method == "by-network":
-        with Parallel(n_jobs=cpu_pool, backend="loky") as parallel:
-            jobs = []
-            for twi, (tw, reach_list) in enumerate(reaches_bytw.items(), 1):
-                # The X_sub lines use SEGS...
-                # which is now invalid with the wbodies included.
-                # So we define "common_segs" to identify regular routing segments
-                # and wbodies_segs for the waterbody reaches/segments
-                segs = list(chain.from_iterable(reach_list))
-                common_segs = param_df.index.intersection(segs)
-                # Assumes everything else is a waterbody...
-                wbodies_segs = set(segs).symmetric_difference(common_segs)
-
-                #Declare empty dataframe
-                waterbody_types_df_sub = pd.DataFrame()
-
-                # If waterbody parameters exist
-                if not waterbodies_df.empty:
-
-                    lake_segs = list(waterbodies_df.index.intersection(segs))
-
-                    waterbodies_df_sub = waterbodies_df.loc[
-                        lake_segs,
-                        [
-                            "LkArea",
-                            "LkMxE",
-                            "OrificeA",
-                            "OrificeC",
-                            "OrificeE",
-                            "WeirC",
-                            "WeirE",
-                            "WeirL",
-                            "ifd",
-                            "qd0",
-                            "h0",
-                        ],
-                    ]
-
-                    #If reservoir types other than Level Pool are active
-                    if not waterbody_types_df.empty:
-                        waterbody_types_df_sub = waterbody_types_df.loc[
-                            lake_segs,
-                            [
-                                "reservoir_type",
-                            ],
-                        ]
-
-                else:
-                    lake_segs = []
-                    waterbodies_df_sub = pd.DataFrame()
-
-                param_df_sub = param_df.loc[
-                    common_segs,
-                    ["dt", "bw", "tw", "twcc", "dx", "n", "ncc", "cs", "s0", "alt"],
-                ].sort_index()
-
-                reaches_list_with_type = _build_reach_type_list(reach_list, wbodies_segs)
-
-                # qlat_sub = qlats.loc[common_segs].sort_index()
-                # q0_sub = q0.loc[common_segs].sort_index()
-                qlat_sub = qlats.loc[param_df_sub.index]
-                q0_sub = q0.loc[param_df_sub.index]
-
-                param_df_sub = param_df_sub.reindex(
-                    param_df_sub.index.tolist() + lake_segs
-                ).sort_index()
-
-                usgs_df_sub, lastobs_df_sub, da_positions_list_byseg = _prep_da_dataframes(usgs_df, lastobs_df, param_df_sub.index)
-                da_positions_list_byreach, da_positions_list_bygage = _prep_da_positions_byreach(reach_list, lastobs_df_sub.index)
-
-                qlat_sub = qlat_sub.reindex(param_df_sub.index)
-                q0_sub = q0_sub.reindex(param_df_sub.index)
-                
-                # prepare reservoir DA data
-                (reservoir_usgs_df_sub, 
-                 reservoir_usgs_df_time,
-                 reservoir_usgs_update_time,
-                 reservoir_usgs_prev_persisted_flow,
-                 reservoir_usgs_persistence_update_time,
-                 reservoir_usgs_persistence_index,
-                 reservoir_usace_df_sub, 
-                 reservoir_usace_df_time,
-                 reservoir_usace_update_time,
-                 reservoir_usace_prev_persisted_flow,
-                 reservoir_usace_persistence_update_time,
-                 reservoir_usace_persistence_index,
-                 reservoir_rfc_df_sub, 
-                 reservoir_rfc_totalCounts, 
-                 reservoir_rfc_file, 
-                 reservoir_rfc_use_forecast, 
-                 reservoir_rfc_timeseries_idx, 
-                 reservoir_rfc_update_time, 
-                 reservoir_rfc_da_timestep, 
-                 reservoir_rfc_persist_days,
-                 gl_df_sub, 
-                 gl_parm_lake_id_sub, 
-                 gl_param_flows_sub,
-                 gl_param_time_sub,
-                 gl_param_update_time_sub,
-                 gl_climatology_df_sub,
-                 waterbody_types_df_sub,
-                ) = _prep_reservoir_da_dataframes(
-                    reservoir_usgs_df,
-                    reservoir_usgs_param_df,
-                    reservoir_usace_df, 
-                    reservoir_usace_param_df,
-                    reservoir_rfc_df,
-                    reservoir_rfc_param_df,
-                    great_lakes_df,
-                    great_lakes_param_df,
-                    great_lakes_climatology_df,
-                    waterbody_types_df_sub, 
-                    t0,
-                    from_files,
-                    set()
-                    )
-
-                jobs.append(
-                    delayed(compute_func)(
+        inputs = _get_cluster_inputs(
+            cluster_inputs,
+            parallel_compute_method,
+            list(reaches_bytw),
+            lambda: {
+                tw: (list(chain.from_iterable(reach_list)), set(), reach_list)
+                for tw, reach_list in reaches_bytw.items()
+            },
+            param_df,
+            param_cols,
+            waterbodies_df,
+            waterbody_types_df,
+        )
+        # kernel arguments of every network for every member, the members of
+        # a network are routed together by one job
+        member_args = {tw: [] for tw in reaches_bytw}
+        for member, frames in enumerate(member_inputs):
+            inputs.update_forcing(
+                frames["q0"], frames["qlats"], frames["waterbodies_df"]
+            )
+            da_by_job = inputs.split_da(usgs_df, frames["lastobs_df"])
+            for tw in reaches_bytw:
+                index, params, q0_sub, qlat_sub = inputs.job_arrays(tw)
+                lake_segs, waterbodies_values, _ = inputs.waterbodies[tw]
+                waterbody_types_df_sub, da_args = _partitioned_da_args(
+                    inputs, tw, da_by_job, member
+                )
+                member_args[tw].append(
+                    [
                         nts,
                         dt,
                         qts_subdivisions,
-                        reaches_list_with_type,
+                        inputs.reach_types[tw],
                         independent_networks[tw],
-                        param_df_sub.index.values.astype("int64"),
-                        param_df_sub.columns.values,
-                        param_df_sub.values,
-                        q0_sub.values.astype("float32"),
-                        qlat_sub.values.astype("float32"),
+                        index,
+                        inputs.param_cols,
+                        params,
+                        q0_sub,
+                        qlat_sub,
                         lake_segs,
-                        waterbodies_df_sub.values,
+                        waterbodies_values,
                         data_assimilation_parameters,
                         waterbody_types_df_sub.values.astype("int32"),
                         waterbody_type_specified,
                         t0.strftime('%Y-%m-%d_%H:%M:%S'),
-                        usgs_df_sub.values.astype("float32"),
-                        np.array(da_positions_list_byseg, dtype="int32"),
-                        np.array(da_positions_list_byreach, dtype="int32"),
-                        np.array(da_positions_list_bygage, dtype="int32"),
-                        lastobs_df_sub.get("lastobs_discharge", pd.Series(index=lastobs_df_sub.index, name="Null", dtype="float32")).values.astype("float32"),
-                        lastobs_df_sub.get("time_since_lastobs", pd.Series(index=lastobs_df_sub.index, name="Null", dtype="float32")).values.astype("float32"),
-                        da_decay_coefficient,
-                        # USGS Hybrid Reservoir DA data
-                        reservoir_usgs_df_sub.values.astype("float32"),
-                        reservoir_usgs_df_sub.index.values.astype("int32"),
-                        reservoir_usgs_df_time.astype('float32'),
-                        reservoir_usgs_update_time.astype('float32'),
-                        reservoir_usgs_prev_persisted_flow.astype('float32'),
-                        reservoir_usgs_persistence_update_time.astype('float32'),
-                        reservoir_usgs_persistence_index.astype('float32'),
-                        # USACE Hybrid Reservoir DA data
-                        reservoir_usace_df_sub.values.astype("float32"),
-                        reservoir_usace_df_sub.index.values.astype("int32"),
-                        reservoir_usace_df_time.astype('float32'),
-                        reservoir_usace_update_time.astype("float32"),
-                        reservoir_usace_prev_persisted_flow.astype("float32"),
-                        reservoir_usace_persistence_update_time.astype("float32"),
-                        reservoir_usace_persistence_index.astype("float32"),
-                        # RFC Reservoir DA data
-                        reservoir_rfc_df_sub.values.astype("float32"),
-                        reservoir_rfc_df_sub.index.values.astype("int32"),
-                        reservoir_rfc_totalCounts.astype("int32"),
-                        reservoir_rfc_file,
-                        reservoir_rfc_use_forecast.astype("int32"),
-                        reservoir_rfc_timeseries_idx.astype("int32"),
-                        reservoir_rfc_update_time.astype("float32"),
-                        reservoir_rfc_da_timestep.astype("int32"),
-                        reservoir_rfc_persist_days.astype("int32"),
-                        # Great Lakes DA data
-                        gl_df_sub.lake_id.values.astype("int32"),
-                        gl_df_sub.time.values.astype("int32"),
-                        gl_df_sub.Discharge.values.astype("float32"),
-                        gl_parm_lake_id_sub.astype("int32"),
-                        gl_param_flows_sub.astype("float32"),
-                        gl_param_time_sub.astype("int32"),
-                        gl_param_update_time_sub.astype("int32"),
-                        gl_climatology_df_sub.values.astype("float32"),
+                        *da_args,
+                    ]
+                )
+
+        with Parallel(n_jobs=cpu_pool, backend=parallel_backend) as parallel:
+            jobs = {}
+            for tw in reaches_bytw:
+                args = _stack_member_args(member_args[tw])
+                index, params = args[5], args[7]
+                plan_kwargs = {}
+                if thread_plans is not None:
+                    plan_kwargs["plan"] = _cached_plan(
+                        thread_plans,
+                        tw,
+                        inputs.reach_types[tw],
+                        independent_networks[tw],
+                        index,
+                        inputs.param_cols,
+                        params,
+                    )
+
+                jobs[tw] = (
+                    delayed(compute_func)(
+                        *args,
                         {},
                         assume_short_ts,
                         return_courant,
                         from_files=from_files,
+                        hydraulic_table_size=hydraulic_table_size,
+                        hydraulic_table_max_depth=hydraulic_table_max_depth,
+                        return_diagnostics=solver_diagnostics,
+                        route_headwaters_upfront=route_headwaters_upfront,
+                        n_threads=reach_threads,
+                        n_members=n_members,
+                        **plan_kwargs,
                     )
                 )
 
-            results = parallel(jobs)
+            # start the longest networks first and batch the small ones,
+            # so the run does not end on a tail of small jobs
+            if cluster_cost_model is not None:
+                costs = {
+                    tw: cluster_cost_model.cost(
+                        cluster_cost_model.features(reaches_bytw[tw], *cost_context)
+                    )
+                    for tw in jobs
+                }
+            else:
+                costs = {
+                    tw: sum(len(reach) for reach in reaches_bytw[tw]) for tw in jobs
+                }
+            batches = _batch_networks(costs, network_batch_size)
+            timed_batches = parallel(
+                delayed(_compute_network_batch)([jobs[tw] for tw in batch])
+                for batch in batches
+            )
+            _report_network_timings(batches, timed_batches, costs)
+
+            timed_results = dict(
+                zip(chain.from_iterable(batches), chain.from_iterable(timed_batches))
+            )
+            if cluster_cost_model is not None:
+                for tw, (_, seconds) in timed_results.items():
+                    cluster_cost_model.record(
+                        cluster_cost_model.features(reaches_bytw[tw], *cost_context),
+                        seconds / max(nts, 1),
+                    )
+            results = [timed_results[tw][0] for tw in jobs]
 
     elif parallel_compute_method == "serial":
         results = []
@@ -1414,23 +1938,6 @@ def compute_nhd_routing_v02(
 
                 lake_segs = list(waterbodies_df.index.intersection(segs))
 
-                waterbodies_df_sub = waterbodies_df.loc[
-                    lake_segs,
-                    [
-                        "LkArea",
-                        "LkMxE",
-                        "OrificeA",
-                        "OrificeC",
-                        "OrificeE",
-                        "WeirC",
-                        "WeirE",
-                        "WeirL",
-                        "ifd",
-                        "qd0",
-                        "h0",
-                    ],
-                ]
-
                 #If reservoir types other than Level Pool are active
                 if not waterbody_types_df.empty:
                     waterbody_types_df_sub = waterbody_types_df.loc[
@@ -1442,7 +1949,6 @@ def compute_nhd_routing_v02(
 
             else:
                 lake_segs = []
-                waterbodies_df_sub = pd.DataFrame()
 
             param_df_sub = param_df.loc[
                 common_segs,
@@ -1451,132 +1957,108 @@ def compute_nhd_routing_v02(
 
             reaches_list_with_type = _build_reach_type_list(reach_list, wbodies_segs)
 
-            # qlat_sub = qlats.loc[common_segs].sort_index()
-            # q0_sub = q0.loc[common_segs].sort_index()
-            qlat_sub = qlats.loc[param_df_sub.index]
-            q0_sub = q0.loc[param_df_sub.index]
-
+            channel_index = param_df_sub.index
             param_df_sub = param_df_sub.reindex(
                 param_df_sub.index.tolist() + lake_segs
             ).sort_index()
+            data_idx = param_df_sub.index.values.astype("int64")
 
-            usgs_df_sub, lastobs_df_sub, da_positions_list_byseg = _prep_da_dataframes(usgs_df, lastobs_df, param_df_sub.index)
-            da_positions_list_byreach, da_positions_list_bygage = _prep_da_positions_byreach(reach_list, lastobs_df_sub.index)
+            # kernel arguments of every member, the members of the network
+            # are routed together
+            member_args = []
+            for frames in member_inputs:
+                if not waterbodies_df.empty:
+                    waterbodies_df_sub = frames["waterbodies_df"].loc[
+                        lake_segs, WATERBODY_COLS
+                    ]
+                else:
+                    waterbodies_df_sub = pd.DataFrame()
 
-            qlat_sub = qlat_sub.reindex(param_df_sub.index)
-            q0_sub = q0_sub.reindex(param_df_sub.index)
-            
-            # prepare reservoir DA data
-            (reservoir_usgs_df_sub, 
-             reservoir_usgs_df_time,
-             reservoir_usgs_update_time,
-             reservoir_usgs_prev_persisted_flow,
-             reservoir_usgs_persistence_update_time,
-             reservoir_usgs_persistence_index,
-             reservoir_usace_df_sub, 
-             reservoir_usace_df_time,
-             reservoir_usace_update_time,
-             reservoir_usace_prev_persisted_flow,
-             reservoir_usace_persistence_update_time,
-             reservoir_usace_persistence_index,
-             reservoir_rfc_df_sub, 
-             reservoir_rfc_totalCounts, 
-             reservoir_rfc_file, 
-             reservoir_rfc_use_forecast, 
-             reservoir_rfc_timeseries_idx, 
-             reservoir_rfc_update_time, 
-             reservoir_rfc_da_timestep, 
-             reservoir_rfc_persist_days,
-             gl_df_sub,
-             gl_parm_lake_id_sub, 
-             gl_param_flows_sub,
-             gl_param_time_sub,
-             gl_param_update_time_sub,
-             gl_climatology_df_sub,
-             waterbody_types_df_sub,
-             ) = _prep_reservoir_da_dataframes(
-                reservoir_usgs_df,
-                reservoir_usgs_param_df,
-                reservoir_usace_df, 
-                reservoir_usace_param_df,
-                reservoir_rfc_df,
-                reservoir_rfc_param_df,
-                great_lakes_df,
-                great_lakes_param_df,
-                great_lakes_climatology_df,
-                waterbody_types_df_sub, 
-                t0,
-                from_files,
+                # qlat_sub = qlats.loc[common_segs].sort_index()
+                # q0_sub = q0.loc[common_segs].sort_index()
+                qlat_sub = frames["qlats"].loc[channel_index].reindex(param_df_sub.index)
+                q0_sub = frames["q0"].loc[channel_index].reindex(param_df_sub.index)
+
+                usgs_df_sub, lastobs_df_sub, da_positions_list_byseg = _prep_da_dataframes(usgs_df, frames["lastobs_df"], param_df_sub.index)
+                da_positions_list_byreach, da_positions_list_bygage = _prep_da_positions_byreach(reach_list, lastobs_df_sub.index)
+
+                # prepare reservoir DA data
+                member_types_df_sub, reservoir_da_args = _prep_reservoir_da_job_args(
+                    reservoir_usgs_df,
+                    frames["reservoir_usgs_param_df"],
+                    reservoir_usace_df,
+                    frames["reservoir_usace_param_df"],
+                    reservoir_rfc_df,
+                    frames["reservoir_rfc_param_df"],
+                    great_lakes_df,
+                    frames["great_lakes_param_df"],
+                    great_lakes_climatology_df,
+                    waterbody_types_df_sub.copy(),
+                    t0,
+                    from_files,
                 )
-            
-            results.append(
-                compute_func(
-                    nts,
-                    dt,
-                    qts_subdivisions,
+
+                member_args.append(
+                    [
+                        nts,
+                        dt,
+                        qts_subdivisions,
+                        reaches_list_with_type,
+                        independent_networks[tw],
+                        data_idx,
+                        param_df_sub.columns.values,
+                        param_df_sub.values,
+                        q0_sub.values.astype("float32"),
+                        qlat_sub.values.astype("float32"),
+                        lake_segs,
+                        waterbodies_df_sub.values,
+                        data_assimilation_parameters,
+                        member_types_df_sub.values.astype("int32"),
+                        waterbody_type_specified,
+                        t0.strftime('%Y-%m-%d_%H:%M:%S'),
+                        usgs_df_sub.values.astype("float32"),
+                        np.array(da_positions_list_byseg, dtype="int32"),
+                        np.array(da_positions_list_byreach, dtype="int32"),
+                        np.array(da_positions_list_bygage, dtype="int32"),
+                        lastobs_df_sub.get("lastobs_discharge", pd.Series(index=lastobs_df_sub.index, name="Null", dtype="float32")).values.astype("float32"),
+                        lastobs_df_sub.get("time_since_lastobs", pd.Series(index=lastobs_df_sub.index, name="Null", dtype="float32")).values.astype("float32"),
+                        da_decay_coefficient,
+                        *reservoir_da_args,
+                    ]
+                )
+
+            plan = None
+            if routing_plans is not None:
+                # reach structs of this network, built on the first loop
+                plan = _cached_plan(
+                    routing_plans,
+                    tw,
                     reaches_list_with_type,
                     independent_networks[tw],
-                    param_df_sub.index.values.astype("int64"),
+                    data_idx,
                     param_df_sub.columns.values,
                     param_df_sub.values,
-                    q0_sub.values.astype("float32"),
-                    qlat_sub.values.astype("float32"),
-                    lake_segs,
-                    waterbodies_df_sub.values,
-                    data_assimilation_parameters,
-                    waterbody_types_df_sub.values.astype("int32"),
-                    waterbody_type_specified,
-                    t0.strftime('%Y-%m-%d_%H:%M:%S'),
-                    usgs_df_sub.values.astype("float32"),
-                    np.array(da_positions_list_byseg, dtype="int32"),
-                    np.array(da_positions_list_byreach, dtype="int32"),
-                    np.array(da_positions_list_bygage, dtype="int32"),
-                    lastobs_df_sub.get("lastobs_discharge", pd.Series(index=lastobs_df_sub.index, name="Null", dtype="float32")).values.astype("float32"),
-                    lastobs_df_sub.get("time_since_lastobs", pd.Series(index=lastobs_df_sub.index, name="Null", dtype="float32")).values.astype("float32"),
-                    da_decay_coefficient,
-                    # USGS Hybrid Reservoir DA data
-                    reservoir_usgs_df_sub.values.astype("float32"),
-                    reservoir_usgs_df_sub.index.values.astype("int32"),
-                    reservoir_usgs_df_time.astype('float32'),
-                    reservoir_usgs_update_time.astype('float32'),
-                    reservoir_usgs_prev_persisted_flow.astype('float32'),
-                    reservoir_usgs_persistence_update_time.astype('float32'),
-                    reservoir_usgs_persistence_index.astype('float32'),
-                    # USACE Hybrid Reservoir DA data
-                    reservoir_usace_df_sub.values.astype("float32"),
-                    reservoir_usace_df_sub.index.values.astype("int32"),
-                    reservoir_usace_df_time.astype('float32'),
-                    reservoir_usace_update_time.astype("float32"),
-                    reservoir_usace_prev_persisted_flow.astype("float32"),
-                    reservoir_usace_persistence_update_time.astype("float32"),
-                    reservoir_usace_persistence_index.astype("float32"),
-                    # RFC Reservoir DA data
-                    reservoir_rfc_df_sub.values.astype("float32"),
-                    reservoir_rfc_df_sub.index.values.astype("int32"),
-                    reservoir_rfc_totalCounts.astype("int32"),
-                    reservoir_rfc_file,
-                    reservoir_rfc_use_forecast.astype("int32"),
-                    reservoir_rfc_timeseries_idx.astype("int32"),
-                    reservoir_rfc_update_time.astype("float32"),
-                    reservoir_rfc_da_timestep.astype("int32"),
-                    reservoir_rfc_persist_days.astype("int32"),
-                    # Great Lakes DA data
-                    gl_df_sub.lake_id.values.astype("int32"),
-                    gl_df_sub.time.values.astype("int32"),
-                    gl_df_sub.Discharge.values.astype("float32"),
-                    gl_parm_lake_id_sub.astype("int32"),
-                    gl_param_flows_sub.astype("float32"),
-                    gl_param_time_sub.astype("int32"),
-                    gl_param_update_time_sub.astype("int32"),
-                    gl_climatology_df_sub.values.astype("float32"),
+                )
+
+            results.append(
+                compute_func(
+                    *_stack_member_args(member_args),
                     {},
                     assume_short_ts,
                     return_courant,
                     from_files=from_files,
+                    hydraulic_table_size=hydraulic_table_size,
+                    hydraulic_table_max_depth=hydraulic_table_max_depth,
+                    return_diagnostics=solver_diagnostics,
+                    route_headwaters_upfront=route_headwaters_upfront,
+                    n_threads=reach_threads,
+                    stream_callback=stream_writer,
+                    stream_window=stream_writer.window if stream_writer else 0,
+                    plan=plan,
+                    n_members=n_members,
                 )
             )
 
-
     elif parallel_compute_method == "bmi":
         results = []
         for twi, (tw, reach_list) in enumerate(reaches_bytw.items(), 1):
@@ -1732,11 +2214,127 @@ def compute_nhd_routing_v02(
                     },
                     assume_short_ts,
                     return_courant,
+                    hydraulic_table_size=hydraulic_table_size,
+                    hydraulic_table_max_depth=hydraulic_table_max_depth,
+                    return_diagnostics=solver_diagnostics,
+                    route_headwaters_upfront=route_headwaters_upfront,
                 )
             )
 
+    if members is not None:
+        results = _member_results(results, n_members)
+
     return results, subnetwork_list
 
+
+def _tributary_inflows(results, segments):
+    '''
+    MC flows of tributary segments, gathered from the routing results by one
+    index of every routed segment instead of a search of every result.
+
+    Arguments
+    ---------
+    results   (list): routing results tuples, segment ids in r[0] and
+                      flowveldepth in r[1]
+    segments  (list): tributary segment ids
+
+    Returns
+    -------
+    inflows (DataFrame): flows of the segments found in the results, in
+                         the order of the results, indexed by segment id
+    '''
+    ids = [r[0] for r in results]
+    lengths = [len(i) for i in ids]
+    index = pd.Index(np.concatenate(ids)) if ids else pd.Index([], dtype="int64")
+    positions = index.get_indexer(np.fromiter(segments, dtype=index.dtype))
+    positions = np.sort(positions[positions >= 0])
+
+    ends = np.cumsum(lengths)
+    owners = np.searchsorted(ends, positions, side="right")
+    rows = positions - (ends - lengths)[owners]
+
+    nts = results[0][1].shape[1] // 3 if results else 0
+    dtype = results[0][1].dtype if results else "float32"
+    flows = np.empty((positions.shape[0], nts), dtype=dtype)
+    bounds = np.searchsorted(owners, np.arange(len(results) + 1))
+    for k in np.unique(owners):
+        flows[bounds[k]:bounds[k + 1]] = results[k][1][rows[bounds[k]:bounds[k + 1]], ::3]
+    return pd.DataFrame(flows, index=index[positions])
+
+
+def _compute_diffusive_domain(diffusive_inputs, tributary_segments, nts):
+    '''
+    Route one diffusive domain.
+
+    Arguments
+    ---------
+    diffusive_inputs   (dict): inputs built by diffusive_input_data_v02
+    tributary_segments (list): tributary segments of the domain, routed by MC
+    nts                 (int): number of timesteps
+
+    Returns
+    -------
+    results (tuple): results of the domain without its tributary segments,
+                     in the layout of compute_network_structured results
+    '''
+    # run the simulation
+    out_q, out_elv, out_depth = diffusive.compute_diffusive(diffusive_inputs)
+
+    # unpack results
+    rch_list, dat_all = diff_utils.unpack_output(
+        diffusive_inputs['pynw'],
+        diffusive_inputs['ordered_reaches'],
+        out_q,
+        out_depth, #out_elv
+    )
+
+    # mask segments for which we already have MC solution
+    x = np.in1d(rch_list, tributary_segments)
+
+    return (
+        rch_list[~x], dat_all[~x,3:], 0,
+        # place-holder for streamflow DA parameters
+        (np.asarray([]), np.asarray([]), np.asarray([])),
+        # place-holder for reservoir DA parameters
+        (np.asarray([]), np.asarray([]), np.asarray([]), np.asarray([]), np.asarray([])),
+        (np.asarray([]), np.asarray([]), np.asarray([]), np.asarray([]), np.asarray([])),
+        # place holder for reservoir inflows
+        np.zeros(dat_all[~x,3::3].shape),
+        # place-holder for rfc DA parameters
+        (np.asarray([]), np.asarray([]), np.asarray([])),
+        # place-holder for nudge values
+        (np.empty(shape=(0, nts + 1), dtype='float32')),
+        # place-holder for great lakes DA values/parameters
+        (np.asarray([]), np.asarray([]), np.asarray([]), np.asarray([])),
+        # place-holder for solver diagnostics
+        None,
+    )
+
+
+def _report_diffusive_timings(tailwaters, timed_results, sizes, cpu_pool):
+    '''
+    Log the routing time of each diffusive domain.
+
+    Arguments
+    ---------
+    tailwaters    (list): diffusive tailwaters, in the order they were started
+    timed_results (dict): {tailwater: (result, seconds)}
+    sizes         (dict): {tailwater: number of mainstem segments}
+    cpu_pool       (int): number of workers
+    '''
+    for tw in tailwaters:
+        LOG.info(
+            "diffusive domain %s, %d mainstem segments: %s seconds"
+            % (tw, sizes[tw], timed_results[tw][1])
+        )
+    if tailwaters:
+        seconds = [timed_results[tw][1] for tw in tailwaters]
+        LOG.info(
+            "diffusive: %d domains on %d workers, longest %s seconds, total %s seconds"
+            % (len(tailwaters), cpu_pool, max(seconds), sum(seconds))
+        )
+
+
 def compute_diffusive_routing(
     results,
     diffusive_network_data,
@@ -1756,52 +2354,80 @@ def compute_diffusive_routing(
     refactored_reaches,
     coastal_boundary_depth_df, 
     unrefactored_topobathy,
+    diffusive_static=None,
+    diffusive_cache_dir=None,
     ):
+    '''
+    Route the diffusive domains, downstream of the MC results.
+
+    The static inputs of a domain (reach ordering, network mapping, channel
+    geometry and cross sections) are built once and kept in diffusive_static
+    for later loops, keyed by a hash of the domain, its junctions, its
+    topobathy and its refactored hydrofabric inputs, see static_inputs_key.
+    With diffusive_cache_dir, their arrays are also read from, and written
+    to, that folder, and so are the channel cross section lookup tables the
+    kernel then maps read-only instead of building them, see diffusive_cache.
+    '''
 
-    results_diffusive = []
-    for tw in diffusive_network_data: # <------- TODO - by-network parallel loop, here.
-        trib_segs = None
-        trib_flow = None
-        # extract junction inflows from results array
-        for j, i in enumerate(results):
-            x = np.in1d(i[0], diffusive_network_data[tw]['tributary_segments'])
-            if sum(x) > 0:
-                if j == 0:
-                    trib_segs = i[0][x]
-                    trib_flow = i[1][x, ::3]
-                else:
-                    if trib_segs is None:
-                        trib_segs = i[0][x]
-                        trib_flow = i[1][x, ::3]                        
-                    else:
-                        trib_segs = np.append(trib_segs, i[0][x])
-                        trib_flow = np.append(trib_flow, i[1][x, ::3], axis = 0)  
-
-        # create DataFrame of junction inflow data            
-        junction_inflows = pd.DataFrame(data = trib_flow, index = trib_segs)
+    # diffusive streamflow DA activation switch
+    #if da_parameter_dict['diffusive_streamflow_nudging']==True:
+    if 'diffusive_streamflow_nudging' in da_parameter_dict:
+        diffusive_usgs_df = usgs_df
+    else:
+        diffusive_usgs_df = pd.DataFrame()
+
+    # temporary: column names of qlats from HYfeature are currently timestamps. To be consistent with qlats from NHD
+    # the column names need to be changed to intergers from zero incrementing by 1
+    diffusive_qlats = qlats.copy()
+    diffusive_qlats.columns = range(diffusive_qlats.shape[1])
+
+    # MC flows of the tributaries of every domain, extracted from the results at once
+    tributary_inflows = _tributary_inflows(
+        results,
+        set(
+            chain.from_iterable(
+                d['tributary_segments'] for d in diffusive_network_data.values()
+            )
+        ),
+    )
+
+    tributary_index = tributary_inflows.index
+    tributary_flows = tributary_inflows.to_numpy()
+    # rows of the tributary inflows, the same every loop while the MC results are
+    tributary_layout = hashlib.sha256(
+        np.ascontiguousarray(tributary_index.values).tobytes()
+    ).hexdigest()
+
+    def _domain_inputs(tw):
+        # junction segments of this domain, and the rows of the inflows of its
+        # tributary reaches, kept with its static inputs
+        tributary_rows = None
+        if diffusive_static is not None and tw in diffusive_static:
+            tributary_rows = diffusive_static[tw][1].get("tributary_rows")
+        if tributary_rows is not None and tributary_rows[0] == tributary_layout:
+            _, junction_segments, trib_rows = tributary_rows
+        else:
+            positions = tributary_index.get_indexer(
+                diffusive_network_data[tw]['tributary_segments']
+            )
+            junction_segments = set(tributary_index[positions[positions >= 0]])
+            trib_rows = None
 
         if not topobathy.empty:
-            # create topobathy data for diffusive mainstem segments related to this given tw segment        
+            # create topobathy data for diffusive mainstem segments related to this given tw segment
             if refactored_diffusive_domain:
-                topobathy_bytw               = topobathy.loc[refactored_diffusive_domain[tw]['rlinks']] 
-                # TODO: missing topobathy data in one of diffuisve domains, so inactivate the next line for now. 
+                topobathy_bytw               = topobathy.loc[refactored_diffusive_domain[tw]['rlinks']]
+                # TODO: missing topobathy data in one of diffuisve domains, so inactivate the next line for now.
                 #unrefactored_topobathy_bytw  = unrefactored_topobathy.loc[diffusive_network_data[tw]['mainstem_segs']]
                 unrefactored_topobathy_bytw = pd.DataFrame()
             else:
-                topobathy_bytw               = topobathy.loc[diffusive_network_data[tw]['mainstem_segs']] 
+                topobathy_bytw               = topobathy.loc[diffusive_network_data[tw]['mainstem_segs']]
                 unrefactored_topobathy_bytw = pd.DataFrame()
-            
+
         else:
             topobathy_bytw = pd.DataFrame()
             unrefactored_topobathy_bytw = pd.DataFrame()
 
-        # diffusive streamflow DA activation switch
-        #if da_parameter_dict['diffusive_streamflow_nudging']==True:
-        if 'diffusive_streamflow_nudging' in da_parameter_dict:
-            diffusive_usgs_df = usgs_df
-        else:
-            diffusive_usgs_df = pd.DataFrame()
-
         # tw in refactored hydrofabric
         if refactored_diffusive_domain:
             refactored_tw = refactored_diffusive_domain[tw]['refac_tw']
@@ -1810,20 +2436,58 @@ def compute_diffusive_routing(
         else:
             refactored_diffusive_domain_bytw = None
             refactored_reaches_byrftw        = None
-  
+
         # coastal boundary depth input data at TW
         if tw in coastal_boundary_depth_df.index:
             coastal_boundary_depth_bytw_df = coastal_boundary_depth_df.loc[tw].to_frame().T
         else:
             coastal_boundary_depth_bytw_df = pd.DataFrame()
 
-        # temporary: column names of qlats from HYfeature are currently timestamps. To be consistent with qlats from NHD
-        # the column names need to be changed to intergers from zero incrementing by 1
-        diffusive_qlats = qlats.copy()
-        diffusive_qlats.columns = range(diffusive_qlats.shape[1])  
+        # static inputs, reused while the domain, its junctions and its cross
+        # section data on both hydrofabrics are unchanged
+        key = None
+        static_inputs = None
+        if diffusive_static is not None:
+            key = static_inputs_key(
+                tw,
+                diffusive_network_data[tw],
+                junction_segments,
+                topobathy_bytw,
+                refactored_diffusive_domain_bytw,
+                refactored_reaches_byrftw,
+                unrefactored_topobathy_bytw,
+            )
+            cached_key, static_inputs = diffusive_static.get(tw, (None, None))
+            if cached_key != key:
+                static_inputs = None
+        if static_inputs is None:
+            static_args = (
+                tw,
+                diffusive_network_data[tw]['connections'],
+                diffusive_network_data[tw]['rconn'],
+                diffusive_network_data[tw]['reaches'],
+                diffusive_network_data[tw]['mainstem_segs'],
+                diffusive_network_data[tw]['tributary_segments'],
+                diffusive_network_data[tw]['param_df'],
+                junction_segments,
+                topobathy_bytw,
+            )
+            if diffusive_cache_dir:
+                static_inputs = load_or_build_static_inputs(
+                    diffusive_cache_dir, *static_args
+                )
+            else:
+                static_inputs = diff_utils.diffusive_static_inputs(*static_args)
+            if diffusive_static is not None:
+                diffusive_static[tw] = (key, static_inputs)
+            trib_rows = None
+
+        if trib_rows is None:
+            trib_rows = tributary_index.get_indexer(static_inputs["trib_heads"])
+            static_inputs["tributary_rows"] = (tributary_layout, junction_segments, trib_rows)
 
         # build diffusive inputs
-        diffusive_inputs = diff_utils.diffusive_input_data_v02(
+        diff_ins = diff_utils.diffusive_input_data_v02(
             tw,
             diffusive_network_data[tw]['connections'],
             diffusive_network_data[tw]['rconn'],
@@ -1834,7 +2498,7 @@ def compute_diffusive_routing(
             diffusive_network_data[tw]['param_df'],
             diffusive_qlats,
             q0,
-            junction_inflows,
+            None,
             qts_subdivisions,
             t0,
             nts,
@@ -1843,42 +2507,50 @@ def compute_diffusive_routing(
             topobathy_bytw,
             diffusive_usgs_df,
             refactored_diffusive_domain_bytw,
-            refactored_reaches_byrftw, 
+            refactored_reaches_byrftw,
             coastal_boundary_depth_bytw_df,
             unrefactored_topobathy_bytw,
+            static_inputs=static_inputs,
+            trib_inflows=tributary_flows[trib_rows],
         )
 
-        # run the simulation
-        out_q, out_elv, out_depth = diffusive.compute_diffusive(diffusive_inputs)
-
-        # unpack results
-        rch_list, dat_all = diff_utils.unpack_output(
-            diffusive_inputs['pynw'], 
-            diffusive_inputs['ordered_reaches'], 
-            out_q, 
-            out_depth, #out_elv
-        )
-        
-        # mask segments for which we already have MC solution
-        x = np.in1d(rch_list, diffusive_network_data[tw]['tributary_segments'])
-        
-        results_diffusive.append(
-            (
-                rch_list[~x], dat_all[~x,3:], 0,
-                # place-holder for streamflow DA parameters
-                (np.asarray([]), np.asarray([]), np.asarray([])),
-                # place-holder for reservoir DA parameters
-                (np.asarray([]), np.asarray([]), np.asarray([]), np.asarray([]), np.asarray([])),
-                (np.asarray([]), np.asarray([]), np.asarray([]), np.asarray([]), np.asarray([])),
-                # place holder for reservoir inflows
-                np.zeros(dat_all[~x,3::3].shape),
-                # place-holder for rfc DA parameters
-                (np.asarray([]), np.asarray([]), np.asarray([])),
-                # place-holder for nudge values
-                (np.empty(shape=(0, nts + 1), dtype='float32')),
-                # place-holder for great lakes DA values/parameters
-                (np.asarray([]), np.asarray([]), np.asarray([]), np.asarray([])),
+        # channel cross section lookup table, mapped from the cache and kept
+        # with the static inputs, instead of being built by the kernel
+        if diffusive_cache_dir:
+            if "chxsec_lookuptable" not in static_inputs:
+                (
+                    static_inputs["chxsec_lookuptable"],
+                    static_inputs["z_adj"],
+                ) = load_or_build_chxsec_lookuptable(diffusive_cache_dir, diff_ins)
+            diff_ins["chxsec_lookuptable"] = static_inputs["chxsec_lookuptable"]
+            diff_ins["z_adj"] = static_inputs["z_adj"]
+
+        return diff_ins
+
+    # diffusive domains are independent, the largest ones are started first
+    sizes = {
+        tw: len(diffusive_network_data[tw]['mainstem_segs'])
+        for tw in diffusive_network_data
+    }
+    tailwaters = sorted(diffusive_network_data, key=sizes.get, reverse=True)
+
+    # the inputs of a domain are built as a worker is about to take it,
+    # while the domains started before it are routed
+    with Parallel(n_jobs=cpu_pool, backend="loky") as parallel:
+        timed_results = dict(
+            zip(
+                tailwaters,
+                parallel(
+                    delayed(timed_call)(
+                        _compute_diffusive_domain,
+                        _domain_inputs(tw),
+                        diffusive_network_data[tw]['tributary_segments'],
+                        nts,
+                    )
+                    for tw in tailwaters
+                ),
             )
         )
+    _report_diffusive_timings(tailwaters, timed_results, sizes, cpu_pool)
 
-    return results_diffusive
+    return [timed_results[tw][0] for tw in diffusive_network_data]
@@ -0,0 +1,408 @@
+import os
+import hashlib
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import troute.routing.diffusive_utils_v02 as diff_utils
+from troute.routing.fast_reach.chxsec_lookuptable import compute_chxsec_lookuptable
+
+import logging
+
+LOG = logging.getLogger('')
+
+# bump when the layout of the cached arrays changes
+CACHE_VERSION = 1
+
+# rows of the channel cross section lookup tables, as the diffusive kernel builds them
+CHXSEC_TABLE_ROWS = 501
+
+
+def _frame_hash(df):
+    '''
+    Hash the index, columns and values of a DataFrame into one array.
+    '''
+    if df.empty:
+        return np.empty(0, dtype="uint64")
+    columns = pd.util.hash_array(np.asarray(df.columns.astype(str), dtype=object))
+    rows = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    return np.concatenate([columns, rows])
+
+
+def diffusive_cache_key(
+    tw,
+    connections,
+    mainstem_seg_list,
+    trib_seg_list,
+    param_df,
+    junction_segments,
+    topobathy_bytw,
+):
+    '''
+    Hash the inputs that determine the static inputs of a diffusive domain.
+
+    Arguments
+    ---------
+    tw                     (int): tailwater segment of the domain
+    connections           (dict): downstream connections of the domain
+    mainstem_seg_list     (list): mainstem segments of the domain
+    trib_seg_list         (list): tributary segments of the domain
+    param_df         (DataFrame): channel parameters of the domain
+    junction_segments     (iter): tributary segments flowing into a junction
+    topobathy_bytw   (DataFrame): cross section data of the domain
+
+    Returns
+    -------
+    key (str): hex digest
+    '''
+    keys = np.fromiter(connections.keys(), dtype="int64", count=len(connections))
+    keys.sort()
+    downstreams = np.fromiter(
+        (v for k in keys.tolist() for v in connections[k]), dtype="int64"
+    )
+    counts = np.fromiter(
+        (len(connections[k]) for k in keys.tolist()), dtype="int64", count=len(keys)
+    )
+
+    h = hashlib.sha256()
+    h.update(f"v{CACHE_VERSION};{int(tw)};".encode())
+    for arr in (
+        keys,
+        counts,
+        downstreams,
+        np.asarray(list(mainstem_seg_list), dtype="int64"),
+        np.unique(np.asarray(list(trib_seg_list), dtype="int64")),
+        np.unique(np.asarray(list(junction_segments), dtype="int64")),
+        _frame_hash(param_df),
+        _frame_hash(topobathy_bytw),
+    ):
+        h.update(np.int64(arr.shape[0]).tobytes())
+        h.update(np.ascontiguousarray(arr).tobytes())
+    return h.hexdigest()
+
+
+def _update_hash(h, obj):
+    '''
+    Feed a structure of dicts, lists, arrays, DataFrames and scalars, such as
+    the refactored hydrofabric crosswalk of a domain, to a hash.
+    '''
+    if isinstance(obj, dict):
+        h.update(b"{%d" % len(obj))
+        for k in sorted(obj, key=repr):
+            _update_hash(h, k)
+            _update_hash(h, obj[k])
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        items = sorted(obj, key=repr) if isinstance(obj, (set, frozenset)) else obj
+        h.update(b"[%d" % len(items))
+        for item in items:
+            _update_hash(h, item)
+    elif isinstance(obj, pd.DataFrame):
+        arr = _frame_hash(obj)
+        h.update(b"F%d" % arr.shape[0])
+        h.update(arr.tobytes())
+    elif isinstance(obj, (np.ndarray, pd.Index, pd.Series)):
+        arr = np.asarray(obj)
+        h.update(f"A{arr.dtype.str}{arr.shape}".encode())
+        if arr.dtype.hasobject:
+            _update_hash(h, arr.tolist())
+        else:
+            h.update(np.ascontiguousarray(arr).tobytes())
+    else:
+        h.update(f"S{obj!r};".encode())
+
+
+def static_inputs_key(
+    tw,
+    domain,
+    junction_segments,
+    topobathy_bytw,
+    refactored_diffusive_domain_bytw,
+    refactored_reaches_byrftw,
+    unrefactored_topobathy_bytw,
+):
+    '''
+    Hash the inputs the static inputs of a diffusive domain are kept for
+    between routing loops, see compute.compute_diffusive_routing.
+
+    Arguments
+    ---------
+    tw                                  (int): tailwater segment of the domain
+    domain                             (dict): diffusive_network_data of the domain
+    junction_segments                  (iter): tributary segments flowing into a junction
+    topobathy_bytw                (DataFrame): cross section data of the domain
+    refactored_diffusive_domain_bytw   (dict): refactored hydrofabric crosswalk of
+                                               the domain, None if not refactored
+    refactored_reaches_byrftw          (list): reaches of the domain on the
+                                               refactored hydrofabric
+    unrefactored_topobathy_bytw   (DataFrame): cross section data of the domain on
+                                               the original hydrofabric
+
+    Returns
+    -------
+    key (str): hex digest
+    '''
+    h = hashlib.sha256()
+    h.update(
+        diffusive_cache_key(
+            tw,
+            domain['connections'],
+            domain['mainstem_segs'],
+            domain['tributary_segments'],
+            domain['param_df'],
+            junction_segments,
+            topobathy_bytw,
+        ).encode()
+    )
+    for obj in (
+        domain['rconn'],
+        domain['reaches'],
+        refactored_diffusive_domain_bytw,
+        refactored_reaches_byrftw,
+        unrefactored_topobathy_bytw,
+    ):
+        _update_hash(h, obj)
+    return h.hexdigest()
+
+
+def save_static_inputs(path, static_inputs):
+    '''
+    Write the static arrays of a diffusive domain to a folder of .npy files,
+    one per array, in the Fortran order the diffusive kernel takes them.
+    The folder is written under a temporary name first and then moved into
+    place, so concurrent runs never read a partial cache.
+
+    Arguments
+    ---------
+    path           (str): destination folder
+    static_inputs (dict): built by diffusive_utils_v02.diffusive_static_inputs
+    '''
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=folder)
+    try:
+        for name in diff_utils.STATIC_ARRAYS:
+            np.save(os.path.join(tmp, f"{name}.npy"), static_inputs[name])
+        os.replace(tmp, path)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        # another run wrote the same domain first
+        if not os.path.isdir(path):
+            raise
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def load_static_arrays(path):
+    '''
+    Read the static arrays written by save_static_inputs.
+
+    Returns
+    -------
+    arrays (dict): {name: array} for the names of diffusive_utils_v02.STATIC_ARRAYS
+    '''
+    return {
+        name: np.load(os.path.join(path, f"{name}.npy"), allow_pickle=False)
+        for name in diff_utils.STATIC_ARRAYS
+    }
+
+
+def load_or_build_static_inputs(
+    cache_dir,
+    tw,
+    connections,
+    rconn,
+    reach_list,
+    mainstem_seg_list,
+    trib_seg_list,
+    param_df,
+    junction_segments,
+    topobathy_bytw,
+):
+    '''
+    Return the static inputs of a diffusive domain, reading their arrays
+    from the on-disk cache, building and caching them on a miss.
+
+    Arguments
+    ---------
+    cache_dir (str): folder holding cache folders
+    tw, connections, rconn, reach_list, mainstem_seg_list, trib_seg_list,
+    param_df, junction_segments,
+    topobathy_bytw : see diffusive_utils_v02.diffusive_static_inputs
+
+    Returns
+    -------
+    static_inputs (dict): see diffusive_utils_v02.diffusive_static_inputs
+    '''
+    junction_segments = list(junction_segments)
+    build_args = (
+        tw,
+        connections,
+        rconn,
+        reach_list,
+        mainstem_seg_list,
+        trib_seg_list,
+        param_df,
+        junction_segments,
+        topobathy_bytw,
+    )
+    key = diffusive_cache_key(
+        tw,
+        connections,
+        mainstem_seg_list,
+        trib_seg_list,
+        param_df,
+        junction_segments,
+        topobathy_bytw,
+    )
+    path = os.path.join(cache_dir, f"diffusive_{key}")
+
+    if os.path.isdir(path):
+        try:
+            arrays = load_static_arrays(path)
+            static_inputs = diff_utils.diffusive_static_inputs(*build_args, arrays=arrays)
+            LOG.info("loaded static diffusive inputs of %s from %s" % (tw, path))
+            return static_inputs
+        except Exception as e:
+            LOG.warning(
+                "could not read diffusive cache %s (%s), rebuilding" % (path, e)
+            )
+
+    static_inputs = diff_utils.diffusive_static_inputs(*build_args)
+    try:
+        save_static_inputs(path, static_inputs)
+        LOG.info("saved static diffusive inputs of %s to %s" % (tw, path))
+    except OSError as e:
+        LOG.warning("could not write diffusive cache %s (%s)" % (path, e))
+    return static_inputs
+
+
+def chxsec_cache_key(diff_inputs, nrow=CHXSEC_TABLE_ROWS):
+    '''
+    Hash the contents of the inputs that determine the channel cross section
+    lookup table of a diffusive domain.
+
+    Arguments
+    ---------
+    diff_inputs (dict): inputs built by diffusive_utils_v02.diffusive_input_data_v02
+    nrow         (int): number of rows of the table
+
+    Returns
+    -------
+    key (str): hex digest
+    '''
+    h = hashlib.sha256()
+    h.update(
+        f"v{CACHE_VERSION};{int(nrow)};{float(diff_inputs['para_ar_g'][8])!r};"
+        f"{diff_inputs['frnw_col']};{diff_inputs['mxnbathy_g']};".encode()
+    )
+    for name in diff_utils.STATIC_ARRAYS:
+        arr = np.asfortranarray(diff_inputs[name])
+        h.update(f"{name};{arr.dtype.str};{arr.shape};".encode())
+        # the transpose of a Fortran ordered array is C contiguous, no copy is made
+        h.update(np.ascontiguousarray(arr.T))
+    return h.hexdigest()
+
+
+def save_chxsec_lookuptable(path, diff_inputs, nrow=CHXSEC_TABLE_ROWS):
+    '''
+    Build the channel cross section lookup table of a diffusive domain
+    directly into a memory mapped .npy file, next to the adjusted channel
+    bottom elevations. The folder is written under a temporary name first
+    and then moved into place, so concurrent runs never read a partial table.
+
+    Arguments
+    ---------
+    path         (str): destination folder
+    diff_inputs (dict): inputs built by diffusive_utils_v02.diffusive_input_data_v02
+    nrow         (int): number of rows of the table
+    '''
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=folder)
+    try:
+        shape = (11, nrow, diff_inputs["mxncomp_g"], diff_inputs["nrch_g"])
+        table = np.lib.format.open_memmap(
+            os.path.join(tmp, "chxsec_lookuptable.npy"),
+            mode="w+",
+            dtype=np.float64,
+            shape=shape,
+            fortran_order=True,
+        )
+        z_adj = np.empty(shape[2:], dtype=np.float64, order="F")
+        compute_chxsec_lookuptable(
+            dict(diff_inputs, nrow_chxsec_lookuptable=nrow), table, z_adj
+        )
+        table.flush()
+        del table
+        np.save(os.path.join(tmp, "z_adj.npy"), z_adj)
+        os.replace(tmp, path)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        # another run wrote the same table first
+        if not os.path.isdir(path):
+            raise
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def load_chxsec_lookuptable(path, diff_inputs, nrow=CHXSEC_TABLE_ROWS):
+    '''
+    Map the lookup table written by save_chxsec_lookuptable read-only.
+    Pages of the file are shared by every process mapping it, and joblib
+    passes the mapped arrays to its workers by file name, not by copy.
+
+    Returns
+    -------
+    chxsec_lookuptable (memmap): Fortran ordered table of shape (11, nrow, mxncomp_g, nrch_g)
+    z_adj              (memmap): Fortran ordered adjusted channel bottom elevations
+    '''
+    table = np.load(os.path.join(path, "chxsec_lookuptable.npy"), mmap_mode="r")
+    z_adj = np.load(os.path.join(path, "z_adj.npy"), mmap_mode="r")
+    shape = (diff_inputs["mxncomp_g"], diff_inputs["nrch_g"])
+    if (
+        table.shape != (11, nrow) + shape
+        or z_adj.shape != shape
+        or table.dtype != np.float64
+        or z_adj.dtype != np.float64
+        or not (table.flags.f_contiguous and z_adj.flags.f_contiguous)
+    ):
+        raise ValueError("unexpected lookup table layout")
+    return table, z_adj
+
+
+def load_or_build_chxsec_lookuptable(cache_dir, diff_inputs, nrow=CHXSEC_TABLE_ROWS):
+    '''
+    Return the channel cross section lookup table of a diffusive domain,
+    mapped from the on-disk cache, building and caching it on a miss.
+
+    Arguments
+    ---------
+    cache_dir    (str): folder holding cache folders
+    diff_inputs (dict): inputs built by diffusive_utils_v02.diffusive_input_data_v02
+    nrow         (int): number of rows of the table
+
+    Returns
+    -------
+    chxsec_lookuptable, z_adj (memmap): see load_chxsec_lookuptable
+    '''
+    key = chxsec_cache_key(diff_inputs, nrow)
+    path = os.path.join(cache_dir, f"chxsec_{key}")
+
+    if os.path.isdir(path):
+        try:
+            tables = load_chxsec_lookuptable(path, diff_inputs, nrow)
+            LOG.info("mapped channel cross section lookup table from %s" % path)
+            return tables
+        except Exception as e:
+            LOG.warning(
+                "could not read lookup table cache %s (%s), rebuilding" % (path, e)
+            )
+            shutil.rmtree(path, ignore_errors=True)
+
+    save_chxsec_lookuptable(path, diff_inputs, nrow)
+    LOG.info("saved channel cross section lookup table to %s" % path)
+    return load_chxsec_lookuptable(path, diff_inputs, nrow)
@@ -656,6 +656,214 @@ def fp_coastal_boundary_input_map(
 
     return dt_db_g, dsbd_option, nts_db_g, dbcd_g
     
+# channel geometry arrays built by fp_chgeo_map, in the order it returns them
+CHGEO_ARRAYS = (
+    "z_ar_g",
+    "bo_ar_g",
+    "traps_ar_g",
+    "tw_ar_g",
+    "twcc_ar_g",
+    "mann_ar_g",
+    "manncc_ar_g",
+    "so_ar_g",
+    "dx_ar_g",
+)
+
+# natural cross section arrays built by fp_naturalxsec_map
+BATHY_ARRAYS = ("x_bathy_g", "z_bathy_g", "mann_bathy_g", "size_bathy_g")
+
+# static arrays of a diffusive domain, see diffusive_static_inputs
+STATIC_ARRAYS = ("frnw_g",) + CHGEO_ARRAYS + BATHY_ARRAYS
+
+def diffusive_static_inputs(
+    tw,
+    connections,
+    rconn,
+    reach_list,
+    mainstem_seg_list,
+    trib_seg_list,
+    param_df,
+    junction_segments,
+    topobathy_bytw,
+    arrays=None,
+):
+    """
+    Build the inputs of the diffusive wave model that do not change from one
+    routing loop to the next: the reach ordering, the Python-Fortran network
+    mapping, channel geometry and natural cross section data. Arrays are
+    stored in Fortran order, as the diffusive kernel takes them.
+    
+    Parameters
+    ----------
+    tw -- (int) Tailwater segment ID
+    connections -- (dict) donwstream connections for each segment in the network
+    rconn -- (dict) upstream connections for each segment in the network
+    reach_list -- (list of lists) lists of segments comprising different reaches in the network
+    mainstem_seg_list -- (list) mainstem segments of the diffusive domain
+    trib_seg_list -- (list) tributary segments of the diffusive domain
+    param_df --(DataFrame) geomorphic parameters
+    junction_segments -- (iterable) tributary segments flowing into a junction, where reaches are split
+    topobathy_bytw --(DataFrame) natural channel cross section data of a channel network draining into a tailwater node
+    arrays -- (dict) STATIC_ARRAYS read from diffusive_cache, built here if None
+    
+    Returns
+    -------
+    static_inputs -- (dict) reach ordering, network mapping and STATIC_ARRAYS
+    """
+    # number of reaches in network
+    nrch_g = len(reach_list)
+
+    # maximum number of nodes in a reach
+    mxncomp_g = 0
+    for r in reach_list:
+        nnodes = len(r) + 1
+        if nnodes > mxncomp_g:
+            mxncomp_g = nnodes
+
+    # Order reaches by junction depth
+    junction_segments = set(junction_segments)
+    path_func = partial(nhd_network.split_at_waterbodies_and_junctions, junction_segments, rconn)
+    tr = nhd_network.dfs_decomposition_depth_tuple(rconn, path_func)    
+
+    jorder_reaches = sorted(tr, key=lambda x: x[0])
+    mx_jorder = max(jorder_reaches)[0]  # maximum junction order of subnetwork of TW
+
+    ordered_reaches = {}
+    rchhead_reaches = {}
+    rchbottom_reaches = {}
+    z_all = {}
+    for o, rch in jorder_reaches:
+
+        # add one more segment(fake) to the end of a list of segments to account for node configuration.
+        fksegID = int(str(rch[-1]) + str(2))
+        rch.append(fksegID)
+
+        # additional segment(fake) to upstream bottom segments
+        fk_usbseg = [int(str(x) + str(2)) for x in rconn[rch[0]]] 
+
+        if o not in ordered_reaches:
+            ordered_reaches.update({o: []})
+
+        # populate the ordered_reaches dictionary with node connection information
+        ordered_reaches[o].append(
+            [
+                rch[0],
+                {
+                    "number_segments": len(rch),
+                    "segments_list": rch,
+                    "upstream_bottom_segments": fk_usbseg,
+                    "downstream_head_segment": connections[rch[-2]],
+                },
+            ]
+        )
+
+        if rch[0] not in rchhead_reaches:
+
+            # a list of segments for a given reach-head segment
+            rchhead_reaches.update(
+                {rch[0]: {"number_segments": len(rch), "segments_list": rch}}
+            )
+            # a list of segments for a given reach-bottom segment
+            rchbottom_reaches.update(
+                {rch[-1]: {"number_segments": len(rch), "segments_list": rch}}
+            )
+
+        # for channel altitude adjustment
+        z_all.update({seg: {"adj.alt": np.zeros(1)} for seg in rch})
+
+    dbfksegID = int(str(tw) + str(2))
+
+    # --------------------------------------------------------------------------------------
+    #                                 Step 0-4
+    #     Make Fortran-Python channel network mapping variables.
+    # --------------------------------------------------------------------------------------
+    # build a list of head segments in descending reach order [headwater -> tailwater]
+    # and the positions of tributary reaches, which take junction inflows
+    mainstem_segs = set(mainstem_seg_list)
+    pynw = {}
+    trib_frj = []
+    trib_heads = []
+    frj = -1
+    for x in range(mx_jorder, -1, -1):
+        for head_segment, reach in ordered_reaches[x]:
+            frj = frj + 1
+            pynw[frj] = head_segment
+            if head_segment not in mainstem_segs:
+                trib_frj.append(frj)
+                trib_heads.append(head_segment)
+
+    frnw_col = 20
+    if arrays is None:
+        # --------------------------------------------------------------------------------------
+        #                                 Step 0-3
+        #    Adjust altitude so that altitude of the last sement of a reach is equal to that
+        #    of the first segment of its downstream reach right after their common junction.
+        # --------------------------------------------------------------------------------------
+        adj_alt1(
+            mx_jorder, ordered_reaches, param_df, dbfksegID, z_all
+        )
+
+        frnw_g   = fp_network_map(
+                                  mainstem_seg_list,
+                                  trib_seg_list,  
+                                  mx_jorder, 
+                                  ordered_reaches, 
+                                  rchbottom_reaches, 
+                                  nrch_g, 
+                                  frnw_col, 
+                                  dbfksegID, 
+                                  pynw,
+                                  #upstream_boundary_link,
+                                  )
+
+        # ---------------------------------------------------------------------------------
+        #                              Step 0-5
+        #                  Prepare channel geometry data
+        # ---------------------------------------------------------------------------------
+        chgeo = fp_chgeo_map(
+            mx_jorder,
+            ordered_reaches,
+            param_df,
+            z_all,
+            mxncomp_g,
+            nrch_g,
+        )
+
+        # ---------------------------------------------------------------------------------
+        #                              Step 0-10
+        #                 Prepare cross section bathymetry data
+        # ---------------------------------------------------------------------------------    
+        bathy = fp_naturalxsec_map(        
+                                   ordered_reaches,                             
+                                   mainstem_seg_list, 
+                                   topobathy_bytw,
+                                   param_df, 
+                                   mx_jorder,
+                                   mxncomp_g, 
+                                   nrch_g,
+                                   dbfksegID)
+
+        arrays = dict(zip(STATIC_ARRAYS, (frnw_g,) + tuple(chgeo) + tuple(bathy[:4])))
+
+    static_inputs = {
+        "junction_segments": junction_segments,
+        "nrch_g": nrch_g,
+        "mxncomp_g": mxncomp_g,
+        "mx_jorder": mx_jorder,
+        "ordered_reaches": ordered_reaches,
+        "pynw": pynw,
+        "trib_frj": trib_frj,
+        "trib_heads": trib_heads,
+        "frnw_col": frnw_col,
+    }
+    static_inputs.update(
+        {name: np.asfortranarray(arrays[name]) for name in STATIC_ARRAYS}
+    )
+    # maximum number of stations along a single cross section
+    static_inputs["mxnbathy_g"] = int(static_inputs["x_bathy_g"].shape[0])
+
+    return static_inputs
+
 def diffusive_input_data_v02(
     tw,
     connections,
@@ -679,6 +887,8 @@ def diffusive_input_data_v02(
     refactored_reaches,
     coastal_boundary_depth_df,
     unrefactored_topobathy_bytw,
+    static_inputs=None,
+    trib_inflows=None,
 ):
 
     """
@@ -701,6 +911,9 @@ def diffusive_input_data_v02(
     refactored_diffusive_domain -- (dict) geometric relationship information between original and refactored hydrofabrics
     refactored_reaches -- (list of lists) lists of stream segment IDs of diffusive mainstems on refactored hydrofabrics including 
                                           tributaries of original hydrofabric
+    static_inputs -- (dict) inputs built by diffusive_static_inputs for this domain and junctions, built here if None
+    trib_inflows -- (ndarray) MC flows of the head segments of the tributary reaches, static_inputs['trib_heads'], 
+                              one row each, selected from junction_inflows if None. junction_inflows may then be None
  
     Returns
     -------
@@ -751,16 +964,6 @@ def diffusive_input_data_v02(
     para_ar_g[8]  = 0.0001    # lower limit of channel bed slope (default: 0.0001)
     para_ar_g[9]  = 1.0     # weight in numerically computing 2nd derivative: 0: explicit, 1: implicit (default: 1.0)
     para_ar_g[10] = 2      # downstream water depth boundary condition: 1: given water depth data, 2: normal depth
-    # number of reaches in network
-    nrch_g = len(reach_list)
-
-    # maximum number of nodes in a reach
-    mxncomp_g = 0
-    for r in reach_list:
-        nnodes = len(r) + 1
-        if nnodes > mxncomp_g:
-            mxncomp_g = nnodes
-
 # TODO: How do we plan to utilize upstream boundary condition data object?
 #     ds_seg = []
 #     offnet_segs = []
@@ -800,100 +1003,27 @@ def diffusive_input_data_v02(
 #             upstream_flow_array[j,1:] = np.sum(usq, axis = 0)
 #             upstream_flow_array[j,0] = us_iniq
 
-    # Order reaches by junction depth
-    path_func = partial(nhd_network.split_at_waterbodies_and_junctions, set(junction_inflows.index.to_list()),rconn)
-    tr = nhd_network.dfs_decomposition_depth_tuple(rconn, path_func)    
-
-    jorder_reaches = sorted(tr, key=lambda x: x[0])
-    mx_jorder = max(jorder_reaches)[0]  # maximum junction order of subnetwork of TW
-
-    ordered_reaches = {}
-    rchhead_reaches = {}
-    rchbottom_reaches = {}
-    z_all = {}
-    for o, rch in jorder_reaches:
-
-        # add one more segment(fake) to the end of a list of segments to account for node configuration.
-        fksegID = int(str(rch[-1]) + str(2))
-        rch.append(fksegID)
-
-        # additional segment(fake) to upstream bottom segments
-        fk_usbseg = [int(str(x) + str(2)) for x in rconn[rch[0]]] 
-
-        if o not in ordered_reaches:
-            ordered_reaches.update({o: []})
-
-        # populate the ordered_reaches dictionary with node connection information
-        ordered_reaches[o].append(
-            [
-                rch[0],
-                {
-                    "number_segments": len(rch),
-                    "segments_list": rch,
-                    "upstream_bottom_segments": fk_usbseg,
-                    "downstream_head_segment": connections[rch[-2]],
-                },
-            ]
+    # static inputs depend only on the domain, its channel parameters, topobathy
+    # and junctions, they are built once and reused by later loops
+    if static_inputs is None:
+        static_inputs = diffusive_static_inputs(
+            tw,
+            connections,
+            rconn,
+            reach_list,
+            mainstem_seg_list,
+            trib_seg_list,
+            param_df,
+            junction_inflows.index,
+            topobathy_bytw,
         )
-
-        if rch[0] not in rchhead_reaches:
-
-            # a list of segments for a given reach-head segment
-            rchhead_reaches.update(
-                {rch[0]: {"number_segments": len(rch), "segments_list": rch}}
-            )
-            # a list of segments for a given reach-bottom segment
-            rchbottom_reaches.update(
-                {rch[-1]: {"number_segments": len(rch), "segments_list": rch}}
-            )
-
-        # for channel altitude adjustment
-        z_all.update({seg: {"adj.alt": np.zeros(1)} for seg in rch})
-
-    # --------------------------------------------------------------------------------------
-    #                                 Step 0-3
-    #    Adjust altitude so that altitude of the last sement of a reach is equal to that
-    #    of the first segment of its downstream reach right after their common junction.
-    # --------------------------------------------------------------------------------------
-    dbfksegID = int(str(tw) + str(2))
-
-    adj_alt1(
-        mx_jorder, ordered_reaches, param_df, dbfksegID, z_all
-    )
-
-    # --------------------------------------------------------------------------------------
-    #                                 Step 0-4
-    #     Make Fortran-Python channel network mapping variables.
-    # --------------------------------------------------------------------------------------
-    # build a list of head segments in descending reach order [headwater -> tailwater]
-    pynw = {}
-    frj = -1
-    for x in range(mx_jorder, -1, -1):
-        for head_segment, reach in ordered_reaches[x]:
-            frj = frj + 1
-            pynw[frj] = head_segment
-
-    frnw_col = 20
-    frnw_g   = fp_network_map(
-                              mainstem_seg_list,
-                              trib_seg_list,  
-                              mx_jorder, 
-                              ordered_reaches, 
-                              rchbottom_reaches, 
-                              nrch_g, 
-                              frnw_col, 
-                              dbfksegID, 
-                              pynw,
-                              #upstream_boundary_link,
-                              )
-
-    # covert data type from integer to float for frnw  
-    dfrnw_g = frnw_g.astype('float')    
-
-    # ---------------------------------------------------------------------------------
-    #                              Step 0-5
-    #                  Prepare channel geometry data
-    # ---------------------------------------------------------------------------------
+    nrch_g = static_inputs["nrch_g"]
+    mxncomp_g = static_inputs["mxncomp_g"]
+    mx_jorder = static_inputs["mx_jorder"]
+    ordered_reaches = static_inputs["ordered_reaches"]
+    pynw = static_inputs["pynw"]
+    frnw_col = static_inputs["frnw_col"]
+    frnw_g = static_inputs["frnw_g"]
     (
         z_ar_g,
         bo_ar_g,
@@ -904,14 +1034,11 @@ def diffusive_input_data_v02(
         manncc_ar_g,
         so_ar_g,
         dx_ar_g,
-    ) = fp_chgeo_map(
-        mx_jorder,
-        ordered_reaches,
-        param_df,
-        z_all,
-        mxncomp_g,
-        nrch_g,
+    ) = (static_inputs[name] for name in CHGEO_ARRAYS)
+    x_bathy_g, z_bathy_g, mann_bathy_g, size_bathy_g = (
+        static_inputs[name] for name in BATHY_ARRAYS
     )
+    mxnbathy_g = static_inputs["mxnbathy_g"]
 
     # ---------------------------------------------------------------------------------
     #                              Step 0-6
@@ -988,32 +1115,19 @@ def diffusive_input_data_v02(
     #       Prepare tributary q time series data generated by MC that flow into a juction boundary  
     # ---------------------------------------------------------------------------------------------
     nts_qtrib_g = int((tfin_g - t0_g) * 3600.0 / dt_qtrib_g) + 1 # Even MC-computed flow start from first 5 min, t0 is coverd by initial_conditions. 
-    qtrib_g = np.zeros((nts_qtrib_g, nrch_g))
-    frj = -1
-    for x in range(mx_jorder, -1, -1):
-        for head_segment, reach in ordered_reaches[x]:
-            frj = frj + 1
-            if head_segment not in mainstem_seg_list:
-                qtrib_g[1:,frj] = junction_inflows.loc[head_segment]                
-                # TODO - if one of the tributary segments is a waterbody, it's initial conditions
-                # will not be in the initial_conditions array, but rather will be in the waterbodies_df array
-                qtrib_g[0,frj] = initial_conditions.loc[head_segment, 'qu0']    
+    # Fortran ordered, as the diffusive kernel takes it, each reach a contiguous column
+    qtrib_g = np.zeros((nts_qtrib_g, nrch_g), order='F')
+    trib_frj = static_inputs["trib_frj"]
+    trib_heads = static_inputs["trib_heads"]
+    if trib_heads:
+        # gather the inflows of every tributary reach at once
+        if trib_inflows is None:
+            trib_inflows = junction_inflows.loc[trib_heads].to_numpy()
+        qtrib_g[1:,trib_frj] = trib_inflows.T
+        # TODO - if one of the tributary segments is a waterbody, it's initial conditions
+        # will not be in the initial_conditions array, but rather will be in the waterbodies_df array
+        qtrib_g[0,trib_frj] = initial_conditions.loc[trib_heads, 'qu0'].to_numpy()
   
-    # ---------------------------------------------------------------------------------
-    #                              Step 0-10
-
-    #                 Prepare cross section bathymetry data
-    # ---------------------------------------------------------------------------------    
-    x_bathy_g, z_bathy_g, mann_bathy_g, size_bathy_g, mxnbathy_g = fp_naturalxsec_map(        
-                                                                           ordered_reaches,                             
-                                                                           mainstem_seg_list, 
-                                                                           topobathy_bytw,
-                                                                           param_df, 
-                                                                           mx_jorder,
-                                                                           mxncomp_g, 
-                                                                           nrch_g,
-                                                                           dbfksegID)
-                   
     # ---------------------------------------------------------------------------------------------
     #                              Step 0-11
 
@@ -25,14 +25,11 @@ cdef void chxsec_lookuptable(
                             double[::1,:,:] mann_bathy_g,
                             int[::1,:] size_bathy_g, 
                             int nrow_chxsec_lookuptable,
-                            double[:,:,:,:] out_chxsec_lookuptable,
-                            double[:,:] out_z_adj,
+                            double[::1,:,:,:] out_chxsec_lookuptable,
+                            double[::1,:] out_z_adj,
 ):
 
-    cdef:
-        double[::1,:,:,:] xsec_tab = np.empty([11, nrow_chxsec_lookuptable, mxncomp_g, nrch_g], dtype = np.double, order = 'F')
-        double[::1,:]     z_adj    = np.empty([mxncomp_g, nrch_g], dtype = np.double, order = 'F')
-    
+    # the Fortran subroutine writes into the Fortran ordered outputs in place
     c_chxsec_lookuptable_calc(
                             &mxncomp_g,
                             &nrch_g,
@@ -53,17 +50,34 @@ cdef void chxsec_lookuptable(
                             &mann_bathy_g[0,0,0],
                             &size_bathy_g[0,0],        
                             &nrow_chxsec_lookuptable,
-                            &xsec_tab[0,0,0,0],
-                            &z_adj[0,0],
+                            &out_chxsec_lookuptable[0,0,0,0],
+                            &out_z_adj[0,0],
     )
-    
-    # copy data from Fortran to Python memory view
-    out_chxsec_lookuptable[:,:,:,:] = xsec_tab[::1,:,:,:]
-    out_z_adj[:,:]                  = z_adj[::1,:]
 
 cpdef object compute_chxsec_lookuptable(
-    dict diff_inputs
+    dict diff_inputs,
+    object table = None,
+    object z_adj = None,
     ):
+    """
+    Build the hydraulic lookup table of every channel cross section.
+
+    Arguments
+    ---------
+    diff_inputs  (dict): inputs built by diffusive_input_data_v02,
+                       with the number of table rows in
+                       "nrow_chxsec_lookuptable"
+    table    (ndarray): Fortran ordered float64 output of shape
+                       (11, nrow, mxncomp_g, nrch_g), such as a memory
+                       mapped file, allocated if None
+    z_adj    (ndarray): Fortran ordered float64 output of shape
+                       (mxncomp_g, nrch_g), allocated if None
+
+    Returns
+    -------
+    table, z_adj (ndarray): lookup table and channel bottom elevation
+                            adjusted at compute nodes
+    """
 
     # unpack/declare diffusive input variables
     cdef:
@@ -86,8 +100,15 @@ cpdef object compute_chxsec_lookuptable(
         double[::1,:,:] mann_bathy_g = np.asfortranarray(diff_inputs["mann_bathy_g"])
         int[::1,:] size_bathy_g = np.asfortranarray(diff_inputs["size_bathy_g"])             
         int nrow_chxsec_lookuptable = diff_inputs["nrow_chxsec_lookuptable"] 
-        double[:,:,:,:] out_chxsec_lookuptable = np.empty([11, nrow_chxsec_lookuptable, mxncomp_g, nrch_g], dtype = np.double)
-        double[:,:]     out_z_adj = np.empty([mxncomp_g, nrch_g], dtype = np.double)
+        double[::1,:,:,:] out_chxsec_lookuptable
+        double[::1,:]     out_z_adj
+
+    if table is None:
+        table = np.empty([11, nrow_chxsec_lookuptable, mxncomp_g, nrch_g], dtype = np.double, order = 'F')
+    if z_adj is None:
+        z_adj = np.empty([mxncomp_g, nrch_g], dtype = np.double, order = 'F')
+    out_chxsec_lookuptable = table
+    out_z_adj = z_adj
 
     # call fortran channel cross-section look up table creation subroutine 
     chxsec_lookuptable(                      
@@ -113,4 +134,4 @@ cpdef object compute_chxsec_lookuptable(
                         out_chxsec_lookuptable,
                         out_z_adj,
     )
-    return np.asarray(out_chxsec_lookuptable), np.asarray(out_z_adj)
\ No newline at end of file
+    return table, z_adj
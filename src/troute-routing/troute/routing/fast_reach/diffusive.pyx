@@ -45,6 +45,9 @@ cdef void diffnw(
         int cwncol_g,
         double[::1,:] crosswalk_g,
         double[::1,:] z_thalweg_g,
+        int nrow_chxsec_g,
+        const double[::1,:,:,:] chxsec_lookuptable_g,
+        const double[::1,:] z_adj_g,
         double[:,:,:] out_q,
         double[:,:,:] out_elv,
         double[:,:,:] out_depth,
@@ -95,6 +98,9 @@ cdef void diffnw(
         &cwncol_g,
         &crosswalk_g[0,0],  
         &z_thalweg_g[0,0],
+        &nrow_chxsec_g,
+        <double*>&chxsec_lookuptable_g[0,0,0,0],
+        <double*>&z_adj_g[0,0],
         &q_ev_g[0,0,0],
         &elv_ev_g[0,0,0],
         &depth_ev_g[0,0,0]
@@ -151,6 +157,18 @@ cpdef object compute_diffusive(
         int cwncol_g = diff_inputs["cwncol_g"]
         double[::1,:] crosswalk_g = np.asfortranarray(diff_inputs["crosswalk_g"]) 
         double[::1,:] z_thalweg_g = np.asfortranarray(diff_inputs["z_thalweg_g"])
+        # channel cross section lookup table built by chxsec_lookuptable, if given,
+        # read in place, otherwise the kernel builds it
+        const double[::1,:,:,:] chxsec_lookuptable_g = np.asfortranarray(
+            diff_inputs.get(
+                "chxsec_lookuptable",
+                np.empty([11, 0, mxncomp_g, nrch_g], dtype = np.double, order = 'F'),
+            )
+        )
+        const double[::1,:] z_adj_g = np.asfortranarray(
+            diff_inputs.get("z_adj", diff_inputs["z_ar_g"])
+        )
+        int nrow_chxsec_g = chxsec_lookuptable_g.shape[1]
         double[:,:,:] out_q = np.empty([ntss_ev_g,mxncomp_g,nrch_g], dtype = np.double)
         double[:,:,:] out_elv = np.empty([ntss_ev_g,mxncomp_g,nrch_g], dtype = np.double)
         double[:,:,:] out_depth = np.empty([ntss_ev_g,mxncomp_g,nrch_g], dtype = np.double)
@@ -196,6 +214,9 @@ cpdef object compute_diffusive(
         cwncol_g,
         crosswalk_g,
         z_thalweg_g,
+        nrow_chxsec_g,
+        chxsec_lookuptable_g,
+        z_adj_g,
         out_q,
         out_elv,
         out_depth
@@ -38,6 +38,85 @@ cdef extern from "pyMCsingleSegStime_NoLoop.h":
                                   float *ck,
                                   float *cn,
                                   float *X) nogil;
+    void c_muskingcungenwm_diag(float *dt,
+                                float *qup,
+                                float *quc,
+                                float *qdp,
+                                float *ql,
+                                float *dx,
+                                float *bw,
+                                float *tw,
+                                float *twcc,
+                                float *n,
+                                float *ncc,
+                                float *cs,
+                                float *s0,
+                                float *velp,
+                                float *depthp,
+                                float *qdc,
+                                float *velc,
+                                float *depthc,
+                                float *ck,
+                                float *cn,
+                                float *X,
+                                int *iterations,
+                                int *retries,
+                                int *converged) nogil;
+    void c_muskingcunge_headwater(int *nseg,
+                                  int *nsteps,
+                                  int *nts_ql,
+                                  int *qts_subdivisions,
+                                  int *short_ts,
+                                  float *dt,
+                                  float *dx,
+                                  float *bw,
+                                  float *tw,
+                                  float *twcc,
+                                  float *n,
+                                  float *ncc,
+                                  float *cs,
+                                  float *s0,
+                                  float *ql,
+                                  float *qdp0,
+                                  float *depthp0,
+                                  float *qvd) nogil;
+    void c_hydraulic_table(float *bw,
+                           float *tw,
+                           float *twcc,
+                           float *n,
+                           float *ncc,
+                           float *cs,
+                           float *s0,
+                           int *ntab,
+                           float *hmax,
+                           float *table) nogil;
+    void c_muskingcunge_table(float *dt,
+                              float *qup,
+                              float *quc,
+                              float *qdp,
+                              float *ql,
+                              float *dx,
+                              float *bw,
+                              float *tw,
+                              float *twcc,
+                              float *n,
+                              float *ncc,
+                              float *cs,
+                              float *s0,
+                              float *velp,
+                              float *depthp,
+                              int *ntab,
+                              const float *table,
+                              float *qdc,
+                              float *velc,
+                              float *depthc,
+                              float *ck,
+                              float *cn,
+                              float *X,
+                              int *iterations,
+                              int *retries,
+                              int *converged) nogil;
+    void c_swap_secant_residual(float *residual) nogil;
     
 cdef extern from "pydiffusive.h":
     void c_diffnw(double *timestep_ar_g,
@@ -79,6 +158,9 @@ cdef extern from "pydiffusive.h":
                      int *cwncol_g,
                      double *crosswalk_g, 
                      double *z_thalweg_g,
+                     int *nrow_chxsec_g,
+                     double *chxsec_lookuptable_g,
+                     double *z_adj_g,
                      double *q_ev_g,
                      double *elv_ev_g,
                      double *depth_ev_g) nogil;
@@ -17,10 +17,14 @@ from troute.network.musking.mc_reach cimport MC_Segment, MC_Reach, _MC_Segment,
 from troute.network.reach cimport Reach, _Reach, compute_type
 from troute.network.reservoirs.levelpool.levelpool cimport MC_Levelpool, run_lp_c, update_lp_c
 from troute.network.reservoirs.rfc.rfc cimport MC_RFC, run_rfc_c
-from troute.routing.fast_reach.reservoir_hybrid_da import reservoir_hybrid_da
-from troute.routing.fast_reach.reservoir_RFC_da import reservoir_RFC_da
-from troute.routing.fast_reach.reservoir_GL_da import great_lakes_da
-from cython.parallel import prange
+from troute.routing.fast_reach.reservoir_da cimport (
+    reservoir_hybrid_da_c,
+    reservoir_RFC_da_c,
+    great_lakes_da_c,
+    month_index,
+)
+from troute.routing.fast_reach.reservoir_da import log_hybrid_da_warnings, t0_seconds
+from cython.parallel import prange, threadid
 
 #import cProfile
 #pr = cProfile.Profile()
@@ -67,7 +71,7 @@ cpdef object binary_find(object arr, object els):
 
 
 @cython.boundscheck(False)
-cdef void compute_reach_kernel(float qup, float quc, int nreach, const float[:,:] input_buf, float[:, :] output_buf, bint assume_short_ts, bint return_courant=False) nogil:
+cdef void compute_reach_kernel(float qup, float quc, int nreach, const float[:,:] input_buf, float[:, :] output_buf, bint assume_short_ts, bint return_courant=False, int[:, ::1] diag_buf=None) noexcept nogil:
     """
     Kernel to compute reach.
     Input buffer is array matching following description:
@@ -79,6 +83,8 @@ cdef void compute_reach_kernel(float qup, float quc, int nreach, const float[:,:
     Input is nxm (n reaches by m variables)
     Ouput is nx3 (n reaches by 3 return values)
         0: current flow, 1: current depth, 2: current velocity
+    Diagnostic buffer, if given, is nx3 (n reaches by 3 solver diagnostics)
+        0: iterations, 1: retries, 2: converged
     """
     cdef reach.QVD rv
     cdef reach.QVD *out = &rv
@@ -102,23 +108,43 @@ cdef void compute_reach_kernel(float qup, float quc, int nreach, const float[:,:
         velp = input_buf[i, 11]
         depthp = input_buf[i, 12]
 
-        reach.muskingcunge(
-                    dt,
-                    qup,
-                    quc,
-                    qdp,
-                    qlat,
-                    dx,
-                    bw,
-                    tw,
-                    twcc,
-                    n,
-                    ncc,
-                    cs,
-                    s0,
-                    velp,
-                    depthp,
-                    out)
+        if diag_buf is None:
+            reach.muskingcunge(
+                        dt,
+                        qup,
+                        quc,
+                        qdp,
+                        qlat,
+                        dx,
+                        bw,
+                        tw,
+                        twcc,
+                        n,
+                        ncc,
+                        cs,
+                        s0,
+                        velp,
+                        depthp,
+                        out)
+        else:
+            reach.muskingcunge(
+                        dt,
+                        qup,
+                        quc,
+                        qdp,
+                        qlat,
+                        dx,
+                        bw,
+                        tw,
+                        twcc,
+                        n,
+                        ncc,
+                        cs,
+                        s0,
+                        velp,
+                        depthp,
+                        out,
+                        &diag_buf[i, 0])
 
 #        output_buf[i, 0] = quc = out.qdc # this will ignore short TS assumption at seg-to-set scale?
         output_buf[i, 0] = out.qdc
@@ -137,6 +163,198 @@ cdef void compute_reach_kernel(float qup, float quc, int nreach, const float[:,:
         else:
             quc = out.qdc
 
+@cython.boundscheck(False)
+cdef void compute_reach_kernel_table(float qup, float quc, _Reach* r, const float[:,:] input_buf, float[:, :] output_buf, const float[:, :, ::1] tables, bint assume_short_ts, int[:, ::1] diag_buf=None) noexcept nogil:
+    """
+    As compute_reach_kernel, solving each segment of reach r with its
+    hydraulic table, tables[segment.id] (see reach.build_hydraulic_tables).
+    """
+    cdef reach.QVD rv
+    cdef reach.QVD *out = &rv
+    cdef _MC_Segment segment
+
+    cdef:
+        float qdp
+        int i
+        int *diag = NULL
+
+    for i in range(r.reach.mc_reach.num_segments):
+        segment = get_mc_segment(r, i)
+        qdp = input_buf[i, 10]
+        if diag_buf is not None:
+            diag = &diag_buf[i, 0]
+
+        reach.muskingcunge_table(
+                    input_buf[i, 1],
+                    qup,
+                    quc,
+                    qdp,
+                    input_buf[i, 0],
+                    input_buf[i, 2],
+                    input_buf[i, 3],
+                    input_buf[i, 4],
+                    input_buf[i, 5],
+                    input_buf[i, 6],
+                    input_buf[i, 7],
+                    input_buf[i, 8],
+                    input_buf[i, 9],
+                    input_buf[i, 11],
+                    input_buf[i, 12],
+                    tables[segment.id],
+                    out,
+                    diag)
+
+        output_buf[i, 0] = out.qdc
+        output_buf[i, 1] = out.velc
+        output_buf[i, 2] = out.depthc
+
+        qup = qdp
+
+        if assume_short_ts:
+            quc = qup
+        else:
+            quc = out.qdc
+
+@cython.boundscheck(False)
+@cython.cdivision(True)
+cdef void compute_mc_reach(
+    _Reach* r,
+    int timestep,
+    int qts_subdivisions,
+    const float[:,:] qlat_values,
+    float[:,:,::1] flowveldepth,
+    float[:,:] buf_view,
+    float[:,:] out_buf,
+    bint assume_short_ts,
+    const float[:, :, ::1] tables,
+    int[:, ::1] diag_buf,
+    int[:, ::1] diagnostics,
+) noexcept nogil:
+    """
+    Route one Muskingum Cunge reach for one timestep, reading upstream and
+    previous-timestep flows from, and writing results to, flowveldepth.
+    Segments are solved with their hydraulic tables, unless tables is empty.
+    Unless diagnostics is empty, the solver iterations, retries and
+    non-convergences of each segment are added to its row of diagnostics,
+    and the most iterations of a single solve kept, through diag_buf.
+
+    Only touches the rows of the reach itself and the buffers passed in, so
+    reaches whose upstream reaches are already computed can be routed
+    concurrently, each with its own buffers.
+    """
+    cdef float upstream_flows = 0.0
+    cdef float previous_upstream_flows = 0.0
+    cdef _MC_Segment segment
+    cdef int _i
+    cdef long id
+
+    for _i in range(r._num_upstream_ids):#Explicit loop reduces some overhead
+        id = r._upstream_ids[_i]
+        upstream_flows += flowveldepth[id, timestep, 0]
+        previous_upstream_flows += flowveldepth[id, timestep-1, 0]
+
+    if assume_short_ts:
+        upstream_flows = previous_upstream_flows
+
+    #Create compute reach kernel input buffer
+    for _i in range(r.reach.mc_reach.num_segments):
+        segment = get_mc_segment(r, _i)#r._segments[_i]
+        buf_view[_i, 0] = qlat_values[ segment.id, <int>((timestep-1)/qts_subdivisions)]
+        buf_view[_i, 1] = segment.dt
+        buf_view[_i, 2] = segment.dx
+        buf_view[_i, 3] = segment.bw
+        buf_view[_i, 4] = segment.tw
+        buf_view[_i, 5] = segment.twcc
+        buf_view[_i, 6] = segment.n
+        buf_view[_i, 7] = segment.ncc
+        buf_view[_i, 8] = segment.cs
+        buf_view[_i, 9] = segment.s0
+        buf_view[_i, 10] = flowveldepth[segment.id, timestep-1, 0]
+        buf_view[_i, 11] = 0.0 #flowveldepth[segment.id, timestep-1, 1]
+        buf_view[_i, 12] = flowveldepth[segment.id, timestep-1, 2]
+
+    if tables.shape[0] > 0 and diagnostics.shape[0] > 0:
+        compute_reach_kernel_table(previous_upstream_flows, upstream_flows,
+                                   r, buf_view, out_buf, tables,
+                                   assume_short_ts, diag_buf)
+    elif tables.shape[0] > 0:
+        compute_reach_kernel_table(previous_upstream_flows, upstream_flows,
+                                   r, buf_view, out_buf, tables,
+                                   assume_short_ts)
+    elif diagnostics.shape[0] > 0:
+        compute_reach_kernel(previous_upstream_flows, upstream_flows,
+                             r.reach.mc_reach.num_segments, buf_view,
+                             out_buf,
+                             assume_short_ts, False, diag_buf)
+    else:
+        compute_reach_kernel(previous_upstream_flows, upstream_flows,
+                             r.reach.mc_reach.num_segments, buf_view,
+                             out_buf,
+                             assume_short_ts)
+
+    #Copy the output out
+    for _i in range(r.reach.mc_reach.num_segments):
+        segment = get_mc_segment(r, _i)
+        flowveldepth[segment.id, timestep, 0] = out_buf[_i, 0]
+        flowveldepth[segment.id, timestep, 1] = out_buf[_i, 1]
+        flowveldepth[segment.id, timestep, 2] = out_buf[_i, 2]
+
+    if diagnostics.shape[0] > 0:
+        for _i in range(r.reach.mc_reach.num_segments):
+            segment = get_mc_segment(r, _i)
+            diagnostics[segment.id, 0] += diag_buf[_i, 0]
+            diagnostics[segment.id, 1] += diag_buf[_i, 1]
+            diagnostics[segment.id, 2] += 1 - diag_buf[_i, 2]
+            if diag_buf[_i, 0] > diagnostics[segment.id, 3]:
+                diagnostics[segment.id, 3] = diag_buf[_i, 0]
+
+@cython.boundscheck(False)
+cdef void compute_mc_headwater_reach(
+    _Reach* r,
+    int nsteps,
+    int qts_subdivisions,
+    const float[:,:] qlat_values,
+    float[:,:,::1] flowveldepth,
+    float[:, ::1] params_buf,
+    float[:, ::1] qlat_buf,
+    float[:, :, ::1] qvd_buf,
+    bint assume_short_ts,
+) noexcept nogil:
+    """
+    Route every timestep of a Muskingum Cunge reach without upstream
+    segments in one call, starting from its initial conditions in
+    flowveldepth[:, 0] and writing flowveldepth[:, 1:].
+    """
+    cdef _MC_Segment segment
+    cdef int _i, j
+    cdef int nseg = r.reach.mc_reach.num_segments
+
+    for _i in range(nseg):
+        segment = get_mc_segment(r, _i)
+        params_buf[0, _i] = segment.dt
+        params_buf[1, _i] = segment.dx
+        params_buf[2, _i] = segment.bw
+        params_buf[3, _i] = segment.tw
+        params_buf[4, _i] = segment.twcc
+        params_buf[5, _i] = segment.n
+        params_buf[6, _i] = segment.ncc
+        params_buf[7, _i] = segment.cs
+        params_buf[8, _i] = segment.s0
+        params_buf[9, _i] = flowveldepth[segment.id, 0, 0]
+        params_buf[10, _i] = flowveldepth[segment.id, 0, 2]
+        for j in range(qlat_buf.shape[1]):
+            qlat_buf[_i, j] = qlat_values[segment.id, j]
+
+    reach.muskingcunge_headwater(nseg, nsteps, qts_subdivisions, assume_short_ts,
+                                 params_buf, qlat_buf, qvd_buf)
+
+    for _i in range(nseg):
+        segment = get_mc_segment(r, _i)
+        for j in range(nsteps):
+            flowveldepth[segment.id, j + 1, 0] = qvd_buf[_i, j, 0]
+            flowveldepth[segment.id, j + 1, 1] = qvd_buf[_i, j, 1]
+            flowveldepth[segment.id, j + 1, 2] = qvd_buf[_i, j, 2]
+
 cdef void fill_buffer_column(const Py_ssize_t[:] srows,
     const Py_ssize_t scol,
     const Py_ssize_t[:] drows,
@@ -161,6 +379,148 @@ cpdef object column_mapper(object src_cols):
         rv.append(index[label])
     return rv
 
+def topology_fingerprint(list reaches_wTypes, dict upstream_connections):
+    """
+    Hash of the reaches, their types and the upstream connections of their
+    first segments, the parts of the network topology a RoutingPlan is built from
+    """
+    return hash(tuple(
+        (tuple(reach_ids), reach_type, tuple(upstream_connections.get(reach_ids[0], ())))
+        for reach_ids, reach_type in reaches_wTypes
+    ))
+
+cdef class RoutingPlan:
+    """
+    The static part of routing one network with compute_network_structured:
+    the Muskingum Cunge reach structs with their channel parameters, segment
+    and upstream positions of every reach, the topological levels of the
+    reaches and the hydraulic tables of the segments.
+
+    Built once from the network topology and channel parameters and passed
+    to every compute_network_structured call routing that network, e.g. in
+    later loops of a run or BMI updates, which then only bring their own
+    initial conditions, lateral inflows and DA data. Reservoirs are still
+    created by each call, they carry the storage state of the run and RFC
+    reservoirs read forecasts for the model start time.
+    """
+    cdef readonly object topology
+    cdef readonly np.ndarray data_idx
+    cdef readonly np.ndarray data_cols
+    cdef readonly Py_ssize_t max_buff_size
+    # one (segment ids, reach type, segment positions, upstream positions, MC_Reach) per reach
+    cdef readonly list reaches
+    cdef np.ndarray data_array
+    cdef np.ndarray scols
+    cdef object reach_level
+    cdef dict hydraulic_tables
+
+    def __init__(
+        self,
+        list reaches_wTypes,
+        dict upstream_connections,
+        const long[:] data_idx,
+        object[:] data_cols,
+        const float[:,:] data_values,
+    ):
+        """
+        Args:
+            reaches_wTypes (list): List of tuples: (reach, reach_type), where reach_type is 0 for Muskingum Cunge reach and 1 is a reservoir
+            upstream_connections (dict): Network
+            data_idx (ndarray): a 1D sorted index for data_values
+            data_cols (ndarray): column labels of data_values
+            data_values (ndarray): a 2D array of data inputs (nodes x variables)
+        """
+        if data_values.shape[0] != data_idx.shape[0] or data_values.shape[1] != data_cols.shape[0]:
+            raise ValueError(f"data_values shape mismatch")
+        self.topology = topology_fingerprint(reaches_wTypes, upstream_connections)
+        self.data_idx = np.array(data_idx, dtype=np.int64)
+        self.data_cols = np.array(data_cols, dtype=object)
+        # a copy, the channel parameters of the caller may change between calls
+        self.data_array = np.array(data_values)
+        self.scols = np.array(column_mapper(data_cols), dtype=np.intp)
+        self.max_buff_size = 0
+        self.reaches = []
+        self.reach_level = None
+        self.hydraulic_tables = {}
+
+        cdef list segment_positions
+        for reach_ids, reach_type in reaches_wTypes:
+            upstream_ids = array('l', binary_find(data_idx, upstream_connections.get(reach_ids[0], ())))
+            segment_positions = binary_find(data_idx, reach_ids)
+            if reach_type == 1:
+                self.reaches.append((reach_ids, reach_type, segment_positions, upstream_ids, None))
+                continue
+
+            #Find the max reach size, used to create buffer for compute_reach_kernel
+            if len(segment_positions) > self.max_buff_size:
+                self.max_buff_size = len(segment_positions)
+            # initial conditions are read from the flowveldepth array by the
+            # kernel, so segments are created without them (velp isn't used anywhere)
+            mc_reach = MC_Reach(
+                [
+                    MC_Segment(sid, *self.data_array[sid, self.scols], 0.0, 0.0, 0.0)
+                    for sid in segment_positions
+                ],
+                upstream_ids,
+            )
+            self.reaches.append((reach_ids, reach_type, segment_positions, upstream_ids, mc_reach))
+
+    def matches(
+        self,
+        list reaches_wTypes,
+        dict upstream_connections,
+        const long[:] data_idx,
+        object[:] data_cols,
+        const float[:,:] data_values,
+    ):
+        """
+        True if the plan was built for the reaches and upstream connections
+        of reaches_wTypes and upstream_connections, the network segments in
+        data_idx and the channel parameters in data_values, with columns data_cols
+        """
+        return (
+            self.topology == topology_fingerprint(reaches_wTypes, upstream_connections)
+            and np.array_equal(self.data_idx, data_idx)
+            and np.array_equal(self.data_cols, data_cols)
+            and np.array_equal(self.data_array, data_values, equal_nan=True)
+        )
+
+    def get_reach_levels(self):
+        """
+        Topological level of each reach: a reach is one level below the
+        deepest reach draining into it, so the reaches of a level only
+        depend on the levels above and can be routed concurrently.
+        Reaches are ordered upstream to downstream, so one pass suffices.
+        """
+        if self.reach_level is None:
+            reach_of_segment = {}
+            for i, (_, _, segment_positions, _, _) in enumerate(self.reaches):
+                for sid in segment_positions:
+                    reach_of_segment[sid] = i
+            reach_level = np.zeros(len(self.reaches), dtype='int32')
+            for i, (_, _, _, upstream_ids, _) in enumerate(self.reaches):
+                for us in upstream_ids:
+                    # upstream segments outside of this network come from upstream_results
+                    us_reach = reach_of_segment.get(us)
+                    if us_reach is not None:
+                        reach_level[i] = max(reach_level[i], reach_level[us_reach] + 1)
+            self.reach_level = reach_level
+        return self.reach_level
+
+    def get_hydraulic_tables(self, int size, float max_depth):
+        """
+        Per-segment hydraulic tables, rows in data_idx order, see
+        reach.build_hydraulic_tables
+        """
+        key = (size, max_depth)
+        if key not in self.hydraulic_tables:
+            self.hydraulic_tables[key] = reach.build_hydraulic_tables(
+                np.ascontiguousarray(self.data_array[:, self.scols[2:]]),
+                size,
+                max_depth,
+            )
+        return self.hydraulic_tables[key]
+
 cpdef object compute_network_structured(
     int nsteps,
     float dt,
@@ -221,6 +581,15 @@ cpdef object compute_network_structured(
     bint return_courant=False,
     int da_check_gage = -1,
     bint from_files=True,
+    int n_threads=1,
+    object stream_callback=None,
+    int stream_window=0,
+    int hydraulic_table_size=0,
+    float hydraulic_table_max_depth=20.0,
+    bint return_diagnostics=False,
+    bint route_headwaters_upfront=False,
+    RoutingPlan plan=None,
+    int n_members=1,
     ):
     
     """
@@ -234,14 +603,55 @@ cpdef object compute_network_structured(
         qlats (ndarray): a 2D array of qlat values (nodes x nsteps). The index must be shared with data_values
         initial_conditions (ndarray): an n x 3 array of initial conditions. n = nodes, column 1 = qu0, column 2 = qd0, column 3 = h0
         assume_short_ts (bool): Assume short time steps (quc = qup)
+        n_threads (int): Number of OpenMP threads sweeping the Muskingum Cunge reaches
+            of each topological level in parallel. 1 (default) keeps the serial sweep. Secant
+            solves start from the residual of the previous solve on their thread, so only
+            results of hydraulic tables match the serial sweep.
+        stream_callback (callable): Called with (segment ids, gage segment ids, first timestep,
+            flowveldepth, nudge) each time `stream_window` timesteps have been completed and
+            after the last timestep, with copies of the (segments x window x 3) results and
+            (gages x window) nudge values of that window. Used to write output while routing.
+        stream_window (int): Number of timesteps per stream_callback window
+        hydraulic_table_size (int): Number of depths in the hydraulic table built for each
+            segment, solving the Muskingum Cunge depth from the tables instead of by the
+            secant iteration. 0 (default) keeps the secant iteration.
+        hydraulic_table_max_depth (float): Deepest tabulated depth [m], deeper flows fall
+            back to the secant iteration
+        return_diagnostics (bool): Count the Muskingum Cunge solver iterations, retries
+            and non-converged solves of each segment over the run, returned as an
+            (segments x 4) array of [iterations, retries, non-converged, max iterations]
+            after the results of the great lakes DA, None otherwise
+        route_headwaters_upfront (bool): Route every timestep of the headwater reaches
+            in one time-batched kernel call per reach before the timestep loop. The
+            secant iteration then starts from a different residual than in the
+            timestep by timestep sweep, so results differ within its tolerance.
+        plan (RoutingPlan): Reach structs, positions and hydraulic tables of this network
+            built by an earlier call, see RoutingPlan. Built for this call only if None.
+        n_members (int): Number of ensemble members routed together through the same
+            network, channel parameters, plan and observations. The per-member inputs,
+            initial_conditions, qlat_values, wbody_cols, lastobs_values_init,
+            time_since_lastobs_init and the reservoir and great lakes DA states, hold the
+            rows of every member, one member after the other. Every timestep, the
+            members route the reaches one after the other, each carrying its own secant
+            residual from the one the call started with, so that a member gets the
+            results of routing it alone from the same start. Returns a list of the
+            results of every member if n_members > 1. Members are not routed with
+            upstream_results or stream_callback.
     Notes:
         Array dimensions are checked as a precondition to this method.
         This version creates python objects for segments and reaches,
         but then uses only the C structures and access for efficiency
     """
     # Check shapes
-    if qlat_values.shape[0] != data_idx.shape[0]:
-        raise ValueError(f"Number of rows in Qlat is incorrect: expected ({data_idx.shape[0]}), got ({qlat_values.shape[0]})")
+    if n_members < 1:
+        raise ValueError(f"n_members must be at least 1, got {n_members}")
+    if n_members > 1 and (upstream_results or stream_callback is not None):
+        raise ValueError("Ensemble members are routed without upstream_results or stream_callback")
+    cdef Py_ssize_t num_segments = data_idx.shape[0]
+    if qlat_values.shape[0] != num_segments * n_members:
+        raise ValueError(f"Number of rows in Qlat is incorrect: expected ({num_segments * n_members}), got ({qlat_values.shape[0]})")
+    if initial_conditions.shape[0] != num_segments * n_members:
+        raise ValueError(f"Number of rows in initial_conditions is incorrect: expected ({num_segments * n_members}), got ({initial_conditions.shape[0]})")
     
     if qlat_values.shape[1] < nsteps/qts_subdivisions:
         raise ValueError(f"Number of columns (timesteps) in Qlat is incorrect: expected at most ({data_idx.shape[0]}), got ({qlat_values.shape[1]}). The number of columns in Qlat must be equal to or less than the number of routing timesteps")
@@ -250,22 +660,17 @@ cpdef object compute_network_structured(
         raise ValueError(f"data_values shape mismatch")
     #define and initialize the final output array, add one extra time step for initial conditions
     cdef int qvd_ts_w = 3  # There are 3 values per timestep (corresponding to 3 columns per timestep)
-    cdef np.ndarray[float, ndim=3] flowveldepth_nd = np.zeros((data_idx.shape[0], nsteps+1, qvd_ts_w), dtype='float32')
+    cdef np.ndarray[float, ndim=3] flowveldepth_nd = np.zeros((num_segments * n_members, nsteps+1, qvd_ts_w), dtype='float32')
     #Make ndarrays from the mem views for convience of indexing...may be a better method
-    cdef np.ndarray[float, ndim=2] data_array = np.asarray(data_values)
     cdef np.ndarray[float, ndim=2] init_array = np.asarray(initial_conditions)
     cdef np.ndarray[float, ndim=2] qlat_array = np.asarray(qlat_values)
     cdef np.ndarray[double, ndim=2] wbody_parameters = np.asarray(wbody_cols)
     ###### Declare/type variables #####
-    # Source columns
-    cdef Py_ssize_t[:] scols = np.array(column_mapper(data_cols), dtype=np.intp)
-    cdef Py_ssize_t max_buff_size = 0
-    #lists to hold reach definitions, i.e. list of ids
-    cdef list reach
-    cdef list upstream_reach
-    #lists to hold segment ids
-    cdef list segment_ids
-    cdef list upstream_ids
+    if plan is None:
+        plan = RoutingPlan(reaches_wTypes, upstream_connections, data_idx, data_cols, data_values)
+    elif not plan.matches(reaches_wTypes, upstream_connections, data_idx, data_cols, data_values):
+        raise ValueError("Routing plan was built for a different topology, segments or channel parameters")
+    cdef Py_ssize_t max_buff_size = plan.max_buff_size
     #flow accumulation variables
     cdef float upstream_flows, previous_upstream_flows
     #starting timestep, shifted by 1 to account for initial conditions
@@ -277,105 +682,94 @@ cpdef object compute_network_structured(
     cdef float[:] lateral_flows
     # list of reach objects to operate on
     cdef list reach_objects = []
-    cdef list segment_objects
 
-    cdef long sid
     cdef _MC_Segment segment
     #pr.enable()
-    #Preprocess the raw reaches, creating MC_Reach/MC_Segments
-
-    for reach, reach_type in reaches_wTypes:
-        upstream_reach = upstream_connections.get(reach[0], ())
-        upstream_ids = binary_find(data_idx, upstream_reach)
-        #Check if reach_type is 1 for reservoir
-        if (reach_type == 1):
-            my_id = binary_find(data_idx, reach)
-            wbody_index = binary_find(lake_numbers_col,reach)[0]
-            #Reservoirs should be singleton list reaches, TODO enforce that here?
-
-            # write initial reservoir flows to flowveldepth array
-            flowveldepth_nd[my_id, 0, 0] = wbody_parameters[wbody_index, 9] # TODO ref dataframe column label list, rather than hard-coded number
-
-            #Check if reservoir_type is not specified, then initialize default Level Pool reservoir
-            if (not reservoir_type_specified):
-
-                # Initialize levelpool reservoir object
-                lp_obj =  MC_Levelpool(
-                    my_id[0],                        # index position of waterbody reach  
-                    lake_numbers_col[wbody_index],   # lake number 
-                    array('l',upstream_ids),         # upstream segment IDs
-                    wbody_parameters[wbody_index],   # water body parameters
-                    reservoir_types[wbody_index][0], # waterbody type code
-                )
-                reach_objects.append(lp_obj)
+    #Collect the MC_Reach/MC_Segments of the plan, creating reservoirs,
+    #the reservoirs of every member keep their own storage
+    cdef int i, m
+    cdef Py_ssize_t row, lake_row
+    cdef Py_ssize_t num_lakes = len(lake_numbers_col)
+    if wbody_parameters.shape[0] != num_lakes * n_members:
+        raise ValueError(f"Number of rows in wbody_cols is incorrect: expected ({num_lakes * n_members}), got ({wbody_parameters.shape[0]})")
+    for m in range(n_members):
+        # rows of this member in the member-stacked arrays
+        row = m * num_segments
+        lake_row = m * num_lakes
+        for reach_ids, reach_type, segment_ids, upstream_ids, mc_reach in plan.reaches:
+            #Check if reach_type is 1 for reservoir
+            if (reach_type == 1):
+                my_id = segment_ids
+                wbody_index = binary_find(lake_numbers_col,reach_ids)[0]
+                #Reservoirs should be singleton list reaches, TODO enforce that here?
 
-            else:
-                # Check whether to use the fortran or python RFC DA module:
-                if from_files:
-                    # If reservoir_type is 1, 2, or 3, then initialize Levelpool reservoir
-                    # reservoir_type 1 is a straight levelpool reservoir.
-                    # reservoir_types 2 and 3 are USGS and USACE Hybrid reservoirs, respectively.
-                    if (reservoir_types[wbody_index][0] >= 1 and reservoir_types[wbody_index][0] <= 3):
-                                            
-                        # Initialize levelpool reservoir object
-                        lp_obj =  MC_Levelpool(
-                            my_id[0],                        # index position of waterbody reach  
-                            lake_numbers_col[wbody_index],   # lake number 
-                            array('l',upstream_ids),         # upstream segment IDs
-                            wbody_parameters[wbody_index],   # water body parameters
-                            reservoir_types[wbody_index][0], # waterbody type code
-                        )
-                        reach_objects.append(lp_obj)
+                # write initial reservoir flows to flowveldepth array
+                flowveldepth_nd[row + my_id[0], 0, 0] = wbody_parameters[lake_row + wbody_index, 9] # TODO ref dataframe column label list, rather than hard-coded number
+
+                #Check if reservoir_type is not specified, then initialize default Level Pool reservoir
+                if (not reservoir_type_specified):
 
-                    #If reservoir_type is 4, then initialize RFC forecast reservoir
-                    elif (reservoir_types[wbody_index][0] == 4 or reservoir_types[wbody_index][0] == 5):
-                        
-                        # Initialize rfc reservoir object
-                        rfc_obj = MC_RFC(
-                            my_id[0], 
-                            lake_numbers_col[wbody_index],
-                            array('l',upstream_ids),
-                            wbody_parameters[wbody_index],
-                            reservoir_types[wbody_index][0],
-                            data_assimilation_parameters["reservoir_da"]["reservoir_parameter_file"],
-                            model_start_time,
-                            data_assimilation_parameters["reservoir_da"]["reservoir_rfc_da"]["reservoir_rfc_forecasts_time_series_path"],
-                            data_assimilation_parameters["reservoir_da"]["reservoir_rfc_da"]["reservoir_rfc_forecasts_lookback_hours"],
-                        )
-                        reach_objects.append(rfc_obj)
-                
-                else:
                     # Initialize levelpool reservoir object
                     lp_obj =  MC_Levelpool(
                         my_id[0],                        # index position of waterbody reach  
                         lake_numbers_col[wbody_index],   # lake number 
                         array('l',upstream_ids),         # upstream segment IDs
-                        wbody_parameters[wbody_index],   # water body parameters
+                        wbody_parameters[lake_row + wbody_index],   # water body parameters
                         reservoir_types[wbody_index][0], # waterbody type code
                     )
                     reach_objects.append(lp_obj)
 
-        else:
-            segment_ids = binary_find(data_idx, reach)
-            #Set the initial condtions before running loop
-            flowveldepth_nd[segment_ids, 0] = init_array[segment_ids]
-            segment_objects = []
-            #Find the max reach size, used to create buffer for compute_reach_kernel
-            if len(segment_ids) > max_buff_size:
-                max_buff_size=len(segment_ids)
-
-            for sid in segment_ids:
-                #Initialize parameters  from the data_array, and set the initial initial_conditions
-                #These aren't actually used (the initial contions) in the kernel as they are extracted from the
-                #flowdepthvel array, but they could be used I suppose.  Note that velp isn't used anywhere, so
-                #it is inialized to 0.0
-                segment_objects.append(
-                MC_Segment(sid, *data_array[sid, scols], init_array[sid, 0], 0.0, init_array[sid, 2])
-            )
-            reach_objects.append(
-                #tuple of MC_Reach and reach_type
-                MC_Reach(segment_objects, array('l',upstream_ids))
-                )
+                else:
+                    # Check whether to use the fortran or python RFC DA module:
+                    if from_files:
+                        # If reservoir_type is 1, 2, or 3, then initialize Levelpool reservoir
+                        # reservoir_type 1 is a straight levelpool reservoir.
+                        # reservoir_types 2 and 3 are USGS and USACE Hybrid reservoirs, respectively.
+                        if (reservoir_types[wbody_index][0] >= 1 and reservoir_types[wbody_index][0] <= 3):
+                                            
+                            # Initialize levelpool reservoir object
+                            lp_obj =  MC_Levelpool(
+                                my_id[0],                        # index position of waterbody reach  
+                                lake_numbers_col[wbody_index],   # lake number 
+                                array('l',upstream_ids),         # upstream segment IDs
+                                wbody_parameters[lake_row + wbody_index],   # water body parameters
+                                reservoir_types[wbody_index][0], # waterbody type code
+                            )
+                            reach_objects.append(lp_obj)
+
+                        #If reservoir_type is 4, then initialize RFC forecast reservoir
+                        elif (reservoir_types[wbody_index][0] == 4 or reservoir_types[wbody_index][0] == 5):
+                        
+                            # Initialize rfc reservoir object
+                            rfc_obj = MC_RFC(
+                                my_id[0], 
+                                lake_numbers_col[wbody_index],
+                                array('l',upstream_ids),
+                                wbody_parameters[lake_row + wbody_index],
+                                reservoir_types[wbody_index][0],
+                                data_assimilation_parameters["reservoir_da"]["reservoir_parameter_file"],
+                                model_start_time,
+                                data_assimilation_parameters["reservoir_da"]["reservoir_rfc_da"]["reservoir_rfc_forecasts_time_series_path"],
+                                data_assimilation_parameters["reservoir_da"]["reservoir_rfc_da"]["reservoir_rfc_forecasts_lookback_hours"],
+                            )
+                            reach_objects.append(rfc_obj)
+                
+                    else:
+                        # Initialize levelpool reservoir object
+                        lp_obj =  MC_Levelpool(
+                            my_id[0],                        # index position of waterbody reach  
+                            lake_numbers_col[wbody_index],   # lake number 
+                            array('l',upstream_ids),         # upstream segment IDs
+                            wbody_parameters[lake_row + wbody_index],   # water body parameters
+                            reservoir_types[wbody_index][0], # waterbody type code
+                        )
+                        reach_objects.append(lp_obj)
+
+            else:
+                #Set the initial condtions before running loop
+                segment_rows = np.asarray(segment_ids) + row
+                flowveldepth_nd[segment_rows, 0] = init_array[segment_rows]
+                reach_objects.append(mc_reach)
 
     # replace initial conditions with gage observations, wherever available
     cdef int gages_size = usgs_positions.shape[0]
@@ -385,19 +779,26 @@ cpdef object compute_network_structured(
     cdef float [:] lastobs_values, lastobs_times
     cdef (float, float, float, float) da_buf
     cdef int[:] reach_has_gage = np.full(len(reaches_wTypes), np.iinfo(np.int32).min, dtype="int32")
-    cdef float[:,:] nudge = np.zeros((gages_size, nsteps + 1), dtype="float32")
+    # nudge and lastobs rows of the gages of every member, one member after the other
+    cdef float[:,:] nudge = np.zeros((gages_size * n_members, nsteps + 1), dtype="float32")
 
-    lastobs_times = np.full(gages_size, NAN, dtype="float32")
-    lastobs_values = np.full(gages_size, NAN, dtype="float32")
+    lastobs_times = np.full(gages_size * n_members, NAN, dtype="float32")
+    lastobs_values = np.full(gages_size * n_members, NAN, dtype="float32")
     if gages_size:
+        if n_members > 1 and (
+            lastobs_values_init.shape[0] != gages_size * n_members
+            or time_since_lastobs_init.shape[0] != gages_size * n_members
+        ):
+            raise ValueError(f"Expected the lastobs of {n_members} members of {gages_size} gages")
         # if da_check_gage > 0:
         #     print(f"gage_i     usgs_positions[gage_i]  usgs_positions_reach[gage_i]  usgs_positions_gage[gage_i]   list(usgs_positions)")
         for gage_i in range(gages_size):
-            lastobs_values[gage_i] = lastobs_values_init[gage_i]
-            lastobs_times[gage_i] = time_since_lastobs_init[gage_i]
             reach_has_gage[usgs_positions_reach[gage_i]] = usgs_positions_gage[gage_i]
             # if da_check_gage > 0:
             #     print(f"{gage_i} {usgs_positions[gage_i]} {usgs_positions_reach[gage_i]} {usgs_positions_gage[gage_i]} {list(usgs_positions)}")
+        for gage_i in range(gages_size * n_members):
+            lastobs_values[gage_i] = lastobs_values_init[gage_i]
+            lastobs_times[gage_i] = time_since_lastobs_init[gage_i]
 
     if gages_size and gage_maxtimestep > 0:
         for gage_i in range(gages_size):
@@ -405,7 +806,8 @@ cpdef object compute_network_structured(
             # Handle the instance where there are no values, only gage positions
             # TODO: Compare performance with math.isnan (imported for nogil...)
             if not np.isnan(usgs_values[gage_i, 0]):
-                flowveldepth_nd[usgs_position_i, 0, 0] = usgs_values[gage_i, 0]
+                for m in range(n_members):
+                    flowveldepth_nd[m * num_segments + usgs_position_i, 0, 0] = usgs_values[gage_i, 0]
 
     
     #---------------------------------------------------------------------------------------------
@@ -444,6 +846,31 @@ cpdef object compute_network_structured(
     cdef np.ndarray[int, ndim=1] gl_prev_assim_timestamp = np.asarray(great_lakes_param_prev_assim_times)
     cdef np.ndarray[float, ndim=2] gl_climatology = np.asarray(great_lakes_climatology) 
 
+    # DA states hold the rows of every member, one member after the other,
+    # observations and parameters are shared by the members
+    cdef int n_usgs = usgs_idx.shape[0]
+    cdef int n_usace = usace_idx.shape[0]
+    cdef int n_rfc = rfc_idx.shape[0]
+    cdef int n_gl = gl_param_idx.shape[0]
+    if n_members > 1:
+        for state, n_rows in (
+            (usgs_update_time, n_usgs),
+            (usgs_prev_persisted_ouflow, n_usgs),
+            (usgs_persistence_update_time, n_usgs),
+            (usgs_prev_persistence_index, n_usgs),
+            (usace_update_time, n_usace),
+            (usace_prev_persisted_ouflow, n_usace),
+            (usace_persistence_update_time, n_usace),
+            (usace_prev_persistence_index, n_usace),
+            (rfc_update_time, n_rfc),
+            (rfc_timeseries_idx, n_rfc),
+            (gl_prev_assim_ouflow, n_gl),
+            (gl_prev_assim_timestamp, n_gl),
+            (gl_update_time, n_gl),
+        ):
+            if state.shape[0] != n_rows * n_members:
+                raise ValueError(f"Expected the reservoir DA states of {n_members} members of {n_rows} waterbodies")
+
 
     #---------------------------------------------------------------------------------------------
     #---------------------------------------------------------------------------------------------
@@ -452,353 +879,520 @@ cpdef object compute_network_structured(
     cdef Py_ssize_t fill_index
     cdef long upstream_tw_id
     cdef dict tmp
-    cdef int idx
-    cdef float val
+    cdef np.ndarray upstream_fvd
+    cdef set lake_numbers = set(lake_numbers_col)
 
     for upstream_tw_id in upstream_results:
         tmp = upstream_results[upstream_tw_id]
         fill_index = tmp["position_index"]
         fill_index_mask[fill_index] = False
-        for idx, val in enumerate(tmp["results"]):
-            flowveldepth_nd[fill_index, (idx//qvd_ts_w) + 1, idx%qvd_ts_w] = val
-            if data_idx[fill_index]  in lake_numbers_col:
-                res_idx = binary_find(lake_numbers_col, [data_idx[fill_index]])
-                flowveldepth_nd[fill_index, 0, 0] = wbody_parameters[res_idx, 9] # TODO ref dataframe column label
-            else:
-                flowveldepth_nd[fill_index, 0, 0] = init_array[fill_index, 0] # initial flow condition
-                flowveldepth_nd[fill_index, 0, 2] = init_array[fill_index, 2] # initial depth condition
+        # (timesteps x 3) results of the upstream tailwater, copied in one slice
+        upstream_fvd = np.asarray(tmp["results"], dtype='float32').reshape(-1, qvd_ts_w)
+        if upstream_fvd.shape[0] == 0:
+            continue
+        flowveldepth_nd[fill_index, 1:upstream_fvd.shape[0] + 1] = upstream_fvd
+        if data_idx[fill_index] in lake_numbers:
+            res_idx = binary_find(lake_numbers_col, [data_idx[fill_index]])[0]
+            flowveldepth_nd[fill_index, 0, 0] = wbody_parameters[res_idx, 9] # TODO ref dataframe column label
+        else:
+            flowveldepth_nd[fill_index, 0, 0] = init_array[fill_index, 0] # initial flow condition
+            flowveldepth_nd[fill_index, 0, 2] = init_array[fill_index, 2] # initial depth condition
 
     #Init buffers
     lateral_flows = np.zeros( max_buff_size, dtype='float32' )
     buf_view = np.zeros( (max_buff_size, 13), dtype='float32')
     out_buf = np.full( (max_buff_size, 3), -1, dtype='float32')
 
-    cdef int num_reaches = len(reach_objects)
+    # Solver diagnostics, rows of every member in data_idx order, indexed by segment.id
+    cdef int[:, ::1] diag_buf = np.zeros((max_buff_size, 3), dtype='int32')
+    cdef int[:, ::1] diagnostics = np.zeros(
+        (num_segments * n_members if return_diagnostics else 0, 4), dtype='int32'
+    )
+
+    # reach_objects holds the reaches of every member, one member after the other
+    cdef int num_reaches = len(plan.reaches)
+    #reach iterator
+    cdef _Reach* r
+
+    # views of the DA state arrays, rows are passed by pointer to the native
+    # DA functions and updated in place
+    cdef float[:] usgs_update_time_v = usgs_update_time
+    cdef float[:] usgs_prev_persisted_ouflow_v = usgs_prev_persisted_ouflow
+    cdef float[:] usgs_prev_persistence_index_v = usgs_prev_persistence_index
+    cdef float[:] usgs_persistence_update_time_v = usgs_persistence_update_time
+    cdef float[:] usace_update_time_v = usace_update_time
+    cdef float[:] usace_prev_persisted_ouflow_v = usace_prev_persisted_ouflow
+    cdef float[:] usace_prev_persistence_index_v = usace_prev_persistence_index
+    cdef float[:] usace_persistence_update_time_v = usace_persistence_update_time
+    cdef float[:] rfc_update_time_v = rfc_update_time
+    cdef int[:] rfc_timeseries_idx_v = rfc_timeseries_idx
+    cdef int[:] gl_update_time_v = gl_update_time
+    cdef float[:] gl_prev_assim_ouflow_v = gl_prev_assim_ouflow
+    cdef int[:] gl_prev_assim_timestamp_v = gl_prev_assim_timestamp
+    cdef float[:, :] gl_climatology_v = gl_climatology
+    cdef float initial_water_elevation
+    cdef double da_outflow, da_water_elevation, da_projected_storage
+    cdef double rfc_update_time_row, assimilated_value
+    cdef int da_flags, dynamic_reservoir_type
     #Dynamically allocate a C array of reach structs
-    cdef _Reach* reach_structs = <_Reach*>malloc(sizeof(_Reach)*num_reaches)
+    cdef _Reach* reach_structs = <_Reach*>malloc(sizeof(_Reach)*num_reaches*n_members)
     #Populate the above array with the structs contained in each reach object
-    for i in range(num_reaches):
+    for i in range(num_reaches * n_members):
         reach_structs[i] = (<Reach>reach_objects[i])._reach
 
-    #reach iterator
-    cdef _Reach* r
+    # Map each reservoir reach to its row in the DA state arrays once, so the
+    # timestep loop below indexes the state arrays directly instead of
+    # searching them for the lake number on every timestep.
+    # Great Lakes observations are sorted by lake (stable, so the original
+    # order within a lake is kept) and addressed by a [start, stop) range.
+    cdef int[::1] reach_da_row = np.full(num_reaches, -1, dtype='int32')
+    cdef int[::1] reach_gl_start = np.zeros(num_reaches, dtype='int32')
+    cdef int[::1] reach_gl_stop = np.zeros(num_reaches, dtype='int32')
+    cdef int da_row
+    # RFC DA row of the last type 4 reservoir routed, see the RFC DA below
+    cdef int rfc_da_row = -1
+    gl_obs_order = np.argsort(gl_idx, kind='stable')
+    gl_idx_sorted = gl_idx[gl_obs_order]
+    gl_obs = gl_obs[gl_obs_order]
+    gl_times = gl_times[gl_obs_order]
+    cdef float[:] gl_obs_v = gl_obs
+    cdef int[:] gl_times_v = gl_times
+    da_row_maps = {}
+    for code, idx_array in ((2, usgs_idx), (3, usace_idx), (4, rfc_idx), (6, gl_param_idx)):
+        # first occurrence wins, as with np.where(...)[0][0]
+        row_map = {}
+        for row, lake in enumerate(idx_array.tolist()):
+            row_map.setdefault(lake, row)
+        da_row_maps[code] = row_map
+    cdef long long model_start_seconds = 0
+    for i in range(num_reaches):
+        r = &reach_structs[i]
+        if r.type == compute_type.RESERVOIR_LP and r.reach.lp.wbody_type_code == 6:
+            model_start_seconds = t0_seconds(model_start_time)
+            break
+    for i in range(num_reaches):
+        r = &reach_structs[i]
+        if r.type == compute_type.RESERVOIR_LP and r.reach.lp.wbody_type_code in da_row_maps:
+            # raises for a reservoir missing from its DA arrays, as the lookup it replaces did
+            reach_da_row[i] = da_row_maps[r.reach.lp.wbody_type_code][r.reach.lp.lake_number]
+            if r.reach.lp.wbody_type_code == 6:
+                reach_gl_start[i] = np.searchsorted(gl_idx_sorted, r.reach.lp.lake_number, side='left')
+                reach_gl_stop[i] = np.searchsorted(gl_idx_sorted, r.reach.lp.lake_number, side='right')
+
     #create a memory view of the ndarray
     cdef float[:,:,::1] flowveldepth = flowveldepth_nd
-    cdef np.ndarray[float, ndim=3] upstream_array = np.empty((data_idx.shape[0], nsteps+1, 1), dtype='float32')
+
+    # Per-segment hydraulic tables, rows in data_idx order, indexed by segment.id
+    cdef float[:, :, ::1] hydraulic_tables
+    if hydraulic_table_size > 0:
+        hydraulic_tables = plan.get_hydraulic_tables(hydraulic_table_size, hydraulic_table_max_depth)
+    else:
+        hydraulic_tables = np.empty((0, 2, 4), dtype='float32')
+
+    # Headwater reaches have no upstream segments, so if requested and unless
+    # a gage nudges them along the way, all of their timesteps are routed up
+    # front by the time-batched kernel and the timestep loop below skips them.
+    # The time-batched kernel uses the secant iteration, so not with tables,
+    # and does not count its iterations, so not with diagnostics either.
+    cdef int k
+    cdef np.uint8_t[::1] routed_upfront = np.zeros(num_reaches, dtype=np.uint8)
+    cdef int[::1] headwater_reaches
+    cdef float[:, :, ::1] hw_params_buf
+    cdef float[:, :, ::1] hw_qlat_buf
+    cdef float[:, :, :, ::1] hw_qvd_buf
+    cdef int hw_threads = max(n_threads, 1)
+
+    # The secant solves of a thread carry their last residual over to the next
+    # solve. Members keep their own residual on every thread, swapped in for
+    # their reaches, so that a member is routed as it would be on its own.
+    cdef bint swap_residual = n_members > 1
+    cdef float entry_residual
+    cdef float[:, ::1] member_residual
+    if swap_residual:
+        entry_residual = reach.swap_secant_residual(0.0)
+        reach.swap_secant_residual(entry_residual)
+        member_residual = np.full((hw_threads, n_members), entry_residual, dtype='float32')
+
+    headwater_list = []
+    for i in range(num_reaches):
+        r = &reach_structs[i]
+        if (route_headwaters_upfront and r.type == compute_type.MC_REACH
+                and r._num_upstream_ids == 0 and reach_has_gage[i] < 0
+                and hydraulic_table_size == 0 and not return_diagnostics):
+            headwater_list.append(i)
+    headwater_reaches = np.array(headwater_list, dtype='int32')
+    if headwater_reaches.shape[0] and nsteps > 0:
+        hw_threads = min(hw_threads, headwater_reaches.shape[0])
+        hw_params_buf = np.empty((hw_threads, 11, max_buff_size), dtype='float32')
+        hw_qlat_buf = np.empty((hw_threads, max_buff_size, qlat_values.shape[1]), dtype='float32')
+        hw_qvd_buf = np.empty((hw_threads, max_buff_size, nsteps, 3), dtype='float32')
+        for k in prange(
+            headwater_reaches.shape[0],
+            nogil=True,
+            num_threads=hw_threads,
+            schedule='dynamic',
+        ):
+            for m in range(n_members):
+                if swap_residual:
+                    member_residual[threadid(), m] = reach.swap_secant_residual(member_residual[threadid(), m])
+                compute_mc_headwater_reach(
+                    &reach_structs[headwater_reaches[k]],
+                    nsteps,
+                    qts_subdivisions,
+                    qlat_values[m * num_segments:(m + 1) * num_segments],
+                    flowveldepth[m * num_segments:(m + 1) * num_segments],
+                    hw_params_buf[threadid()],
+                    hw_qlat_buf[threadid()],
+                    hw_qvd_buf[threadid()],
+                    assume_short_ts,
+                )
+                if swap_residual:
+                    member_residual[threadid(), m] = reach.swap_secant_residual(member_residual[threadid(), m])
+            routed_upfront[headwater_reaches[k]] = 1
+
+    # Group the reaches into the topological levels of the plan, the reaches
+    # of a level only depend on the levels above and can be routed concurrently.
+    # The serial sweep is a single level in the original order.
+    cdef bint parallel_sweep = n_threads > 1 and num_reaches > 0
+    cdef int num_levels = 1
+    cdef int lvl, level_start, level_stop
+    cdef int[::1] level_order = np.arange(num_reaches, dtype='int32')
+    cdef int[::1] level_bounds = np.array([0, num_reaches], dtype='int32')
+    cdef int[::1] level_mc_order
+    cdef int[::1] level_mc_bounds
+    cdef float[:,:,:] thread_buf
+    cdef float[:,:,:] thread_out
+    cdef int[:, :, ::1] thread_diag
+    if parallel_sweep:
+        swept_mc_reach = np.zeros(num_reaches, dtype=bool)
+        for i in range(num_reaches):
+            r = &reach_structs[i]
+            if r.type == compute_type.MC_REACH:
+                swept_mc_reach[i] = not routed_upfront[i]
+        reach_level = plan.get_reach_levels()
+        num_levels = reach_level.max() + 1
+        order = np.argsort(reach_level, kind='stable').astype('int32')
+        mc_order = order[swept_mc_reach[order]]
+        level_order = order
+        level_bounds = np.searchsorted(
+            reach_level[order], np.arange(num_levels + 1)
+        ).astype('int32')
+        level_mc_order = mc_order
+        level_mc_bounds = np.searchsorted(
+            reach_level[mc_order], np.arange(num_levels + 1)
+        ).astype('int32')
+        thread_buf = np.zeros((n_threads, max_buff_size, 13), dtype='float32')
+        thread_out = np.full((n_threads, max_buff_size, 3), -1, dtype='float32')
+        thread_diag = np.zeros((n_threads, max_buff_size, 3), dtype='int32')
+
+    cdef np.ndarray[float, ndim=3] upstream_array = np.empty((num_segments * n_members, nsteps+1, 1), dtype='float32')
     cdef float reservoir_outflow, reservoir_water_elevation
     cdef int id = 0
     
+    cdef bint streaming = stream_callback is not None and stream_window > 0
+    cdef int stream_start = 0
+    cdef np.ndarray stream_ids, stream_gage_ids
+    if streaming:
+        stream_ids = np.asarray(data_idx)[fill_index_mask]
+        stream_gage_ids = np.asarray(data_idx)[np.asarray(usgs_positions, dtype=np.intp)]
     
     while timestep < nsteps+1:
-        for i in range(num_reaches):
-            r = &reach_structs[i]
-            #Need to get quc and qup
-            upstream_flows = 0.0
-            previous_upstream_flows = 0.0
+        # the sweep of a timestep runs without the GIL, so that networks
+        # routed on threads of the same process run concurrently
+        with nogil:
+            for lvl in range(num_levels):
+                if parallel_sweep:
+                    # Muskingum Cunge reaches of a level only read reaches of the
+                    # levels above it, each thread routes into its own buffers.
+                    # The secant iteration starts from the residual of the last
+                    # solve on its thread, so secant results depend on which
+                    # thread routes a reach, hydraulic table results do not
+                    level_start = level_mc_bounds[lvl]
+                    level_stop = level_mc_bounds[lvl+1]
+                    for k in prange(
+                        level_start,
+                        level_stop,
+                        num_threads=n_threads,
+                        schedule='dynamic',
+                    ):
+                        for m in range(n_members):
+                            if swap_residual:
+                                member_residual[threadid(), m] = reach.swap_secant_residual(member_residual[threadid(), m])
+                            compute_mc_reach(
+                                &reach_structs[level_mc_order[k]],
+                                timestep,
+                                qts_subdivisions,
+                                qlat_values[m * num_segments:(m + 1) * num_segments],
+                                flowveldepth[m * num_segments:(m + 1) * num_segments],
+                                thread_buf[threadid()],
+                                thread_out[threadid()],
+                                assume_short_ts,
+                                hydraulic_tables,
+                                thread_diag[threadid()],
+                                diagnostics[m * num_segments:(m + 1) * num_segments],
+                            )
+                            if swap_residual:
+                                member_residual[threadid(), m] = reach.swap_secant_residual(member_residual[threadid(), m])
 
-            for _i in range(r._num_upstream_ids):#Explicit loop reduces some overhead
-                id = r._upstream_ids[_i]
-                upstream_flows += flowveldepth[id, timestep, 0]
-                previous_upstream_flows += flowveldepth[id, timestep-1, 0]
+                # members route the level one after the other
+                for m in range(n_members):
+                    for k in range(level_bounds[lvl], level_bounds[lvl+1]):
+                        i = level_order[k]
+                        row = m * num_segments
+                        r = &reach_structs[m * num_reaches + i]
+                        if r.type == compute_type.MC_REACH:
+                            if not parallel_sweep and not routed_upfront[i]:
+                                if swap_residual:
+                                    member_residual[0, m] = reach.swap_secant_residual(member_residual[0, m])
+                                compute_mc_reach(r, timestep, qts_subdivisions,
+                                                 qlat_values[row:row + num_segments],
+                                                 flowveldepth[row:row + num_segments],
+                                                 buf_view, out_buf,
+                                                 assume_short_ts, hydraulic_tables,
+                                                 diag_buf, diagnostics[row:row + num_segments])
+                                if swap_residual:
+                                    member_residual[0, m] = reach.swap_secant_residual(member_residual[0, m])
+                            if reach_has_gage[i] == da_check_gage:
+                                for _i in range(r.reach.mc_reach.num_segments):
+                                    segment = get_mc_segment(r, _i)
+                                    printf("segment.id: %ld\t", segment.id)
+                                    printf("segment.id: %d\t", usgs_positions[reach_has_gage[i]])
 
-            if assume_short_ts:
-                upstream_flows = previous_upstream_flows
+                        else:
+                            #Need to get quc and qup
+                            upstream_flows = 0.0
+                            previous_upstream_flows = 0.0
 
-            if r.type == compute_type.RESERVOIR_LP: 
-                
-                # Great Lake waterbody: doesn't actually route anything, default outflows
-                # are from climatology.
-                if r.reach.lp.wbody_type_code == 6:
-                    # find index location of waterbody in great_lakes_df 
-                    # and great_lakes_param_df
-                    res_idx                    = np.where(gl_idx == r.reach.lp.lake_number)
-                    wbody_gage_obs             = gl_obs[res_idx[0]]
-                    wbody_gage_time            = gl_times[res_idx[0]]
-                    res_param_idx              = np.where(gl_param_idx == r.reach.lp.lake_number)
-                    param_prev_assim_flow      = gl_prev_assim_ouflow[res_param_idx[0][0]]
-                    param_prev_assim_timestamp = gl_prev_assim_timestamp[res_param_idx[0][0]]
-                    param_update_time          = gl_update_time[res_param_idx[0][0]]
-                    climatology                = gl_climatology[res_param_idx[0][0],:]
-
-                    (new_outflow,
-                    new_assimilated_outflow, 
-                    new_assimilated_timestamp, 
-                    new_update_time
-                    ) = great_lakes_da(
-                        wbody_gage_obs,             # gage observations (cms)
-                        wbody_gage_time,            # timestamps of gage observations (datetime str)
-                        param_prev_assim_flow,      # last used observation (cms)
-                        param_prev_assim_timestamp, # timestamp of last used observation (datetime str)
-                        param_update_time,          # timestamp to determine whether to look for new observation (datetime str)
-                        model_start_time,           # model initilaization time (datetime str)
-                        dt * timestep,              # model time (sec)
-                        climatology,                # climatology outflows (cms)
-                    )
+                            for _i in range(r._num_upstream_ids):#Explicit loop reduces some overhead
+                                id = r._upstream_ids[_i]
+                                upstream_flows += flowveldepth[row + id, timestep, 0]
+                                previous_upstream_flows += flowveldepth[row + id, timestep-1, 0]
 
-                    gl_update_time[res_param_idx[0][0]] = new_update_time
-                    gl_prev_assim_ouflow[res_param_idx[0][0]] = new_assimilated_outflow
-                    gl_prev_assim_timestamp[res_param_idx[0][0]] = new_assimilated_timestamp
+                            if assume_short_ts:
+                                upstream_flows = previous_upstream_flows
 
-                    # populate flowveldepth array with levelpool or hybrid DA results 
-                    flowveldepth[r.id, timestep, 0] = new_outflow
-                    flowveldepth[r.id, timestep, 1] = 0.0
-                    flowveldepth[r.id, timestep, 2] = 0.0
-                    upstream_array[r.id, timestep, 0] = upstream_flows
+                            if r.type == compute_type.RESERVOIR_LP: 
 
-                else:
-                    # water elevation before levelpool calculation
-                    initial_water_elevation = r.reach.lp.water_elevation
-                    
-                    # levelpool reservoir storage/outflow calculation
-                    run_lp_c(r, upstream_flows, 0.0, routing_period, &reservoir_outflow, &reservoir_water_elevation)
-                    
-                    # USGS reservoir hybrid DA inputs
-                    if r.reach.lp.wbody_type_code == 2:
-                        # find index location of waterbody in reservoir_usgs_obs 
-                        # and reservoir_usgs_time
-                        res_idx = np.where(usgs_idx == r.reach.lp.lake_number)
-                        wbody_gage_obs          = reservoir_usgs_obs[res_idx[0][0],:]
-                        wbody_gage_time         = reservoir_usgs_time
-                        prev_persisted_outflow  = usgs_prev_persisted_ouflow[res_idx[0][0]]
-                        persistence_update_time = usgs_persistence_update_time[res_idx[0][0]] 
-                        persistence_index       = usgs_prev_persistence_index[res_idx[0][0]]
-                        update_time             = usgs_update_time[res_idx[0][0]] 
-                    
-                    # USACE reservoir hybrid DA inputs
-                    if r.reach.lp.wbody_type_code == 3:
-                        # find index location of waterbody in reservoir_usgs_obs 
-                        # and reservoir_usgs_time
-                        res_idx = np.where(usace_idx == r.reach.lp.lake_number)
-                        wbody_gage_obs          = reservoir_usace_obs[res_idx[0][0],:]
-                        wbody_gage_time         = reservoir_usace_time
-                        prev_persisted_outflow  = usace_prev_persisted_ouflow[res_idx[0][0]]
-                        persistence_update_time = usace_persistence_update_time[res_idx[0][0]] 
-                        persistence_index       = usace_prev_persistence_index[res_idx[0][0]]
-                        update_time             = usace_update_time[res_idx[0][0]] 
-                        
-                    # Execute reservoir DA - both USGS(2) and USACE(3) types
-                    if r.reach.lp.wbody_type_code == 2 or r.reach.lp.wbody_type_code == 3:
-                        
-                        #print('***********************************************************')
-                        #print('calling reservoir DA code for lake_id:', r.reach.lp.lake_number) 
-                        #print('before DA, simulated outflow = ', reservoir_outflow)
-                        #print('before DA, simulated water elevation = ', r.reach.lp.water_elevation)
-                        
-                        (new_outflow,
-                        new_persisted_outflow,
-                        new_water_elevation, 
-                        new_update_time, 
-                        new_persistence_index, 
-                        new_persistence_update_time
-                        ) = reservoir_hybrid_da(
-                            r.reach.lp.lake_number,       # lake identification number
-                            wbody_gage_obs,               # gage observation values (cms)
-                            wbody_gage_time,              # gage observation times (sec)
-                            dt * timestep,                # model time (sec)
-                            prev_persisted_outflow,       # previously persisted outflow (cms)
-                            persistence_update_time,
-                            persistence_index,            # number of sequentially persisted update cycles
-                            reservoir_outflow,            # levelpool simulated outflow (cms)
-                            upstream_flows,               # waterbody inflow (cms)
-                            dt,                           # model timestep (sec)
-                            r.reach.lp.area,              # waterbody surface area (km2)
-                            r.reach.lp.max_depth,         # max waterbody depth (m)
-                            r.reach.lp.orifice_elevation, # orifice elevation (m)
-                            initial_water_elevation,      # water surface el., previous timestep (m)
-                            48.0,                         # gage lookback hours (hrs)
-                            update_time                   # waterbody update time (sec)
-                        )
-                        
-                        #print('After DA, outflow = ', new_outflow)
-                        #print('After DA, water elevation =', new_water_elevation)
-                        
-                        # update levelpool water elevation state
-                        update_lp_c(r, new_water_elevation, &reservoir_water_elevation)
-                        
-                        # change reservoir_outflow
-                        reservoir_outflow = new_outflow
-                        
-                        #print('confirming DA elevation replacement:', reservoir_water_elevation)
-                        #print('===========================================================')
-                        
-                    # update USGS DA reservoir state arrays
-                    if r.reach.lp.wbody_type_code == 2:
-                        usgs_update_time[res_idx[0][0]]              = new_update_time
-                        usgs_prev_persisted_ouflow[res_idx[0][0]]    = new_persisted_outflow
-                        usgs_prev_persistence_index[res_idx[0][0]]   = new_persistence_index
-                        usgs_persistence_update_time[res_idx[0][0]]  = new_persistence_update_time
-                        
-                    # update USACE DA reservoir state arrays
-                    if r.reach.lp.wbody_type_code == 3:
-                        usace_update_time[res_idx[0][0]]             = new_update_time
-                        usace_prev_persisted_ouflow[res_idx[0][0]]   = new_persisted_outflow
-                        usace_prev_persistence_index[res_idx[0][0]]  = new_persistence_index
-                        usace_persistence_update_time[res_idx[0][0]] = new_persistence_update_time
-
-
-                    # RFC reservoir hybrid DA inputs
-                    if r.reach.lp.wbody_type_code == 4:
-                        # find index location of waterbody in reservoir_rfc_obs 
-                        # and reservoir_rfc_time
-                        res_idx            = np.where(rfc_idx == r.reach.lp.lake_number)
-                        wbody_gage_obs     = reservoir_rfc_obs[res_idx[0][0],:]
-                        totalCounts        = reservoir_rfc_totalCounts[res_idx[0][0]]
-                        rfc_file           = reservoir_rfc_file[res_idx[0][0]]
-                        use_RFC            = reservoir_rfc_use_forecast[res_idx[0][0]]
-                        current_timeseries_idx = rfc_timeseries_idx[res_idx[0][0]]
-                        update_time        = rfc_update_time[res_idx[0][0]]
-                        rfc_timestep       = reservoir_rfc_da_timestep[res_idx[0][0]]
-                        rfc_persist_days   = reservoir_rfc_persist_days[res_idx[0][0]]
-
-                    # Execute RFC reservoir DA - both RFC(4) and Glacially Dammed Lake(5) types
-                    if r.reach.lp.wbody_type_code == 4 or r.reach.lp.wbody_type_code == 5:
-                        
-                        #print('***********************************************************')
-                        #print('calling reservoir DA code for lake_id:', r.reach.lp.lake_number) 
-                        #print('before DA, simulated outflow = ', reservoir_outflow)
-                        #print('before DA, simulated water elevation = ', r.reach.lp.water_elevation)
-                        
-                        (
-                            new_outflow, 
-                            new_water_elevation, 
-                            new_update_time,
-                            new_timeseries_idx,
-                            dynamic_reservoir_type, 
-                            assimilated_value, 
-                            assimilated_source_file,
-                        ) = reservoir_RFC_da(
-                            use_RFC,                            # boolean whether to use RFC values or not
-                            wbody_gage_obs,              # gage observation values (cms)
-                            current_timeseries_idx,                     # index of for current time series observation
-                            totalCounts,                       # total number of observations in RFC timeseries
-                            routing_period,                          # routing period (sec)
-                            dt * timestep,                               # model time (sec)
-                            update_time,                        # time to advance to next time series index
-                            rfc_timestep,                       # frequency of DA observations (sec)
-                            rfc_persist_days*24*60*60, # max seconds RFC forecasts will be used/persisted (days -> seconds)
-                            r.reach.lp.wbody_type_code,                           # reservoir type
-                            upstream_flows,                                   # waterbody inflow (cms)
-                            initial_water_elevation,                  # water surface el., previous timestep (m)
-                            reservoir_outflow,                  # levelpool simulated outflow (cms)
-                            reservoir_water_elevation,                # levelpool simulated water elevation (m)
-                            r.reach.lp.area*1.0e6,          # waterbody surface area (km2 -> m2)
-                            r.reach.lp.max_depth,                # max waterbody depth (m)
-                            rfc_file,                # RFC file name
-                        )
+                                # Great Lake waterbody: doesn't actually route anything, default outflows
+                                # are from climatology.
+                                if r.reach.lp.wbody_type_code == 6:
+                                    # DA state row of waterbody in great_lakes_param_df, updated in place
+                                    da_row = reach_da_row[i]
+                                    great_lakes_da_c(
+                                        gl_obs_v[reach_gl_start[i]:reach_gl_stop[i]],    # gage observations (cms)
+                                        gl_times_v[reach_gl_start[i]:reach_gl_stop[i]],  # timestamps of gage observations (sec)
+                                        month_index(model_start_seconds, dt * timestep), # month of model time
+                                        dt * timestep,                                   # model time (sec)
+                                        gl_climatology_v[da_row, :],                     # climatology outflows (cms)
+                                        &gl_prev_assim_ouflow_v[da_row + m * n_gl],      # last used observation (cms)
+                                        &gl_prev_assim_timestamp_v[da_row + m * n_gl],   # timestamp of last used observation (sec)
+                                        &gl_update_time_v[da_row + m * n_gl],            # time to look for new observation (sec)
+                                        &da_outflow,
+                                    )
 
-                        #print('After DA, outflow = ', new_outflow)
-                        #print('After DA, water elevation =', new_water_elevation)
-                        
-                        # update levelpool water elevation state
-                        update_lp_c(r, new_water_elevation, &reservoir_water_elevation)
-                        
-                        # change reservoir_outflow
-                        reservoir_outflow = new_outflow
-                        
-                        #print('confirming DA elevation replacement:', reservoir_water_elevation)
-                        #print('===========================================================')
-                        
-                        # update RFC DA reservoir state arrays
-                        rfc_update_time[res_idx[0][0]]    = new_update_time
-                        rfc_timeseries_idx[res_idx[0][0]] = new_timeseries_idx
-                        
-                    
-                    # populate flowveldepth array with levelpool or hybrid DA results 
-                    flowveldepth[r.id, timestep, 0] = reservoir_outflow
-                    flowveldepth[r.id, timestep, 1] = 0.0
-                    flowveldepth[r.id, timestep, 2] = reservoir_water_elevation
-                    upstream_array[r.id, timestep, 0] = upstream_flows
-
-            elif r.type == compute_type.RESERVOIR_RFC:
-                run_rfc_c(r, upstream_flows, 0.0, routing_period, &reservoir_outflow, &reservoir_water_elevation)
-                flowveldepth[r.id, timestep, 0] = reservoir_outflow
-                flowveldepth[r.id, timestep, 1] = 0.0
-                flowveldepth[r.id, timestep, 2] = reservoir_water_elevation
-                upstream_array[r.id, timestep, 0] = upstream_flows
-            
-            else:
-                #Create compute reach kernel input buffer
-                for _i in range(r.reach.mc_reach.num_segments):
-                    segment = get_mc_segment(r, _i)#r._segments[_i]
-                    buf_view[_i, 0] = qlat_array[ segment.id, <int>((timestep-1)/qts_subdivisions)]
-                    buf_view[_i, 1] = segment.dt
-                    buf_view[_i, 2] = segment.dx
-                    buf_view[_i, 3] = segment.bw
-                    buf_view[_i, 4] = segment.tw
-                    buf_view[_i, 5] = segment.twcc
-                    buf_view[_i, 6] = segment.n
-                    buf_view[_i, 7] = segment.ncc
-                    buf_view[_i, 8] = segment.cs
-                    buf_view[_i, 9] = segment.s0
-                    buf_view[_i, 10] = flowveldepth[segment.id, timestep-1, 0]
-                    buf_view[_i, 11] = 0.0 #flowveldepth[segment.id, timestep-1, 1]
-                    buf_view[_i, 12] = flowveldepth[segment.id, timestep-1, 2]
-
-                compute_reach_kernel(previous_upstream_flows, upstream_flows,
-                                     r.reach.mc_reach.num_segments, buf_view,
-                                     out_buf,
-                                     assume_short_ts)
-
-                #Copy the output out
-                for _i in range(r.reach.mc_reach.num_segments):
-                    segment = get_mc_segment(r, _i)
-                    flowveldepth[segment.id, timestep, 0] = out_buf[_i, 0]
-                    if reach_has_gage[i] == da_check_gage:
-                        printf("segment.id: %ld\t", segment.id)
-                        printf("segment.id: %d\t", usgs_positions[reach_has_gage[i]])
-                    flowveldepth[segment.id, timestep, 1] = out_buf[_i, 1]
-                    flowveldepth[segment.id, timestep, 2] = out_buf[_i, 2]
-
-            # For each reach,
-            # at the end of flow calculation, Check if there is something to assimilate
-            # by evaluating whether the reach_has_gage array has a value different from
-            # the initialized value, np.iinfo(np.int32).min (the minimum possible integer).
-
-            # TODO: If it were possible to invert the time and reach loops
-            # (should be possible for the MC), then this check could be
-            # performed fewer times -- consider implementing such a change.
-
-            if reach_has_gage[i] > -1:
-            # We only enter this process for reaches where the
-            # gage actually exists.
-            # If assimilation is active for this reach, we touch the
-            # exactly one gage which is relevant for the reach ...
-                gage_i = reach_has_gage[i]
-                usgs_position_i = usgs_positions[gage_i]
-                da_buf = simple_da(
-                    timestep,
-                    routing_period,
-                    da_decay_coefficient,
-                    gage_maxtimestep,
-                    NAN if timestep >= gage_maxtimestep else usgs_values[gage_i,timestep],
-                    flowveldepth[usgs_position_i, timestep, 0],
-                    lastobs_times[gage_i],
-                    lastobs_values[gage_i],
-                    gage_i == da_check_gage,
-                )
-                if gage_i == da_check_gage:
-                    printf("ts: %d\t", timestep)
-                    printf("gmxt: %d\t", gage_maxtimestep)
-                    printf("gage: %d\t", gage_i)
-                    printf("old: %g\t", flowveldepth[usgs_position_i, timestep, 0])
-                    printf("exp_gage_val: %g\t", 
-                    NAN if timestep >= gage_maxtimestep else usgs_values[gage_i,timestep],)
+                                    # populate flowveldepth array with levelpool or hybrid DA results 
+                                    flowveldepth[row + r.id, timestep, 0] = da_outflow
+                                    flowveldepth[row + r.id, timestep, 1] = 0.0
+                                    flowveldepth[row + r.id, timestep, 2] = 0.0
+                                    upstream_array[row + r.id, timestep, 0] = upstream_flows
+
+                                else:
+                                    # water elevation before levelpool calculation
+                                    initial_water_elevation = r.reach.lp.water_elevation
+
+                                    # levelpool reservoir storage/outflow calculation
+                                    run_lp_c(r, upstream_flows, 0.0, routing_period, &reservoir_outflow, &reservoir_water_elevation)
+
+                                    # Execute reservoir DA - both USGS(2) and USACE(3) types,
+                                    # DA state rows of the waterbody are updated in place
+                                    if r.reach.lp.wbody_type_code == 2 or r.reach.lp.wbody_type_code == 3:
+                                        da_row = reach_da_row[i]
+                                        if r.reach.lp.wbody_type_code == 2:
+                                            da_flags = reservoir_hybrid_da_c(
+                                                reservoir_usgs_obs[da_row, :],          # gage observation values (cms)
+                                                reservoir_usgs_time,                    # gage observation times (sec)
+                                                dt * timestep,                          # model time (sec)
+                                                reservoir_outflow,                      # levelpool simulated outflow (cms)
+                                                upstream_flows,                         # waterbody inflow (cms)
+                                                dt,                                     # model timestep (sec)
+                                                r.reach.lp.area,                        # waterbody surface area (km2)
+                                                r.reach.lp.max_depth,                   # max waterbody depth (m)
+                                                r.reach.lp.orifice_elevation,           # orifice elevation (m)
+                                                initial_water_elevation,                # water surface el., previous timestep (m)
+                                                48.0,                                   # gage lookback hours (hrs)
+                                                &usgs_update_time_v[da_row + m * n_usgs],
+                                                &usgs_prev_persisted_ouflow_v[da_row + m * n_usgs],
+                                                &usgs_prev_persistence_index_v[da_row + m * n_usgs],
+                                                &usgs_persistence_update_time_v[da_row + m * n_usgs],
+                                                &da_outflow,
+                                                &da_water_elevation,
+                                                &da_projected_storage,
+                                            )
+                                        else:
+                                            da_flags = reservoir_hybrid_da_c(
+                                                reservoir_usace_obs[da_row, :],
+                                                reservoir_usace_time,
+                                                dt * timestep,
+                                                reservoir_outflow,
+                                                upstream_flows,
+                                                dt,
+                                                r.reach.lp.area,
+                                                r.reach.lp.max_depth,
+                                                r.reach.lp.orifice_elevation,
+                                                initial_water_elevation,
+                                                48.0,
+                                                &usace_update_time_v[da_row + m * n_usace],
+                                                &usace_prev_persisted_ouflow_v[da_row + m * n_usace],
+                                                &usace_prev_persistence_index_v[da_row + m * n_usace],
+                                                &usace_persistence_update_time_v[da_row + m * n_usace],
+                                                &da_outflow,
+                                                &da_water_elevation,
+                                                &da_projected_storage,
+                                            )
+
+                                        if da_flags:
+                                            with gil:
+                                                log_hybrid_da_warnings(
+                                                    da_flags,
+                                                    r.reach.lp.lake_number,
+                                                    dt * timestep,
+                                                    da_projected_storage,
+                                                    r.reach.lp.max_depth,
+                                                    r.reach.lp.orifice_elevation,
+                                                    r.reach.lp.area,
+                                                )
+
+                                        # update levelpool water elevation state
+                                        update_lp_c(r, da_water_elevation, &reservoir_water_elevation)
+
+                                        # change reservoir_outflow
+                                        reservoir_outflow = da_outflow
+
+                                    # RFC reservoir DA inputs, only type 4 reservoirs have their own
+                                    # row. Type 5 reservoirs run with the inputs of the last type 4
+                                    # reservoir routed before them
+                                    if r.reach.lp.wbody_type_code == 4:
+                                        rfc_da_row = reach_da_row[i]
+                                    if r.reach.lp.wbody_type_code == 5 and rfc_da_row < 0:
+                                        with gil:
+                                            raise ValueError(
+                                                f"No RFC DA inputs for type 5 waterbody {r.reach.lp.lake_number}, "
+                                                "they are taken from a type 4 waterbody routed before it"
+                                            )
+
+                                    # Execute RFC reservoir DA - both RFC(4) and Glacially Dammed Lake(5) types
+                                    if r.reach.lp.wbody_type_code == 4 or r.reach.lp.wbody_type_code == 5:
+                                        da_row = rfc_da_row
+                                        rfc_update_time_row = rfc_update_time_v[da_row + m * n_rfc]
+                                        reservoir_RFC_da_c(
+                                            reservoir_rfc_use_forecast[da_row],     # boolean whether to use RFC values or not
+                                            reservoir_rfc_obs[da_row, :],           # RFC time series values (cms)
+                                            reservoir_rfc_totalCounts[da_row],      # total number of observations in RFC timeseries
+                                            routing_period,                         # routing period (sec)
+                                            dt * timestep,                          # model time (sec)
+                                            reservoir_rfc_da_timestep[da_row],      # frequency of DA observations (sec)
+                                            reservoir_rfc_persist_days[da_row]*24*60*60, # max seconds RFC forecasts will be used/persisted (days -> seconds)
+                                            r.reach.lp.wbody_type_code,             # reservoir type
+                                            upstream_flows,                         # waterbody inflow (cms)
+                                            initial_water_elevation,                # water surface el., previous timestep (m)
+                                            reservoir_outflow,                      # levelpool simulated outflow (cms)
+                                            reservoir_water_elevation,              # levelpool simulated water elevation (m)
+                                            r.reach.lp.area*1.0e6,                  # waterbody surface area (km2 -> m2)
+                                            r.reach.lp.max_depth,                   # max waterbody depth (m)
+                                            &rfc_update_time_row,                   # time to advance to next time series index
+                                            &rfc_timeseries_idx_v[da_row + m * n_rfc], # index of current time series value
+                                            &da_outflow,
+                                            &da_water_elevation,
+                                            &dynamic_reservoir_type,
+                                            &assimilated_value,
+                                        )
+                                        rfc_update_time_v[da_row + m * n_rfc] = rfc_update_time_row
 
-                flowveldepth[usgs_position_i, timestep, 0] = da_buf[0]
+                                        # update levelpool water elevation state
+                                        update_lp_c(r, da_water_elevation, &reservoir_water_elevation)
 
-                if gage_i == da_check_gage:
-                    printf("new: %g\t", flowveldepth[usgs_position_i, timestep, 0])
-                    printf("repl: %g\t", da_buf[0])
-                    printf("nudg: %g\n", da_buf[1])
+                                        # change reservoir_outflow
+                                        reservoir_outflow = da_outflow
 
-                nudge[gage_i, timestep] = da_buf[1]
-                lastobs_times[gage_i] = da_buf[2]
-                lastobs_values[gage_i] = da_buf[3]
+                                    # populate flowveldepth array with levelpool or hybrid DA results 
+                                    flowveldepth[row + r.id, timestep, 0] = reservoir_outflow
+                                    flowveldepth[row + r.id, timestep, 1] = 0.0
+                                    flowveldepth[row + r.id, timestep, 2] = reservoir_water_elevation
+                                    upstream_array[row + r.id, timestep, 0] = upstream_flows
+
+                            elif r.type == compute_type.RESERVOIR_RFC:
+                                run_rfc_c(r, upstream_flows, 0.0, routing_period, &reservoir_outflow, &reservoir_water_elevation)
+                                flowveldepth[row + r.id, timestep, 0] = reservoir_outflow
+                                flowveldepth[row + r.id, timestep, 1] = 0.0
+                                flowveldepth[row + r.id, timestep, 2] = reservoir_water_elevation
+                                upstream_array[row + r.id, timestep, 0] = upstream_flows
+
+                        # For each reach,
+                        # at the end of flow calculation, Check if there is something to assimilate
+                        # by evaluating whether the reach_has_gage array has a value different from
+                        # the initialized value, np.iinfo(np.int32).min (the minimum possible integer).
+
+                        # TODO: If it were possible to invert the time and reach loops
+                        # (should be possible for the MC), then this check could be
+                        # performed fewer times -- consider implementing such a change.
+
+                        if reach_has_gage[i] > -1:
+                        # We only enter this process for reaches where the
+                        # gage actually exists.
+                        # If assimilation is active for this reach, we touch the
+                        # exactly one gage which is relevant for the reach ...
+                            gage_i = reach_has_gage[i]
+                            usgs_position_i = usgs_positions[gage_i]
+                            da_buf = simple_da(
+                                timestep,
+                                routing_period,
+                                da_decay_coefficient,
+                                gage_maxtimestep,
+                                NAN if timestep >= gage_maxtimestep else usgs_values[gage_i,timestep],
+                                flowveldepth[row + usgs_position_i, timestep, 0],
+                                lastobs_times[m * gages_size + gage_i],
+                                lastobs_values[m * gages_size + gage_i],
+                                gage_i == da_check_gage,
+                            )
+                            if gage_i == da_check_gage:
+                                printf("ts: %d\t", timestep)
+                                printf("gmxt: %d\t", gage_maxtimestep)
+                                printf("gage: %d\t", gage_i)
+                                printf("old: %g\t", flowveldepth[row + usgs_position_i, timestep, 0])
+                                printf("exp_gage_val: %g\t", 
+                                NAN if timestep >= gage_maxtimestep else usgs_values[gage_i,timestep],)
+
+                            flowveldepth[row + usgs_position_i, timestep, 0] = da_buf[0]
+
+                            if gage_i == da_check_gage:
+                                printf("new: %g\t", flowveldepth[row + usgs_position_i, timestep, 0])
+                                printf("repl: %g\t", da_buf[0])
+                                printf("nudg: %g\n", da_buf[1])
+
+                            nudge[m * gages_size + gage_i, timestep] = da_buf[1]
+                            lastobs_times[m * gages_size + gage_i] = da_buf[2]
+                            lastobs_values[m * gages_size + gage_i] = da_buf[3]
 
         # TODO: Address remaining TODOs (feels existential...), Extra commented material, etc.
 
+        if streaming and (timestep - stream_start == stream_window or timestep == nsteps):
+            stream_callback(
+                stream_ids,
+                stream_gage_ids,
+                stream_start,
+                flowveldepth_nd[fill_index_mask, stream_start + 1:timestep + 1],
+                np.array(nudge[:, stream_start + 1:timestep + 1]),
+            )
+            stream_start = timestep
+
         timestep += 1
 
+    # leave the thread with the residual of the first member, as routing it
+    # alone would, so that the first member of consecutive calls is routed
+    # as on its own
+    if swap_residual:
+        reach.swap_secant_residual(member_residual[0, 0])
+
     #pr.disable()
     #pr.print_stats(sort='time')
     #IMPORTANT, free the dynamic array created
@@ -808,38 +1402,52 @@ cpdef object compute_network_structured(
     #do the same for the upstream_array
     output_upstream = np.asarray(upstream_array[:,1:,:], dtype='float32')
     #return np.asarray(data_idx, dtype=np.intp), np.asarray(flowveldepth.base.reshape(flowveldepth.shape[0], -1), dtype='float32')
-    return (
-        np.asarray(data_idx, dtype=np.intp)[fill_index_mask], 
-        output.reshape(output.shape[0], -1)[fill_index_mask], 
-        0, 
-        (
-            np.asarray([data_idx[usgs_position_i] for usgs_position_i in usgs_positions]), 
-            np.asarray(lastobs_times), 
-            np.asarray(lastobs_values)
-        ), 
-        (
-            usgs_idx, 
-            usgs_update_time-((timestep-1)*dt), 
-            usgs_prev_persisted_ouflow, 
-            usgs_prev_persistence_index, 
-            usgs_persistence_update_time-((timestep-1)*dt)
-        ), 
-        (
-            usace_idx, usace_update_time-((timestep-1)*dt), 
-            usace_prev_persisted_ouflow, 
-            usace_prev_persistence_index, 
-            usace_persistence_update_time-((timestep-1)*dt)
-        ), 
-        output_upstream.reshape(output.shape[0], -1)[fill_index_mask], 
-        (
-            rfc_idx, rfc_update_time-((timestep-1)*dt), 
-            rfc_timeseries_idx
-        ),
-        np.asarray(nudge),
-        (
-            gl_param_idx,
-            gl_prev_assim_ouflow,
-            gl_prev_assim_timestamp,
-            gl_update_time
-        )
-    )
\ No newline at end of file
+    gage_ids = np.asarray([data_idx[usgs_position_i] for usgs_position_i in usgs_positions])
+    member_results = []
+    for m in range(n_members):
+        # rows of this member in the member-stacked arrays
+        seg_rows = slice(m * num_segments, (m + 1) * num_segments)
+        gage_rows = slice(m * gages_size, (m + 1) * gages_size)
+        usgs_rows = slice(m * n_usgs, (m + 1) * n_usgs)
+        usace_rows = slice(m * n_usace, (m + 1) * n_usace)
+        rfc_rows = slice(m * n_rfc, (m + 1) * n_rfc)
+        gl_rows = slice(m * n_gl, (m + 1) * n_gl)
+        member_results.append((
+            np.asarray(data_idx, dtype=np.intp)[fill_index_mask], 
+            output[seg_rows].reshape(num_segments, -1)[fill_index_mask], 
+            0, 
+            (
+                gage_ids, 
+                np.asarray(lastobs_times)[gage_rows], 
+                np.asarray(lastobs_values)[gage_rows]
+            ), 
+            (
+                usgs_idx, 
+                usgs_update_time[usgs_rows]-((timestep-1)*dt), 
+                usgs_prev_persisted_ouflow[usgs_rows], 
+                usgs_prev_persistence_index[usgs_rows], 
+                usgs_persistence_update_time[usgs_rows]-((timestep-1)*dt)
+            ), 
+            (
+                usace_idx, usace_update_time[usace_rows]-((timestep-1)*dt), 
+                usace_prev_persisted_ouflow[usace_rows], 
+                usace_prev_persistence_index[usace_rows], 
+                usace_persistence_update_time[usace_rows]-((timestep-1)*dt)
+            ), 
+            output_upstream[seg_rows].reshape(num_segments, -1)[fill_index_mask], 
+            (
+                rfc_idx, rfc_update_time[rfc_rows]-((timestep-1)*dt), 
+                rfc_timeseries_idx[rfc_rows]
+            ),
+            np.asarray(nudge)[gage_rows],
+            (
+                gl_param_idx,
+                gl_prev_assim_ouflow[gl_rows],
+                gl_prev_assim_timestamp[gl_rows],
+                gl_update_time[gl_rows]
+            ),
+            np.asarray(diagnostics)[seg_rows][fill_index_mask] if return_diagnostics else None,
+        ))
+    if n_members == 1:
+        return member_results[0]
+    return member_results
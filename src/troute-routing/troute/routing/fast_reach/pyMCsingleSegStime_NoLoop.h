@@ -20,3 +20,86 @@ extern void c_muskingcungenwm(float *dt,
                               float *cn,
                               float *X);
 
+extern void c_muskingcungenwm_diag(float *dt,
+                                   float *qup,
+                                   float *quc,
+                                   float *qdp,
+                                   float *ql,
+                                   float *dx,
+                                   float *bw,
+                                   float *tw,
+                                   float *twcc,
+                                   float *n,
+                                   float *ncc,
+                                   float *cs,
+                                   float *s0,
+                                   float *velp,
+                                   float *depthp,
+                                   float *qdc,
+                                   float *velc,
+                                   float *depthc,
+                                   float *ck,
+                                   float *cn,
+                                   float *X,
+                                   int *iterations,
+                                   int *retries,
+                                   int *converged);
+
+extern void c_muskingcunge_headwater(int *nseg,
+                                     int *nsteps,
+                                     int *nts_ql,
+                                     int *qts_subdivisions,
+                                     int *short_ts,
+                                     float *dt,
+                                     float *dx,
+                                     float *bw,
+                                     float *tw,
+                                     float *twcc,
+                                     float *n,
+                                     float *ncc,
+                                     float *cs,
+                                     float *s0,
+                                     float *ql,
+                                     float *qdp0,
+                                     float *depthp0,
+                                     float *qvd);
+
+extern void c_hydraulic_table(float *bw,
+                              float *tw,
+                              float *twcc,
+                              float *n,
+                              float *ncc,
+                              float *cs,
+                              float *s0,
+                              int *ntab,
+                              float *hmax,
+                              float *table);
+
+extern void c_muskingcunge_table(float *dt,
+                                 float *qup,
+                                 float *quc,
+                                 float *qdp,
+                                 float *ql,
+                                 float *dx,
+                                 float *bw,
+                                 float *tw,
+                                 float *twcc,
+                                 float *n,
+                                 float *ncc,
+                                 float *cs,
+                                 float *s0,
+                                 float *velp,
+                                 float *depthp,
+                                 int *ntab,
+                                 const float *table,
+                                 float *qdc,
+                                 float *velc,
+                                 float *depthc,
+                                 float *ck,
+                                 float *cn,
+                                 float *X,
+                                 int *iterations,
+                                 int *retries,
+                                 int *converged);
+
+extern void c_swap_secant_residual(float *residual);
@@ -37,6 +37,9 @@ extern void c_diffnw(double *timestep_ar_g,
                      int *cwncol_g,
                      double *crosswalk_g,  
                      double *z_thalweg_g,
+                     int *nrow_chxsec_g,
+                     double *chxsec_lookuptable_g,
+                     double *z_adj_g,
                      double *q_ev_g,
                      double *elv_ev_g,
                      double *depth_ev_g);
@@ -22,9 +22,49 @@ cdef void muskingcunge(float dt,
         float s0,
         float velp,
         float depthp,
-        QVD *rv) nogil
+        QVD *rv,
+        int *diag=*) noexcept nogil
+
+cdef void muskingcunge_table(float dt,
+        float qup,
+        float quc,
+        float qdp,
+        float ql,
+        float dx,
+        float bw,
+        float tw,
+        float twcc,
+        float n,
+        float ncc,
+        float cs,
+        float s0,
+        float velp,
+        float depthp,
+        const float[:, ::1] table,
+        QVD *rv,
+        int *diag=*) noexcept nogil
+
+cdef void muskingcunge_headwater(int nseg,
+        int nsteps,
+        int qts_subdivisions,
+        bint assume_short_ts,
+        float[:, ::1] params,
+        float[:, ::1] ql,
+        float[:, :, ::1] qvd) noexcept nogil
+
+cpdef float swap_secant_residual(float residual) noexcept nogil
 
 cpdef float[:,:] compute_reach(const float[:] boundary,
                                 const float[:,:] previous_state,
                                 const float[:,:] parameter_inputs,
                                 float[:,:] output_buffer) nogil
+
+cpdef float[:,:,::1] compute_headwater_reach(float[:,::1] parameter_inputs,
+                                float[:,::1] qlat,
+                                float[:,:,::1] output_buffer,
+                                int qts_subdivisions=*,
+                                bint assume_short_ts=*)
+
+cpdef float[:,:,::1] build_hydraulic_tables(const float[:,:] geometry,
+                                int size=*,
+                                float max_depth=*)
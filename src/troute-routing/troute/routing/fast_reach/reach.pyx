@@ -1,7 +1,10 @@
 import cython
+import numpy as np
 #from libc.stdio cimport printf
 
-from .fortran_wrappers cimport c_muskingcungenwm
+from .fortran_wrappers cimport (c_muskingcungenwm, c_muskingcungenwm_diag,
+    c_muskingcunge_headwater, c_hydraulic_table, c_muskingcunge_table,
+    c_swap_secant_residual)
 
 @cython.boundscheck(False)
 cdef void muskingcunge(float dt,
@@ -19,7 +22,12 @@ cdef void muskingcunge(float dt,
         float s0,
         float velp,
         float depthp,
-        QVD *rv) nogil:
+        QVD *rv,
+        int *diag=NULL) noexcept nogil:
+    """
+    diag, if given, receives the [iterations, retries, converged] of the
+    secant iteration.
+    """
 
     cdef:
         float qdc = 0.0
@@ -30,7 +38,103 @@ cdef void muskingcunge(float dt,
         float X = 0.0
 
     #printf("reach.pyx before %3.9f\t", depthc)
-    c_muskingcungenwm(
+    if diag == NULL:
+        c_muskingcungenwm(
+            &dt,
+            &qup,
+            &quc,
+            &qdp,
+            &ql,
+            &dx,
+            &bw,
+            &tw,
+            &twcc,
+            &n,
+            &ncc,
+            &cs,
+            &s0,
+            &velp,
+            &depthp,
+            &qdc,
+            &velc,
+            &depthc,
+            &ck,
+            &cn,
+            &X)
+    else:
+        c_muskingcungenwm_diag(
+            &dt,
+            &qup,
+            &quc,
+            &qdp,
+            &ql,
+            &dx,
+            &bw,
+            &tw,
+            &twcc,
+            &n,
+            &ncc,
+            &cs,
+            &s0,
+            &velp,
+            &depthp,
+            &qdc,
+            &velc,
+            &depthc,
+            &ck,
+            &cn,
+            &X,
+            &diag[0],
+            &diag[1],
+            &diag[2])
+    #printf("reach.pyx after %3.9f\t", depthc)
+
+    rv.qdc = qdc
+    rv.depthc = depthc
+    rv.velc = velc
+
+    # to do: make these additional variable's conditional, somehow
+    rv.ck = ck
+    rv.cn = cn
+    rv.X = X
+
+@cython.boundscheck(False)
+cdef void muskingcunge_table(float dt,
+        float qup,
+        float quc,
+        float qdp,
+        float ql,
+        float dx,
+        float bw,
+        float tw,
+        float twcc,
+        float n,
+        float ncc,
+        float cs,
+        float s0,
+        float velp,
+        float depthp,
+        const float[:, ::1] table,
+        QVD *rv,
+        int *diag=NULL) noexcept nogil:
+    """
+    As muskingcunge, solving for depth from the hydraulic table of the
+    segment (see build_hydraulic_tables) instead of the secant iteration.
+    """
+    cdef:
+        float qdc = 0.0
+        float depthc = 0.0
+        float velc = 0.0
+        float ck = 0.0
+        float cn = 0.0
+        float X = 0.0
+        int ntab = table.shape[0]
+        int unused[3]
+
+    if diag == NULL:
+        diag = unused
+
+    c_muskingcunge_table(
         &dt,
         &qup,
         &quc,
@@ -46,23 +150,71 @@ cdef void muskingcunge(float dt,
         &s0,
         &velp,
         &depthp,
+        &ntab,
+        &table[0, 0],
         &qdc,
         &velc,
         &depthc,
         &ck,
         &cn,
-        &X)
-    #printf("reach.pyx after %3.9f\t", depthc)
+        &X,
+        &diag[0],
+        &diag[1],
+        &diag[2])
 
     rv.qdc = qdc
     rv.depthc = depthc
     rv.velc = velc
-
-    # to do: make these additional variable's conditional, somehow
     rv.ck = ck
     rv.cn = cn
     rv.X = X
 
+@cython.boundscheck(False)
+cdef void muskingcunge_headwater(int nseg,
+        int nsteps,
+        int qts_subdivisions,
+        bint assume_short_ts,
+        float[:, ::1] params,
+        float[:, ::1] ql,
+        float[:, :, ::1] qvd) noexcept nogil:
+    """
+    Route all nsteps timesteps of a reach without upstream inflow in one call.
+
+    params rows are dt, dx, bw, tw, twcc, n, ncc, cs, s0, qdp0, depthp0 and
+    columns are segments, ql is segments x lateral inflow timesteps and qvd
+    receives segments x nsteps x [qdc, velc, depthc].
+    """
+    cdef int nts_ql = ql.shape[1]
+    cdef int short_ts = assume_short_ts
+
+    c_muskingcunge_headwater(
+        &nseg,
+        &nsteps,
+        &nts_ql,
+        &qts_subdivisions,
+        &short_ts,
+        &params[0, 0],
+        &params[1, 0],
+        &params[2, 0],
+        &params[3, 0],
+        &params[4, 0],
+        &params[5, 0],
+        &params[6, 0],
+        &params[7, 0],
+        &params[8, 0],
+        &ql[0, 0],
+        &params[9, 0],
+        &params[10, 0],
+        &qvd[0, 0, 0])
+
+cpdef float swap_secant_residual(float residual) noexcept nogil:
+    """
+    Set the residual the secant solves of this thread carry over from one
+    solve to the next, and return the residual it replaces.
+    """
+    c_swap_secant_residual(&residual)
+    return residual
+
 cpdef dict compute_reach_kernel(float dt,
         float qup,
         float quc,
@@ -77,10 +229,16 @@ cpdef dict compute_reach_kernel(float dt,
         float cs,
         float s0,
         float velp,
-        float depthp):
+        float depthp,
+        bint return_diagnostics=False):
+    """
+    With return_diagnostics, the solver iterations, retries and whether it
+    converged are added to the result.
+    """
 
     cdef QVD rv
     cdef QVD *out = &rv
+    cdef int diag[3]
 
     muskingcunge(
         dt,
@@ -98,10 +256,111 @@ cpdef dict compute_reach_kernel(float dt,
         s0,
         velp,
         depthp,
-        out)
+        out,
+        diag if return_diagnostics else NULL)
 
+    if return_diagnostics:
+        return dict(rv, iterations=diag[0], retries=diag[1], converged=bool(diag[2]))
     return rv
 
+cpdef dict compute_reach_kernel_table(float dt,
+        float qup,
+        float quc,
+        float qdp,
+        float ql,
+        float dx,
+        float bw,
+        float tw,
+        float twcc,
+        float n,
+        float ncc,
+        float cs,
+        float s0,
+        float velp,
+        float depthp,
+        const float[:, ::1] table,
+        bint return_diagnostics=False):
+
+    cdef QVD rv
+    cdef QVD *out = &rv
+    cdef int diag[3]
+
+    if table.shape[0] < 2 or table.shape[1] != 4:
+        raise ValueError("table must be a (size, 4) hydraulic table with size >= 2")
+
+    muskingcunge_table(
+        dt,
+        qup,
+        quc,
+        qdp,
+        ql,
+        dx,
+        bw,
+        tw,
+        twcc,
+        n,
+        ncc,
+        cs,
+        s0,
+        velp,
+        depthp,
+        table,
+        out,
+        diag)
+
+    if return_diagnostics:
+        return dict(rv, iterations=diag[0], retries=diag[1], converged=bool(diag[2]))
+    return rv
+
+
+@cython.boundscheck(False)
+cpdef float[:,:,::1] build_hydraulic_tables(const float[:,:] geometry,
+                                int size=64,
+                                float max_depth=20.0):
+    """
+    Tabulate the static channel geometry of each segment for
+    muskingcunge_table.
+
+    Arguments:
+        geometry: One row per segment [bw, tw, twcc, n, ncc, cs, s0]
+        size: Number of depths in each table
+        max_depth: Deepest tabulated depth [m]; deeper flows fall back to the
+            secant solution
+
+    Returns:
+        tables: (segments, size, 4) array of [depth, Manning discharge,
+            celerity, top width] at each depth, with depths spaced
+            quadratically between 0 and max_depth
+    """
+    cdef:
+        Py_ssize_t i
+        int ntab = size
+        float bw, tw, twcc, n, ncc, cs, s0
+        float hmax = max_depth
+
+    if size < 2:
+        raise ValueError("size must be at least 2")
+    if max_depth <= 0:
+        raise ValueError("max_depth must be positive")
+    if geometry.shape[1] < 7:
+        raise IndexError
+
+    tables = np.empty((geometry.shape[0], size, 4), dtype='float32')
+    cdef float[:,:,::1] tables_view = tables
+
+    with nogil:
+        for i in range(geometry.shape[0]):
+            bw = geometry[i, 0]
+            tw = geometry[i, 1]
+            twcc = geometry[i, 2]
+            n = geometry[i, 3]
+            ncc = geometry[i, 4]
+            cs = geometry[i, 5]
+            s0 = geometry[i, 6]
+            c_hydraulic_table(&bw, &tw, &twcc, &n, &ncc, &cs, &s0,
+                              &ntab, &hmax, &tables_view[i, 0, 0])
+    return tables_view
+
 
 cpdef long boundary_shape() nogil:
     return 2
@@ -204,3 +463,95 @@ cpdef float[:,:] compute_reach(const float[:] boundary,
 
         qup = qdp
     return output_buffer
+
+@cython.boundscheck(False)
+cpdef float[:,:] compute_reach_table(const float[:] boundary,
+                                const float[:,:] previous_state,
+                                const float[:,:] parameter_inputs,
+                                const float[:,:,::1] tables,
+                                float[:,:] output_buffer):
+    """
+    As compute_reach, solving each node with its hydraulic table
+
+    Arguments:
+        boundary: [qup, quc]
+        previous_state: Previous state for each node in the reach [qdp, velp, depthp]
+        parameter_inputs: Parameterization of the reach at node.
+            qlat, dt, dx, bw, tw, twcc, n, ncc, cs, s0
+        tables: Hydraulic table of each node, see build_hydraulic_tables
+        output_buffer: Current state [qdc, velc, depthc]
+
+    """
+    cdef QVD rv
+    cdef QVD *out = &rv
+    cdef Py_ssize_t i, rows = previous_state.shape[0]
+
+    if (rows != parameter_inputs.shape[0] or rows != output_buffer.shape[0]
+            or rows != tables.shape[0]):
+        raise ValueError("axis 0 of input arguments do not agree")
+    if (boundary.shape[0] < 2 or parameter_inputs.shape[1] < 10
+            or output_buffer.shape[1] < 3 or previous_state.shape[1] < 3
+            or tables.shape[1] < 2 or tables.shape[2] != 4):
+        raise IndexError
+
+    cdef float qup = boundary[0]
+    cdef float quc = boundary[1]
+
+    with nogil:
+        for i in range(rows):
+            muskingcunge_table(
+                        parameter_inputs[i, 1],
+                        qup,
+                        quc,
+                        previous_state[i, 0],
+                        parameter_inputs[i, 0],
+                        parameter_inputs[i, 2],
+                        parameter_inputs[i, 3],
+                        parameter_inputs[i, 4],
+                        parameter_inputs[i, 5],
+                        parameter_inputs[i, 6],
+                        parameter_inputs[i, 7],
+                        parameter_inputs[i, 8],
+                        parameter_inputs[i, 9],
+                        previous_state[i, 1],
+                        previous_state[i, 2],
+                        tables[i],
+                        out)
+
+            output_buffer[i, 0] = quc = out.qdc
+            output_buffer[i, 1] = out.velc
+            output_buffer[i, 2] = out.depthc
+
+            qup = previous_state[i, 0]
+    return output_buffer
+
+cpdef float[:,:,::1] compute_headwater_reach(float[:,::1] parameter_inputs,
+                                float[:,::1] qlat,
+                                float[:,:,::1] output_buffer,
+                                int qts_subdivisions=1,
+                                bint assume_short_ts=False):
+    """
+    Compute every timestep of a headwater reach
+
+    Arguments:
+        parameter_inputs: Parameterization of the reach, one column per node.
+            dt, dx, bw, tw, twcc, n, ncc, cs, s0, qdp0, depthp0
+        qlat: Lateral inflow of each node, one column per qlat timestep
+        output_buffer: State of each node at each timestep [qdc, velc, depthc]
+        qts_subdivisions: Number of routing timesteps per qlat timestep
+        assume_short_ts: Assume short time steps (quc = qup)
+    """
+    cdef int nseg = output_buffer.shape[0]
+    cdef int nsteps = output_buffer.shape[1]
+
+    if parameter_inputs.shape[0] < 11 or output_buffer.shape[2] < 3:
+        raise IndexError
+    if parameter_inputs.shape[1] != nseg or qlat.shape[0] != nseg:
+        raise ValueError("axis 0 of input arguments do not agree")
+    if qlat.shape[1] < (nsteps - 1) // qts_subdivisions + 1:
+        raise ValueError(f"qlat has fewer than the {(nsteps - 1) // qts_subdivisions + 1} timesteps needed")
+
+    if nseg > 0 and nsteps > 0:
+        muskingcunge_headwater(nseg, nsteps, qts_subdivisions, assume_short_ts,
+                               parameter_inputs, qlat, output_buffer)
+    return output_buffer
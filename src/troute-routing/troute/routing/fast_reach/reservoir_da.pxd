@@ -0,0 +1,64 @@
+cdef int reservoir_hybrid_da_c(
+    const float[:] gage_obs,
+    const float[:] gage_time,
+    const double now,
+    const double levelpool_outflow,
+    const double inflow,
+    const double routing_period,
+    const double lake_area,
+    const double max_depth,
+    const double orifice_elevation,
+    const double initial_water_elevation,
+    const double obs_lookback_hours,
+    float* update_time,
+    float* persisted_outflow,
+    float* persistence_index,
+    float* persistence_update_time,
+    double* outflow,
+    double* new_water_elevation,
+    double* projected_storage,
+    double update_time_interval=*,
+    double persistence_update_time_interval=*,
+) noexcept nogil
+
+
+cdef int reservoir_RFC_da_c(
+    const bint use_RFC,
+    const float[:] time_series,
+    const int total_counts,
+    const double routing_period,
+    const double current_time,
+    const int DA_time_step,
+    const double rfc_forecast_persist_seconds,
+    const int reservoir_type,
+    const double inflow,
+    const double water_elevation,
+    const double levelpool_outflow,
+    const double levelpool_water_elevation,
+    const double lake_area,
+    const double max_water_elevation,
+    double* update_time,
+    int* timeseries_idx,
+    double* outflow,
+    double* new_water_elevation,
+    int* dynamic_reservoir_type,
+    double* assimilated_value,
+) except -1 nogil
+
+
+cdef void great_lakes_da_c(
+    const float[:] gage_obs,
+    const int[:] gage_time,
+    const int month_idx,
+    const double now,
+    const float[:] climatology_outflows,
+    float* assimilated_outflow,
+    int* assimilated_time,
+    int* update_time,
+    double* outflow,
+    int update_time_interval=*,
+    int persistence_limit=*,
+) noexcept nogil
+
+
+cdef int month_index(const long long t0_seconds, const double now) noexcept nogil
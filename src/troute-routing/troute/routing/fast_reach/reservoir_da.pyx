@@ -0,0 +1,525 @@
+"""
+Native implementations of the hybrid, RFC and Great Lakes reservoir data
+assimilation schemes of reservoir_hybrid_da.py, reservoir_RFC_da.py and
+reservoir_GL_da.py, callable without the GIL from the MC routing loop.
+
+The per-reservoir DA state lives in the caller's struct-of-arrays (one array
+per state variable, one row per reservoir) and is passed by pointer to the
+row, which is read and then updated in place. The `_py` functions keep the
+call signature and return values of the Python versions, for testing.
+"""
+import calendar
+from datetime import datetime
+import logging
+
+from libc.math cimport isnan, NAN, INFINITY, floor
+cimport cython
+
+LOG = logging.getLogger('')
+
+# warnings raised by the projected storage check of the hybrid scheme
+cdef enum:
+    HYBRID_NEGATIVE_OUTFLOW = 1
+    HYBRID_MAX_STORAGE = 2
+    HYBRID_STORAGE_DEFICIT = 4
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int reservoir_hybrid_da_c(
+    const float[:] gage_obs,
+    const float[:] gage_time,
+    const double now,
+    const double levelpool_outflow,
+    const double inflow,
+    const double routing_period,
+    const double lake_area,
+    const double max_depth,
+    const double orifice_elevation,
+    const double initial_water_elevation,
+    const double obs_lookback_hours,
+    float* update_time,
+    float* persisted_outflow,
+    float* persistence_index,
+    float* persistence_update_time,
+    double* outflow,
+    double* new_water_elevation,
+    double* projected_storage,
+    double update_time_interval=3600,
+    double persistence_update_time_interval=86400,
+) noexcept nogil:
+    """
+    Hybrid (USGS/USACE persistence) reservoir DA, see reservoir_hybrid_da.
+
+    update_time, persisted_outflow, persistence_index and persistence_update_time
+    point to this reservoir's row of the DA state arrays and are updated in place.
+    outflow, new_water_elevation and projected_storage are outputs.
+
+    Returns a bitmask of HYBRID_* storage warnings, see log_hybrid_da_warnings.
+    """
+    cdef int persistence_limit = 11
+    cdef int flags = 0
+    cdef Py_ssize_t i
+    cdef Py_ssize_t t_idx = 0
+    cdef float t_diff
+    cdef float t_diff_min = INFINITY
+    cdef float obs = NAN
+    cdef float gage_lookback_seconds = 0
+    cdef float previous_persisted_outflow = persisted_outflow[0]
+    cdef float previous_persistence_index = persistence_index[0]
+    cdef float previous_persistence_update_time = persistence_update_time[0]
+    cdef float previous_update_time = update_time[0]
+    cdef float new_persisted_outflow
+    cdef double initial_storage, maximum_storage
+    cdef double outflow_assess, new_outflow, delta_storage
+    cdef bint max_storage_reached = False
+
+    # initial and maximum waterbody storage - m3
+    initial_storage = (initial_water_elevation - orifice_elevation) * (lake_area * 1e6)
+    maximum_storage = (max_depth - orifice_elevation) * (lake_area * 1e6)
+
+    if now >= previous_update_time:
+
+        # gage_time index nearest to, but not greater than the update_time
+        for i in range(gage_time.shape[0]):
+            t_diff = previous_update_time - gage_time[i]
+            if t_diff >= 0 and t_diff < t_diff_min:
+                t_diff_min = t_diff
+                t_idx = i
+
+        # look backwards from there for the first available observation
+        if gage_obs.shape[0] > 0:
+            for i in range(t_idx, -1, -1):
+                if not isnan(gage_obs[i]):
+                    obs = gage_obs[i]
+                    gage_lookback_seconds = previous_update_time - gage_time[i]
+                    update_time[0] = previous_update_time + update_time_interval
+                    break
+
+        if isnan(obs) or gage_lookback_seconds > obs_lookback_hours * 60 * 60:
+            # no good observation, or only outside of the lookback window
+            new_persisted_outflow = previous_persisted_outflow
+            if now >= previous_persistence_update_time:
+                persistence_index[0] = previous_persistence_index + 1
+                persistence_update_time[0] = (
+                    previous_persistence_update_time + persistence_update_time_interval
+                )
+
+        else:
+            new_persisted_outflow = obs
+            persistence_index[0] = 1
+            persistence_update_time[0] = (
+                previous_persistence_update_time + persistence_update_time_interval
+            )
+
+    elif now >= previous_persistence_update_time:
+
+        persistence_index[0] = previous_persistence_index + 1
+        persistence_update_time[0] = (
+            previous_persistence_update_time + persistence_update_time_interval
+        )
+
+        if previous_persistence_index <= persistence_limit:
+            new_persisted_outflow = previous_persisted_outflow
+        else:
+            # persistence limit reached - use levelpool outflow
+            new_persisted_outflow = levelpool_outflow
+            persistence_index[0] = 0
+
+    else:
+        new_persisted_outflow = previous_persisted_outflow
+
+    persisted_outflow[0] = new_persisted_outflow
+
+    if isnan(new_persisted_outflow):
+        outflow_assess = levelpool_outflow
+        persistence_index[0] = 0
+    else:
+        outflow_assess = new_persisted_outflow
+
+    # check that adjusted outflow does not violate storage limitations
+    new_outflow = outflow_assess
+    if outflow_assess < 0:
+        flags |= HYBRID_NEGATIVE_OUTFLOW
+        new_outflow = 0
+
+    projected_storage[0] = initial_storage + (inflow - outflow_assess) * routing_period
+    if projected_storage[0] > maximum_storage:
+        max_storage_reached = True
+        flags |= HYBRID_MAX_STORAGE
+
+    if projected_storage[0] <= 0:
+        flags |= HYBRID_STORAGE_DEFICIT
+        new_outflow = inflow
+
+    if new_outflow < 0:
+        new_outflow = 0
+
+    # if storage limits are violated, reset outflow to levelpool
+    if max_storage_reached and new_outflow < levelpool_outflow:
+        new_outflow = levelpool_outflow
+
+    delta_storage = (inflow - new_outflow) * routing_period
+    new_water_elevation[0] = initial_water_elevation + delta_storage / (lake_area * 1e6)
+    outflow[0] = new_outflow
+
+    return flags
+
+
+def log_hybrid_da_warnings(
+    int flags,
+    lake_number,
+    double now,
+    double projected_storage,
+    double max_depth,
+    double orifice_elevation,
+    double lake_area,
+):
+    """
+    Log the storage warnings flagged by reservoir_hybrid_da_c, with the
+    messages of the Python implementation.
+    """
+    if flags & HYBRID_NEGATIVE_OUTFLOW:
+        LOG.warning('WARNING: Calculations return a negative outflow for reservoir %s', lake_number)
+        LOG.warning('at %s seconds after model start time.', now)
+    if flags & HYBRID_MAX_STORAGE:
+        LOG.warning('WARNING: Modified release to prevent maximum storage exceedance for reservoir %s', lake_number)
+        LOG.warning('at %s seconds after model start time.', now)
+        LOG.warning('simulated storage would be %s m3', projected_storage)
+        LOG.warning('maximum waterbody storage is %s m3', (max_depth - orifice_elevation) * (lake_area * 1e6))
+    if flags & HYBRID_STORAGE_DEFICIT:
+        LOG.warning('WARNING: Modified release to prevent storage deficit for reservoir %s', lake_number)
+        LOG.warning('at %s seconds after model start time.', now)
+
+
+cpdef tuple reservoir_hybrid_da_py(
+    lake_number,
+    const float[:] gage_obs,
+    const float[:] gage_time,
+    double now,
+    float previous_persisted_outflow,
+    float persistence_update_time,
+    float persistence_index,
+    double levelpool_outflow,
+    double inflow,
+    double routing_period,
+    double lake_area,
+    double max_depth,
+    double orifice_elevation,
+    double initial_water_elevation,
+    double obs_lookback_hours,
+    float update_time,
+    double update_time_interval=3600,
+    double persistence_update_time_interval=86400,
+):
+    """
+    pass-through for using pytest with `reservoir_hybrid_da_c`, same
+    arguments and returns as reservoir_hybrid_da.reservoir_hybrid_da
+    """
+    cdef double outflow, new_water_elevation, projected_storage
+    cdef int flags = reservoir_hybrid_da_c(
+        gage_obs,
+        gage_time,
+        now,
+        levelpool_outflow,
+        inflow,
+        routing_period,
+        lake_area,
+        max_depth,
+        orifice_elevation,
+        initial_water_elevation,
+        obs_lookback_hours,
+        &update_time,
+        &previous_persisted_outflow,
+        &persistence_index,
+        &persistence_update_time,
+        &outflow,
+        &new_water_elevation,
+        &projected_storage,
+        update_time_interval,
+        persistence_update_time_interval,
+    )
+    if flags:
+        log_hybrid_da_warnings(
+            flags, lake_number, now, projected_storage, max_depth, orifice_elevation, lake_area
+        )
+    return (
+        outflow,
+        previous_persisted_outflow,
+        new_water_elevation,
+        update_time,
+        persistence_index,
+        persistence_update_time,
+    )
+
+
+cdef int reservoir_RFC_da_c(
+    const bint use_RFC,
+    const float[:] time_series,
+    const int total_counts,
+    const double routing_period,
+    const double current_time,
+    const int DA_time_step,
+    const double rfc_forecast_persist_seconds,
+    const int reservoir_type,
+    const double inflow,
+    const double water_elevation,
+    const double levelpool_outflow,
+    const double levelpool_water_elevation,
+    const double lake_area,
+    const double max_water_elevation,
+    double* update_time,
+    int* timeseries_idx,
+    double* outflow,
+    double* new_water_elevation,
+    int* dynamic_reservoir_type,
+    double* assimilated_value,
+) except -1 nogil:
+    """
+    RFC forecast reservoir DA, see reservoir_RFC_da.
+
+    update_time and timeseries_idx point to this reservoir's row of the DA state
+    and are updated in place. lake_area is in m2.
+
+    Returns 1 if the assimilated value came from the RFC file, else 0.
+    """
+    cdef int missing_outflow_index
+    cdef int from_file = 0
+
+    if use_RFC and current_time <= rfc_forecast_persist_seconds:
+        if current_time >= update_time[0] and timeseries_idx[0] < total_counts:
+            # Advance update_time to the next timestep and time_series_idx to next index
+            update_time[0] += DA_time_step
+            timeseries_idx[0] += 1
+
+        if reservoir_type == 4:
+            # CONUS RFC reservoirs, outflow is the forecast discharge
+            outflow[0] = time_series[timeseries_idx[0]]
+        else:
+            # Alaska RFC glacier outflows, forecast discharge is added to inflow
+            outflow[0] = inflow + time_series[timeseries_idx[0]]
+
+        new_water_elevation[0] = water_elevation + ((inflow - outflow[0]) / lake_area) * routing_period
+
+        # Ensure that the water elevation is within the minimum and maximum elevation
+        if new_water_elevation[0] < 0.0:
+            new_water_elevation[0] = 0.0
+        elif new_water_elevation[0] > max_water_elevation:
+            new_water_elevation[0] = max_water_elevation
+
+        dynamic_reservoir_type[0] = reservoir_type
+        assimilated_value[0] = time_series[timeseries_idx[0]]
+        from_file = 1
+
+        # cycle backwards through negative (missing) outflows, fall back to
+        # levelpool if there is no valid value
+        if outflow[0] < 0:
+            missing_outflow_index = timeseries_idx[0]
+
+            while outflow[0] < 0 and missing_outflow_index > 1:
+                missing_outflow_index = missing_outflow_index - 1
+                outflow[0] = time_series[missing_outflow_index]
+
+            if outflow[0] < 0:
+                if reservoir_type == 4:
+                    outflow[0] = levelpool_outflow
+                else:
+                    outflow[0] = inflow
+                new_water_elevation[0] = levelpool_water_elevation
+                dynamic_reservoir_type[0] = 1
+                assimilated_value[0] = -9999.0
+                from_file = 0
+
+    else:
+        if reservoir_type == 4:
+            outflow[0] = levelpool_outflow
+        else:
+            outflow[0] = inflow
+        new_water_elevation[0] = levelpool_water_elevation
+        dynamic_reservoir_type[0] = 1
+        assimilated_value[0] = -9999.0
+
+    return from_file
+
+
+cpdef tuple reservoir_RFC_da_py(
+    bint use_RFC,
+    const float[:] time_series,
+    int timeseries_idx,
+    int total_counts,
+    double routing_period,
+    double current_time,
+    double update_time,
+    int DA_time_step,
+    double rfc_forecast_persist_seconds,
+    int reservoir_type,
+    double inflow,
+    double water_elevation,
+    double levelpool_outflow,
+    double levelpool_water_elevation,
+    double lake_area,
+    double max_water_elevation,
+    str rfc_file,
+):
+    """
+    pass-through for using pytest with `reservoir_RFC_da_c`, same
+    arguments and returns as reservoir_RFC_da.reservoir_RFC_da
+    """
+    cdef double outflow, new_water_elevation, assimilated_value
+    cdef int dynamic_reservoir_type
+    cdef int from_file = reservoir_RFC_da_c(
+        use_RFC,
+        time_series,
+        total_counts,
+        routing_period,
+        current_time,
+        DA_time_step,
+        rfc_forecast_persist_seconds,
+        reservoir_type,
+        inflow,
+        water_elevation,
+        levelpool_outflow,
+        levelpool_water_elevation,
+        lake_area,
+        max_water_elevation,
+        &update_time,
+        &timeseries_idx,
+        &outflow,
+        &new_water_elevation,
+        &dynamic_reservoir_type,
+        &assimilated_value,
+    )
+    return (
+        outflow,
+        new_water_elevation,
+        update_time,
+        timeseries_idx,
+        dynamic_reservoir_type,
+        assimilated_value,
+        rfc_file if from_file else "",
+    )
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void great_lakes_da_c(
+    const float[:] gage_obs,
+    const int[:] gage_time,
+    const int month_idx,
+    const double now,
+    const float[:] climatology_outflows,
+    float* assimilated_outflow,
+    int* assimilated_time,
+    int* update_time,
+    double* outflow,
+    int update_time_interval=3600,
+    int persistence_limit=11,
+) noexcept nogil:
+    """
+    Great Lakes persistence DA, see great_lakes_da.
+
+    assimilated_outflow, assimilated_time and update_time point to this lake's
+    row of the DA state and are updated in place. month_idx is the 0-based
+    month of the model time, see month_index.
+    """
+    cdef Py_ssize_t i
+    cdef Py_ssize_t t_idx = -1
+    cdef float obs = NAN
+    cdef int t_obs = 0
+    cdef double gage_lookback_seconds = 0
+    cdef float climatology_outflow = climatology_outflows[month_idx]
+    cdef float previous_assimilated_outflow = assimilated_outflow[0]
+    cdef int previous_assimilated_time = assimilated_time[0]
+    cdef int previous_update_time = update_time[0]
+
+    if isnan(previous_assimilated_outflow):
+        previous_assimilated_outflow = climatology_outflow
+
+    if now >= previous_update_time:
+
+        # last observation taken at or before the model time
+        for i in range(gage_time.shape[0] - 1, -1, -1):
+            if now - gage_time[i] >= 0:
+                t_idx = i
+                break
+
+        if t_idx >= 0:
+            obs = gage_obs[t_idx]
+            t_obs = gage_time[t_idx]
+            gage_lookback_seconds = now - t_obs
+
+        if isnan(obs):
+            outflow[0] = previous_assimilated_outflow
+
+        elif gage_lookback_seconds > (persistence_limit * 60 * 60 * 24):
+            outflow[0] = climatology_outflow
+
+        else:
+            outflow[0] = obs
+            assimilated_outflow[0] = obs
+            assimilated_time[0] = t_obs
+            update_time[0] = previous_update_time + update_time_interval
+
+    else:
+        outflow[0] = previous_assimilated_outflow
+
+        if (now - previous_assimilated_time) > (persistence_limit * 60 * 60 * 24):
+            outflow[0] = climatology_outflow
+
+
+cdef int month_index(const long long t0_seconds, const double now) noexcept nogil:
+    """
+    0-based calendar month of t0_seconds (seconds since 1970-01-01 UTC) + now,
+    using the days-to-civil conversion of the proleptic Gregorian calendar.
+    """
+    cdef long long seconds = t0_seconds + <long long>floor(now)
+    # floor division, days since 1970-01-01
+    cdef long long z = seconds // 86400
+    cdef long long era, doe, yoe, doy, mp
+    z += 719468
+    era = (z if z >= 0 else z - 146096) // 146097
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    return <int>(mp + 2 if mp < 10 else mp - 10)
+
+
+def t0_seconds(str t0):
+    """
+    Seconds since 1970-01-01 of a '%Y-%m-%d_%H:%M:%S' model start time.
+    """
+    return calendar.timegm(datetime.strptime(t0, '%Y-%m-%d_%H:%M:%S').timetuple())
+
+
+cpdef tuple great_lakes_da_py(
+    const float[:] gage_obs,
+    const int[:] gage_time,
+    float previous_assimilated_outflow,
+    int previous_assimilated_time,
+    int update_time,
+    str t0,
+    double now,
+    const float[:] climatology_outflows,
+    int update_time_interval=3600,
+    int persistence_limit=11,
+):
+    """
+    pass-through for using pytest with `great_lakes_da_c`, same
+    arguments and returns as reservoir_GL_da.great_lakes_da
+    """
+    cdef double outflow
+    great_lakes_da_c(
+        gage_obs,
+        gage_time,
+        month_index(t0_seconds(t0), now),
+        now,
+        climatology_outflows,
+        &previous_assimilated_outflow,
+        &previous_assimilated_time,
+        &update_time,
+        &outflow,
+        update_time_interval,
+        persistence_limit,
+    )
+    return outflow, previous_assimilated_outflow, previous_assimilated_time, update_time
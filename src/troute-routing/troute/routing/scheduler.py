@@ -0,0 +1,255 @@
+import time
+import random
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from joblib.executor import get_memmapping_executor
+
+import logging
+
+LOG = logging.getLogger('')
+
+
+def cluster_dependencies(reaches_ordered_bysubntw_clustered, rconn):
+    '''
+    Find, for every cluster, the clusters computing its off-network upstream
+    segments.
+
+    Arguments
+    ---------
+    reaches_ordered_bysubntw_clustered (dict): {order: {cluster: {'segs', 'tw', ...}}}
+    rconn                              (dict): upstream connections
+
+    Returns
+    -------
+    dependencies (dict): {(order, cluster): set of (order, cluster) it waits on}
+    '''
+    producer = {}
+    for order, clusters in reaches_ordered_bysubntw_clustered.items():
+        for cluster, clustered_subns in clusters.items():
+            for tw in clustered_subns["tw"]:
+                producer[tw] = (order, cluster)
+
+    dependencies = {}
+    for order, clusters in reaches_ordered_bysubntw_clustered.items():
+        for cluster, clustered_subns in clusters.items():
+            segs = set(clustered_subns["segs"])
+            deps = set()
+            for seg in segs:
+                for us in rconn.get(seg, ()):
+                    if us not in segs and us in producer:
+                        deps.add(producer[us])
+            dependencies[(order, cluster)] = deps
+    return dependencies
+
+
+def barrier_dependencies(dependencies):
+    '''
+    Turn a dependency graph into the one enforced by a barrier between
+    orders: every job waits on all jobs of higher order.
+
+    Arguments
+    ---------
+    dependencies (dict): {(order, cluster): set of (order, cluster)}
+
+    Returns
+    -------
+    dependencies (dict): {(order, cluster): set of (order, cluster)}
+    '''
+    by_order = {}
+    for order, cluster in dependencies:
+        by_order.setdefault(order, set()).add((order, cluster))
+    return {
+        (order, cluster): set(by_order.get(order + 1, ()))
+        for order, cluster in dependencies
+    }
+
+
+class SchedulerStats:
+    '''
+    Pool utilization bookkeeping, measured from the submitting process as the
+    time integral of min(jobs in flight, workers).
+    '''
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.start = time.perf_counter()
+        self.wall_time = 0.0
+        self.busy_time = 0.0
+        self.jobs = 0
+        self._inflight = 0
+        self._last = self.start
+
+    def _advance(self):
+        now = time.perf_counter()
+        self.busy_time += min(self._inflight, self.workers) * (now - self._last)
+        self._last = now
+
+    def submitted(self):
+        self._advance()
+        self._inflight += 1
+        self.jobs += 1
+
+    def completed(self):
+        self._advance()
+        self._inflight -= 1
+
+    def finish(self):
+        self._advance()
+        self.wall_time = self._last - self.start
+
+    @property
+    def utilization(self):
+        if not self.wall_time or not self.workers:
+            return 0.0
+        return self.busy_time / (self.wall_time * self.workers)
+
+
+@contextmanager
+def job_executor(parallel_backend, workers):
+    '''
+    Futures executor running the jobs of a joblib backend, for run_scheduled.
+
+    Arguments
+    ---------
+    parallel_backend (str): "loky", the reusable worker processes joblib
+                            Parallel uses, kept across routing loops, or
+                            "threading", a thread pool shut down on exit
+    workers          (int): number of workers
+    '''
+    if parallel_backend == "threading":
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            yield executor
+    else:
+        yield get_memmapping_executor(workers)
+
+
+def run_scheduled(dependencies, submit, on_complete, workers):
+    '''
+    Run jobs as soon as the jobs they depend on have completed. Jobs ready
+    at the same time are submitted highest order first, then by cluster.
+
+    Arguments
+    ---------
+    dependencies (dict): {(order, cluster): set of jobs it waits on}
+    submit   (function): submit(job) -> concurrent.futures.Future
+    on_complete (function): on_complete(job, result), called in the submitting
+                            process before any dependent job is submitted
+    workers       (int): size of the pool, for utilization bookkeeping
+
+    Returns
+    -------
+    results        (dict): {job: result}
+    stats (SchedulerStats): wall time and pool utilization
+    '''
+    remaining = {job: set(deps) for job, deps in dependencies.items()}
+    dependents = {job: [] for job in dependencies}
+    for job, deps in dependencies.items():
+        for dep in deps:
+            dependents[dep].append(job)
+
+    stats = SchedulerStats(workers)
+    results = {}
+    running = {}
+
+    def _submit_ready(jobs):
+        # keep submission order stable: highest order first, then cluster,
+        # the order jobs of an order are handed to joblib Parallel
+        for job in sorted(jobs, key=lambda job: (-job[0], job[1:])):
+            stats.submitted()
+            running[submit(job)] = job
+
+    _submit_ready([job for job, deps in remaining.items() if not deps])
+
+    while running:
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        ready = []
+        for future in done:
+            job = running.pop(future)
+            stats.completed()
+            results[job] = future.result()
+            on_complete(job, results[job])
+            for dependent in dependents[job]:
+                remaining[dependent].discard(job)
+                if not remaining[dependent]:
+                    ready.append(dependent)
+        _submit_ready(ready)
+
+    stats.finish()
+
+    if len(results) < len(dependencies):
+        raise ValueError(
+            "cyclic or unresolved job dependencies: %s"
+            % sorted(set(dependencies) - set(results))
+        )
+
+    return results, stats
+
+
+def benchmark_scheduling(
+    n_orders=4,
+    fan_in=3,
+    workers=4,
+    mean_duration=0.02,
+    spread=1.0,
+    seed=0,
+):
+    '''
+    Compare pool utilization of the barrier and pipelined schedules on a
+    synthetic tree of clusters. Each cluster of order N feeds one cluster of
+    order N-1, and job durations are drawn from an exponential distribution
+    to mimic the uneven cluster sizes of real domains.
+
+    Arguments
+    ---------
+    n_orders        (int): number of subnetwork orders
+    fan_in          (int): clusters of order N+1 feeding each cluster of order N
+    workers         (int): thread pool size
+    mean_duration (float): mean job duration (s)
+    spread        (float): 0 for equal durations, 1 for exponential durations
+    seed            (int): random seed
+
+    Returns
+    -------
+    report (dict): {'barrier': SchedulerStats, 'pipelined': SchedulerStats}
+    '''
+    rng = random.Random(seed)
+    dependencies = {(0, 0): set()}
+    frontier = [(0, 0)]
+    for order in range(1, n_orders):
+        new_frontier = []
+        for parent in frontier:
+            for _ in range(fan_in):
+                job = (order, len(new_frontier))
+                dependencies[job] = set()
+                dependencies[parent].add(job)
+                new_frontier.append(job)
+        frontier = new_frontier
+
+    durations = {
+        job: mean_duration * ((1 - spread) + spread * rng.expovariate(1.0))
+        for job in dependencies
+    }
+
+    report = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for name, deps in (
+            ("barrier", barrier_dependencies(dependencies)),
+            ("pipelined", dependencies),
+        ):
+            _, stats = run_scheduled(
+                deps,
+                lambda job: executor.submit(time.sleep, durations[job]),
+                lambda job, result: None,
+                workers,
+            )
+            report[name] = stats
+    return report
+
+
+if __name__ == "__main__":
+    for name, stats in benchmark_scheduling().items():
+        print(
+            f"{name:>10}: {stats.jobs} jobs, wall time {stats.wall_time:.3f} s, "
+            f"pool utilization {stats.utilization:.1%}"
+        )
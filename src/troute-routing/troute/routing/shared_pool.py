@@ -0,0 +1,384 @@
+import os
+import shutil
+import tempfile
+import weakref
+import itertools
+
+import numpy as np
+from joblib.executor import get_memmapping_executor
+from troute.routing.cluster_cost import timed_call
+from troute.routing.cluster_inputs import WATERBODY_PARAM_COLS, WATERBODY_STATE_COLS
+from troute.routing.fast_reach.mc_reach import RoutingPlan
+
+import logging
+
+LOG = logging.getLogger('')
+
+# arrays opened by this (worker) process, keyed by file path
+_attached = {}
+# positions of the arrays written to the shared output buffers in the results tuple
+_OUTPUTS = {"fvd": 1, "inflow": 6}
+# routing plans built by this (worker) process, keyed by (parameter file path, start, stop)
+_plans = {}
+
+
+def _attach(path, writable=False):
+    '''
+    Open a shared .npy array, read-only unless writable, caching the map
+    for later jobs executed by the same worker process.
+    '''
+    arr = _attached.get(path)
+    if arr is None:
+        # a new file generation replaces older ones, drop maps of removed files
+        for p in [p for p in _attached if not os.path.exists(p)]:
+            del _attached[p]
+        arr = np.load(path, mmap_mode="r+" if writable else "r")
+        _attached[path] = arr
+    return arr
+
+
+def _write_output(result, output):
+    '''
+    Write the flowveldepth and reservoir inflow arrays of a results tuple to
+    their rows of the shared output buffers, returning the tuple without them.
+    '''
+    start, stop = output["rows"]
+    result = list(result)
+    for name, k in _OUTPUTS.items():
+        buffer = _attach(output[name], writable=True)
+        if result[k].shape != buffer[start:stop].shape:
+            raise ValueError(
+                "Results of shape %s do not fit rows %d to %d of the %s buffer"
+                % (result[k].shape, start, stop, name)
+            )
+        buffer[start:stop] = result[k]
+        result[k] = None
+    return tuple(result)
+
+
+def compute_from_shared(
+    compute_func,
+    paths,
+    start,
+    stop,
+    nts,
+    dt,
+    qts_subdivisions,
+    reaches_wTypes,
+    upstream_connections,
+    data_cols,
+    *args,
+    lakes=None,
+    cache_plan=False,
+    output=None,
+    timed=False,
+    **kwargs,
+):
+    '''
+    Worker-side entry point for shared-memory routing jobs. Slices the
+    rows [start, stop) out of the shared segment index, channel parameter,
+    initial condition and lateral inflow arrays, and the waterbody rows of
+    the job out of the shared waterbody arrays, and passes them on to the
+    compute kernel.
+
+    Arguments
+    ---------
+    compute_func          (function): routing kernel, e.g. compute_network_structured
+    paths                     (dict): file paths of the shared arrays, keyed by
+                                      'index', 'params', 'q0' and 'qlat', and
+                                      'lakes', 'waterbodies' and
+                                      'waterbody_states' when lakes is given
+    start                      (int): first row of this job in the shared arrays
+    stop                       (int): one past the last row of this job
+    nts, dt, qts_subdivisions,
+    reaches_wTypes,
+    upstream_connections,
+    data_cols                       : passed through to compute_func
+    *args, **kwargs                 : remaining compute_func arguments, starting
+                                      with lake_numbers_col, or with
+                                      data_assimilation_parameters when lakes
+                                      is given
+    lakes                    (tuple): if given, the (start, stop) rows of the
+                                      waterbodies of this job in the shared
+                                      waterbody arrays, passed to compute_func
+                                      as lake_numbers_col and wbody_cols
+    cache_plan                (bool): keep the routing plan of the job in this
+                                      worker process and reuse it whenever the
+                                      worker executes the job again, as long
+                                      as its topology, segments and channel
+                                      parameters are unchanged
+    output                    (dict): if given, file paths of the shared output
+                                      buffers, keyed by 'fvd' and 'inflow', and
+                                      'rows', the (start, stop) rows of this job
+                                      in them. Flowveldepth and reservoir inflows
+                                      are written there and left out of the
+                                      returned tuple, see SharedMemoryPool.output_view
+    timed                     (bool): return the results with the seconds
+                                      compute_func took, as timed_call
+
+    Returns
+    -------
+    compute_func results tuple
+    '''
+    index = _attach(paths["index"])
+    params = _attach(paths["params"])
+    q0 = _attach(paths["q0"])
+    qlat = _attach(paths["qlat"])
+
+    if cache_plan:
+        key = (paths["params"], start, stop)
+        plan = _plans.get(key)
+        if plan is None or not plan.matches(
+            reaches_wTypes, upstream_connections, index[start:stop], data_cols, params[start:stop]
+        ):
+            # plans of a replaced parameter file are not used again
+            for k in [k for k in _plans if k[0] != paths["params"]]:
+                del _plans[k]
+            plan = _plans[key] = RoutingPlan(
+                reaches_wTypes,
+                upstream_connections,
+                index[start:stop],
+                data_cols,
+                params[start:stop],
+            )
+        kwargs["plan"] = plan
+
+    if lakes is not None:
+        lake_start, lake_stop = lakes
+        args = (
+            _attach(paths["lakes"])[lake_start:lake_stop].tolist(),
+            np.hstack(
+                (
+                    _attach(paths["waterbodies"])[lake_start:lake_stop],
+                    _attach(paths["waterbody_states"])[lake_start:lake_stop],
+                )
+            ),
+            *args,
+        )
+
+    result, seconds = timed_call(
+        compute_func,
+        nts,
+        dt,
+        qts_subdivisions,
+        reaches_wTypes,
+        upstream_connections,
+        index[start:stop],
+        data_cols,
+        params[start:stop],
+        q0[start:stop],
+        qlat[start:stop],
+        *args,
+        **kwargs,
+    )
+    if output is not None:
+        result = _write_output(result, output)
+    return (result, seconds) if timed else result
+
+
+class SharedMemoryPool:
+    '''
+    A long-lived pool of routing workers paired with a set of arrays held
+    in shared memory.
+
+    Static channel and waterbody parameters are written once, when the
+    subnetwork layout is set, and the lateral inflow, initial condition and
+    waterbody state arrays are refreshed once per routing loop. Rows are
+    laid out by ClusterInputs, so that every subnetwork cluster occupies a
+    contiguous block, hence jobs only carry (start, stop) row ranges into
+    the shared arrays instead of their own copies of the data.
+    '''
+
+    def __init__(self, cpu_pool, directory=None):
+        '''
+        Arguments
+        ---------
+        cpu_pool   (int): number of worker processes
+        directory  (str): folder to place shared arrays in. Defaults to
+                          /dev/shm when available, else the system temp folder
+        '''
+        if directory is None and os.path.isdir("/dev/shm"):
+            directory = "/dev/shm"
+        self.cpu_pool = cpu_pool
+        self.folder = tempfile.mkdtemp(prefix="troute_shared_", dir=directory)
+        self.inputs = None
+        self.layout = None
+        self.paths = {}
+        self.outputs = {}
+        self.output_paths = {}
+        self._generation = itertools.count()
+        # make sure shared arrays do not outlive the run
+        self._finalizer = weakref.finalize(
+            self, shutil.rmtree, self.folder, ignore_errors=True
+        )
+
+    @property
+    def executor(self):
+        # the reusable executor hands back the same workers as long as the
+        # number of workers is unchanged, so the pool persists across loops.
+        # It is the executor of the joblib loky backend, which Parallel can
+        # take over when other routing calls of the run use that backend
+        return get_memmapping_executor(self.cpu_pool)
+
+    def _write(self, name, values):
+        path = os.path.join(self.folder, f"{name}_{next(self._generation)}.npy")
+        arr = np.lib.format.open_memmap(
+            path, mode="w+", dtype=values.dtype, shape=values.shape
+        )
+        arr[:] = values
+        arr.flush()
+        del arr
+
+        old = self.paths.get(name)
+        self.paths[name] = path
+        if old is not None and os.path.exists(old):
+            os.remove(old)
+
+    def _remove(self, *names):
+        for name in names:
+            path = self.paths.pop(name, None)
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+
+    def allocate_output(self, rows, nts):
+        '''
+        Create the shared output buffers of this loop, flowveldepth and
+        reservoir inflows of every routed segment, which workers write to
+        in place. Results of earlier loops keep their own buffers.
+
+        Arguments
+        ---------
+        rows (int): number of routed segments
+        nts  (int): number of timesteps
+        '''
+        for name, columns in (("fvd", nts * 3), ("inflow", nts)):
+            path = os.path.join(self.folder, f"{name}_{next(self._generation)}.npy")
+            self.outputs[name] = np.lib.format.open_memmap(
+                path, mode="w+", dtype="float32", shape=(rows, columns)
+            )
+            old = self.output_paths.get(name)
+            self.output_paths[name] = path
+            # the maps of this process keep old buffers readable until released
+            if old is not None and os.path.exists(old):
+                os.remove(old)
+
+    def output_view(self, result, start, stop):
+        '''
+        Results tuple of a job which wrote to the output buffers, with its
+        flowveldepth and reservoir inflows as views of rows [start, stop).
+        '''
+        result = list(result)
+        for name, k in _OUTPUTS.items():
+            result[k] = self.outputs[name][start:stop]
+        return tuple(result)
+
+    def set_layout(self, inputs, waterbodies_df):
+        '''
+        Write the static segment index, channel parameters and waterbody
+        parameters of the jobs to shared memory.
+
+        Arguments
+        ---------
+        inputs        (ClusterInputs): jobs laid out as contiguous row blocks
+        waterbodies_df    (DataFrame): waterbody parameters, indexed by waterbody id
+        '''
+        self.inputs = inputs
+        self.layout = dict(inputs.layout, index=inputs.index)
+        self._write("index", inputs.index)
+        self._write("params", inputs.params)
+        if waterbodies_df.empty:
+            self._remove("lakes", "waterbodies", "waterbody_states")
+            return
+        self._write("lakes", inputs.lake_index)
+        self._write(
+            "waterbodies",
+            waterbodies_df.loc[inputs.lake_index, WATERBODY_PARAM_COLS].to_numpy(dtype="float64"),
+        )
+
+    def update_forcing(self, q0, qlats, waterbodies_df):
+        '''
+        Write initial conditions, lateral inflows and waterbody states for
+        this loop to shared memory.
+
+        Arguments
+        ---------
+        q0             (DataFrame): initial flow, velocity and depth, indexed by segment id
+        qlats          (DataFrame): lateral inflows, indexed by segment id
+        waterbodies_df (DataFrame): waterbody parameters, with the outflow (qd0)
+                                    and water elevation (h0) this loop starts
+                                    from, indexed by waterbody id
+        '''
+        index = self.layout["index"]
+        self._write("q0", q0.reindex(index).to_numpy(dtype="float32"))
+        self._write("qlat", qlats.reindex(index).to_numpy(dtype="float32"))
+        if "lakes" in self.paths:
+            self._write(
+                "waterbody_states",
+                waterbodies_df.loc[
+                    self.inputs.lake_index, WATERBODY_STATE_COLS
+                ].to_numpy(dtype="float64"),
+            )
+
+    def submit(self, compute_func, start, stop, *args, **kwargs):
+        '''
+        Submit a routing job over rows [start, stop) of the shared arrays.
+        See compute_from_shared for the argument list.
+        '''
+        return self.executor.submit(
+            compute_from_shared,
+            compute_func,
+            dict(self.paths),
+            start,
+            stop,
+            *args,
+            **kwargs,
+        )
+
+    def shutdown(self):
+        '''
+        Remove the shared arrays. Workers are left to the reusable executor.
+        '''
+        self._finalizer()
+        self.inputs = None
+        self.layout = None
+        self.paths = {}
+        self.output_paths = {}
+
+
+def stacked_rows(arrays):
+    '''
+    The 2D arrays stacked by rows as one view, without copying, if they are
+    consecutive row blocks of one C-contiguous array, as the results written
+    to the shared output buffers.
+
+    Returns
+    -------
+    stacked (ndarray): view of the stacked rows, None if the arrays are not
+                       consecutive blocks of one array
+    '''
+    if not arrays or any(a is None or a.ndim != 2 for a in arrays):
+        return None
+    root = arrays[0]
+    while isinstance(root.base, np.ndarray):
+        root = root.base
+    if root.ndim != 2 or not root.flags.c_contiguous:
+        return None
+
+    row_bytes = root.strides[0]
+    root_address = root.__array_interface__["data"][0]
+    offset = arrays[0].__array_interface__["data"][0] - root_address
+    if offset % row_bytes:
+        return None
+    start = stop = offset // row_bytes
+    for a in arrays:
+        if (
+            a.dtype != root.dtype
+            or a.shape[1] != root.shape[1]
+            or not a.flags.c_contiguous
+            or a.__array_interface__["data"][0] != root_address + stop * row_bytes
+        ):
+            return None
+        stop += a.shape[0]
+    if stop > root.shape[0]:
+        return None
+    return root[start:stop]
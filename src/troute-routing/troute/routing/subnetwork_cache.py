@@ -0,0 +1,249 @@
+import os
+import hashlib
+import tempfile
+from collections import defaultdict
+
+import numpy as np
+
+import logging
+
+LOG = logging.getLogger('')
+
+# bump when the layout of the cached arrays changes
+CACHE_VERSION = 1
+
+
+def _to_csr(lists):
+    '''
+    Flatten a sequence of integer sequences into (pointer, values) arrays.
+    '''
+    lengths = np.fromiter((len(l) for l in lists), dtype="int64", count=len(lists))
+    ptr = np.zeros(len(lists) + 1, dtype="int64")
+    np.cumsum(lengths, out=ptr[1:])
+    values = np.fromiter(
+        (v for l in lists for v in l), dtype="int64", count=int(ptr[-1])
+    )
+    return ptr, values
+
+
+def _from_csr(ptr, values):
+    '''
+    Inverse of _to_csr, returns a list of lists of Python ints.
+    '''
+    values = values.tolist()
+    ptr = ptr.tolist()
+    return [values[ptr[i]:ptr[i + 1]] for i in range(len(ptr) - 1)]
+
+
+def subnetwork_cache_key(
+    connections,
+    gages,
+    waterbodies,
+    subnetwork_target_size,
+    packing="",
+):
+    '''
+    Hash the inputs that determine the clustered subnetwork decomposition.
+
+    Arguments
+    ---------
+    connections            (dict): downstream network connections
+    gages                  (iter): segments with gages used to split reaches
+    waterbodies            (iter): waterbody ids used to split reaches
+    subnetwork_target_size  (int): target number of segments per subnetwork
+    packing                 (str): identifies how subnetworks are packed into
+                                   clusters, empty for packing by segment count
+
+    Returns
+    -------
+    key (str): hex digest
+    '''
+    keys = np.fromiter(connections.keys(), dtype="int64", count=len(connections))
+    order = np.argsort(keys, kind="stable")
+    ptr, values = _to_csr([connections[k] for k in keys[order].tolist()])
+
+    h = hashlib.sha256()
+    h.update(f"v{CACHE_VERSION};{int(subnetwork_target_size)};".encode())
+    if packing:
+        h.update(f"{packing};".encode())
+    for arr in (
+        keys[order],
+        ptr,
+        values,
+        np.unique(np.asarray(list(gages), dtype="int64")),
+        np.unique(np.asarray(list(waterbodies), dtype="int64")),
+    ):
+        h.update(np.int64(arr.shape[0]).tobytes())
+        h.update(np.ascontiguousarray(arr).tobytes())
+    return h.hexdigest()
+
+
+def _pack(subnetworks_only_ordered_jit, reaches_ordered_bysubntw_clustered):
+    '''
+    Pack the subnetwork structures into flat integer arrays.
+    '''
+    arrays = {}
+
+    # subnetworks: one row per subnetwork tailwater, in dictionary order
+    subn_order, subn_tw, subn_segs = [], [], []
+    for order, subn_dict in subnetworks_only_ordered_jit.items():
+        for tw, segs in subn_dict.items():
+            subn_order.append(order)
+            subn_tw.append(tw)
+            subn_segs.append(sorted(segs))
+    arrays["subn_order"] = np.asarray(subn_order, dtype="int64")
+    arrays["subn_tw"] = np.asarray(subn_tw, dtype="int64")
+    arrays["subn_ptr"], arrays["subn_segs"] = _to_csr(subn_segs)
+
+    # clusters: one row per cluster, in dictionary order
+    cl_order, cl_id = [], []
+    cl_segs, cl_tw, cl_n_reaches, cl_ups_keys = [], [], [], []
+    reaches, ups_vals = [], []
+    for order, clusters in reaches_ordered_bysubntw_clustered.items():
+        for cluster, clustered_subns in clusters.items():
+            cl_order.append(order)
+            cl_id.append(cluster)
+            cl_segs.append(clustered_subns["segs"])
+            cl_tw.append(clustered_subns["tw"])
+            cl_n_reaches.append(len(clustered_subns["subn_reach_list"]))
+            reaches.extend(clustered_subns["subn_reach_list"])
+            cl_ups_keys.append(list(clustered_subns["upstreams"]))
+            ups_vals.extend(clustered_subns["upstreams"].values())
+
+    arrays["cluster_order"] = np.asarray(cl_order, dtype="int64")
+    arrays["cluster_id"] = np.asarray(cl_id, dtype="int64")
+    arrays["segs_ptr"], arrays["segs"] = _to_csr(cl_segs)
+    arrays["tw_ptr"], arrays["tw"] = _to_csr(cl_tw)
+    arrays["cluster_reach_ptr"] = np.zeros(len(cl_n_reaches) + 1, dtype="int64")
+    np.cumsum(cl_n_reaches, out=arrays["cluster_reach_ptr"][1:])
+    arrays["reach_ptr"], arrays["reach_segs"] = _to_csr(reaches)
+    arrays["ups_ptr"], arrays["ups_keys"] = _to_csr(cl_ups_keys)
+    arrays["ups_val_ptr"], arrays["ups_vals"] = _to_csr(ups_vals)
+    return arrays
+
+
+def _unpack(arrays):
+    '''
+    Rebuild the subnetwork structures from the arrays written by _pack.
+    '''
+    subnetworks_only_ordered_jit = defaultdict(dict)
+    subn_segs = _from_csr(arrays["subn_ptr"], arrays["subn_segs"])
+    for order, tw, segs in zip(
+        arrays["subn_order"].tolist(), arrays["subn_tw"].tolist(), subn_segs
+    ):
+        subnetworks_only_ordered_jit[order][tw] = set(segs)
+
+    cl_segs = _from_csr(arrays["segs_ptr"], arrays["segs"])
+    cl_tw = _from_csr(arrays["tw_ptr"], arrays["tw"])
+    reaches = _from_csr(arrays["reach_ptr"], arrays["reach_segs"])
+    reach_ptr = arrays["cluster_reach_ptr"].tolist()
+    ups_keys = arrays["ups_keys"].tolist()
+    ups_ptr = arrays["ups_ptr"].tolist()
+    ups_vals = _from_csr(arrays["ups_val_ptr"], arrays["ups_vals"])
+
+    reaches_ordered_bysubntw_clustered = defaultdict(dict)
+    for i, (order, cluster) in enumerate(
+        zip(arrays["cluster_order"].tolist(), arrays["cluster_id"].tolist())
+    ):
+        reaches_ordered_bysubntw_clustered[order][cluster] = {
+            "segs": cl_segs[i],
+            "upstreams": dict(
+                zip(
+                    ups_keys[ups_ptr[i]:ups_ptr[i + 1]],
+                    ups_vals[ups_ptr[i]:ups_ptr[i + 1]],
+                )
+            ),
+            "tw": cl_tw[i],
+            "subn_reach_list": reaches[reach_ptr[i]:reach_ptr[i + 1]],
+        }
+
+    return [subnetworks_only_ordered_jit, reaches_ordered_bysubntw_clustered]
+
+
+def save_subnetworks(path, subnetwork_list):
+    '''
+    Write clustered subnetwork structures to an uncompressed .npz file.
+    The file is written to a temporary name first and then moved into place,
+    so concurrent runs never read a partial cache.
+
+    Arguments
+    ---------
+    path            (str): destination file
+    subnetwork_list (list): [subnetworks_only_ordered_jit, reaches_ordered_bysubntw_clustered]
+    '''
+    arrays = _pack(*subnetwork_list)
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(suffix=".npz", dir=folder)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def load_subnetworks(path):
+    '''
+    Read clustered subnetwork structures written by save_subnetworks.
+
+    Returns
+    -------
+    subnetwork_list (list): [subnetworks_only_ordered_jit, reaches_ordered_bysubntw_clustered]
+    '''
+    with np.load(path, allow_pickle=False) as npz:
+        arrays = {k: npz[k] for k in npz.files}
+    return _unpack(arrays)
+
+
+def load_or_build_subnetworks(
+    cache_dir,
+    build_func,
+    connections,
+    gages,
+    waterbodies,
+    subnetwork_target_size,
+    packing="",
+):
+    '''
+    Return clustered subnetworks from the on-disk cache, building and
+    caching them with build_func on a miss.
+
+    Arguments
+    ---------
+    cache_dir               (str): folder holding cache files
+    build_func         (function): called without arguments to build
+                                   [subnetworks_only_ordered_jit, reaches_ordered_bysubntw_clustered]
+    connections, gages,
+    waterbodies,
+    subnetwork_target_size,
+    packing                      : cache key inputs, see subnetwork_cache_key
+
+    Returns
+    -------
+    subnetwork_list (list): [subnetworks_only_ordered_jit, reaches_ordered_bysubntw_clustered]
+    '''
+    key = subnetwork_cache_key(
+        connections, gages, waterbodies, subnetwork_target_size, packing
+    )
+    path = os.path.join(cache_dir, f"subnetworks_{key}.npz")
+
+    if os.path.isfile(path):
+        try:
+            subnetwork_list = load_subnetworks(path)
+            LOG.info("loaded clustered subnetworks from %s" % path)
+            return subnetwork_list
+        except Exception as e:
+            LOG.warning(
+                "could not read subnetwork cache %s (%s), rebuilding" % (path, e)
+            )
+
+    subnetwork_list = build_func()
+    try:
+        save_subnetworks(path, subnetwork_list)
+        LOG.info("saved clustered subnetworks to %s" % path)
+    except OSError as e:
+        LOG.warning("could not write subnetwork cache %s (%s)" % (path, e))
+    return subnetwork_list
@@ -73,6 +73,10 @@ class troute_model():
             }
         
         self._subnetwork_list = [None, None, None]
+        # reach structures of each network, reused by every update
+        self._routing_plans = {} if self._compute_parameters.get("reuse_routing_plans", False) else None
+        # inputs of the parallel jobs, partitioned by the first update
+        self._cluster_inputs = {} if self._compute_parameters.get("reuse_cluster_inputs", False) else None
     
     def preprocess_static_vars(self, values: dict):
         """
@@ -268,6 +272,9 @@ class troute_model():
                          self._network.unrefactored_topobathy_df,
                          flowveldepth_interorder,
                          from_files=False,
+                         routing_plans=self._routing_plans,
+                         cluster_inputs=self._cluster_inputs,
+                         parallel_backend=self._compute_parameters.get('parallel_backend', 'loky'),
                          )
         
         # update initial conditions with results output
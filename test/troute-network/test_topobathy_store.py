@@ -0,0 +1,116 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from troute.AbstractRouting import read_parquet
+from troute.topobathy_store import (
+    index_path,
+    is_topobathy_store,
+    read_topobathy_store,
+    topobathy_hy_ids,
+    write_topobathy_store,
+)
+
+
+@pytest.fixture
+def topobathy_file(tmp_path: Path) -> Path:
+    """
+    Provides a topobathy parquet file with "wb-" segment ids, in no particular order.
+
+    Parameters
+    ----------
+    tmp_path : Path
+        Temporary folder for the file
+
+    Returns
+    -------
+    Path
+        Path of the parquet file
+    """
+    rng = np.random.default_rng(0)
+    segs = rng.permutation(np.arange(100, 160))
+    rows = []
+    for seg in segs:
+        for cs_id in (2, 1):
+            for dist in range(int(rng.integers(2, 6))):
+                rows.append((f"wb-{seg}", float(dist), rng.uniform(0, 5), 0.05, cs_id))
+    df = pd.DataFrame(rows, columns=["hy_id", "relative_dist", "Z", "roughness", "cs_id"])
+    df = df.sample(frac=1.0, random_state=0)
+    df.loc[df.index[:3], "Z"] = np.nan
+    path = tmp_path / "topobathy.parquet"
+    df.to_parquet(path)
+    return path
+
+
+def test_topobathy_store(tmp_path: Path, topobathy_file: Path) -> None:
+    """
+    Test that a topobathy store returns the stations read_parquet returns, for any set of segments.
+
+    Parameters
+    ----------
+    tmp_path : Path
+        Temporary folder for the store
+    topobathy_file : Path
+        Topobathy parquet file
+    """
+    store = tmp_path / "topobathy_sorted.parquet"
+    assert not is_topobathy_store(topobathy_file)
+    write_topobathy_store(topobathy_file, store, row_group_size=16)
+    assert is_topobathy_store(store)
+
+    for seg_ids in ([101, 102, 140, 159], list(range(90, 170)), [120], [999]):
+        expected = read_parquet(topobathy_file, [f"wb-{seg}" for seg in seg_ids])
+        expected["hy_id"] = expected["hy_id"].astype(int)
+        expected = expected.sort_values("hy_id", kind="stable").reset_index(drop=True)
+
+        df = read_topobathy_store(store, seg_ids)
+        assert list(df.columns) == list(expected.columns)
+        assert len(df) == len(expected)
+        if len(df):
+            pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+            assert df["hy_id"].dtype == np.int64
+
+
+def test_topobathy_store_mismatch(tmp_path: Path, topobathy_file: Path) -> None:
+    """
+    Test that a store whose offset index does not match its parquet file is refused.
+
+    Parameters
+    ----------
+    tmp_path : Path
+        Temporary folder for the store
+    topobathy_file : Path
+        Topobathy parquet file
+    """
+    store = tmp_path / "topobathy_sorted.parquet"
+    write_topobathy_store(topobathy_file, store)
+    pd.read_parquet(store).iloc[:10].to_parquet(store)
+    assert Path(index_path(store)).is_file()
+    with pytest.raises(ValueError):
+        read_topobathy_store(store, [120])
+
+
+def test_topobathy_store_fallback(tmp_path: Path, topobathy_file: Path) -> None:
+    """
+    Test that a store modified after its offset index was written is read with read_parquet.
+
+    Parameters
+    ----------
+    tmp_path : Path
+        Temporary folder for the store
+    topobathy_file : Path
+        Topobathy parquet file
+    """
+    store = tmp_path / "topobathy_sorted.parquet"
+    write_topobathy_store(topobathy_file, store)
+    df = pd.read_parquet(store)
+    df.loc[df["hy_id"] == 120, "Z"] = -1.0
+    df.to_parquet(store)
+    assert not is_topobathy_store(store)
+
+    # stations of the modified store, not those recorded by its index
+    topobathy = read_parquet(store, topobathy_hy_ids(store, [120, 121]))
+    assert sorted(topobathy["hy_id"].unique()) == [120, 121]
+    assert (topobathy.loc[topobathy["hy_id"] == 120, "Z"] == -1.0).all()
+    assert topobathy_hy_ids(topobathy_file, [120]) == ["wb-120"]
@@ -1,11 +1,18 @@
+import inspect
 import os
 from pathlib import Path
 from typing import Any, Dict
 
+import numpy as np
 import pandas as pd
 import pytest
-from nwm_routing.__main__ import new_nwm_q0, nwm_route
+from nwm_routing.__main__ import get_waterbody_water_elevation, new_nwm_q0, nwm_route
 from nwm_routing.preprocess import nwm_forcing_preprocess
+import troute.nhd_network as nhd_network
+import troute.nhd_network_utilities_v02 as nnu
+from troute.config.compute_parameters import ComputeParameters
+from troute.routing.compute import compute_nhd_routing_v02
+from troute.routing.shared_pool import SharedMemoryPool, stacked_rows
 from test import find_cwd, temporarily_change_dir
 
 
@@ -157,3 +164,481 @@ def test_nwm_route_execution(
        check_exact=False,
        rtol=1e-5
    )
+
+
+def _forcing_qlats(nhd_test_network, nhd_built_test_network, warmstart_nhd_test, nhd_qlat_data):
+    with temporarily_change_dir(nhd_test_network["path"]):
+        return nwm_forcing_preprocess(
+            nhd_qlat_data,
+            nhd_test_network["forcing_parameters"],
+            nhd_test_network["hybrid_parameters"],
+            {},
+            {},
+            nhd_built_test_network["break_network_at_waterbodies"],
+            nhd_built_test_network["param_df"].index,
+            nhd_built_test_network["link_gage_df"],
+            nhd_built_test_network["usgs_lake_gage_crosswalk"],
+            nhd_built_test_network["usace_lake_gage_crosswalk"],
+            nhd_built_test_network["link_lake_crosswalk"],
+            warmstart_nhd_test["lastobs_df"].index,
+            1,
+            warmstart_nhd_test["t0"],
+        )[0]
+
+
+def _route_serial(
+    nhd_test_network,
+    nhd_built_test_network,
+    warmstart_nhd_test,
+    nts,
+    qlats,
+    q0,
+    parallel_compute_method="serial",
+    cpu_pool=1,
+    waterbodies_df=None,
+    **kwargs,
+):
+    """Routing without data assimilation, waterbodies as level pool reservoirs"""
+    if waterbodies_df is None:
+        waterbodies_df = warmstart_nhd_test["waterbodies_df"]
+    empty = pd.DataFrame()
+    run_results, _ = nwm_route(
+        nhd_built_test_network["connections"],
+        nhd_built_test_network["rconn"],
+        nhd_built_test_network["wbody_conn"],
+        nhd_built_test_network["reaches_bytw"],
+        parallel_compute_method,
+        "V02-structured",
+        1,
+        cpu_pool,
+        warmstart_nhd_test["t0"],
+        nhd_test_network["forcing_parameters"].get("dt"),
+        nts,
+        nhd_test_network["forcing_parameters"].get("qts_subdivisions", 1),
+        nhd_built_test_network["independent_networks"],
+        nhd_built_test_network["param_df"].copy(),
+        q0,
+        qlats,
+        empty,
+        pd.DataFrame(),
+        empty,
+        empty,
+        empty,
+        empty,
+        empty,
+        empty,
+        empty,
+        empty,
+        empty,
+        {},
+        True,
+        False,
+        waterbodies_df,
+        nhd_test_network["waterbody_parameters"],
+        nhd_built_test_network["waterbody_types_df"].assign(reservoir_type=1),
+        False,
+        {},
+        None,
+        None,
+        None,
+        [None, None, None],
+        None,
+        None,
+        **kwargs,
+    )
+    return run_results
+
+
+def _split_network(nhd_built_test_network, n_cuts):
+    """
+    The test network cut into several independent networks, at the inlets of
+    its n_cuts largest tributaries away from waterbodies.
+    """
+    connections = {seg: list(ds) for seg, ds in nhd_built_test_network["connections"].items()}
+    rconn = nhd_built_test_network["rconn"]
+    wbody_conn = nhd_built_test_network["wbody_conn"]
+    lakes = set(wbody_conn.values())
+
+    # number of segments upstream of, and including, every segment
+    upstream = {}
+    for tw in nhd_network.headwaters(rconn):
+        stack = [tw]
+        while stack:
+            seg = stack[-1]
+            pending = [us for us in rconn.get(seg, []) if us not in upstream]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            upstream[seg] = 1 + sum(upstream[us] for us in rconn.get(seg, []))
+
+    def is_tributary(seg):
+        ds = connections[seg]
+        if len(ds) != 1 or len(rconn.get(ds[0], [])) < 2:
+            return False
+        if {seg, ds[0]} & (lakes | set(wbody_conn)):
+            return False
+        return upstream[seg] < max(upstream[us] for us in rconn[ds[0]])
+
+    tributaries = sorted(filter(is_tributary, connections), key=lambda seg: (-upstream[seg], seg))
+    for seg in tributaries[:n_cuts]:
+        connections[seg] = []
+
+    independent_networks, reaches_bytw, rconn = nnu.organize_independent_networks(
+        connections, lakes, set()
+    )
+    return {
+        **nhd_built_test_network,
+        "connections": connections,
+        "rconn": rconn,
+        "independent_networks": independent_networks,
+        "reaches_bytw": reaches_bytw,
+    }
+
+
+def _stacked_results(run_results):
+    """Segment ids and flowveldepth rows of all networks, sorted by segment id"""
+    ids = np.concatenate([result[0] for result in run_results])
+    flowveldepth = np.concatenate([result[1] for result in run_results])
+    order = np.argsort(ids, kind="stable")
+    return ids[order], flowveldepth[order]
+
+
+def test_network_batch_size_default():
+    """Direct calls batch networks as runs configured without network_batch_size"""
+    default = ComputeParameters().network_batch_size
+    for func in (compute_nhd_routing_v02, nwm_route):
+        assert inspect.signature(func).parameters["network_batch_size"].default == default
+
+
+@pytest.mark.parametrize("reach_threads", [2, 4])
+@pytest.mark.parametrize("hydraulic_table_size", [0, 16])
+def test_nwm_route_reach_threads(
+    nhd_test_network: Dict[str, Any],
+    nhd_built_test_network: Dict[str, Any],
+    warmstart_nhd_test: Dict[str, Any],
+    nhd_qlat_data: Dict[str, Any],
+    reach_threads: int,
+    hydraulic_table_size: int,
+):
+    """
+    Reaches of each topological level routed on threads give the results of the serial sweep
+    with hydraulic tables. Secant solves start from the residual of the previous solve on
+    their thread, so only the routed segments are compared.
+    """
+    nts = nhd_qlat_data.get("nts")
+    q0 = warmstart_nhd_test["q0"]
+    qlats = _forcing_qlats(nhd_test_network, nhd_built_test_network, warmstart_nhd_test, nhd_qlat_data)
+
+    def route(reach_threads):
+        return _route_serial(
+            nhd_test_network,
+            nhd_built_test_network,
+            warmstart_nhd_test,
+            nts,
+            qlats,
+            q0,
+            reach_threads=reach_threads,
+            hydraulic_table_size=hydraulic_table_size,
+        )
+
+    expected_results = route(1)
+    for _ in range(2):
+        run_results = route(reach_threads)
+        assert len(run_results) == len(expected_results)
+        for result, expected in zip(run_results, expected_results):
+            np.testing.assert_array_equal(result[0], expected[0])
+            if hydraulic_table_size:
+                np.testing.assert_array_equal(result[1], expected[1])
+            else:
+                assert result[1].shape == expected[1].shape
+                assert np.isfinite(result[1]).all()
+
+
+@pytest.mark.parametrize("hydraulic_table_size", [0, 16])
+def test_nwm_route_routing_plans(
+    nhd_test_network: Dict[str, Any],
+    nhd_built_test_network: Dict[str, Any],
+    warmstart_nhd_test: Dict[str, Any],
+    nhd_qlat_data: Dict[str, Any],
+    hydraulic_table_size: int,
+):
+    """Routing plans kept from the first loop give the results of building them anew"""
+    nts = nhd_qlat_data.get("nts")
+    qlats = _forcing_qlats(nhd_test_network, nhd_built_test_network, warmstart_nhd_test, nhd_qlat_data)
+
+    # the third loop with rougher channels, which plans of earlier loops do not fit
+    rough_network = dict(nhd_built_test_network)
+    rough_network["param_df"] = nhd_built_test_network["param_df"].assign(
+        n=lambda df: df["n"] * 1.5
+    )
+
+    def route_loops(routing_plans):
+        # three loops, each continuing from the previous one
+        q0 = warmstart_nhd_test["q0"]
+        loops = []
+        for loop_qlats, network in (
+            (qlats, nhd_built_test_network),
+            (qlats * 2.0, nhd_built_test_network),
+            (qlats * 2.0, rough_network),
+        ):
+            run_results = _route_serial(
+                nhd_test_network,
+                network,
+                warmstart_nhd_test,
+                nts,
+                loop_qlats,
+                q0,
+                hydraulic_table_size=hydraulic_table_size,
+                routing_plans=routing_plans,
+            )
+            q0 = new_nwm_q0(run_results)
+            loops.append(run_results)
+        return loops
+
+    routing_plans = {}
+    with_plans = route_loops(routing_plans)
+    assert set(routing_plans) == set(nhd_built_test_network["reaches_bytw"])
+
+    for run_results, expected_results in zip(with_plans, route_loops(None)):
+        for result, expected in zip(run_results, expected_results):
+            np.testing.assert_array_equal(result[0], expected[0])
+            np.testing.assert_array_equal(result[1], expected[1])
+
+
+@pytest.mark.parametrize("cpu_pool", [2, 4])
+@pytest.mark.parametrize("parallel_compute_method", ["by-network", "by-subnetwork-jit-clustered"])
+def test_nwm_route_parallel_backend(
+    nhd_test_network: Dict[str, Any],
+    nhd_built_test_network: Dict[str, Any],
+    warmstart_nhd_test: Dict[str, Any],
+    nhd_qlat_data: Dict[str, Any],
+    parallel_compute_method: str,
+    cpu_pool: int,
+):
+    """
+    Networks routed concurrently on threads, with routing plans built in the
+    routing process, or on loky processes, give the serial results. Depths
+    are solved from hydraulic tables, secant solves start from the residual
+    of the previous solve of their thread or process.
+    """
+    nts = nhd_qlat_data.get("nts")
+    qlats = _forcing_qlats(nhd_test_network, nhd_built_test_network, warmstart_nhd_test, nhd_qlat_data)
+    split_network = _split_network(nhd_built_test_network, 6)
+    assert len(split_network["reaches_bytw"]) == 7
+
+    def route_loops(parallel_compute_method, cpu_pool, **kwargs):
+        q0 = warmstart_nhd_test["q0"]
+        loops = []
+        for loop_qlats in (qlats, qlats * 2.0):
+            run_results = _route_serial(
+                nhd_test_network,
+                split_network,
+                warmstart_nhd_test,
+                nts,
+                loop_qlats,
+                q0,
+                parallel_compute_method=parallel_compute_method,
+                cpu_pool=cpu_pool,
+                hydraulic_table_size=16,
+                **kwargs,
+            )
+            q0 = new_nwm_q0(run_results)
+            loops.append(_stacked_results(run_results))
+        return loops
+
+    expected_loops = route_loops("serial", 1)
+    routing_plans = {}
+    threaded = route_loops(
+        parallel_compute_method, cpu_pool, parallel_backend="threading", routing_plans=routing_plans
+    )
+    assert routing_plans
+    loky = route_loops(parallel_compute_method, cpu_pool, parallel_backend="loky")
+
+    for expected, *results in zip(expected_loops, threaded, loky):
+        for ids, flowveldepth in results:
+            np.testing.assert_array_equal(ids, expected[0])
+            np.testing.assert_array_equal(flowveldepth, expected[1])
+
+
+@pytest.mark.parametrize(
+    "parallel_compute_method", ["by-network", "by-subnetwork-jit", "by-subnetwork-jit-clustered"]
+)
+def test_nwm_route_cluster_inputs(
+    nhd_test_network: Dict[str, Any],
+    nhd_built_test_network: Dict[str, Any],
+    warmstart_nhd_test: Dict[str, Any],
+    nhd_qlat_data: Dict[str, Any],
+    parallel_compute_method: str,
+):
+    """Inputs partitioned on the first loop give the results of inputs partitioned every loop"""
+    nts = nhd_qlat_data.get("nts")
+    qlats = _forcing_qlats(nhd_test_network, nhd_built_test_network, warmstart_nhd_test, nhd_qlat_data)
+    split_network = _split_network(nhd_built_test_network, 6)
+
+    def route_loops(cluster_inputs):
+        q0 = warmstart_nhd_test["q0"]
+        waterbodies_df = warmstart_nhd_test["waterbodies_df"].copy()
+        loops = []
+        for loop_qlats in (qlats, qlats * 2.0, qlats * 0.5):
+            run_results = _route_serial(
+                nhd_test_network,
+                split_network,
+                warmstart_nhd_test,
+                nts,
+                loop_qlats,
+                q0,
+                parallel_compute_method=parallel_compute_method,
+                waterbodies_df=waterbodies_df,
+                cluster_inputs=cluster_inputs,
+            )
+            # waterbodies start the next loop from the outflow and elevation of this one
+            q0 = new_nwm_q0(run_results)
+            waterbodies_df = get_waterbody_water_elevation(waterbodies_df, q0)
+            loops.append(_stacked_results(run_results))
+        return loops
+
+    cluster_inputs = {}
+    reused = route_loops(cluster_inputs)
+    assert parallel_compute_method in cluster_inputs
+
+    for (ids, flowveldepth), expected in zip(reused, route_loops(None)):
+        np.testing.assert_array_equal(ids, expected[0])
+        np.testing.assert_array_equal(flowveldepth, expected[1])
+
+
+def test_nwm_route_shared_pool(
+    tmp_path: Path,
+    nhd_test_network: Dict[str, Any],
+    nhd_built_test_network: Dict[str, Any],
+    warmstart_nhd_test: Dict[str, Any],
+    nhd_qlat_data: Dict[str, Any],
+):
+    """
+    Clusters routed from one shared-memory pool over several loops give the results of the
+    jit-clustered method. Depths are solved from hydraulic tables, secant solves start from
+    the residual of the previous solve of their process.
+    """
+    nts = nhd_qlat_data.get("nts")
+    qlats = _forcing_qlats(nhd_test_network, nhd_built_test_network, warmstart_nhd_test, nhd_qlat_data)
+    split_network = _split_network(nhd_built_test_network, 6)
+
+    def route_loops(parallel_compute_method, **kwargs):
+        q0 = warmstart_nhd_test["q0"]
+        waterbodies_df = warmstart_nhd_test["waterbodies_df"].copy()
+        loops = []
+        for loop_qlats in (qlats, qlats * 2.0):
+            run_results = _route_serial(
+                nhd_test_network,
+                split_network,
+                warmstart_nhd_test,
+                nts,
+                loop_qlats,
+                q0,
+                parallel_compute_method=parallel_compute_method,
+                cpu_pool=2,
+                waterbodies_df=waterbodies_df,
+                hydraulic_table_size=16,
+                **kwargs,
+            )
+            q0 = new_nwm_q0(run_results)
+            waterbodies_df = get_waterbody_water_elevation(waterbodies_df, q0)
+            loops.append(_stacked_results(run_results))
+        return loops
+
+    routing_pool = SharedMemoryPool(2, directory=tmp_path)
+    shared = route_loops(
+        "by-subnetwork-jit-clustered-shared", routing_pool=routing_pool, routing_plans={}
+    )
+    # the pool keeps the arrays of the last loop only
+    assert routing_pool.layout is not None
+    assert sorted(os.listdir(routing_pool.folder)) == sorted(
+        os.path.basename(path) for path in routing_pool.paths.values()
+    )
+    routing_pool.shutdown()
+    assert not os.path.exists(routing_pool.folder)
+
+    for (ids, flowveldepth), expected in zip(shared, route_loops("by-subnetwork-jit-clustered")):
+        np.testing.assert_array_equal(ids, expected[0])
+        np.testing.assert_array_equal(flowveldepth, expected[1])
+
+
+def test_nwm_route_shared_output(
+    nhd_test_network: Dict[str, Any],
+    nhd_built_test_network: Dict[str, Any],
+    warmstart_nhd_test: Dict[str, Any],
+    nhd_qlat_data: Dict[str, Any],
+):
+    """Results written to the shared output buffers match the results returned by the workers"""
+    nts = nhd_qlat_data.get("nts")
+    q0 = warmstart_nhd_test["q0"]
+    qlats = _forcing_qlats(nhd_test_network, nhd_built_test_network, warmstart_nhd_test, nhd_qlat_data)
+
+    def route(shared_output):
+        return _route_serial(
+            nhd_test_network,
+            nhd_built_test_network,
+            warmstart_nhd_test,
+            nts,
+            qlats,
+            q0,
+            parallel_compute_method="by-subnetwork-jit-clustered-shared",
+            shared_output=shared_output,
+        )
+
+    shared = route(True)
+    expected = route(False)
+
+    assert stacked_rows([r[1] for r in shared]) is not None
+    assert stacked_rows([r[1] for r in expected]) is None
+    assert len(shared) == len(expected)
+    for result, expected_result in zip(shared, expected):
+        for k in (0, 1, 8):
+            np.testing.assert_array_equal(result[k], expected_result[k])
+
+
+@pytest.mark.parametrize("parallel_compute_method", ["serial", "by-network"])
+def test_nwm_route_members(
+    nhd_test_network: Dict[str, Any],
+    nhd_built_test_network: Dict[str, Any],
+    warmstart_nhd_test: Dict[str, Any],
+    nhd_qlat_data: Dict[str, Any],
+    parallel_compute_method: str,
+):
+    """Ensemble members routed together give the results of routing every member on its own"""
+    nts = nhd_qlat_data.get("nts")
+    q0 = warmstart_nhd_test["q0"]
+    waterbodies_df = warmstart_nhd_test["waterbodies_df"]
+    qlats = _forcing_qlats(nhd_test_network, nhd_built_test_network, warmstart_nhd_test, nhd_qlat_data)
+    members = [
+        {},
+        {"qlats": qlats * 2.0, "waterbodies_df": waterbodies_df.assign(h0=waterbodies_df["h0"] + 0.1)},
+        {"qlats": qlats * 0.5, "q0": q0 * 1.5},
+    ]
+
+    def route(members=None, **member):
+        return _route_serial(
+            nhd_test_network,
+            nhd_built_test_network,
+            warmstart_nhd_test,
+            nts,
+            member.get("qlats", qlats),
+            member.get("q0", q0),
+            parallel_compute_method=parallel_compute_method,
+            waterbodies_df=member.get("waterbodies_df", waterbodies_df),
+            hydraulic_table_size=16,
+            members=members,
+        )
+
+    member_results = route(members)
+
+    assert len(member_results) == len(members)
+    for run_results, member in zip(member_results, members):
+        expected_results = route(**member)
+        assert len(run_results) == len(expected_results)
+        for result, expected in zip(run_results, expected_results):
+            np.testing.assert_array_equal(result[0], expected[0])
+            np.testing.assert_array_equal(result[1], expected[1])
+    assert not np.array_equal(
+        _stacked_results(member_results[0])[1], _stacked_results(member_results[1])[1]
+    )
@@ -0,0 +1,51 @@
+import threading
+import time
+
+import pytest
+import nwm_routing.output as output
+from nwm_routing.output import OutputService
+
+
+def test_output_service_writes_in_order(monkeypatch):
+    written = []
+
+    def generator(loop, delay):
+        time.sleep(delay)
+        written.append(loop)
+
+    monkeypatch.setattr(output, "nwm_output_generator", generator)
+
+    service = OutputService(max_pending=2)
+    for loop in range(5):
+        service.submit(loop, 0.02)
+        assert len(service._pending) <= 2
+    service.close()
+
+    assert written == list(range(5))
+    assert service.write_time >= 0.1
+    assert 0 <= service.overlap_time <= service.write_time
+
+
+def test_output_service_blocks_when_full(monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(output, "nwm_output_generator", lambda: release.wait())
+
+    service = OutputService(max_pending=1)
+    service.submit()
+    threading.Timer(0.1, release.set).start()
+    start = time.time()
+    service.submit()
+    assert time.time() - start >= 0.05
+    service.close()
+
+
+def test_output_service_raises_writer_errors(monkeypatch):
+    def generator():
+        raise OSError("disk full")
+
+    monkeypatch.setattr(output, "nwm_output_generator", generator)
+
+    service = OutputService()
+    service.submit()
+    with pytest.raises(OSError):
+        service.close()
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+from nwm_routing.output import accumulate_solver_diagnostics, solver_diagnostics_report
+
+
+def _results(ids, diagnostics):
+    # only the segment ids and the solver diagnostics of the routing results are used
+    if diagnostics is not None:
+        diagnostics = np.array(diagnostics, dtype="int32")
+    return (np.array(ids), None, 0, None, None, None, None, None, None, None, diagnostics)
+
+
+def test_accumulate_solver_diagnostics():
+    loop = [
+        _results([1, 2], [[10, 0, 0, 4], [30, 1, 0, 9]]),
+        _results([3], [[5, 0, 0, 3]]),
+        _results([4], None),
+    ]
+    diagnostics = accumulate_solver_diagnostics(loop)
+    diagnostics = accumulate_solver_diagnostics([_results([2, 3], [[20, 0, 1, 6], [5, 0, 0, 5]])], diagnostics)
+
+    expected = pd.DataFrame(
+        [[10, 0, 0, 4], [50, 1, 1, 9], [10, 0, 0, 5]],
+        index=[1, 2, 3],
+        columns=["iterations", "retries", "nonconverged", "max_iterations"],
+    )
+    pd.testing.assert_frame_equal(diagnostics, expected, check_dtype=False)
+    assert accumulate_solver_diagnostics([_results([4], None)]) is None
+
+
+def test_solver_diagnostics_report(tmp_path):
+    diagnostics = accumulate_solver_diagnostics(
+        [_results([1, 2, 3], [[10, 0, 0, 4], [50, 1, 1, 9], [10, 2, 0, 5]])]
+    )
+    ranked = solver_diagnostics_report(diagnostics, top=2, diagnostics_file=tmp_path / "diagnostics.csv")
+
+    assert ranked.index.tolist() == [2, 3, 1]
+    written = pd.read_csv(tmp_path / "diagnostics.csv", index_col="feature_id")
+    assert written.index.tolist() == [2, 3, 1]
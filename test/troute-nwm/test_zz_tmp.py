@@ -0,0 +1,23 @@
+import time
+import numpy as np
+from test_nwm_route import _forcing_qlats, _route_serial
+
+
+def test_timing(nhd_test_network, nhd_built_test_network, warmstart_nhd_test, nhd_qlat_data):
+    nts = nhd_qlat_data.get("nts")
+    qlats = _forcing_qlats(nhd_test_network, nhd_built_test_network, warmstart_nhd_test, nhd_qlat_data)
+    q0 = warmstart_nhd_test["q0"]
+    scales = [1.0, 1.5, 2.0, 0.5]
+    def ab(x, y):
+        return max(np.abs(a[1] - b[1]).max() for e, s in zip(x, y) for a, b in zip(e, s))
+    for method in ("serial", "by-network"):
+        r = lambda s, **kw: _route_serial(nhd_test_network, nhd_built_test_network, warmstart_nhd_test, nts, qlats * s, q0, parallel_compute_method=method, **kw)
+        r(1.0)
+        best = {}
+        for label, f in (("sep", lambda: [r(s) for s in scales]), ("ens", lambda: r(1.0, members=[{"qlats": qlats * s} for s in scales]))):
+            ts = []
+            for _ in range(3):
+                t = time.perf_counter(); out = f(); ts.append(time.perf_counter() - t)
+            best[label] = (min(ts), out)
+        print("\nTIME", method, "sep %.2f ens %.2f" % (best["sep"][0], best["ens"][0]))
+        print("DIFF", method, ab(best["ens"][1], best["sep"][1]))
@@ -0,0 +1,84 @@
+import numpy as np
+from troute.routing.cluster_cost import (
+    FEATURES,
+    ClusterCostModel,
+    cluster_features,
+    pack_by_cost,
+)
+
+
+def test_cluster_features() -> None:
+    """Test that reaches are counted by type, as in the reach type list."""
+    reach_list = [[1, 2, 3], [4], [10], [20], [5, 6]]
+    features = cluster_features(
+        reach_list, gages={2, 6}, waterbodies={10, 20}, da_reservoirs={20}
+    )
+    counts = dict(zip(FEATURES, features))
+
+    assert counts == {
+        "segments": 6,
+        "reaches": 3,
+        "reservoirs": 1,
+        "da_reservoirs": 1,
+        "gages": 2,
+    }
+
+
+def test_pack_by_cost() -> None:
+    """Test that subnetworks are packed into clusters of even cost."""
+    costs = {1: 90.0, 2: 10.0, 3: 50.0, 4: 40.0, 5: 60.0, 6: 30.0}
+
+    clusters = pack_by_cost(costs, target_cost=100.0)
+
+    assert len(clusters) == 3
+    assert sorted(tw for c in clusters for tw in c) == sorted(costs)
+    loads = [sum(costs[tw] for tw in c) for c in clusters]
+    assert max(loads) - min(loads) <= 10.0
+    # members keep the order of costs
+    for c in clusters:
+        assert c == sorted(c)
+
+
+def test_pack_by_cost_empty() -> None:
+    """Test that an order without subnetworks gives one empty cluster."""
+    assert pack_by_cost({}, target_cost=100.0) == [[]]
+
+
+def test_calibrated_recovers_weights() -> None:
+    """Test that the calibrated model fits the recorded cluster times."""
+    true_weights = np.array([2e-6, 1e-6, 3e-5, 0.0, 8e-6])
+    rng = np.random.default_rng(0)
+    model = ClusterCostModel()
+    for _ in range(20):
+        features = rng.integers(0, 50, size=len(FEATURES)).astype(float)
+        features[3] = 0.0
+        model.record(features, float(true_weights @ features))
+
+    calibrated = model.calibrated()
+
+    np.testing.assert_allclose(calibrated.weights[[0, 1, 2, 4]], true_weights[[0, 1, 2, 4]])
+    # no DA reservoirs were observed, so their weight keeps its default ratio
+    default = ClusterCostModel()
+    np.testing.assert_allclose(
+        calibrated.weights[3] / calibrated.weights[0],
+        default.weights[3] / default.weights[0],
+    )
+
+
+def test_calibrated_without_observations() -> None:
+    """Test that a model with nothing recorded is left as is."""
+    model = ClusterCostModel()
+    assert model.calibrated() is model
+
+
+def test_save_load(tmp_path) -> None:
+    """Test that saved weights are read back."""
+    model = ClusterCostModel({"reservoirs": 7.5, "gages": 0.5})
+    path = tmp_path / "cluster_cost.json"
+
+    model.save(path)
+    loaded = ClusterCostModel.load(path)
+
+    np.testing.assert_array_equal(loaded.weights, model.weights)
+    assert loaded.key() == model.key()
+    assert loaded.cost(np.ones(len(FEATURES))) == model.cost(np.ones(len(FEATURES)))
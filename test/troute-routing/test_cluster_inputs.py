@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+import pytest
+from troute.routing.cluster_inputs import WATERBODY_COLS, ClusterInputs
+from troute.routing.compute import (
+    _build_reach_type_list,
+    _prep_da_dataframes,
+    _prep_da_positions_byreach,
+)
+
+PARAM_COLS = ["dt", "bw", "tw", "twcc", "dx", "n", "ncc", "cs", "s0", "alt"]
+
+# two clusters, the second downstream of the first, with waterbody 100 in the first
+JOBS = {
+    (1, 0): ([5, 4, 100, 3], set(), [[5, 4], [100], [3]]),
+    (0, 0): ([2, 1], {3}, [[2, 1]]),
+}
+
+
+def _network():
+    segs = [1, 2, 3, 4, 5]
+    param_df = pd.DataFrame(
+        np.arange(len(segs) * len(PARAM_COLS), dtype="float32").reshape(len(segs), -1),
+        index=segs,
+        columns=PARAM_COLS,
+    )
+    waterbodies_df = pd.DataFrame(
+        np.ones((1, len(WATERBODY_COLS))), index=[100], columns=WATERBODY_COLS
+    )
+    waterbody_types_df = pd.DataFrame({"reservoir_type": [1]}, index=[100])
+    return param_df, waterbodies_df, waterbody_types_df
+
+
+def _job_index(param_df, waterbodies_df, job):
+    segs, offnetwork_upstreams, _ = JOBS[job]
+    segs = set(segs) | offnetwork_upstreams
+    common_segs = list(param_df.index.intersection(segs))
+    lake_segs = list(waterbodies_df.index.intersection(segs))
+    return pd.Index(sorted(common_segs + lake_segs))
+
+
+def test_job_arrays() -> None:
+    """Test that job inputs are the rows the per-job pandas selection gives."""
+    param_df, waterbodies_df, waterbody_types_df = _network()
+    q0 = pd.DataFrame(np.random.rand(6, 3), index=[1, 2, 3, 4, 5, 100])
+    qlats = pd.DataFrame(np.random.rand(5, 4), index=[1, 2, 3, 4, 5])
+
+    inputs = ClusterInputs(JOBS, param_df, PARAM_COLS, waterbodies_df, waterbody_types_df)
+    inputs.update_forcing(q0, qlats, waterbodies_df)
+
+    for job, (segs, offnetwork_upstreams, reach_list) in JOBS.items():
+        idx = _job_index(param_df, waterbodies_df, job)
+        channel = param_df.index.intersection(idx)
+        index, params, q0_sub, qlat_sub = inputs.job_arrays(job)
+
+        np.testing.assert_array_equal(index, idx.values)
+        np.testing.assert_array_equal(params, param_df.reindex(idx).values)
+        np.testing.assert_array_equal(
+            q0_sub, q0.loc[channel].reindex(idx).values.astype("float32")
+        )
+        np.testing.assert_array_equal(
+            qlat_sub, qlats.loc[channel].reindex(idx).values.astype("float32")
+        )
+        wbodies_segs = (set(segs) | offnetwork_upstreams).difference(param_df.index)
+        assert inputs.reach_types[job] == _build_reach_type_list(reach_list, wbodies_segs)
+        assert inputs.upstreams[job] == {us: idx.get_loc(us) for us in offnetwork_upstreams}
+
+    assert inputs.waterbodies[(1, 0)][0] == [100]
+    assert inputs.waterbodies[(0, 0)][0] == []
+    # waterbodies of all jobs are laid out in one block of rows
+    np.testing.assert_array_equal(inputs.lake_index, [100])
+    assert inputs.lake_layout == {(1, 0): (0, 1), (0, 0): (1, 1)}
+    assert inputs.waterbodies[(0, 0)][1].shape == (0, len(WATERBODY_COLS))
+
+    # waterbodies start every loop from the states of that loop
+    waterbodies_df = waterbodies_df.assign(qd0=2.0, h0=3.0)
+    inputs.update_forcing(q0, qlats, waterbodies_df)
+    np.testing.assert_array_equal(
+        inputs.waterbodies[(1, 0)][1], waterbodies_df.loc[[100], WATERBODY_COLS].values
+    )
+    assert inputs.matches([(1, 0), (0, 0)], param_df.index)
+    assert not inputs.matches([(0, 0)], param_df.index)
+
+
+@pytest.mark.parametrize("with_usgs", [True, False])
+@pytest.mark.parametrize("with_lastobs", [True, False])
+def test_split_da(with_usgs, with_lastobs) -> None:
+    """Test that DA frames are split as they are selected for every job."""
+    param_df, waterbodies_df, waterbody_types_df = _network()
+    # gages 3 and 5, and 9 outside the network
+    usgs_df = pd.DataFrame(np.random.rand(3, 4), index=[5, 9, 3])
+    lastobs_df = pd.DataFrame(
+        {
+            "lastobs_discharge": [1.0, 2.0, 3.0],
+            "time_since_lastobs": [60.0, 120.0, 180.0],
+        },
+        index=[3, 5, 9],
+    )
+    usgs_df = usgs_df if with_usgs else pd.DataFrame()
+    lastobs_df = lastobs_df if with_lastobs else pd.DataFrame()
+
+    inputs = ClusterInputs(JOBS, param_df, PARAM_COLS, waterbodies_df, waterbody_types_df)
+    da_by_job = inputs.split_da(usgs_df, lastobs_df)
+
+    for job, (segs, offnetwork_upstreams, reach_list) in JOBS.items():
+        idx = _job_index(param_df, waterbodies_df, job)
+        usgs_df_sub, lastobs_df_sub, da_positions_list_byseg = _prep_da_dataframes(
+            usgs_df, lastobs_df, idx, offnetwork_upstreams
+        )
+        da_positions_list_byreach, da_positions_list_bygage = _prep_da_positions_byreach(
+            reach_list, lastobs_df_sub.index
+        )
+        expected = [
+            usgs_df_sub.values.astype("float32"),
+            np.array(da_positions_list_byseg, dtype="int32"),
+            np.array(da_positions_list_byreach, dtype="int32"),
+            np.array(da_positions_list_bygage, dtype="int32"),
+            lastobs_df_sub.get(
+                "lastobs_discharge",
+                pd.Series(index=lastobs_df_sub.index, name="Null", dtype="float32"),
+            ).values.astype("float32"),
+            lastobs_df_sub.get(
+                "time_since_lastobs",
+                pd.Series(index=lastobs_df_sub.index, name="Null", dtype="float32"),
+            ).values.astype("float32"),
+        ]
+
+        da_args = da_by_job.get(job, ClusterInputs.empty_da(usgs_df, lastobs_df))
+        assert len(da_args) == len(expected)
+        for arg, expected_arg in zip(da_args, expected):
+            assert arg.dtype == expected_arg.dtype
+            np.testing.assert_array_equal(arg, expected_arg)
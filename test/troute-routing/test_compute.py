@@ -0,0 +1,267 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+from troute.routing.compute import (
+    _batch_networks,
+    _cached_plan,
+    _ensemble_members,
+    _tailwater_results,
+    _tributary_inflows,
+    compute_nhd_routing_v02,
+)
+from troute.routing.fast_reach.reach import swap_secant_residual
+
+NTS = 12
+
+
+def test_tailwater_results() -> None:
+    """Test that tailwater rows are taken from the sorted subnetwork results."""
+    ids = np.array([3, 8, 15, 42], dtype=np.intp)
+    flowveldepth = np.arange(4 * 6, dtype="float32").reshape(4, 6)
+
+    results = _tailwater_results((ids, flowveldepth), [42, 8])
+
+    assert list(results) == [42, 8]
+    np.testing.assert_array_equal(results[42], flowveldepth[3])
+    np.testing.assert_array_equal(results[8], flowveldepth[1])
+
+
+@pytest.mark.parametrize("tailwaters", [[9], [50]])
+def test_tailwater_results_missing(tailwaters) -> None:
+    """Test that a tailwater missing from the results raises."""
+    ids = np.array([3, 8, 15, 42], dtype=np.intp)
+    flowveldepth = np.zeros((4, 6), dtype="float32")
+
+    with pytest.raises(ValueError):
+        _tailwater_results((ids, flowveldepth), tailwaters)
+
+
+def test_batch_networks() -> None:
+    """Test that networks are ordered longest first and small ones batched."""
+    costs = {1: 5, 2: 1500, 3: 400, 4: 300, 5: 1000, 6: 200, 7: 350}
+
+    batches = _batch_networks(costs, batch_size=1000)
+
+    assert batches == [[2], [5], [3, 7], [4, 6, 1]]
+
+
+def test_batch_networks_unbatched() -> None:
+    """Test that a batch size of 0 gives one job per network, longest first."""
+    costs = {1: 5, 2: 1500, 3: 400}
+
+    assert _batch_networks(costs, batch_size=0) == [[2], [3], [1]]
+
+
+def test_tributary_inflows() -> None:
+    """Test that tributary flows are gathered from every result, in the order of the results."""
+    results = [
+        (np.array([5, 1, 7], dtype=np.intp), np.arange(3 * 6, dtype="float32").reshape(3, 6)),
+        (np.array([], dtype=np.intp), np.zeros((0, 6), dtype="float32")),
+        (np.array([9, 2], dtype=np.intp), -np.arange(2 * 6, dtype="float32").reshape(2, 6)),
+    ]
+
+    inflows = _tributary_inflows(results, {2, 7, 5, 100})
+
+    expected = pd.DataFrame(
+        np.vstack([results[0][1][[0, 2], ::3], results[2][1][[1], ::3]]),
+        index=[5, 7, 2],
+    )
+    pd.testing.assert_frame_equal(inflows, expected, check_index_type=False)
+
+
+def test_cached_plan() -> None:
+    """Test that a plan is reused only for the topology, segments and channel parameters it was built for."""
+    data_cols = np.array(["dt", "bw", "tw", "twcc", "dx", "n", "ncc", "cs", "s0"], dtype=object)
+    data_idx = np.array([1, 2, 3], dtype="int64")
+    data_values = np.tile(
+        np.array([300, 10, 15, 40, 1000, 0.05, 0.1, 0.5, 0.001], dtype="float32"), (3, 1)
+    )
+    reaches = [([1, 2], 0), ([3], 0)]
+    upstream_connections = {1: [], 2: [1], 3: [2]}
+
+    routing_plans = {}
+    plan = _cached_plan(routing_plans, 3, reaches, upstream_connections, data_idx, data_cols, data_values)
+    assert routing_plans == {3: plan}
+    same = _cached_plan(routing_plans, 3, reaches, upstream_connections, data_idx, data_cols, data_values.copy())
+    assert same is plan
+
+    # channel parameters changed in place, e.g. by calibration
+    data_values[:, 5] *= 1.5
+    rough = _cached_plan(routing_plans, 3, reaches, upstream_connections, data_idx, data_cols, data_values)
+    assert rough is not plan and routing_plans[3] is rough
+    assert not plan.matches(reaches, upstream_connections, data_idx, data_cols, data_values)
+
+    other_idx = np.array([1, 2, 4], dtype="int64")
+    assert not rough.matches(reaches, upstream_connections, other_idx, data_cols, data_values)
+
+    # same segments and channel parameters, reaches split differently
+    split = [([1], 0), ([2], 0), ([3], 0)]
+    assert not rough.matches(split, upstream_connections, data_idx, data_cols, data_values)
+    resplit = _cached_plan(routing_plans, 3, split, upstream_connections, data_idx, data_cols, data_values)
+    assert resplit is not rough and len(resplit.reaches) == 3
+
+    # same reaches, the head of the second one connected upstream differently
+    rewired = {1: [], 2: [1], 3: [1]}
+    assert not resplit.matches(split, rewired, data_idx, data_cols, data_values)
+    assert resplit.matches(split, dict(upstream_connections), data_idx, data_cols, data_values)
+
+
+def _ensemble_network() -> dict:
+    """Two independent networks, a confluence with a gage at segment 2 and a single reach."""
+    rconn = {1: [], 2: [1], 4: [], 3: [2, 4], 11: [], 12: [11]}
+    connections = {1: [2], 2: [3], 4: [3], 3: [], 11: [12], 12: []}
+    segs = list(rconn)
+    rng = np.random.default_rng(0)
+    param_df = pd.DataFrame(
+        {
+            "dt": 300.0,
+            "bw": rng.uniform(5, 15, len(segs)),
+            "tw": 15.0,
+            "twcc": 40.0,
+            "dx": rng.uniform(500, 2000, len(segs)),
+            "n": 0.05,
+            "ncc": 0.1,
+            "cs": 0.5,
+            "s0": 0.001,
+            "alt": 1.0,
+        },
+        index=segs,
+    )
+    usgs_df = pd.DataFrame(
+        np.where(np.arange(NTS) % 4 == 0, 8.0, np.nan)[None, :], index=[2]
+    )
+    return {
+        "connections": connections,
+        "rconn": rconn,
+        "reaches_bytw": {3: [[1, 2], [4], [3]], 12: [[11, 12]]},
+        "independent_networks": {
+            3: {seg: rconn[seg] for seg in (1, 2, 3, 4)},
+            12: {seg: rconn[seg] for seg in (11, 12)},
+        },
+        "param_df": param_df,
+        "usgs_df": usgs_df,
+        "q0": pd.DataFrame({"qu0": 2.0, "qd0": 2.0, "h0": 0.5}, index=segs),
+        "qlats": pd.DataFrame(rng.uniform(0.1, 1.0, (len(segs), NTS)), index=segs),
+        "lastobs_df": pd.DataFrame(
+            {"lastobs_discharge": [6.0], "time_since_lastobs": [-600.0]}, index=[2]
+        ),
+    }
+
+
+def _route_members(network: dict, parallel_compute_method: str, **kwargs) -> list:
+    empty = pd.DataFrame()
+    inputs = dict(q0=network["q0"], qlats=network["qlats"], lastobs_df=network["lastobs_df"])
+    inputs.update((key, kwargs.pop(key)) for key in list(inputs) if key in kwargs)
+    return compute_nhd_routing_v02(
+        network["connections"],
+        network["rconn"],
+        {},
+        network["reaches_bytw"],
+        "V02-structured",
+        parallel_compute_method,
+        1,
+        1,
+        datetime(2020, 1, 1),
+        300.0,
+        NTS,
+        1,
+        network["independent_networks"],
+        network["param_df"].copy(),
+        inputs["q0"],
+        inputs["qlats"],
+        network["usgs_df"],
+        inputs["lastobs_df"],
+        empty,
+        empty,
+        empty,
+        empty,
+        empty,
+        empty,
+        empty,
+        empty,
+        empty,
+        {"da_decay_coefficient": 120},
+        True,
+        False,
+        empty,
+        {},
+        empty,
+        False,
+        [None, None],
+        **kwargs,
+    )[0]
+
+
+@pytest.mark.parametrize("hydraulic_table_size", [0, 16])
+@pytest.mark.parametrize("parallel_compute_method", ["serial", "by-network"])
+def test_ensemble_members(parallel_compute_method: str, hydraulic_table_size: int) -> None:
+    """
+    Test that ensemble members routed together give the results of routing
+    every member on its own, with the secant solver or hydraulic tables.
+
+    Parameters
+    ----------
+    parallel_compute_method : str
+        Method routing the networks
+    hydraulic_table_size : int
+        Rows of the hydraulic tables, 0 for the secant solver
+    """
+    network = _ensemble_network()
+    if not hydraulic_table_size:
+        # members carry their own secant residual within a call, and start
+        # every call from the residual of the first member, so route one network
+        for key in ("reaches_bytw", "independent_networks"):
+            network[key] = {3: network[key][3]}
+
+    def route(**kwargs) -> list:
+        # secant solves start from the residual their thread was left with
+        swap_secant_residual(0.0)
+        return _route_members(
+            network, parallel_compute_method, hydraulic_table_size=hydraulic_table_size, **kwargs
+        )
+
+    members = [
+        {},
+        {"qlats": network["qlats"] * 2.0, "q0": network["q0"] * 1.5},
+        {
+            "qlats": network["qlats"] * 0.5,
+            "lastobs_df": network["lastobs_df"].assign(lastobs_discharge=2.0),
+        },
+    ]
+
+    member_results = route(members=members)
+
+    assert len(member_results) == len(members)
+    for results, member in zip(member_results, members):
+        expected = route(**member)
+        assert len(results) == len(expected) == len(network["reaches_bytw"])
+        for result, expected_result in zip(results, expected):
+            np.testing.assert_array_equal(result[0], expected_result[0])
+            np.testing.assert_array_equal(result[1], expected_result[1])
+            # last observations and nudging of the gage
+            for values, expected_values in zip(result[3], expected_result[3]):
+                np.testing.assert_array_equal(values, expected_values)
+            np.testing.assert_array_equal(result[8], expected_result[8])
+    # the members differ
+    assert not np.array_equal(member_results[0][0][1], member_results[1][0][1])
+    assert not np.array_equal(member_results[0][0][8], member_results[2][0][8])
+
+
+def test_ensemble_members_rejected() -> None:
+    """Test that members are checked against the inputs they can replace and the routing method."""
+    network = _ensemble_network()
+    with pytest.raises(ValueError):
+        _ensemble_members([], q0=network["q0"])
+    with pytest.raises(ValueError):
+        _ensemble_members([{"usgs_df": network["usgs_df"]}], q0=network["q0"])
+    with pytest.raises(ValueError):
+        _route_members(network, "by-subnetwork-jit", members=[{}, {}])
+
+    # lastobs of every member are laid out on the gages of the first
+    lastobs_df = pd.DataFrame({"lastobs_discharge": [1.0, 2.0]}, index=[5, 2])
+    members = _ensemble_members(
+        [{}, {"lastobs_df": lastobs_df.iloc[::-1]}], lastobs_df=lastobs_df
+    )
+    pd.testing.assert_frame_equal(members[1]["lastobs_df"], lastobs_df)
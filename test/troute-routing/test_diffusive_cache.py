@@ -0,0 +1,220 @@
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+import troute.routing.diffusive_utils_v02 as diff_utils
+from troute.routing.diffusive_cache import (
+    chxsec_cache_key,
+    diffusive_cache_key,
+    load_or_build_chxsec_lookuptable,
+    load_or_build_static_inputs,
+    load_static_arrays,
+    save_static_inputs,
+    static_inputs_key,
+)
+from troute.routing.fast_reach import diffusive
+
+# mainstem 11 -> 12 -> 13 -> 15, with tributary 14 flowing into 13
+TW = 15
+CONNECTIONS = {11: [12], 12: [13], 13: [15], 14: [13], 15: []}
+RCONN = {11: [], 12: [11], 13: [12, 14], 14: [], 15: [13]}
+REACHES = [[11, 12], [14], [13, 15]]
+MAINSTEM = [11, 12, 13, 15]
+TRIBUTARIES = [14]
+
+
+@pytest.fixture
+def domain() -> dict:
+    rng = np.random.default_rng(0)
+    segs = list(CONNECTIONS)
+    param_df = pd.DataFrame(
+        {
+            "bw": rng.uniform(1, 5, len(segs)),
+            "tw": 6.0,
+            "twcc": 20.0,
+            "n": 0.05,
+            "ncc": 0.1,
+            "cs": 0.5,
+            "s0": 0.001,
+            "dx": 1000.0,
+            "alt": [10.0, 9.0, 8.0, 9.0, 7.0],
+        },
+        index=segs,
+    )
+    topobathy = pd.DataFrame(
+        {
+            "xid_d": np.tile([0.0, 5.0, 10.0], len(MAINSTEM)),
+            "z": np.tile([2.0, 0.0, 2.0], len(MAINSTEM)),
+            "n": 0.05,
+        },
+        index=np.repeat(MAINSTEM, 3),
+    )
+    return {"param_df": param_df, "topobathy": topobathy}
+
+
+def _static_args(domain: dict) -> tuple:
+    return (
+        TW,
+        CONNECTIONS,
+        RCONN,
+        REACHES,
+        MAINSTEM,
+        TRIBUTARIES,
+        domain["param_df"],
+        TRIBUTARIES,
+        domain["topobathy"],
+    )
+
+
+def _input_data(domain: dict, static_inputs=None) -> dict:
+    nts = 6
+    segs = list(CONNECTIONS)
+    return diff_utils.diffusive_input_data_v02(
+        TW,
+        CONNECTIONS,
+        RCONN,
+        REACHES,
+        MAINSTEM,
+        TRIBUTARIES,
+        None,
+        domain["param_df"],
+        pd.DataFrame(np.full((len(segs), 1), 0.5), index=segs),
+        pd.DataFrame({"qu0": 1.0, "qd0": 1.0, "h0": 0.5}, index=segs),
+        pd.DataFrame(np.linspace(1.0, 2.0, nts)[None, :], index=TRIBUTARIES),
+        1,
+        datetime(2020, 1, 1),
+        nts,
+        300.0,
+        pd.DataFrame(),
+        domain["topobathy"],
+        pd.DataFrame(),
+        None,
+        None,
+        pd.DataFrame(),
+        pd.DataFrame(),
+        static_inputs=static_inputs,
+    )
+
+
+def test_static_inputs_reused(domain: dict) -> None:
+    """Test that diffusive inputs built from reused static inputs match those built from scratch."""
+    expected = _input_data(domain)
+    static_inputs = diff_utils.diffusive_static_inputs(*_static_args(domain))
+    for _ in range(2):
+        diff_ins = _input_data(domain, static_inputs)
+        assert diff_ins.keys() == expected.keys()
+        for name, value in expected.items():
+            if isinstance(value, np.ndarray):
+                assert diff_ins[name].dtype == value.dtype
+                np.testing.assert_array_equal(diff_ins[name], value)
+            else:
+                assert diff_ins[name] == value
+    for name in diff_utils.STATIC_ARRAYS:
+        assert static_inputs[name].flags.f_contiguous
+
+
+def test_diffusive_cache_roundtrip(tmp_path: Path, domain: dict) -> None:
+    """Test that cached static arrays load back identical and Fortran ordered.
+
+    Parameters
+    ----------
+    tmp_path : Path
+        Temporary folder for the cache
+    domain : dict
+        Channel parameters and topobathy of the domain
+    """
+    static_inputs = diff_utils.diffusive_static_inputs(*_static_args(domain))
+    path = tmp_path / "diffusive"
+    save_static_inputs(path, static_inputs)
+    arrays = load_static_arrays(path)
+
+    assert arrays.keys() == set(diff_utils.STATIC_ARRAYS)
+    for name, array in arrays.items():
+        assert array.dtype == static_inputs[name].dtype
+        assert array.flags.f_contiguous
+        np.testing.assert_array_equal(array, static_inputs[name])
+
+    # a second build over the cache reads the arrays instead of building them
+    loaded = load_or_build_static_inputs(str(tmp_path), *_static_args(domain))
+    assert len(list(tmp_path.glob("diffusive_*"))) == 1
+    reloaded = load_or_build_static_inputs(str(tmp_path), *_static_args(domain))
+    for name in diff_utils.STATIC_ARRAYS:
+        np.testing.assert_array_equal(reloaded[name], loaded[name])
+    assert reloaded["pynw"] == static_inputs["pynw"]
+    assert reloaded["mxnbathy_g"] == static_inputs["mxnbathy_g"]
+
+
+def test_diffusive_cache_key(domain: dict) -> None:
+    """Test that the cache key changes with the domain, channel parameters, junctions and topobathy."""
+    key_args = (TW, CONNECTIONS, MAINSTEM, TRIBUTARIES, domain["param_df"], TRIBUTARIES, domain["topobathy"])
+    key = diffusive_cache_key(*key_args)
+    assert key == diffusive_cache_key(*key_args)
+
+    param_df = domain["param_df"].copy()
+    param_df.loc[12, "bw"] += 1.0
+    topobathy = domain["topobathy"].copy()
+    topobathy.iloc[0, 1] += 0.1
+    assert key != diffusive_cache_key(TW, CONNECTIONS, MAINSTEM, TRIBUTARIES, param_df, TRIBUTARIES, domain["topobathy"])
+    assert key != diffusive_cache_key(TW, CONNECTIONS, MAINSTEM, TRIBUTARIES, domain["param_df"], TRIBUTARIES, topobathy)
+    assert key != diffusive_cache_key(TW, CONNECTIONS, MAINSTEM, TRIBUTARIES, domain["param_df"], [], domain["topobathy"])
+
+
+def test_static_inputs_key(domain: dict) -> None:
+    """Test that the in-memory key also changes with the reaches and the refactored hydrofabric inputs."""
+    network_data = {
+        "connections": CONNECTIONS,
+        "rconn": RCONN,
+        "reaches": REACHES,
+        "mainstem_segs": MAINSTEM,
+        "tributary_segments": TRIBUTARIES,
+        "param_df": domain["param_df"],
+    }
+    refactored = {"rlinks": MAINSTEM, "refac_tw": TW}
+    key_args = [TW, network_data, TRIBUTARIES, domain["topobathy"], refactored, [MAINSTEM], pd.DataFrame()]
+    key = static_inputs_key(*key_args)
+    assert key == static_inputs_key(*key_args)
+
+    changed = [
+        (1, dict(network_data, reaches=[[11], [12], [14], [13, 15]])),
+        (3, domain["topobathy"].assign(n=0.06)),
+        (4, None),
+        (4, dict(refactored, refac_tw=13)),
+        (5, [MAINSTEM[:2], MAINSTEM[2:]]),
+        (6, domain["topobathy"]),
+    ]
+    for position, value in changed:
+        args = list(key_args)
+        args[position] = value
+        assert static_inputs_key(*args) != key
+
+
+@pytest.mark.parametrize("natural_xsec", [True, False])
+def test_chxsec_lookuptable_cache(tmp_path: Path, domain: dict, natural_xsec: bool) -> None:
+    """Test that the diffusive kernel routes the same flows from a cached, read-only lookup table.
+
+    Parameters
+    ----------
+    tmp_path : Path
+        Temporary folder for the cache
+    domain : dict
+        Channel parameters and topobathy of the domain
+    natural_xsec : bool
+        Whether cross sections come from topobathy, or are synthetic
+    """
+    if not natural_xsec:
+        domain = dict(domain, topobathy=pd.DataFrame())
+    diff_ins = _input_data(domain)
+    expected = diffusive.compute_diffusive(diff_ins)
+
+    table, z_adj = load_or_build_chxsec_lookuptable(str(tmp_path), diff_ins)
+    assert (tmp_path / f"chxsec_{chxsec_cache_key(diff_ins)}").is_dir()
+    table, z_adj = load_or_build_chxsec_lookuptable(str(tmp_path), diff_ins)
+    assert isinstance(table, np.memmap)
+    assert not table.flags.writeable
+    assert table.flags.f_contiguous
+
+    routed = diffusive.compute_diffusive(dict(diff_ins, chxsec_lookuptable=table, z_adj=z_adj))
+    for result, expected_result in zip(routed, expected):
+        np.testing.assert_array_equal(result, expected_result)
@@ -0,0 +1,172 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+from troute.routing.compute import compute_diffusive_routing
+
+NTS = 6
+
+
+def _domain(offset: int, n_mainstem: int, rng: np.random.Generator) -> dict:
+    """
+    A diffusive domain, a mainstem of n_mainstem segments with one tributary
+    joining it halfway, segment ids starting after offset.
+    """
+    mainstem = list(range(offset + 1, offset + n_mainstem + 1))
+    tributary = offset + 100
+    junction = n_mainstem // 2
+    connections = {seg: [ds] for seg, ds in zip(mainstem, mainstem[1:])}
+    connections[mainstem[-1]] = []
+    connections[tributary] = [mainstem[junction]]
+    rconn = {seg: [] for seg in connections}
+    for seg, ds in connections.items():
+        for d in ds:
+            rconn[d].append(seg)
+
+    segs = mainstem + [tributary]
+    param_df = pd.DataFrame(
+        {
+            "bw": rng.uniform(1, 5, len(segs)),
+            "tw": 6.0,
+            "twcc": 20.0,
+            "n": 0.05,
+            "ncc": 0.1,
+            "cs": 0.5,
+            "s0": 0.001,
+            "dx": rng.uniform(500, 1500, len(segs)),
+            "alt": np.append(np.linspace(10.0, 7.0, n_mainstem), 9.0),
+        },
+        index=segs,
+    )
+    return {
+        "connections": connections,
+        "rconn": rconn,
+        "reaches": [mainstem[:junction], [tributary], mainstem[junction:]],
+        "mainstem_segs": mainstem,
+        "tributary_segments": [tributary],
+        "param_df": param_df,
+    }
+
+
+@pytest.fixture
+def domains() -> dict:
+    """
+    Provides diffusive domains of different sizes, with MC results of their
+    tributaries, lateral inflows, initial conditions and topobathy.
+
+    Returns
+    -------
+    dict
+        compute_diffusive_routing inputs of the domains
+    """
+    rng = np.random.default_rng(0)
+    diffusive_network_data = {}
+    for offset, n_mainstem in ((1000, 4), (2000, 12), (3000, 6), (4000, 9)):
+        domain = _domain(offset, n_mainstem, rng)
+        diffusive_network_data[domain["mainstem_segs"][-1]] = domain
+
+    segs = [seg for d in diffusive_network_data.values() for seg in d["param_df"].index]
+    mainstem = [seg for d in diffusive_network_data.values() for seg in d["mainstem_segs"]]
+    tributaries = [seg for d in diffusive_network_data.values() for seg in d["tributary_segments"]]
+    # MC results of the tributaries, flows in every third column
+    mc_fvd = np.repeat(rng.uniform(1.0, 3.0, (len(tributaries), NTS)), 3, axis=1)
+    return {
+        "results": [(np.array(tributaries), mc_fvd.astype("float32"))],
+        "diffusive_network_data": diffusive_network_data,
+        "q0": pd.DataFrame({"qu0": 1.0, "qd0": 1.0, "h0": 0.5}, index=segs),
+        "qlats": pd.DataFrame(rng.uniform(0.1, 0.5, (len(segs), 1)), index=segs),
+        "topobathy": pd.DataFrame(
+            {
+                "xid_d": np.tile([0.0, 5.0, 10.0], len(mainstem)),
+                "z": np.tile([2.0, 0.0, 2.0], len(mainstem)),
+                "n": 0.05,
+            },
+            index=np.repeat(mainstem, 3),
+        ),
+    }
+
+
+def _route(domains: dict, cpu_pool: int, topobathy=None, **kwargs) -> list:
+    return compute_diffusive_routing(
+        domains["results"],
+        domains["diffusive_network_data"],
+        cpu_pool,
+        datetime(2020, 1, 1),
+        300.0,
+        NTS,
+        domains["q0"],
+        domains["qlats"],
+        1,
+        pd.DataFrame(),
+        pd.DataFrame(),
+        {},
+        pd.DataFrame(),
+        domains["topobathy"] if topobathy is None else topobathy,
+        {},
+        {},
+        pd.DataFrame(),
+        pd.DataFrame(),
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize("cpu_pool", [2, 4])
+def test_diffusive_routing_parallel(domains: dict, cpu_pool: int) -> None:
+    """
+    Test that domains routed in parallel, largest first, give the results of
+    routing them one at a time, in the order of diffusive_network_data.
+
+    Parameters
+    ----------
+    domains : dict
+        Inputs of the diffusive domains
+    cpu_pool : int
+        Number of workers routing the domains
+    """
+    expected = _route(domains, 1)
+    results = _route(domains, cpu_pool)
+
+    assert len(results) == len(expected) == len(domains["diffusive_network_data"])
+    for result, expected_result, domain in zip(
+        results, expected, domains["diffusive_network_data"].values()
+    ):
+        assert sorted(result[0]) == domain["mainstem_segs"]
+        np.testing.assert_array_equal(result[0], expected_result[0])
+        np.testing.assert_array_equal(result[1], expected_result[1])
+        # flow and depth, the diffusive kernel leaves velocity out
+        assert np.isfinite(result[1][:, 0::3]).all() and np.isfinite(result[1][:, 2::3]).all()
+
+
+def test_diffusive_static_reused(domains: dict) -> None:
+    """
+    Test that static inputs kept between loops give the results of building
+    them every loop, and are rebuilt when the topobathy of a domain changes.
+
+    Parameters
+    ----------
+    domains : dict
+        Inputs of the diffusive domains
+    """
+    diffusive_static = {}
+    expected = _route(domains, 1)
+    for _ in range(2):
+        results = _route(domains, 1, diffusive_static=diffusive_static)
+        for result, expected_result in zip(results, expected):
+            np.testing.assert_array_equal(result[1], expected_result[1])
+    assert set(diffusive_static) == set(domains["diffusive_network_data"])
+    kept = dict(diffusive_static)
+    # rows of the tributary inflows of every domain are kept with its static inputs
+    for tw, domain in domains["diffusive_network_data"].items():
+        _, junction_segments, trib_rows = diffusive_static[tw][1]["tributary_rows"]
+        assert junction_segments == set(domain["tributary_segments"])
+        np.testing.assert_array_equal(
+            domains["results"][0][0][trib_rows], diffusive_static[tw][1]["trib_heads"]
+        )
+
+    topobathy = domains["topobathy"].assign(z=np.tile([3.0, 0.0, 3.0], len(domains["topobathy"]) // 3))
+    results = _route(domains, 1, diffusive_static=diffusive_static, topobathy=topobathy)
+    expected = _route(domains, 1, topobathy=topobathy)
+    for tw, result, expected_result in zip(diffusive_static, results, expected):
+        assert diffusive_static[tw][1] is not kept[tw][1]
+        np.testing.assert_array_equal(result[1], expected_result[1])
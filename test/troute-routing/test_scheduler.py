@@ -0,0 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+import pytest
+from troute.routing.scheduler import (
+    barrier_dependencies,
+    benchmark_scheduling,
+    cluster_dependencies,
+    run_scheduled,
+)
+
+
+@pytest.fixture
+def clustered_network() -> Dict[str, dict]:
+    # two order-1 clusters draining into one order-0 cluster, and one order-2
+    # cluster draining into the first order-1 cluster
+    rconn = {1: [], 2: [1], 3: [], 4: [2, 3], 5: [4], 6: []}
+    reaches_ordered_bysubntw_clustered = {
+        2: {0: {"segs": [1], "tw": [1]}},
+        1: {0: {"segs": [2], "tw": [2]}, 1: {"segs": [3, 6], "tw": [3, 6]}},
+        0: {0: {"segs": [4, 5], "tw": [5]}},
+    }
+    return {"rconn": rconn, "clusters": reaches_ordered_bysubntw_clustered}
+
+
+def test_cluster_dependencies(clustered_network: Dict[str, dict]) -> None:
+    """Test that clusters wait exactly on the clusters feeding them.
+
+    Parameters
+    ----------
+    clustered_network : Dict[str, dict]
+        Upstream connections and clustered subnetworks
+    """
+    deps = cluster_dependencies(
+        clustered_network["clusters"], clustered_network["rconn"]
+    )
+    assert deps == {
+        (2, 0): set(),
+        (1, 0): {(2, 0)},
+        (1, 1): set(),
+        (0, 0): {(1, 0), (1, 1)},
+    }
+
+    barrier = barrier_dependencies(deps)
+    assert barrier[(1, 1)] == {(2, 0)}
+    assert barrier[(0, 0)] == {(1, 0), (1, 1)}
+
+
+def test_run_scheduled(clustered_network: Dict[str, dict]) -> None:
+    """Test that every job runs once, after the jobs it depends on.
+
+    Parameters
+    ----------
+    clustered_network : Dict[str, dict]
+        Upstream connections and clustered subnetworks
+    """
+    deps = cluster_dependencies(
+        clustered_network["clusters"], clustered_network["rconn"]
+    )
+    completed = []
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results, stats = run_scheduled(
+            deps,
+            lambda job: executor.submit(lambda: job),
+            lambda job, result: completed.append(result),
+            2,
+        )
+
+    assert results == {job: job for job in deps}
+    assert stats.jobs == len(deps)
+    for job, job_deps in deps.items():
+        assert all(completed.index(d) < completed.index(job) for d in job_deps)
+
+
+def test_run_scheduled_order() -> None:
+    """Test that jobs ready together are submitted highest order first, then by cluster."""
+    deps = {(1, 2): set(), (1, 0): set(), (2, 5): set(), (0, 0): {(1, 0), (1, 2)}}
+    submitted = []
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        run_scheduled(
+            deps,
+            lambda job: submitted.append(job) or executor.submit(lambda: job),
+            lambda job, result: None,
+            1,
+        )
+    assert submitted == [(2, 5), (1, 0), (1, 2), (0, 0)]
+
+
+def test_run_scheduled_cycle() -> None:
+    """Test that unresolvable dependencies raise instead of hanging."""
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with pytest.raises(ValueError):
+            run_scheduled(
+                {"a": {"b"}, "b": {"a"}},
+                lambda job: executor.submit(lambda: job),
+                lambda job, result: None,
+                1,
+            )
+
+
+def test_benchmark_scheduling() -> None:
+    """Test that the scheduling benchmark reports both schedules."""
+    report = benchmark_scheduling(n_orders=3, fan_in=2, workers=2, mean_duration=0.001)
+    assert set(report) == {"barrier", "pipelined"}
+    for stats in report.values():
+        assert stats.jobs == 7
+        assert 0.0 < stats.utilization <= 1.0
@@ -0,0 +1,252 @@
+import gc
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from troute.routing import shared_pool
+from troute.routing.cluster_inputs import WATERBODY_COLS, ClusterInputs
+from troute.routing.compute import _cluster_jobs
+from troute.routing.shared_pool import SharedMemoryPool, compute_from_shared, stacked_rows
+
+PARAM_COLS = ["dt", "bw", "tw"]
+NTS = 4
+
+# two order-1 clusters draining into one order-0 cluster, with waterbody 100
+# in the first cluster and segment 9 off the channel parameters
+RCONN = {1: [], 2: [1], 100: [2], 3: [], 4: [100, 3], 5: [4], 9: []}
+CLUSTERS = {
+    1: {
+        0: {"segs": [2, 1, 100], "subn_reach_list": [[1, 2], [100]]},
+        1: {"segs": [3, 9], "subn_reach_list": [[3], [9]]},
+    },
+    0: {0: {"segs": [5, 4], "subn_reach_list": [[4, 5]]}},
+}
+
+
+def _network():
+    segs = [1, 2, 3, 4, 5]
+    param_df = pd.DataFrame(
+        np.arange(len(segs) * len(PARAM_COLS), dtype="float32").reshape(len(segs), -1),
+        index=segs,
+        columns=PARAM_COLS,
+    )
+    waterbodies_df = pd.DataFrame(
+        np.arange(len(WATERBODY_COLS), dtype="float64").reshape(1, -1),
+        index=[100],
+        columns=WATERBODY_COLS,
+    )
+    return param_df, waterbodies_df
+
+
+def _inputs(param_df, waterbodies_df):
+    return ClusterInputs(
+        _cluster_jobs(CLUSTERS, RCONN), param_df, PARAM_COLS, waterbodies_df, pd.DataFrame()
+    )
+
+
+def _kernel(nts, dt, qts_subdivisions, reaches_wTypes, upstream_connections,
+            index, data_cols, params, q0, qlat, *args, **kwargs):
+    """Stand-in for the compute kernel, returning the rows it was given."""
+    fvd = np.repeat(q0, nts, axis=1)
+    inflow = np.repeat(qlat[:, :1], nts, axis=1)
+    return (np.array(index), fvd, params.copy(), args, kwargs, None, inflow)
+
+
+@pytest.fixture
+def pool(tmp_path: Path) -> SharedMemoryPool:
+    """
+    Provides a pool with the test clusters laid out and one loop of forcing.
+
+    Parameters
+    ----------
+    tmp_path : Path
+        Folder for the shared arrays
+
+    Returns
+    -------
+    SharedMemoryPool
+        Pool holding the shared arrays
+    """
+    param_df, waterbodies_df = _network()
+    pool = SharedMemoryPool(1, directory=tmp_path)
+    pool.set_layout(_inputs(param_df, waterbodies_df), waterbodies_df)
+    q0 = pd.DataFrame(np.random.rand(6, 3), index=[1, 2, 3, 4, 5, 100])
+    qlats = pd.DataFrame(np.random.rand(5, NTS), index=[1, 2, 3, 4, 5])
+    pool.update_forcing(q0, qlats, waterbodies_df)
+    yield pool
+    pool.shutdown()
+    shared_pool._attached.clear()
+
+
+def test_cluster_layout(pool: SharedMemoryPool) -> None:
+    """Test that every cluster gets a sorted block of its segments, waterbodies and upstreams."""
+    layout = pool.layout
+
+    # upstream orders first, segments neither on the channel parameters nor waterbodies left out
+    assert layout[(1, 0)] == (0, 3)
+    assert layout[(1, 1)] == (3, 4)
+    assert layout[(0, 0)] == (4, 8)
+    np.testing.assert_array_equal(layout["index"], [1, 2, 100, 3, 3, 4, 5, 100])
+    assert layout["index"].dtype == np.int64
+
+    # waterbody 100 is in the first cluster, and upstream of the last one
+    np.testing.assert_array_equal(np.load(pool.paths["lakes"]), [100, 100])
+    assert pool.inputs.lake_layout == {(1, 0): (0, 1), (1, 1): (1, 1), (0, 0): (1, 2)}
+
+
+def test_shared_arrays(pool: SharedMemoryPool) -> None:
+    """
+    Test that shared arrays hold the rows of the layout, and that every
+    loop replaces the files of the previous one.
+
+    Parameters
+    ----------
+    pool : SharedMemoryPool
+        Pool holding the shared arrays
+    """
+    param_df, waterbodies_df = _network()
+    index = pool.layout["index"]
+    np.testing.assert_array_equal(np.load(pool.paths["index"]), index)
+    np.testing.assert_array_equal(
+        np.load(pool.paths["params"]), param_df.reindex(index).to_numpy(dtype="float32")
+    )
+    np.testing.assert_array_equal(
+        np.load(pool.paths["waterbodies"]), waterbodies_df.loc[[100, 100], WATERBODY_COLS[:-2]]
+    )
+
+    old_paths = dict(pool.paths)
+    q0 = pd.DataFrame(np.full((6, 3), 2.0), index=[1, 2, 3, 4, 5, 100])
+    qlats = pd.DataFrame(np.full((5, NTS), 3.0), index=[1, 2, 3, 4, 5])
+    pool.update_forcing(q0, qlats, waterbodies_df.assign(qd0=5.0, h0=6.0))
+
+    for name in ("q0", "qlat", "waterbody_states"):
+        assert pool.paths[name] != old_paths[name]
+        assert not os.path.exists(old_paths[name])
+    for name in ("params", "lakes", "waterbodies"):
+        assert pool.paths[name] == old_paths[name]
+    np.testing.assert_array_equal(np.load(pool.paths["waterbody_states"]), [[5.0, 6.0]] * 2)
+    assert sorted(os.listdir(pool.folder)) == sorted(
+        os.path.basename(p) for p in pool.paths.values()
+    )
+    np.testing.assert_array_equal(
+        np.load(pool.paths["q0"]), q0.reindex(index).to_numpy(dtype="float32")
+    )
+
+
+def test_compute_from_shared(pool: SharedMemoryPool) -> None:
+    """
+    Test that a job passes its rows of the shared arrays to the kernel, and
+    reads the arrays of the current loop.
+
+    Parameters
+    ----------
+    pool : SharedMemoryPool
+        Pool holding the shared arrays
+    """
+    start, stop = pool.layout[(0, 0)]
+    args = (NTS, 300.0, 12, [], {}, np.array(PARAM_COLS, dtype=object))
+
+    result = compute_from_shared(_kernel, dict(pool.paths), start, stop, *args, "lake", flag=True)
+    np.testing.assert_array_equal(result[0], pool.layout["index"][start:stop])
+    np.testing.assert_array_equal(result[2], np.load(pool.paths["params"])[start:stop])
+    assert result[3] == ("lake",)
+    assert result[4] == {"flag": True}
+    assert pool.paths["q0"] in shared_pool._attached
+
+    # waterbodies of the job are read from the shared arrays
+    _, waterbodies_df = _network()
+    result = compute_from_shared(
+        _kernel, dict(pool.paths), start, stop, *args, "da", lakes=pool.inputs.lake_layout[(0, 0)]
+    )
+    lake_numbers_col, wbody_cols, da = result[3]
+    assert lake_numbers_col == [100] and da == "da"
+    np.testing.assert_array_equal(wbody_cols, waterbodies_df.loc[[100], WATERBODY_COLS].values)
+
+    old_q0 = pool.paths["q0"]
+    q0 = pd.DataFrame(np.full((6, 3), 2.0), index=[1, 2, 3, 4, 5, 100])
+    pool.update_forcing(q0, pd.DataFrame(np.ones((5, NTS)), index=[1, 2, 3, 4, 5]), waterbodies_df)
+    result = compute_from_shared(_kernel, dict(pool.paths), start, stop, *args)
+    assert (result[1] == 2.0).all()
+    # maps of replaced files are dropped
+    assert old_q0 not in shared_pool._attached
+
+
+def test_shared_output(pool: SharedMemoryPool) -> None:
+    """
+    Test that jobs write their results to their rows of the output buffers,
+    which are read back as views of one array.
+
+    Parameters
+    ----------
+    pool : SharedMemoryPool
+        Pool holding the shared arrays
+    """
+    jobs = [(1, 0), (1, 1), (0, 0)]
+    rows = {}
+    n = 0
+    for job in jobs:
+        start, stop = pool.layout[job]
+        rows[job] = (n, n + stop - start)
+        n += stop - start
+    pool.allocate_output(n, NTS)
+
+    args = (NTS, 300.0, 12, [], {}, np.array(PARAM_COLS, dtype=object))
+    results = []
+    for job in jobs:
+        start, stop = pool.layout[job]
+        output = dict(pool.output_paths, rows=rows[job])
+        q0 = np.load(pool.paths["q0"])[start:stop]
+        qlat = np.load(pool.paths["qlat"])[start:stop]
+        result = compute_from_shared(_kernel, dict(pool.paths), start, stop, *args, output=output)
+        assert result[1] is None and result[6] is None
+        result = pool.output_view(result, *rows[job])
+        np.testing.assert_array_equal(result[1], np.repeat(q0, NTS, axis=1))
+        np.testing.assert_array_equal(result[6], np.repeat(qlat[:, :1], NTS, axis=1))
+        results.append(result)
+
+    stacked = stacked_rows([r[1] for r in results])
+    assert stacked is not None and stacked.shape == (n, NTS * 3)
+
+    with pytest.raises(ValueError):
+        start, stop = pool.layout[(0, 0)]
+        output = dict(pool.output_paths, rows=(0, 1))
+        compute_from_shared(_kernel, dict(pool.paths), start, stop, *args, output=output)
+
+
+def test_pool_cleanup(tmp_path: Path) -> None:
+    """
+    Test that shared arrays are removed on shutdown, or when the pool is
+    garbage collected.
+
+    Parameters
+    ----------
+    tmp_path : Path
+        Folder for the shared arrays
+    """
+    param_df, waterbodies_df = _network()
+    inputs = _inputs(param_df, waterbodies_df)
+
+    pool = SharedMemoryPool(1, directory=tmp_path)
+    pool.set_layout(inputs, waterbodies_df)
+    folder = pool.folder
+    assert Path(folder).parent == tmp_path and os.listdir(folder)
+
+    # a network without waterbodies drops the waterbody arrays
+    pool.set_layout(_inputs(param_df, pd.DataFrame()), pd.DataFrame())
+    assert "lakes" not in pool.paths and "waterbodies" not in pool.paths
+    assert sorted(os.listdir(folder)) == sorted(os.path.basename(p) for p in pool.paths.values())
+
+    pool.shutdown()
+    assert not os.path.exists(folder)
+    assert pool.inputs is None and pool.layout is None and pool.paths == {}
+    # shutting down twice is harmless
+    pool.shutdown()
+
+    pool = SharedMemoryPool(1, directory=tmp_path)
+    pool.set_layout(inputs, waterbodies_df)
+    folder = pool.folder
+    del pool
+    gc.collect()
+    assert not os.path.exists(folder)
@@ -0,0 +1,118 @@
+from collections import defaultdict
+from pathlib import Path
+from typing import List
+
+import pytest
+from troute.routing.subnetwork_cache import (
+    load_or_build_subnetworks,
+    load_subnetworks,
+    save_subnetworks,
+    subnetwork_cache_key,
+)
+
+
+@pytest.fixture
+def connections() -> dict:
+    return {1: [3], 2: [3], 3: [5], 4: [5], 5: []}
+
+
+@pytest.fixture
+def subnetwork_list() -> List[dict]:
+    subnetworks_only_ordered_jit = defaultdict(dict)
+    subnetworks_only_ordered_jit[0][5] = {3, 4, 5}
+    subnetworks_only_ordered_jit[1][1] = {1}
+    subnetworks_only_ordered_jit[1][2] = {2}
+
+    reaches_ordered_bysubntw_clustered = defaultdict(dict)
+    reaches_ordered_bysubntw_clustered[0][0] = {
+        "segs": [3, 5, 4],
+        "upstreams": {3: [1, 2], 4: [], 5: [3, 4]},
+        "tw": [5],
+        "subn_reach_list": [[3, 5], [4]],
+    }
+    reaches_ordered_bysubntw_clustered[1][0] = {
+        "segs": [1],
+        "upstreams": {1: []},
+        "tw": [1],
+        "subn_reach_list": [[1]],
+    }
+    reaches_ordered_bysubntw_clustered[1][1] = {
+        "segs": [2],
+        "upstreams": {2: []},
+        "tw": [2],
+        "subn_reach_list": [[2]],
+    }
+    return [subnetworks_only_ordered_jit, reaches_ordered_bysubntw_clustered]
+
+
+def test_subnetwork_cache_roundtrip(tmp_path: Path, subnetwork_list: List[dict]) -> None:
+    """Test that cached subnetworks load back identical, including dictionary order.
+
+    Parameters
+    ----------
+    tmp_path : Path
+        Temporary folder for the cache file
+    subnetwork_list : List[dict]
+        Clustered subnetwork structures
+    """
+    path = tmp_path / "subnetworks.npz"
+    save_subnetworks(path, subnetwork_list)
+    loaded = load_subnetworks(path)
+
+    assert loaded == subnetwork_list
+    for expected, actual in zip(subnetwork_list, loaded):
+        assert list(expected) == list(actual)
+        for order in expected:
+            assert list(expected[order]) == list(actual[order])
+    for order, clusters in subnetwork_list[1].items():
+        for cluster, clustered_subns in clusters.items():
+            assert list(clustered_subns["upstreams"]) == list(
+                loaded[1][order][cluster]["upstreams"]
+            )
+
+
+def test_subnetwork_cache_key(connections: dict) -> None:
+    """Test that the cache key tracks every input of the decomposition.
+
+    Parameters
+    ----------
+    connections : dict
+        Downstream network connections
+    """
+    key = subnetwork_cache_key(connections, [3], [], 100)
+
+    reordered = dict(reversed(list(connections.items())))
+    assert subnetwork_cache_key(reordered, [3], [], 100) == key
+
+    assert subnetwork_cache_key(connections, [4], [], 100) != key
+    assert subnetwork_cache_key(connections, [3], [5], 100) != key
+    assert subnetwork_cache_key(connections, [3], [], 200) != key
+    assert subnetwork_cache_key({**connections, 4: [3]}, [3], [], 100) != key
+
+
+def test_load_or_build_subnetworks(
+    tmp_path: Path, connections: dict, subnetwork_list: List[dict]
+) -> None:
+    """Test that subnetworks are built once and then served from the cache.
+
+    Parameters
+    ----------
+    tmp_path : Path
+        Temporary cache folder
+    connections : dict
+        Downstream network connections
+    subnetwork_list : List[dict]
+        Clustered subnetwork structures
+    """
+    calls = []
+
+    def build():
+        calls.append(1)
+        return subnetwork_list
+
+    first = load_or_build_subnetworks(tmp_path, build, connections, [3], [], 100)
+    second = load_or_build_subnetworks(tmp_path, build, connections, [3], [], 100)
+
+    assert len(calls) == 1
+    assert first == second == subnetwork_list
+    assert len(list(tmp_path.glob("subnetworks_*.npz"))) == 1